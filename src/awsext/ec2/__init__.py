@@ -26,7 +26,12 @@ INSTANCE_STATE_CODE_TERMINATED = 48
 INSTANCE_STATE_CODE_STOPPING = 64
 INSTANCE_STATE_CODE_STOPPED = 80
 
-from boto.regioninfo import get_regions, RegionInfo
+# poll_instances_running readiness modes
+READINESS_STATUS = 'status'
+READINESS_SSH = 'ssh'
+
+from boto.regioninfo import RegionInfo
+import awsext.regioncache
 import awsext.ec2.connection
 
 
@@ -39,7 +44,7 @@ def regions(**kw_params):
     :param **kw_params: 
 
     """
-    return get_regions('ec2', connection_cls=awsext.ec2.connection.AwsExtEC2Connection)
+    return awsext.regioncache.get_regions('ec2', connection_cls=awsext.ec2.connection.AwsExtEC2Connection)
 
 
 
@@ -253,18 +253,104 @@ class AwsExtEC2Connection(boto.ec2.connection.EC2Connection):
         return self.poll_instances( [instance_id], interval_secs, max_minutes, awsext.ec2.INSTANCE_STATE_CODE_RUNNING, verbose )
     
     
-    def poll_instances_running( self, instance_ids, interval_secs, max_minutes, verbose=False ):
+    def poll_instances_running( self, instance_ids, interval_secs, max_minutes, verbose=False, readiness='status',
+                                ready_callback=None, username='ec2-user', key_filename=None, is_private_ip=False, port=22, max_probe_workers=32 ):
         """Poll a list of instances until Running or timeout
 
         :param instance_ids: list of instance id's
         :param max_minutes: max minutes to poll
         :param interval_secs: interval to check for status awsext.ec2.INSTANCE_STATE_CODE_RUNNING
         :param verbose: If True, log detailed status messages. (Default value = False)
+        :param readiness: awsext.ec2.READINESS_STATUS waits for the system status check, awsext.ec2.READINESS_SSH releases each
+                instance as soon as it accepts SSH connections, see iter_instances_ready (Default value = 'status')
+        :param ready_callback: If not None and readiness is READINESS_SSH, called with (instance_id, ip_address) as each instance is ready (Default value = None)
+        :param username: user name for the SSH probe (Default value = 'ec2-user')
+        :param key_filename: If not None, the SSH probe authenticates with this key file (Default value = None)
+        :param is_private_ip: If True, probe the private ip address, else the public ip address (Default value = False)
+        :param port: SSH port (Default value = 22)
+        :param max_probe_workers: max concurrent SSH probes (Default value = 32)
         :return: True if all instances are running
         :raise awsext.exception.InstancePollTimeoutError: if all instances are not running within max_minutes
 
         """
-        return self.poll_instances( instance_ids, interval_secs, max_minutes, awsext.ec2.INSTANCE_STATE_CODE_RUNNING, verbose )
+        if readiness == awsext.ec2.READINESS_STATUS:
+            return self.poll_instances( instance_ids, interval_secs, max_minutes, awsext.ec2.INSTANCE_STATE_CODE_RUNNING, verbose )
+        for instance_id, ip_address in self.iter_instances_ready( instance_ids, interval_secs, max_minutes, verbose=verbose, username=username,
+                                                                  key_filename=key_filename, is_private_ip=is_private_ip, port=port,
+                                                                  max_probe_workers=max_probe_workers ):
+            if ready_callback != None: ready_callback( instance_id, ip_address )
+        return True
+
+
+    def iter_instances_ready( self, instance_ids, interval_secs, max_minutes, verbose=False, username='ec2-user', key_filename=None,
+                              is_private_ip=False, port=22, max_probe_workers=32 ):
+        """Poll a list of instances, yielding each one as soon as it's usable: either the system status check is ok or, while
+        the status is still initializing, the instance accepts SSH connections.  Instances are probed concurrently
+
+        :param instance_ids: list of instance id's
+        :param interval_secs: interval between polls
+        :param max_minutes: max minutes to poll
+        :param verbose: If True, log detailed status messages. (Default value = False)
+        :param username: user name for the SSH probe (Default value = 'ec2-user')
+        :param key_filename: If not None, the SSH probe authenticates with this key file, else only waits for the SSH banner (Default value = None)
+        :param is_private_ip: If True, probe the private ip address, else the public ip address (Default value = False)
+        :param port: SSH port (Default value = 22)
+        :param max_probe_workers: max concurrent SSH probes (Default value = 32)
+        :return: generator of (instance_id, ip_address) in the order instances become ready
+        :raise awsext.exception.InstancePollTimeoutError: if all instances are not ready within max_minutes
+        :raise awsext.exception.InstancePollTerminatedError: if an instance is terminated while polling, i.e. a spot instance
+
+        """
+        # paramiko is only needed for the SSH probe
+        from awsext.ec2.remote import probe_ssh_ready
+        from awsext.workerpool import WorkerPool
+        map_poll_instance_ids = {}
+        for instance_id in instance_ids: map_poll_instance_ids[instance_id] = None
+        map_ip_addresses = {}
+        expires_at = time.time() + (max_minutes * 60)
+        worker_pool = WorkerPool( max_workers=max(1, min(max_probe_workers, len(instance_ids))), name_prefix='ssh-probe' )
+        try:
+            while time.time() < expires_at:
+                ok_instance_ids = []
+                probe_instance_ids = []
+                instance_statuss = self.get_all_instance_status( instance_ids=map_poll_instance_ids.keys(), include_all_instances=True )
+                for instance_status in instance_statuss:
+                    if verbose: logger.info( '   Instance: ' + instance_status.id + ', instance_status.state_code=' + str(instance_status.state_code) + ', instance_status.system_status.status=' + instance_status.system_status.status )
+                    if instance_status.state_code == awsext.ec2.INSTANCE_STATE_CODE_TERMINATED:
+                        raise awsext.exception.InstancePollTerminatedError( 'Instance terminated while polling: ' + instance_status.id, instance_status.id )
+                    if instance_status.state_code != awsext.ec2.INSTANCE_STATE_CODE_RUNNING: continue
+                    if instance_status.system_status.status == 'ok': ok_instance_ids.append( instance_status.id )
+                    else: probe_instance_ids.append( instance_status.id )
+
+                # ip addresses are assigned once running, fetched once per instance
+                unknown_ip_instance_ids = [ instance_id for instance_id in ok_instance_ids + probe_instance_ids if instance_id not in map_ip_addresses ]
+                if len(unknown_ip_instance_ids) > 0:
+                    for instance in self.get_only_instances( instance_ids=unknown_ip_instance_ids ):
+                        if is_private_ip: ip_address = instance.private_ip_address
+                        else: ip_address = instance.ip_address
+                        map_ip_addresses[ instance.id ] = ip_address
+                for instance_id in ok_instance_ids:
+                    map_poll_instance_ids.pop( instance_id, None )
+                    yield instance_id, map_ip_addresses.get( instance_id )
+                probe_instance_ids = [ instance_id for instance_id in probe_instance_ids if map_ip_addresses.get( instance_id ) != None ]
+
+                def probe_instance( instance_id ):
+                    return probe_ssh_ready( map_ip_addresses[instance_id], port=port, username=username, key_filename=key_filename,
+                                            timeout=max(1, interval_secs) )
+                for work_item in worker_pool.imap_unordered( probe_instance, probe_instance_ids ):
+                    instance_id = work_item.args[0]
+                    if work_item.get():
+                        if verbose: logger.info( '   Instance SSH ready: ' + instance_id + ', ' + map_ip_addresses[instance_id] )
+                        map_poll_instance_ids.pop( instance_id, None )
+                        yield instance_id, map_ip_addresses[ instance_id ]
+
+                if len(map_poll_instance_ids) == 0: return
+                if verbose: logger.info( '   Poll Loop processed, num instances remaining to ready: ' + str(len(map_poll_instance_ids)) )
+                time.sleep( interval_secs )
+        finally:
+            worker_pool.shutdown()
+        raise awsext.exception.InstancePollTimeoutError( 'Timeout polling ' + str(map_poll_instance_ids.keys()), map_poll_instance_ids.keys(),
+                                                         awsext.ec2.INSTANCE_STATE_CODE_RUNNING )
     
     
     def poll_instance_stopped( self, instance_id, interval_secs, max_minutes, verbose=False ):
@@ -370,7 +456,7 @@ class AwsExtEC2Connection(boto.ec2.connection.EC2Connection):
                     and instance_status.state_code == target_state_code: map_poll_instance_ids.pop( instance_status.id, None )
                 # This can happen with Spot instances - while waiting for checks to complete, the spot request is terminated by price
                 elif( target_state_code == awsext.ec2.INSTANCE_STATE_CODE_RUNNING and instance_status.state_code == awsext.ec2.INSTANCE_STATE_CODE_TERMINATED) : 
-                    raise awsext.exception.InstancePollTerminatedError( instance_status.id )
+                    raise awsext.exception.InstancePollTerminatedError( 'Instance terminated while polling: ' + instance_status.id, instance_status.id )
             if( len(map_poll_instance_ids) == 0 ): return True
             if is_instance_check: return False      # one pass through the loop and all of the instances are not in the target state - must be false
             if verbose: logger.info( '   Poll Loop processed, num instances remaining to target_state: ' + str(len(map_poll_instance_ids)) )
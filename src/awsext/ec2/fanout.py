@@ -0,0 +1,378 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tree based distribution of a file to many hosts, hosts relay the file to each other over SSH
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import time
+import uuid
+import pipes
+import Queue
+import hashlib
+import tempfile
+import collections
+import paramiko
+from awsext.workerpool import WorkerPool, WorkItem
+from awsext.ec2.sshpool import SshConnectionPool
+from awsext.ec2.remote import RemoteRunThread, RemoteRunRequest
+
+import logging
+logger = logging.getLogger(__name__)
+
+# parent id of the local (deploy) host
+LOCAL_PARENT = None
+# remote authorized_keys, relative to the login directory
+AUTHORIZED_KEYS_FILE = '.ssh/authorized_keys'
+
+
+def compute_file_sha256( path, block_size=1048576 ):
+    """
+
+    :param path: local path/name.ext
+    :param block_size: bytes read at a time (Default value = 1048576)
+    :return: hex SHA-256 of the file contents
+
+    """
+    sha256 = hashlib.sha256()
+    with open( path, 'rb' ) as local_file:
+        while True:
+            data = local_file.read( block_size )
+            if not data: break
+            sha256.update( data )
+    return sha256.hexdigest()
+
+
+class FanoutRelayKey():
+    """Ephemeral key pair used between hosts for a single distribution, the public key is authorized on each host with a
+    comment unique to the run, so it can be revoked without touching other keys """
+
+    def __init__(self, relay_key_to_file=None, bits=2048 ):
+        """
+
+        :param relay_key_to_file: remote path/name.ext of the private key (Default value = None, .ssh/<comment>.pem)
+        :param bits: key size (Default value = 2048)
+
+        """
+        self.comment = 'awsext-fanout-' + uuid.uuid4().hex[:16]
+        self.to_file = relay_key_to_file
+        if self.to_file == None: self.to_file = '.ssh/' + self.comment + '.pem'
+        rsa_key = paramiko.RSAKey.generate( bits )
+        self.public_key = rsa_key.get_name() + ' ' + rsa_key.get_base64() + ' ' + self.comment
+        fd, self.local_file = tempfile.mkstemp( prefix='awsext_fanout_', suffix='.pem' )
+        os.close( fd )
+        rsa_key.write_private_key_file( self.local_file )
+
+
+    def get_install_requests(self):
+        """
+
+        :return: list of :class:`awsext.ec2.remote.RemoteRunRequest` that authorize the public key and copy the private key, can be repeated
+
+        """
+        authorized_keys_file = pipes.quote(AUTHORIZED_KEYS_FILE)
+        return [ RemoteRunRequest( cmd_line='mkdir -p .ssh $(dirname ' + pipes.quote(self.to_file) + ') && chmod 700 .ssh && ' +
+                                   '(grep -qF ' + pipes.quote(self.comment) + ' ' + authorized_keys_file + ' 2>/dev/null || ' +
+                                   'echo ' + pipes.quote(self.public_key) + ' >> ' + authorized_keys_file + ') && chmod 600 ' + authorized_keys_file ),
+                 RemoteRunRequest( from_file=self.local_file, to_file=self.to_file ),
+                 RemoteRunRequest( cmd_line='chmod 600 ' + pipes.quote(self.to_file) ) ]
+
+
+    def get_remove_requests(self):
+        """
+
+        :return: list of :class:`awsext.ec2.remote.RemoteRunRequest` that remove the private key and revoke the public key
+
+        """
+        authorized_keys_file = pipes.quote(AUTHORIZED_KEYS_FILE)
+        return [ RemoteRunRequest( cmd_line='rm -f ' + pipes.quote(self.to_file) + ' && if [ -f ' + authorized_keys_file + ' ]; then ' +
+                                   'sed -i ' + pipes.quote('/ ' + self.comment + '$/d') + ' ' + authorized_keys_file + '; fi' ) ]
+
+
+    def close(self):
+        """Remove the local private key file """
+        if self.local_file != None and os.path.exists( self.local_file ): os.remove( self.local_file )
+        self.local_file = None
+
+
+class RemoteFanout():
+    """Distribute a file in a k-ary tree: the local host uploads to at most fanout hosts at a time, and each host with a
+    verified copy relays to at most fanout other hosts at a time (scp on the parent), so the local uplink isn't the bottleneck
+    and distribution time grows logarithmically with the number of hosts.  The checksum is verified on every host, a
+    failed relay is retried from a different parent.
+    Hosts authenticate to each other with a key pair generated for the run, installed on each host from the local host
+    and revoked on every host that received it when distribution completes, the deploy key never leaves the local host """
+
+    def __init__(self, fanout=3, username='ec2-user', key_filename=None, timeout=60, ssh_pool=None, max_workers=64,
+                 max_attempts=3, relay_key_to_file=None, is_remove_relay_key=True ):
+        """
+
+        :param fanout: max concurrent transfers from each parent, including the local host (Default value = 3)
+        :param username: user name for SSH, from the local host and between hosts (Default value = 'ec2-user')
+        :param key_filename: path/name.ext of key file, used only from the local host (Default value = None)
+        :param timeout: max time to wait for SSH connection (Default value = 60)
+        :param ssh_pool: If not None, :class:`awsext.ec2.sshpool.SshConnectionPool` to reuse, else a pool is created and closed (Default value = None)
+        :param max_workers: max concurrent transfers across all parents (Default value = 64)
+        :param max_attempts: max transfer attempts per host, each from a different parent (Default value = 3)
+        :param relay_key_to_file: remote path/name.ext of the run's private key (Default value = None, unique per run under .ssh)
+        :param is_remove_relay_key: If True, remove the run's private key and revoke its public key on every host that received
+            it after distribution (Default value = True)
+
+        """
+        if key_filename == None: raise ValueError( 'key_filename is required' )
+        self.fanout = fanout
+        self.username = username
+        self.key_filename = key_filename
+        self.timeout = timeout
+        self.ssh_pool = ssh_pool
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.relay_key_to_file = relay_key_to_file
+        self.is_remove_relay_key = is_remove_relay_key
+
+
+    def distribute(self, ip_addresses, from_file, to_file, map_relay_ip_addresses=None ):
+        """Copy from_file to to_file on all hosts
+
+        :param ip_addresses: list of ip addresses, as reachable from the local host
+        :param from_file: local path/name.ext
+        :param to_file: remote path/name.ext
+        :param map_relay_ip_addresses: dict of ip address to the address used between hosts, i.e. the private ip (Default value = None)
+        :return: :class:`awsext.ec2.fanout.RemoteFanoutResult`, including hosts where the relay key couldn't be removed
+
+        """
+        if map_relay_ip_addresses == None: map_relay_ip_addresses = {}
+        sha256 = compute_file_sha256( from_file )
+        remote_fanout_result = RemoteFanoutResult( ip_addresses )
+        fanout_relay_key = FanoutRelayKey( relay_key_to_file=self.relay_key_to_file )
+        is_own_ssh_pool = self.ssh_pool == None
+        ssh_pool = self.ssh_pool
+        if is_own_ssh_pool: ssh_pool = SshConnectionPool( timeout=self.timeout )
+
+        pending_ip_addresses = collections.deque( ip_addresses )
+        map_parent_num_active = { LOCAL_PARENT:0 }
+        map_failed_parents = collections.defaultdict( set )
+        done_queue = Queue.Queue()
+        num_in_flight = 0
+        worker_pool = WorkerPool( max_workers=self.max_workers, name_prefix='fanout' )
+        try:
+            while True:
+                # assign as many pending hosts as possible to a parent with a free slot, least busy parent first
+                num_unassigned = len(pending_ip_addresses)
+                for i in range(num_unassigned):
+                    ip_address = pending_ip_addresses.popleft()
+                    parent_ip_address = self.find_parent( ip_address, map_parent_num_active, map_failed_parents[ip_address] )
+                    if parent_ip_address == -1:
+                        pending_ip_addresses.append( ip_address )
+                        continue
+                    map_parent_num_active[ parent_ip_address ] += 1
+                    num_in_flight += 1
+                    remote_fanout_result.map_host_statuses[ ip_address ].attempts += 1
+                    worker_pool.submit_work_item( WorkItem( self.transfer, ( ssh_pool, ip_address, parent_ip_address, from_file, to_file, sha256, map_relay_ip_addresses,
+                                                                             fanout_relay_key, remote_fanout_result.map_host_statuses[ ip_address ] ), {}, done_queue=done_queue ) )
+                if num_in_flight == 0: 
+                    for ip_address in pending_ip_addresses: 
+                        remote_fanout_result.map_host_statuses[ ip_address ].errors.append( 'No parent available' )
+                    break
+
+                work_item = done_queue.get()
+                num_in_flight -= 1
+                ip_address, parent_ip_address = work_item.args[1], work_item.args[2]
+                map_parent_num_active[ parent_ip_address ] -= 1
+                remote_fanout_host_status = remote_fanout_result.map_host_statuses[ ip_address ]
+                if work_item.exception == None:
+                    remote_fanout_host_status.parent_ip_address = parent_ip_address
+                    remote_fanout_host_status.is_verified = True
+                    map_parent_num_active[ ip_address ] = 0
+                    continue
+                remote_fanout_host_status.errors.append( str(work_item.exception) )
+                map_failed_parents[ ip_address ].add( parent_ip_address )
+                logger.warn( 'Fanout transfer failed: ip_address=' + ip_address + ', parent=' + str(parent_ip_address) + ', ' + str(work_item.exception) )
+                if remote_fanout_host_status.attempts < self.max_attempts: pending_ip_addresses.appendleft( ip_address )
+
+            if self.is_remove_relay_key: self.remove_relay_keys( worker_pool, ssh_pool, fanout_relay_key, remote_fanout_result )
+        finally:
+            worker_pool.shutdown()
+            if is_own_ssh_pool: ssh_pool.close_all()
+            fanout_relay_key.close()
+        remote_fanout_result.end_time = time.time()
+        return remote_fanout_result
+
+
+    def find_parent(self, ip_address, map_parent_num_active, failed_parent_ip_addresses ):
+        """
+
+        :param ip_address: host to be transferred to
+        :param map_parent_num_active: dict of parent (LOCAL_PARENT or ip address with a verified copy) to number of active transfers
+        :param failed_parent_ip_addresses: set of parents that already failed for this host
+        :return: least busy parent with a free slot, -1 if none are available
+
+        """
+        parent_ip_address = -1
+        parent_num_active = self.fanout
+        for check_parent_ip_address, num_active in map_parent_num_active.items():
+            if num_active < parent_num_active and check_parent_ip_address not in failed_parent_ip_addresses:
+                parent_ip_address = check_parent_ip_address
+                parent_num_active = num_active
+        return parent_ip_address
+
+
+    def remove_relay_keys(self, worker_pool, ssh_pool, fanout_relay_key, remote_fanout_result ):
+        """Remove the private key and revoke the public key on every host that received the relay key, whether or not the
+        host was verified, waiting for all removals to complete
+
+        :param worker_pool: :class:`awsext.workerpool.WorkerPool`
+        :param ssh_pool: :class:`awsext.ec2.sshpool.SshConnectionPool`
+        :param fanout_relay_key: :class:`awsext.ec2.fanout.FanoutRelayKey`
+        :param remote_fanout_result: :class:`awsext.ec2.fanout.RemoteFanoutResult`, cleanup_error is set on failed hosts
+
+        """
+        work_items = []
+        for ip_address, remote_fanout_host_status in remote_fanout_result.map_host_statuses.items():
+            if not remote_fanout_host_status.is_relay_key_sent: continue
+            work_items.append( worker_pool.submit( self.run_requests, ssh_pool, ip_address, fanout_relay_key.get_remove_requests() ) )
+        for work_item in work_items:
+            remote_fanout_host_status = remote_fanout_result.map_host_statuses[ work_item.args[1] ]
+            work_item.done_event.wait()
+            if work_item.exception == None: remote_fanout_host_status.is_relay_key_removed = True
+            else:
+                remote_fanout_host_status.cleanup_error = str(work_item.exception)
+                logger.warn( 'Relay key removal failed: ip_address=' + remote_fanout_host_status.ip_address + ', ' + str(work_item.exception) )
+
+
+    def transfer(self, ssh_pool, ip_address, parent_ip_address, from_file, to_file, sha256, map_relay_ip_addresses, fanout_relay_key,
+                 remote_fanout_host_status ):
+        """Install the relay key on the host from the local host, copy the file from the local host or a parent, then verify the checksum
+
+        :param ssh_pool: :class:`awsext.ec2.sshpool.SshConnectionPool`
+        :param ip_address: target host
+        :param parent_ip_address: LOCAL_PARENT or ip address of the parent host
+        :param from_file: local path/name.ext
+        :param to_file: remote path/name.ext
+        :param sha256: expected hex SHA-256
+        :param map_relay_ip_addresses: dict of ip address to the address used between hosts
+        :param fanout_relay_key: :class:`awsext.ec2.fanout.FanoutRelayKey`
+        :param remote_fanout_host_status: :class:`awsext.ec2.fanout.RemoteFanoutHostStatus` of the host
+
+        """
+        # flagged before the attempt, a partial install still needs to be removed
+        remote_fanout_host_status.is_relay_key_sent = True
+        self.run_requests( ssh_pool, ip_address, fanout_relay_key.get_install_requests() )
+        if parent_ip_address == LOCAL_PARENT:
+            self.run_requests( ssh_pool, ip_address, [ RemoteRunRequest( from_file=from_file, to_file=to_file ) ] )
+        else:
+            relay_target = self.username + '@' + map_relay_ip_addresses.get( ip_address, ip_address ) + ':'
+            scp = 'scp -q -B -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -i ' + pipes.quote(fanout_relay_key.to_file) + ' -p '
+            self.run_requests( ssh_pool, parent_ip_address, [ RemoteRunRequest( cmd_line=scp + pipes.quote(to_file) + ' ' + pipes.quote(relay_target + to_file) ) ] )
+        remote_run_thread = self.run_requests( ssh_pool, ip_address, [ RemoteRunRequest( cmd_line='sha256sum ' + pipes.quote(to_file) ) ] )
+        remote_sha256 = (remote_run_thread.remote_run_responses[-1].std_out.split() + [''])[0]
+        if remote_sha256 != sha256: raise IOError( 'Checksum mismatch on ' + ip_address + ', expected=' + sha256 + ', actual=' + remote_sha256 )
+
+
+    def run_requests(self, ssh_pool, ip_address, remote_run_requests ):
+        """Process RemoteRunRequests on the current thread
+
+        :param ssh_pool: :class:`awsext.ec2.sshpool.SshConnectionPool`
+        :param ip_address: ip address to SSH into
+        :param remote_run_requests: list of :class:`awsext.ec2.remote.RemoteRunRequest`
+        :return: processed :class:`awsext.ec2.remote.RemoteRunThread`
+        :raise IOError: if the SSH connection failed or a request exceeded max_returncode
+
+        """
+        remote_run_thread = RemoteRunThread( 0, ip_address, timeout=self.timeout, username=self.username, key_filename=self.key_filename,
+                                             remote_run_requests=remote_run_requests, ssh_pool=ssh_pool )
+        remote_run_thread.run()
+        if remote_run_thread.exception != None: raise remote_run_thread.exception
+        if remote_run_thread.is_max_return_code_exceeded:
+            remote_run_response = remote_run_thread.remote_run_responses[-1]
+            raise IOError( 'Failed on ' + ip_address + ': returncode=' + str(remote_run_response.returncode) + ', cmd_line=' +
+                           remote_run_response.cmd_line + ', std_err=' + remote_run_response.std_err )
+        return remote_run_thread
+
+
+class RemoteFanoutHostStatus():
+    """Distribution status of a single host """
+
+    def __init__(self, ip_address ):
+        """
+
+        :param ip_address: ip address of host
+
+        """
+        self.ip_address = ip_address
+        self.parent_ip_address = None
+        self.is_verified = False
+        self.attempts = 0
+        self.errors = []
+        self.is_relay_key_sent = False
+        self.is_relay_key_removed = False
+        self.cleanup_error = None
+
+
+class RemoteFanoutResult():
+    """Distribution status of all hosts """
+
+    def __init__(self, ip_addresses ):
+        """
+
+        :param ip_addresses: list of ip addresses
+
+        """
+        self.start_time = time.time()
+        self.end_time = None
+        self.map_host_statuses = collections.OrderedDict( [ (ip_address, RemoteFanoutHostStatus( ip_address )) for ip_address in ip_addresses ] )
+
+
+    def get_verified(self):
+        """
+
+        :return: list of ip addresses with a verified copy
+
+        """
+        return [ ip_address for ip_address, host_status in self.map_host_statuses.items() if host_status.is_verified ]
+
+
+    def get_failed(self):
+        """
+
+        :return: list of ip addresses without a verified copy
+
+        """
+        return [ ip_address for ip_address, host_status in self.map_host_statuses.items() if not host_status.is_verified ]
+
+
+    def get_cleanup_failed(self):
+        """
+
+        :return: list of ip addresses where the relay key couldn't be removed
+
+        """
+        return [ ip_address for ip_address, host_status in self.map_host_statuses.items() if host_status.cleanup_error != None ]
+
+
+    def __str__(self):
+        """ """
+        end_time = self.end_time
+        if end_time == None: end_time = time.time()
+        lines = [ 'RemoteFanoutResult: hosts=' + str(len(self.map_host_statuses)) + ', verified=' + str(len(self.get_verified())) +
+                  ', failed=' + str(len(self.get_failed())) + ', cleanup_failed=' + str(len(self.get_cleanup_failed())) + ', elapsed_secs=' + str(round(end_time - self.start_time, 3)) ]
+        for ip_address in self.get_failed():
+            lines.append( '   Failed: ip_address=' + ip_address + ', errors=' + str(self.map_host_statuses[ip_address].errors) )
+        for ip_address in self.get_cleanup_failed():
+            lines.append( '   Cleanup failed: ip_address=' + ip_address + ', error=' + self.map_host_statuses[ip_address].cleanup_error )
+        return '\n'.join( lines )
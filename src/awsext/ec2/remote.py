@@ -19,17 +19,117 @@ Classes for remote SSH data transfer and processing
 :version: 1.1
 """
 
+import os
+import time
+import socket
 import threading
-import paramiko
 import traceback
+import awsext.exception
+from awsext.workerpool import WorkerPool, RateLimiter
+from awsext.ec2.sshpool import SshPooledConnection
+import awsext.ec2.transfer
+from awsext.ec2.remoteoutput import OutputCapture, ProcessIdFilter, drain_channel, STREAM_NAME_STD_OUT, STREAM_NAME_STD_ERR
 import logging
 logger = logging.getLogger(__name__)
 
 
+def probe_ssh_ready( ip_address, port=22, username='ec2-user', key_filename=None, timeout=5 ):
+    """Check if a host accepts SSH connections: TCP connect, then a full handshake and authentication if key_filename is
+    passed (the key is installed by cloud-init shortly after sshd starts), else only wait for the SSH banner
+
+    :param ip_address: ip address to SSH into
+    :param port: SSH port (Default value = 22)
+    :param username: user name for SSH (Default value = 'ec2-user')
+    :param key_filename: If not None, path/name.ext of key file used to authenticate (Default value = None)
+    :param timeout: max seconds for the TCP connect and for the handshake (Default value = 5)
+    :return: True if ready, False if the connection was refused, timed out or failed
+
+    """
+    try:
+        probe_socket = socket.create_connection( (ip_address, port), timeout )
+        try:
+            banner = probe_socket.recv( 4 )
+        finally:
+            probe_socket.close()
+        if banner != 'SSH-': return False
+        if key_filename == None: return True
+        ssh_connection = SshPooledConnection( ip_address, username=username, key_filename=key_filename, keepalive_secs=0, port=port )
+        try:
+            ssh_connection.connect( timeout=timeout )
+        finally:
+            ssh_connection.close()
+        return True
+    # paramiko.SSHException isn't a StandardError
+    except Exception as e:
+        logger.debug( 'SSH not ready: ' + ip_address + ', ' + str(e) )
+        return False
+
+
+class RemoteDeadline():
+    """Deadline shared by the hosts of a batch, can be shortened (i.e. for stragglers) or cancelled while the hosts are running """
+
+    def __init__(self, timeout_secs=None, cancel_event=None, is_cancellable=False ):
+        """
+
+        :param timeout_secs: If not None, max seconds from now for the batch (Default value = None)
+        :param cancel_event: If not None, threading.Event that cancels the batch when set (Default value = None)
+        :param is_cancellable: If True, the batch can be cancelled from another thread, implied by cancel_event (Default value = False)
+
+        """
+        self.expires_at = None
+        if timeout_secs != None: self.expires_at = time.time() + timeout_secs
+        self.is_cancellable = is_cancellable or cancel_event != None
+        if cancel_event == None: cancel_event = threading.Event()
+        self.cancel_event = cancel_event
+
+
+    def expire_in(self, secs ):
+        """Shorten the deadline to secs from now, a later deadline is ignored
+
+        :param secs: max seconds from now
+
+        """
+        expires_at = time.time() + secs
+        if self.expires_at == None or expires_at < self.expires_at: self.expires_at = expires_at
+
+
+    def cancel(self):
+        """ """
+        self.cancel_event.set()
+
+
+    def is_cancelled(self):
+        """ """
+        return self.cancel_event.is_set()
+
+
+    def can_expire(self):
+        """
+
+        :return: True if the deadline is set or the batch can be cancelled, i.e. a running command may have to be stopped
+
+        """
+        return self.expires_at != None or self.is_cancellable or self.cancel_event.is_set()
+
+
+    def is_expired(self, request_expires_at=None ):
+        """
+
+        :param request_expires_at: If not None, time.time() deadline of the current request (Default value = None)
+        :return: True if cancelled or either deadline has passed
+
+        """
+        if self.cancel_event.is_set(): return True
+        now = time.time()
+        if self.expires_at != None and now >= self.expires_at: return True
+        return request_expires_at != None and now >= request_expires_at
+
+
 class RemoteRunThread(threading.Thread):
     """SSH into remote, SCP data to remote, run executables on remote"""
 
-    def __init__(self, thread_num, ip_address, timeout=60, username='ec2-user', key_filename=None, remote_run_requests=None ):
+    def __init__(self, thread_num, ip_address, timeout=60, username='ec2-user', key_filename=None, remote_run_requests=None,
+                 rate_limiter=None, ssh_pool=None, output_callback=None, max_output_bytes=65536, spool_dir=None, port=22, deadline=None ):
         """
 
         :param thread_num: unique thread number, used for tracking/logging
@@ -38,6 +138,16 @@ class RemoteRunThread(threading.Thread):
         :param username: user name for SSH (Default value = 'ec2-user')
         :param key_filename: path/name.ext of key file used to connect to remote (Default value = None)
         :param remote_run_requests: list of awsext.ec2.remote.RemoteRunRequest to process (Default value = None)
+        :param rate_limiter: :class:`awsext.workerpool.RateLimiter` acquired before the SSH handshake (Default value = None)
+        :param ssh_pool: If not None, reuse the :class:`awsext.ec2.sshpool.SshConnectionPool` connection to the host and leave
+                it open, else connect and close (Default value = None)
+        :param output_callback: If not None, called with (ip_address, stream_name, line) for each line of STD_OUT/STD_ERR as it arrives (Default value = None)
+        :param max_output_bytes: max bytes of STD_OUT and of STD_ERR kept in each RemoteRunResponse, half from the start 
+                and half from the end of the output (Default value = 65536)
+        :param spool_dir: If not None, the full STD_OUT/STD_ERR of each command is written to files in this directory (Default value = None)
+        :param port: SSH port (Default value = 22)
+        :param deadline: If not None, :class:`awsext.ec2.remote.RemoteDeadline` of the batch, checked before each request and 
+                while waiting for each command (Default value = None)
         :return: self.remote_run_responses contains awsext.ec2.remote.RemoteRunResponse for each processed awsext.ec2.remote.RemoteRunRequest
 
         """
@@ -49,44 +159,113 @@ class RemoteRunThread(threading.Thread):
         self.username = username
         self.key_filename = key_filename
         self.remote_run_requests = remote_run_requests
+        self.rate_limiter = rate_limiter
+        self.ssh_pool = ssh_pool
+        self.output_callback = output_callback
+        self.max_output_bytes = max_output_bytes
+        self.spool_dir = spool_dir
+        self.port = port
+        if deadline == None: deadline = RemoteDeadline()
+        self.deadline = deadline
         self.remote_run_responses = []
         self.is_max_return_code_exceeded = False
+        self.is_timed_out = False
         self.exception = None
 
 
     def run(self):
         """Attempt to connect to remote and process each remote_run_request """
-        ssh = None
+        ssh_connection = None
         try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect( self.ip_address, timeout=self.timeout, username=self.username, key_filename=self.key_filename )
+            self.check_deadline( None )
+            if self.ssh_pool != None:
+                ssh_connection = self.ssh_pool.get_connection( self.ip_address, username=self.username, key_filename=self.key_filename, 
+                                                               timeout=self.timeout, rate_limiter=self.rate_limiter, port=self.port )
+            else:
+                ssh_connection = SshPooledConnection( self.ip_address, username=self.username, key_filename=self.key_filename, keepalive_secs=0, port=self.port )
+                ssh_connection.connect( timeout=self.timeout, rate_limiter=self.rate_limiter )
             
-            for remote_run_request in self.remote_run_requests:
-                std_out = ''
-                std_err = ''
-                std_out_lines = ''
-                std_err_lines = ''
+            for request_num, remote_run_request in enumerate(self.remote_run_requests):
+                self.check_deadline( remote_run_request.cmd_line )
+                std_out_capture = None
+                std_err_capture = None
                 returncode = 0
+                transfer_bytes = 0
+                transfer_start = time.time()
+                # transfers are stopped at the batch deadline, RemoteRunRequest.timeout_secs only limits cmd_line
+                is_transfer_expired = lambda: self.deadline.is_expired()
+                try:
+                    # the idle SFTP session is reused for all requests (and across batches when pooled), threads sharing a pooled
+                    # connection each hold their own session while transferring
+                    if remote_run_request.from_file != None or remote_run_request.upload_manifest != None:
+                        sftp_client = ssh_connection.acquire_sftp()
+                        is_sftp_reusable = False
+                        try:
+                            if remote_run_request.from_file != None:
+                                mode = None
+                                if remote_run_request.chmod_executable: mode = awsext.ec2.transfer.get_executable_mode( remote_run_request.from_file )
+                                transfer_bytes += awsext.ec2.transfer.put_file( sftp_client, remote_run_request.from_file, remote_run_request.to_file, mode=mode,
+                                                                                is_expired=is_transfer_expired )
+                            if remote_run_request.upload_manifest != None:
+                                transfer_bytes += awsext.ec2.transfer.upload_manifest( sftp_client, remote_run_request.upload_manifest, 
+                                                                                       max_concurrent=remote_run_request.max_concurrent_uploads, ssh_connection=ssh_connection,
+                                                                                       is_expired=is_transfer_expired )
+                            is_sftp_reusable = True
+                        finally:
+                            ssh_connection.release_sftp( sftp_client, is_reusable=is_sftp_reusable )
+    
+                    if remote_run_request.sync_from_dir != None:
+                        remote_sync_result = awsext.ec2.transfer.sync_dir_to_remote( ssh_connection, remote_run_request.sync_from_dir, remote_run_request.sync_to_dir,
+                                                        local_hash_cache=remote_run_request.sync_hash_cache, is_delete=remote_run_request.is_sync_delete,
+                                                        max_concurrent=remote_run_request.max_concurrent_uploads, is_expired=is_transfer_expired )
+                        logger.info( self.ip_address + ' ' + str(remote_sync_result) )
+                        transfer_bytes += remote_sync_result.num_bytes
+    
+                    if remote_run_request.tar_from_dir != None:
+                        transfer_bytes += awsext.ec2.transfer.put_tar_stream( ssh_connection, remote_run_request.tar_from_dir, remote_run_request.tar_to_dir, 
+                                                                              compress_level=remote_run_request.tar_compress_level, is_expired=is_transfer_expired )
+                except awsext.exception.RemoteCommandTimeoutError as e:
+                    raise self.create_timeout_error( remote_run_request.cmd_line )
+                transfer_secs = time.time() - transfer_start
                 
-                if remote_run_request.from_file != None:
-                    sftp_client = ssh.open_sftp()
-                    sftp_client.put( remote_run_request.from_file, remote_run_request.to_file )
-                    sftp_client.close()
-                
+                timeout_error = None
+                duration_secs = 0.0
                 if remote_run_request.cmd_line != None:
-                    chan = ssh._transport.open_session()   
-                    chan.exec_command( remote_run_request.cmd_line )
-                    if remote_run_request.is_wait_cmd_complete:            
-                        # note that out/err doesn't have inter-stream ordering locked down.
-                        std_out = chan.makefile('rb', -1)
-                        std_err = chan.makefile_stderr('rb', -1)
-                        std_out_lines = ''.join(std_out.readlines())
-                        std_err_lines = ''.join(std_err.readlines())
-                        returncode = chan.recv_exit_status()
-                    chan.close()
+                    std_out_capture = self.create_output_capture( STREAM_NAME_STD_OUT, request_num )
+                    std_err_capture = self.create_output_capture( STREAM_NAME_STD_ERR, request_num )
+                    request_expires_at = None
+                    if remote_run_request.timeout_secs != None: request_expires_at = time.time() + remote_run_request.timeout_secs
+                    is_expired = lambda: self.deadline.is_expired( request_expires_at )
+                    # the remote shell leads the command's process group, its pid is the first line of STD_OUT, only needed
+                    # if the command can be stopped
+                    process_id_filter = None
+                    cmd_line = remote_run_request.cmd_line
+                    if remote_run_request.is_kill_on_timeout and remote_run_request.is_wait_cmd_complete and \
+                            (request_expires_at != None or self.deadline.can_expire()):
+                        process_id_filter = ProcessIdFilter( std_out_capture )
+                        cmd_line = 'echo $$; ' + cmd_line
+                    cmd_start = time.time()
+                    chan = ssh_connection.open_session()
+                    try:
+                        chan.exec_command( cmd_line )
+                        if remote_run_request.is_wait_cmd_complete:            
+                            # note that out/err doesn't have inter-stream ordering locked down.
+                            returncode = drain_channel( chan, process_id_filter or std_out_capture, std_err_capture, is_expired=is_expired )
+                    except awsext.exception.RemoteCommandTimeoutError as e:
+                        timeout_error = self.create_timeout_error( remote_run_request.cmd_line )
+                        returncode = None
+                    finally:
+                        ssh_connection.close_session( chan )
+                        std_out_capture.close()
+                        std_err_capture.close()
+                    duration_secs = time.time() - cmd_start
+                    if timeout_error != None and process_id_filter != None and process_id_filter.process_id != None:
+                        self.kill_process_group( ssh_connection, process_id_filter.process_id )
                 
-                self.remote_run_responses.append( RemoteRunResponse( returncode=returncode, std_out=std_out_lines, std_err=std_err_lines, cmd_line=remote_run_request.cmd_line ))
+                self.remote_run_responses.append( self.create_response( remote_run_request, returncode, std_out_capture, std_err_capture,
+                                                                        transfer_bytes=transfer_bytes, transfer_secs=transfer_secs,
+                                                                        is_timed_out=timeout_error != None, duration_secs=duration_secs ) )
+                if timeout_error != None: raise timeout_error
                 # max_return_code=None means "don't check the return code, i.e. don't fail on a delete during cleanup
                 # if the max_return_code is specified and this execution exceeds it then stop processing
                 if remote_run_request.max_returncode != None and returncode > remote_run_request.max_returncode:
@@ -94,17 +273,391 @@ class RemoteRunThread(threading.Thread):
                     break
             
             
-        except StandardError as e:
+        except awsext.exception.RemoteCommandTimeoutError as e:
+            logger.warn( e )
+            self.is_timed_out = True
+            self.exception = e
+        # paramiko.SSHException isn't a StandardError
+        except Exception as e:
             logger.error( e )
             logger.error( traceback.format_exc() )
             self.exception = e
         finally:
-            if ssh != None: ssh.close()
+            if ssh_connection != None:
+                if self.ssh_pool != None: self.ssh_pool.release_connection( ssh_connection )
+                else: ssh_connection.close()
+
+
+    def check_deadline(self, cmd_line ):
+        """
+
+        :param cmd_line: command line of the next request, for the exception
+        :raise awsext.exception.RemoteCommandTimeoutError: if the batch is cancelled or past its deadline
+
+        """
+        if self.deadline.is_expired(): raise self.create_timeout_error( cmd_line )
+
+
+    def create_timeout_error(self, cmd_line ):
+        """
+
+        :param cmd_line: command line that was running or about to run
+        :return: :class:`awsext.exception.RemoteCommandTimeoutError`
+
+        """
+        is_cancelled = self.deadline.is_cancelled()
+        if is_cancelled: message = 'Cancelled: ' + self.ip_address
+        else: message = 'Timed out: ' + self.ip_address
+        if cmd_line != None: message += ', cmd_line=' + cmd_line
+        return awsext.exception.RemoteCommandTimeoutError( message, ip_address=self.ip_address, cmd_line=cmd_line, is_cancelled=is_cancelled )
+
+
+    def kill_process_group(self, ssh_connection, process_id, grace_secs=2, timeout_secs=10 ):
+        """Kill the process group of a timed out command, SIGTERM then SIGKILL after grace_secs.  Closing the channel
+        doesn't stop a remote command started without a pty
+
+        :param ssh_connection: connected :class:`awsext.ec2.sshpool.SshPooledConnection`
+        :param process_id: pid of the remote shell that leads the process group
+        :param grace_secs: seconds between SIGTERM and SIGKILL (Default value = 2)
+        :param timeout_secs: max seconds to wait for the kill command (Default value = 10)
+
+        """
+        process_group = str(process_id)
+        # no '--', dash's kill doesn't accept it
+        cmd_line = ('kill -TERM -' + process_group + ' 2>/dev/null || exit 0; i=0; while kill -0 -' + process_group + ' 2>/dev/null && [ $i -lt ' + 
+                    str(grace_secs) + ' ]; do sleep 1; i=$((i+1)); done; kill -KILL -' + process_group + ' 2>/dev/null; exit 0')
+        expires_at = time.time() + timeout_secs
+        try:
+            chan = ssh_connection.open_session()
+            try:
+                chan.exec_command( cmd_line )
+                drain_channel( chan, OutputCapture( STREAM_NAME_STD_OUT, 0, 0 ), OutputCapture( STREAM_NAME_STD_ERR, 0, 0 ), 
+                               is_expired=lambda: time.time() >= expires_at )
+            finally:
+                ssh_connection.close_session( chan )
+        # paramiko.SSHException isn't a StandardError
+        except Exception as e:
+            logger.warn( 'Kill failed: ' + self.ip_address + ', process group ' + process_group + ', ' + str(e) )
+
+
+    def create_output_capture(self, stream_name, request_num ):
+        """
+
+        :param stream_name: STREAM_NAME_STD_OUT or STREAM_NAME_STD_ERR
+        :param request_num: offset of the request in remote_run_requests
+        :return: :class:`awsext.ec2.remoteoutput.OutputCapture` based on max_output_bytes, spool_dir and output_callback
+
+        """
+        spool_path = None
+        if self.spool_dir != None: 
+            spool_path = os.path.join( self.spool_dir, self.ip_address + '_' + str(self.thread_num) + '_' + str(request_num) + '.' + stream_name )
+        line_callback = None
+        if self.output_callback != None:
+            ip_address = self.ip_address
+            output_callback = self.output_callback
+            line_callback = lambda stream_name, line: output_callback( ip_address, stream_name, line )
+        return OutputCapture( stream_name, max_head_bytes=self.max_output_bytes // 2, max_tail_bytes=self.max_output_bytes // 2, 
+                              spool_path=spool_path, line_callback=line_callback )
+
+
+    def create_response(self, remote_run_request, returncode, std_out_capture, std_err_capture, transfer_bytes=0, transfer_secs=0.0, is_timed_out=False,
+                        duration_secs=0.0 ):
+        """
+
+        :param remote_run_request: processed :class:`awsext.ec2.remote.RemoteRunRequest`
+        :param returncode: return code of remote command
+        :param std_out_capture: :class:`awsext.ec2.remoteoutput.OutputCapture` of STD_OUT, None if no command was run
+        :param std_err_capture: :class:`awsext.ec2.remoteoutput.OutputCapture` of STD_ERR, None if no command was run
+        :param transfer_bytes: bytes transferred by the file/directory steps of the request (Default value = 0)
+        :param transfer_secs: elapsed seconds of the file/directory steps of the request (Default value = 0.0)
+        :param is_timed_out: True if the command was stopped at the deadline (Default value = False)
+        :param duration_secs: elapsed seconds of the command (Default value = 0.0)
+        :return: :class:`awsext.ec2.remote.RemoteRunResponse`
+
+        """
+        if std_out_capture == None: return RemoteRunResponse( returncode=returncode, cmd_line=remote_run_request.cmd_line, 
+                                                              transfer_bytes=transfer_bytes, transfer_secs=transfer_secs, duration_secs=duration_secs )
+        return RemoteRunResponse( returncode=returncode, std_out=std_out_capture.get_text(), std_err=std_err_capture.get_text(), 
+                                  cmd_line=remote_run_request.cmd_line, std_out_bytes=std_out_capture.num_bytes, 
+                                  std_err_bytes=std_err_capture.num_bytes, std_out_spool_path=std_out_capture.spool_path, 
+                                  std_err_spool_path=std_err_capture.spool_path, transfer_bytes=transfer_bytes, transfer_secs=transfer_secs,
+                                  is_timed_out=is_timed_out, duration_secs=duration_secs )
+
+
+    def is_succeeded(self):
+        """ 
+
+        :return: True if all requests were processed without an exception, timing out or exceeding max_returncode
+
+        """
+        return self.exception == None and not self.is_max_return_code_exceeded
+        
+
+class RemoteFleetExecutor():
+    """Process RemoteRunRequest lists for many hosts on a bounded number of worker threads, with a limited
+    SSH handshake rate, instead of starting one RemoteRunThread per host """
+
+    def __init__(self, max_workers=32, handshakes_per_sec=10, timeout=60, username='ec2-user', key_filename=None, ssh_pool=None,
+                 output_callback=None, max_output_bytes=65536, spool_dir=None, port=22 ):
+        """
+
+        :param max_workers: max number of hosts processed concurrently (Default value = 32)
+        :param handshakes_per_sec: max SSH handshakes started per second, None for unlimited (Default value = 10)
+        :param timeout:  max time to wait for each SSH connection (Default value = 60)
+        :param username: user name for SSH (Default value = 'ec2-user')
+        :param key_filename: path/name.ext of key file used to connect to remote (Default value = None)
+        :param ssh_pool: If not None, :class:`awsext.ec2.sshpool.SshConnectionPool` reused across runs (Default value = None)
+        :param output_callback: If not None, called with (ip_address, stream_name, line) for each line of output as it arrives (Default value = None)
+        :param max_output_bytes: max bytes of STD_OUT and of STD_ERR kept in each RemoteRunResponse (Default value = 65536)
+        :param spool_dir: If not None, the full output of each command is written to files in this directory (Default value = None)
+        :param port: SSH port of all hosts (Default value = 22)
+
+        """
+        self.max_workers = max_workers
+        self.handshakes_per_sec = handshakes_per_sec
+        self.timeout = timeout
+        self.username = username
+        self.key_filename = key_filename
+        self.ssh_pool = ssh_pool
+        self.output_callback = output_callback
+        self.max_output_bytes = max_output_bytes
+        self.spool_dir = spool_dir
+        self.port = port
+        self.active_deadlines = set()
+        self.lock = threading.Lock()
+
+
+    def cancel(self):
+        """Cancel the running batches (iter_run, run, run_table and run_dag) from any thread: running commands and transfers 
+        are stopped (and the command's process group killed if RemoteRunRequest.is_kill_on_timeout) and hosts/steps not 
+        yet started are skipped, all are marked is_timed_out.  Only the batches running now are cancelled, later runs aren't affected """
+        with self.lock:
+            for deadline in self.active_deadlines: deadline.cancel()
+
+
+    def start_deadline(self, timeout_secs ):
+        """Create the deadline of a batch, cancelled by cancel() until end_deadline
+
+        :param timeout_secs: If not None, max seconds for the batch
+        :return: :class:`awsext.ec2.remote.RemoteDeadline`
+
+        """
+        deadline = RemoteDeadline( timeout_secs=timeout_secs, is_cancellable=True )
+        with self.lock:
+            self.active_deadlines.add( deadline )
+        return deadline
+
+
+    def end_deadline(self, deadline ):
+        """
+
+        :param deadline: :class:`awsext.ec2.remote.RemoteDeadline` from start_deadline
+
+        """
+        with self.lock:
+            self.active_deadlines.discard( deadline )
+
+
+    def iter_run(self, host_run_requests, callback=None, timeout_secs=None, straggler_fraction=None, straggler_grace_secs=60 ):
+        """Process each host's RemoteRunRequest list, yielding results as each host completes
+
+        :param host_run_requests: dict of ip address to list of RemoteRunRequest, or iterable of (ip_address, list of RemoteRunRequest)
+        :param callback: If not None, called with each completed RemoteRunThread (Default value = None)
+        :param timeout_secs: If not None, max seconds for the batch, hosts still running (including transfers) are stopped and marked is_timed_out (Default value = None)
+        :param straggler_fraction: If not None, once this fraction of the hosts (i.e. 0.9) has completed, the remaining hosts 
+                get straggler_grace_secs more before they are stopped and marked is_timed_out (Default value = None)
+        :param straggler_grace_secs: seconds allowed for the stragglers (Default value = 60)
+        :return: generator of processed (not started) :class:`awsext.ec2.remote.RemoteRunThread`, in completion order, 
+                each containing ip_address, remote_run_responses, is_max_return_code_exceeded, is_timed_out and exception
+
+        """
+        if isinstance( host_run_requests, dict ): host_run_requests = host_run_requests.items()
+        host_run_requests = list( host_run_requests )
+        deadline = self.start_deadline( timeout_secs )
+        num_stragglers_at = None
+        if straggler_fraction != None: num_stragglers_at = max( 1, int( straggler_fraction * len(host_run_requests) ) )
+        rate_limiter = None
+        if self.handshakes_per_sec != None: rate_limiter = RateLimiter( self.handshakes_per_sec )
+
+        def run_host( thread_num_host_run_request ):
+            thread_num, (ip_address, remote_run_requests) = thread_num_host_run_request
+            remote_run_thread = RemoteRunThread( thread_num, ip_address, timeout=self.timeout, username=self.username, 
+                                                 key_filename=self.key_filename, remote_run_requests=remote_run_requests, 
+                                                 rate_limiter=rate_limiter, ssh_pool=self.ssh_pool, output_callback=self.output_callback,
+                                                 max_output_bytes=self.max_output_bytes, spool_dir=self.spool_dir, port=self.port,
+                                                 deadline=deadline )
+            # run on the worker thread, the RemoteRunThread is never started
+            remote_run_thread.run()
+            return remote_run_thread
+
+        worker_pool = WorkerPool( max_workers=self.max_workers, name_prefix='remote-fleet' )
+        try:
+            for num_completed, work_item in enumerate( worker_pool.imap_unordered( run_host, enumerate( host_run_requests ) ), 1 ):
+                remote_run_thread = work_item.get()
+                if num_completed == num_stragglers_at and num_completed < len(host_run_requests):
+                    logger.info( 'Stragglers: ' + str(len(host_run_requests) - num_completed) + ' hosts remaining, stopping in ' + str(straggler_grace_secs) + ' secs' )
+                    deadline.expire_in( straggler_grace_secs )
+                if callback != None: callback( remote_run_thread )
+                yield remote_run_thread
+        finally:
+            worker_pool.shutdown()
+            self.end_deadline( deadline )
+
+
+    def fanout_file(self, ip_addresses, from_file, to_file, fanout=3, map_relay_ip_addresses=None, max_attempts=3 ):
+        """Copy a file to all hosts in a k-ary tree, hosts relay the file to each other, see :class:`awsext.ec2.fanout.RemoteFanout`
+
+        :param ip_addresses: list of ip addresses
+        :param from_file: local path/name.ext
+        :param to_file: remote path/name.ext
+        :param fanout: max concurrent transfers from each parent, including the local host (Default value = 3)
+        :param map_relay_ip_addresses: dict of ip address to the address used between hosts, i.e. the private ip (Default value = None)
+        :param max_attempts: max transfer attempts per host, each from a different parent (Default value = 3)
+        :return: :class:`awsext.ec2.fanout.RemoteFanoutResult`
+
+        """
+        from awsext.ec2.fanout import RemoteFanout
+        remote_fanout = RemoteFanout( fanout=fanout, username=self.username, key_filename=self.key_filename, timeout=self.timeout, 
+                                      ssh_pool=self.ssh_pool, max_workers=self.max_workers, max_attempts=max_attempts )
+        return remote_fanout.distribute( ip_addresses, from_file, to_file, map_relay_ip_addresses=map_relay_ip_addresses )
+
+
+    def run_dag(self, host_run_requests, map_host_group_names=None, max_per_host=1, failure_policy='continue', is_implicit_host_order=True, callback=None,
+                timeout_secs=None ):
+        """Run the requests of all hosts as a DAG based on RemoteRunRequest.depends_on, see :class:`awsext.ec2.remotedag.RemoteDagScheduler`
+
+        :param host_run_requests: dict of ip address to list of RemoteRunRequest, or iterable of (ip_address, list of RemoteRunRequest)
+        :param map_host_group_names: dict of ip address to list of group names (Default value = None)
+        :param max_per_host: max steps running concurrently on one host (Default value = 1)
+        :param failure_policy: 'fail_fast', 'continue' or 'quarantine_host' (Default value = 'continue')
+        :param is_implicit_host_order: If True, each step also depends on the previous step of its host (Default value = True)
+        :param callback: If not None, called with each completed RemoteDagStep (Default value = None)
+        :param timeout_secs: If not None, max seconds for the DAG, running steps are stopped and failed, steps not yet started are skipped (Default value = None)
+        :return: :class:`awsext.ec2.remotedag.RemoteDagResult`
+
+        """
+        from awsext.ec2.remotedag import RemoteDagScheduler
+        if isinstance( host_run_requests, dict ): host_run_requests = host_run_requests.items()
+        if map_host_group_names == None: map_host_group_names = {}
+        remote_dag_scheduler = RemoteDagScheduler( max_workers=self.max_workers, max_per_host=max_per_host, handshakes_per_sec=self.handshakes_per_sec,
+                                                   timeout=self.timeout, username=self.username, key_filename=self.key_filename, ssh_pool=self.ssh_pool,
+                                                   failure_policy=failure_policy, is_implicit_host_order=is_implicit_host_order, 
+                                                   output_callback=self.output_callback, max_output_bytes=self.max_output_bytes, spool_dir=self.spool_dir,
+                                                   port=self.port )
+        for ip_address, remote_run_requests in host_run_requests:
+            remote_dag_scheduler.add_host( ip_address, remote_run_requests, group_names=map_host_group_names.get( ip_address ) )
+        deadline = self.start_deadline( timeout_secs )
+        try:
+            return remote_dag_scheduler.run( callback=callback, deadline=deadline )
+        finally:
+            self.end_deadline( deadline )
+
+
+    def run(self, host_run_requests, callback=None, timeout_secs=None, straggler_fraction=None, straggler_grace_secs=60 ):
+        """Process each host's RemoteRunRequest list and wait for all hosts to complete
+
+        :param host_run_requests: dict of ip address to list of RemoteRunRequest, or iterable of (ip_address, list of RemoteRunRequest)
+        :param callback: If not None, called with each completed RemoteRunThread (Default value = None)
+        :param timeout_secs: If not None, max seconds for the batch, see iter_run (Default value = None)
+        :param straggler_fraction: If not None, fraction of hosts completed before the stragglers are limited, see iter_run (Default value = None)
+        :param straggler_grace_secs: seconds allowed for the stragglers (Default value = 60)
+        :return: :class:`awsext.ec2.remote.RemoteFleetSummary`
+
+        """
+        remote_fleet_summary = RemoteFleetSummary()
+        for remote_run_thread in self.iter_run( host_run_requests, callback=callback, timeout_secs=timeout_secs, 
+                                                straggler_fraction=straggler_fraction, straggler_grace_secs=straggler_grace_secs ):
+            remote_fleet_summary.add( remote_run_thread )
+        remote_fleet_summary.end_time = time.time()
+        return remote_fleet_summary
+
+
+    def run_table(self, host_run_requests, timeout_secs=None, straggler_fraction=None, straggler_grace_secs=60, remote_result_table=None ):
+        """Process each host's RemoteRunRequest list, keeping the results in a columnar table instead of a RemoteRunThread 
+        per host, i.e. for 10,000's of hosts
+
+        :param host_run_requests: dict of ip address to list of RemoteRunRequest, or iterable of (ip_address, list of RemoteRunRequest)
+        :param timeout_secs: If not None, max seconds for the batch, see iter_run (Default value = None)
+        :param straggler_fraction: If not None, fraction of hosts completed before the stragglers are limited, see iter_run (Default value = None)
+        :param straggler_grace_secs: seconds allowed for the stragglers (Default value = 60)
+        :param remote_result_table: If not None, :class:`awsext.ec2.remoteresults.RemoteResultTable` the rows are added to (Default value = None)
+        :return: :class:`awsext.ec2.remoteresults.RemoteResultTable`
+
+        """
+        from awsext.ec2.remoteresults import RemoteResultTable
+        if remote_result_table == None: remote_result_table = RemoteResultTable()
+        for remote_run_thread in self.iter_run( host_run_requests, timeout_secs=timeout_secs, straggler_fraction=straggler_fraction, 
+                                                straggler_grace_secs=straggler_grace_secs ):
+            remote_result_table.add_remote_run_thread( remote_run_thread )
+        return remote_result_table
+
+
+class RemoteFleetSummary():
+    """Per host results of a RemoteFleetExecutor run """
+
+    def __init__(self):
+        """ """
+        self.start_time = time.time()
+        self.end_time = None
+        self.remote_run_threads = []
+        self.num_succeeded = 0
+        self.num_failed = 0
+        self.num_timed_out = 0
+
+
+    def add(self, remote_run_thread ):
+        """
+
+        :param remote_run_thread: processed :class:`awsext.ec2.remote.RemoteRunThread`
+
+        """
+        self.remote_run_threads.append( remote_run_thread )
+        if remote_run_thread.is_succeeded(): self.num_succeeded += 1
+        else: self.num_failed += 1
+        if remote_run_thread.is_timed_out: self.num_timed_out += 1
+
+
+    def get_failed(self):
+        """
+
+        :return: list of RemoteRunThread that had an exception or exceeded max_returncode
+
+        """
+        return [ remote_run_thread for remote_run_thread in self.remote_run_threads if not remote_run_thread.is_succeeded() ]
+
+
+    def get_timed_out(self):
+        """
+
+        :return: list of RemoteRunThread that were stopped at the deadline or cancelled, a subset of get_failed
+
+        """
+        return [ remote_run_thread for remote_run_thread in self.remote_run_threads if remote_run_thread.is_timed_out ]
+
+
+    def __str__(self):
+        """ """
+        end_time = self.end_time
+        if end_time == None: end_time = time.time()
+        lines = [ 'RemoteFleetSummary: hosts=' + str(len(self.remote_run_threads)) + ', succeeded=' + str(self.num_succeeded) + 
+                  ', failed=' + str(self.num_failed) + ', timed_out=' + str(self.num_timed_out) + ', elapsed_secs=' + str(round(end_time - self.start_time, 3)) ]
+        for remote_run_thread in self.get_failed():
+            if remote_run_thread.exception != None: reason = 'exception=' + str(remote_run_thread.exception)
+            else: reason = 'returncode=' + str(remote_run_thread.remote_run_responses[-1].returncode) + ', cmd_line=' + remote_run_thread.remote_run_responses[-1].cmd_line
+            lines.append( '   Failed: ip_address=' + remote_run_thread.ip_address + ', ' + reason )
+        return '\n'.join( lines )
         
         
-class RemoteRunRequest():
+class RemoteRunRequest(object):
     """Contains all required values to process a remote command """
-    def __init__(self, from_file=None, to_file=None, cmd_line=None, chmod_executable=False, is_wait_cmd_complete=True, max_returncode=0):
+    # no per-instance dict, runs can hold hundreds of thousands of requests
+    __slots__ = ( 'from_file', 'to_file', 'cmd_line', 'chmod_executable', 'is_wait_cmd_complete', 'max_returncode', 'upload_manifest', 
+                  'max_concurrent_uploads', 'sync_from_dir', 'sync_to_dir', 'sync_hash_cache', 'is_sync_delete', 'tar_from_dir', 'tar_to_dir', 
+                  'tar_compress_level', 'step_name', 'depends_on', 'timeout_secs', 'is_kill_on_timeout' )
+
+    def __init__(self, from_file=None, to_file=None, cmd_line=None, chmod_executable=False, is_wait_cmd_complete=True, max_returncode=0,
+                 upload_manifest=None, max_concurrent_uploads=4, sync_from_dir=None, sync_to_dir=None, sync_hash_cache=None, is_sync_delete=False,
+                 tar_from_dir=None, tar_to_dir=None, tar_compress_level=6, step_name=None, depends_on=None, timeout_secs=None, is_kill_on_timeout=True ):
         """
 
         :param from_file: from path/name.ext to be SCP'ed to remote (Default value = None)
@@ -113,6 +666,22 @@ class RemoteRunRequest():
         :param chmod_executable: If true, chmod +x the to_file, i.e. for a script (Default value = False)
         :param is_wait_cmd_complete: If True, wait for remote execution to complete, else start command and return immediately (Default value = True)
         :param max_returncode: max return code to check before stopping processing of requests (Default value = 0)
+        :param upload_manifest: :class:`awsext.ec2.transfer.RemoteUploadManifest` of files/directory trees to upload before cmd_line (Default value = None)
+        :param max_concurrent_uploads: max files of upload_manifest or sync_from_dir uploaded concurrently (Default value = 4)
+        :param sync_from_dir: If not None, local directory synced to sync_to_dir before cmd_line, only new/changed files are transferred (Default value = None)
+        :param sync_to_dir: remote directory of sync_from_dir (Default value = None)
+        :param sync_hash_cache: :class:`awsext.ec2.transfer.LocalHashCache` of sync_from_dir, share one across hosts to hash each file once (Default value = None)
+        :param is_sync_delete: If True, delete files in sync_to_dir that aren't in sync_from_dir (Default value = False)
+        :param tar_from_dir: If not None, local directory streamed as a tar archive over one channel and extracted into tar_to_dir before cmd_line (Default value = None)
+        :param tar_to_dir: remote directory of tar_from_dir (Default value = None)
+        :param tar_compress_level: gzip level of the tar stream 1-9, 0 for uncompressed (Default value = 6)
+        :param step_name: name of the request within its host, referenced by depends_on, see :class:`awsext.ec2.remotedag.RemoteDagScheduler` (Default value = None)
+        :param depends_on: list of step references ('step_name', 'ip_address:step_name', 'group_name:step_name' or '*:step_name') that must
+                succeed first, only used by RemoteDagScheduler (Default value = None)
+        :param timeout_secs: If not None, max seconds to wait for cmd_line, the request is then marked is_timed_out and processing of 
+                the host stops (Default value = None)
+        :param is_kill_on_timeout: If True, the remote process group of cmd_line is killed when it times out or is cancelled, applies
+            if the request has timeout_secs or the thread's deadline can expire (Default value = True)
 
         """
         self.from_file = from_file
@@ -121,24 +690,70 @@ class RemoteRunRequest():
         self.chmod_executable = chmod_executable
         self.is_wait_cmd_complete = is_wait_cmd_complete
         self.max_returncode = max_returncode
+        self.upload_manifest = upload_manifest
+        self.max_concurrent_uploads = max_concurrent_uploads
+        self.sync_from_dir = sync_from_dir
+        self.sync_to_dir = sync_to_dir
+        self.sync_hash_cache = sync_hash_cache
+        self.is_sync_delete = is_sync_delete
+        self.tar_from_dir = tar_from_dir
+        self.tar_to_dir = tar_to_dir
+        self.tar_compress_level = tar_compress_level
+        self.step_name = step_name
+        self.depends_on = depends_on
+        self.timeout_secs = timeout_secs
+        self.is_kill_on_timeout = is_kill_on_timeout
         
         
-class RemoteRunResponse():
-    """Contains the results of a remote execution attempt """
-    def __init__(self, returncode=0, std_out='', std_err='', cmd_line='' ):
+class RemoteRunResponse(object):
+    """Contains the results of a remote execution attempt, see :class:`awsext.ec2.remoteresults.RemoteResultTable` to keep
+    the results of large runs """
+    __slots__ = ( 'returncode', 'std_out', 'std_err', 'cmd_line', 'std_out_bytes', 'std_err_bytes', 'std_out_spool_path', 'std_err_spool_path',
+                  'transfer_bytes', 'transfer_secs', 'is_timed_out', 'duration_secs' )
+
+    def __init__(self, returncode=0, std_out='', std_err='', cmd_line='', std_out_bytes=None, std_err_bytes=None, 
+                 std_out_spool_path=None, std_err_spool_path=None, transfer_bytes=0, transfer_secs=0.0, is_timed_out=False, duration_secs=0.0 ):
         """
 
         :param returncode: return code of remote comand (Default value = 0)
-        :param std_out: STD_OUT of remote command output (Default value = '')
-        :param std_err: STD_ERR of remote command output (Default value = '')
+        :param std_out: STD_OUT of remote command output, possibly truncated to the head and tail (Default value = '')
+        :param std_err: STD_ERR of remote command output, possibly truncated to the head and tail (Default value = '')
         :param cmd_line: command line/args executed on remote (Default value = '')
+        :param std_out_bytes: total bytes of STD_OUT (Default value = None, len(std_out))
+        :param std_err_bytes: total bytes of STD_ERR (Default value = None, len(std_err))
+        :param std_out_spool_path: path/name.ext of file containing the full STD_OUT (Default value = None)
+        :param std_err_spool_path: path/name.ext of file containing the full STD_ERR (Default value = None)
+        :param transfer_bytes: bytes transferred by the file/directory steps of the request (Default value = 0)
+        :param transfer_secs: elapsed seconds of the file/directory steps of the request (Default value = 0.0)
+        :param is_timed_out: True if the command was stopped at the deadline or cancelled, returncode is None (Default value = False)
+        :param duration_secs: elapsed seconds of the command (Default value = 0.0)
 
         """
         self.returncode = returncode
         self.std_out = std_out
         self.std_err = std_err
+        if std_out_bytes == None: std_out_bytes = len(std_out)
+        if std_err_bytes == None: std_err_bytes = len(std_err)
+        self.std_out_bytes = std_out_bytes
+        self.std_err_bytes = std_err_bytes
+        self.std_out_spool_path = std_out_spool_path
+        self.std_err_spool_path = std_err_spool_path
+        self.transfer_bytes = transfer_bytes
+        self.transfer_secs = transfer_secs
+        self.is_timed_out = is_timed_out
+        self.duration_secs = duration_secs
         if cmd_line != None: self.cmd_line = cmd_line
         else: self.cmd_line = ''
+
+
+    def get_transfer_throughput(self):
+        """
+
+        :return: bytes per second of the file/directory steps, 0.0 if nothing was transferred
+
+        """
+        if self.transfer_bytes == 0 or self.transfer_secs <= 0: return 0.0
+        return self.transfer_bytes / self.transfer_secs
         
         
         
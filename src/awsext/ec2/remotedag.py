@@ -0,0 +1,415 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Dependency (DAG) scheduling of RemoteRunRequests across hosts
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import time
+import Queue
+import collections
+from awsext.workerpool import WorkerPool, WorkItem, RateLimiter
+from awsext.ec2.sshpool import SshConnectionPool
+from awsext.ec2.remote import RemoteRunThread, RemoteDeadline
+
+import logging
+logger = logging.getLogger(__name__)
+
+FAILURE_POLICY_FAIL_FAST = 'fail_fast'
+FAILURE_POLICY_CONTINUE = 'continue'
+FAILURE_POLICY_QUARANTINE_HOST = 'quarantine_host'
+
+STEP_STATUS_PENDING = 'pending'
+STEP_STATUS_RUNNING = 'running'
+STEP_STATUS_SUCCEEDED = 'succeeded'
+STEP_STATUS_FAILED = 'failed'
+STEP_STATUS_SKIPPED = 'skipped'
+
+# prefix of a depends_on reference to a step on all hosts, i.e. '*:install'
+ALL_HOSTS = '*'
+
+
+class RemoteDagScheduler():
+    """Run the RemoteRunRequests of many hosts as a DAG.  Each request is a step identified by (ip_address, step_name) and
+    can depend on steps of its own host, of another host or of every host in a group, referenced in depends_on as
+    'step_name', 'ip_address:step_name', 'group_name:step_name' or '*:step_name'.  A step starts as soon as all of its
+    dependencies succeeded, within the max_workers and max_per_host limits, so there are no fleet wide barriers """
+
+    def __init__(self, max_workers=32, max_per_host=1, handshakes_per_sec=10, timeout=60, username='ec2-user', key_filename=None,
+                 ssh_pool=None, failure_policy=FAILURE_POLICY_CONTINUE, is_implicit_host_order=True,
+                 output_callback=None, max_output_bytes=65536, spool_dir=None, port=22 ):
+        """
+
+        :param max_workers: max steps running concurrently across all hosts (Default value = 32)
+        :param max_per_host: max steps running concurrently on one host (Default value = 1)
+        :param handshakes_per_sec: max SSH handshakes started per second, None for unlimited (Default value = 10)
+        :param timeout:  max time to wait for each SSH connection (Default value = 60)
+        :param username: user name for SSH (Default value = 'ec2-user')
+        :param key_filename: path/name.ext of key file used to connect to remote (Default value = None)
+        :param ssh_pool: If not None, :class:`awsext.ec2.sshpool.SshConnectionPool` to reuse, else a pool is created and closed (Default value = None)
+        :param failure_policy: on a failed step, FAILURE_POLICY_FAIL_FAST skips all steps not yet started, FAILURE_POLICY_CONTINUE
+                skips the steps that depend on it and FAILURE_POLICY_QUARANTINE_HOST also skips the remaining steps of its host (Default value = FAILURE_POLICY_CONTINUE)
+        :param is_implicit_host_order: If True, each step also depends on the previous step of its host (Default value = True)
+        :param output_callback: If not None, called with (ip_address, stream_name, line) for each line of output as it arrives (Default value = None)
+        :param max_output_bytes: max bytes of STD_OUT and of STD_ERR kept in each RemoteRunResponse (Default value = 65536)
+        :param spool_dir: If not None, the full output of each command is written to files in this directory (Default value = None)
+        :param port: SSH port of all hosts (Default value = 22)
+
+        """
+        if failure_policy not in ( FAILURE_POLICY_FAIL_FAST, FAILURE_POLICY_CONTINUE, FAILURE_POLICY_QUARANTINE_HOST ):
+            raise ValueError( 'Invalid failure_policy: ' + str(failure_policy) )
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.handshakes_per_sec = handshakes_per_sec
+        self.timeout = timeout
+        self.username = username
+        self.key_filename = key_filename
+        self.ssh_pool = ssh_pool
+        self.failure_policy = failure_policy
+        self.is_implicit_host_order = is_implicit_host_order
+        self.output_callback = output_callback
+        self.max_output_bytes = max_output_bytes
+        self.spool_dir = spool_dir
+        self.port = port
+        self.map_host_steps = collections.OrderedDict()
+        self.map_group_ip_addresses = collections.defaultdict( list )
+
+
+    def add_host(self, ip_address, remote_run_requests, group_names=None ):
+        """
+
+        :param ip_address: ip address to SSH into
+        :param remote_run_requests: list of :class:`awsext.ec2.remote.RemoteRunRequest`, unnamed steps are named 'step_<offset>'
+        :param group_names: list of group names the host belongs to (Default value = None)
+
+        """
+        if ip_address in self.map_host_steps: raise ValueError( 'Duplicate host: ' + ip_address )
+        remote_dag_steps = []
+        step_names = set()
+        for offset, remote_run_request in enumerate( remote_run_requests ):
+            step_name = remote_run_request.step_name
+            if step_name == None: step_name = 'step_' + str(offset)
+            if step_name in step_names: raise ValueError( 'Duplicate step_name on ' + ip_address + ': ' + step_name )
+            step_names.add( step_name )
+            remote_dag_steps.append( RemoteDagStep( ip_address, step_name, remote_run_request ) )
+        self.map_host_steps[ ip_address ] = remote_dag_steps
+        if group_names != None:
+            for group_name in group_names: self.map_group_ip_addresses[ group_name ].append( ip_address )
+
+
+    def resolve(self):
+        """Link each step to its dependencies, raises ValueError on an unknown reference or a cycle
+
+        :return: list of all :class:`awsext.ec2.remotedag.RemoteDagStep`
+
+        """
+        map_steps = {}
+        for ip_address, remote_dag_steps in self.map_host_steps.items():
+            for remote_dag_step in remote_dag_steps:
+                remote_dag_step.dependencies = set()
+                remote_dag_step.dependents = []
+                map_steps[ (ip_address, remote_dag_step.step_name) ] = remote_dag_step
+
+        all_steps = []
+        for ip_address, remote_dag_steps in self.map_host_steps.items():
+            prev_remote_dag_step = None
+            for remote_dag_step in remote_dag_steps:
+                if self.is_implicit_host_order and prev_remote_dag_step != None: remote_dag_step.dependencies.add( prev_remote_dag_step )
+                depends_on = remote_dag_step.remote_run_request.depends_on
+                if depends_on != None:
+                    for step_ref in depends_on:
+                        for dependency in self.find_steps( ip_address, step_ref, map_steps ):
+                            if dependency is remote_dag_step: raise ValueError( 'Step depends on itself: ' + str(remote_dag_step) )
+                            remote_dag_step.dependencies.add( dependency )
+                prev_remote_dag_step = remote_dag_step
+                all_steps.append( remote_dag_step )
+        for remote_dag_step in all_steps:
+            for dependency in remote_dag_step.dependencies: dependency.dependents.append( remote_dag_step )
+
+        # Kahn's algorithm, any step never reaching zero unmet dependencies is on a cycle
+        map_num_unmet = dict( [ (remote_dag_step, len(remote_dag_step.dependencies)) for remote_dag_step in all_steps ] )
+        ready_steps = [ remote_dag_step for remote_dag_step in all_steps if map_num_unmet[remote_dag_step] == 0 ]
+        num_visited = 0
+        while len(ready_steps) > 0:
+            remote_dag_step = ready_steps.pop()
+            num_visited += 1
+            for dependent in remote_dag_step.dependents:
+                map_num_unmet[ dependent ] -= 1
+                if map_num_unmet[ dependent ] == 0: ready_steps.append( dependent )
+        if num_visited < len(all_steps):
+            cycle_steps = [ str(remote_dag_step) for remote_dag_step in all_steps if map_num_unmet[remote_dag_step] > 0 ]
+            raise ValueError( 'Dependency cycle between steps: ' + ', '.join( cycle_steps ) )
+        return all_steps
+
+
+    def find_steps(self, ip_address, step_ref, map_steps ):
+        """
+
+        :param ip_address: host of the step the reference belongs to
+        :param step_ref: 'step_name', 'ip_address:step_name', 'group_name:step_name' or '*:step_name'
+        :param map_steps: dict of (ip_address, step_name) to RemoteDagStep
+        :return: list of referenced :class:`awsext.ec2.remotedag.RemoteDagStep`
+
+        """
+        if ':' not in step_ref: target_ip_addresses, step_name = [ ip_address ], step_ref
+        else:
+            # rsplit, so IPv6 addresses can be referenced
+            target, step_name = step_ref.rsplit( ':', 1 )
+            if target == ALL_HOSTS: target_ip_addresses = [ check_ip_address for check_ip_address, remote_dag_steps in self.map_host_steps.items()
+                                                            if (check_ip_address, step_name) in map_steps ]
+            elif target in self.map_group_ip_addresses: target_ip_addresses = self.map_group_ip_addresses[ target ]
+            else: target_ip_addresses = [ target ]
+        remote_dag_steps = []
+        for target_ip_address in target_ip_addresses:
+            remote_dag_step = map_steps.get( (target_ip_address, step_name) )
+            if remote_dag_step == None: raise ValueError( 'Unknown step reference on ' + ip_address + ': ' + step_ref )
+            remote_dag_steps.append( remote_dag_step )
+        if len(remote_dag_steps) == 0: raise ValueError( 'Step reference matches no steps on ' + ip_address + ': ' + step_ref )
+        return remote_dag_steps
+
+
+    def run(self, callback=None, deadline=None ):
+        """Run all steps
+
+        :param callback: If not None, called with each completed (succeeded or failed) RemoteDagStep (Default value = None)
+        :param deadline: If not None, :class:`awsext.ec2.remote.RemoteDeadline` of the DAG, running steps are stopped 
+                and steps not yet started are skipped once it expires or is cancelled (Default value = None)
+        :return: :class:`awsext.ec2.remotedag.RemoteDagResult`
+
+        """
+        if deadline == None: deadline = RemoteDeadline()
+        all_steps = self.resolve()
+        remote_dag_result = RemoteDagResult( all_steps )
+        rate_limiter = None
+        if self.handshakes_per_sec != None: rate_limiter = RateLimiter( self.handshakes_per_sec )
+        is_own_ssh_pool = self.ssh_pool == None
+        ssh_pool = self.ssh_pool
+        if is_own_ssh_pool: ssh_pool = SshConnectionPool( timeout=self.timeout, max_sessions_per_host=max(1, self.max_per_host) )
+
+        map_num_unmet = dict( [ (remote_dag_step, len(remote_dag_step.dependencies)) for remote_dag_step in all_steps ] )
+        ready_steps = collections.deque( [ remote_dag_step for remote_dag_step in all_steps if map_num_unmet[remote_dag_step] == 0 ] )
+        map_host_num_running = collections.defaultdict( int )
+        done_queue = Queue.Queue()
+        num_running = 0
+        worker_pool = WorkerPool( max_workers=self.max_workers, name_prefix='remote-dag' )
+        try:
+            while True:
+                if deadline.is_expired():
+                    if deadline.is_cancelled(): reason = 'Cancelled'
+                    else: reason = 'Timed out'
+                    for pending_step in all_steps:
+                        if pending_step.status == STEP_STATUS_PENDING: self.skip_step( pending_step, reason )
+                # start ready steps in dependency order, steps of a busy host wait for a later pass
+                num_ready = len(ready_steps)
+                for i in range(num_ready):
+                    if num_running >= self.max_workers: break
+                    remote_dag_step = ready_steps.popleft()
+                    if remote_dag_step.status != STEP_STATUS_PENDING: continue
+                    if map_host_num_running[ remote_dag_step.ip_address ] >= self.max_per_host:
+                        ready_steps.append( remote_dag_step )
+                        continue
+                    remote_dag_step.status = STEP_STATUS_RUNNING
+                    remote_dag_step.start_time = time.time()
+                    map_host_num_running[ remote_dag_step.ip_address ] += 1
+                    num_running += 1
+                    worker_pool.submit_work_item( WorkItem( self.run_step, ( ssh_pool, rate_limiter, remote_dag_step, deadline ), {}, done_queue=done_queue ) )
+                if num_running == 0: break
+
+                work_item = done_queue.get()
+                num_running -= 1
+                remote_dag_step = work_item.args[2]
+                remote_dag_step.end_time = time.time()
+                map_host_num_running[ remote_dag_step.ip_address ] -= 1
+                if work_item.exception != None: remote_dag_step.error = str(work_item.exception)
+                else:
+                    remote_dag_step.remote_run_thread = work_item.result
+                    if not work_item.result.is_succeeded():
+                        if work_item.result.exception != None: remote_dag_step.error = str(work_item.result.exception)
+                        else: remote_dag_step.error = 'max_returncode exceeded'
+
+                if remote_dag_step.error == None:
+                    remote_dag_step.status = STEP_STATUS_SUCCEEDED
+                    for dependent in remote_dag_step.dependents:
+                        map_num_unmet[ dependent ] -= 1
+                        if map_num_unmet[ dependent ] == 0: ready_steps.append( dependent )
+                else:
+                    remote_dag_step.status = STEP_STATUS_FAILED
+                    logger.warn( 'Step failed: ' + str(remote_dag_step) + ', ' + remote_dag_step.error )
+                    self.skip_dependents( remote_dag_step, 'Dependency failed: ' + str(remote_dag_step) )
+                    if self.failure_policy == FAILURE_POLICY_FAIL_FAST:
+                        for pending_step in all_steps:
+                            if pending_step.status == STEP_STATUS_PENDING: self.skip_step( pending_step, 'Fail fast after: ' + str(remote_dag_step) )
+                    elif self.failure_policy == FAILURE_POLICY_QUARANTINE_HOST:
+                        for pending_step in self.map_host_steps[ remote_dag_step.ip_address ]:
+                            if pending_step.status == STEP_STATUS_PENDING: self.skip_step( pending_step, 'Host quarantined after: ' + str(remote_dag_step) )
+                if callback != None: callback( remote_dag_step )
+        finally:
+            worker_pool.shutdown()
+            if is_own_ssh_pool: ssh_pool.close_all()
+        remote_dag_result.end_time = time.time()
+        return remote_dag_result
+
+
+    def run_step(self, ssh_pool, rate_limiter, remote_dag_step, deadline=None ):
+        """
+
+        :param ssh_pool: :class:`awsext.ec2.sshpool.SshConnectionPool`
+        :param rate_limiter: :class:`awsext.workerpool.RateLimiter` or None
+        :param remote_dag_step: :class:`awsext.ec2.remotedag.RemoteDagStep` to run
+        :param deadline: If not None, :class:`awsext.ec2.remote.RemoteDeadline` of the DAG (Default value = None)
+        :return: processed (not started) :class:`awsext.ec2.remote.RemoteRunThread`
+
+        """
+        remote_run_thread = RemoteRunThread( 0, remote_dag_step.ip_address, timeout=self.timeout, username=self.username,
+                                             key_filename=self.key_filename, remote_run_requests=[ remote_dag_step.remote_run_request ],
+                                             rate_limiter=rate_limiter, ssh_pool=ssh_pool, output_callback=self.output_callback,
+                                             max_output_bytes=self.max_output_bytes, spool_dir=self.spool_dir, port=self.port,
+                                             deadline=deadline )
+        remote_run_thread.run()
+        return remote_run_thread
+
+
+    def skip_step(self, remote_dag_step, reason ):
+        """Skip a pending step and all pending steps that depend on it
+
+        :param remote_dag_step: :class:`awsext.ec2.remotedag.RemoteDagStep`
+        :param reason: recorded in the step error
+
+        """
+        if remote_dag_step.status != STEP_STATUS_PENDING: return
+        remote_dag_step.status = STEP_STATUS_SKIPPED
+        remote_dag_step.error = reason
+        self.skip_dependents( remote_dag_step, 'Dependency skipped: ' + str(remote_dag_step) )
+
+
+    def skip_dependents(self, remote_dag_step, reason ):
+        """
+
+        :param remote_dag_step: :class:`awsext.ec2.remotedag.RemoteDagStep`
+        :param reason: recorded in the error of each skipped step
+
+        """
+        pending_steps = list( remote_dag_step.dependents )
+        while len(pending_steps) > 0:
+            dependent = pending_steps.pop()
+            if dependent.status != STEP_STATUS_PENDING: continue
+            dependent.status = STEP_STATUS_SKIPPED
+            dependent.error = reason
+            pending_steps.extend( dependent.dependents )
+
+
+class RemoteDagStep():
+    """Single RemoteRunRequest on a host, and its state within a RemoteDagScheduler run """
+
+    def __init__(self, ip_address, step_name, remote_run_request ):
+        """
+
+        :param ip_address: ip address to SSH into
+        :param step_name: name of the step, unique per host
+        :param remote_run_request: :class:`awsext.ec2.remote.RemoteRunRequest`
+
+        """
+        self.ip_address = ip_address
+        self.step_name = step_name
+        self.remote_run_request = remote_run_request
+        self.dependencies = set()
+        self.dependents = []
+        self.status = STEP_STATUS_PENDING
+        self.error = None
+        self.remote_run_thread = None
+        self.start_time = None
+        self.end_time = None
+
+
+    def get_remote_run_response(self):
+        """
+
+        :return: :class:`awsext.ec2.remote.RemoteRunResponse` of the step, None if it didn't run or failed before completing
+
+        """
+        if self.remote_run_thread == None or len(self.remote_run_thread.remote_run_responses) == 0: return None
+        return self.remote_run_thread.remote_run_responses[-1]
+
+
+    def __str__(self):
+        """ """
+        return self.ip_address + ':' + self.step_name
+
+
+class RemoteDagResult():
+    """All steps of a RemoteDagScheduler run """
+
+    def __init__(self, remote_dag_steps ):
+        """
+
+        :param remote_dag_steps: list of :class:`awsext.ec2.remotedag.RemoteDagStep`
+
+        """
+        self.remote_dag_steps = remote_dag_steps
+        self.start_time = time.time()
+        self.end_time = None
+
+
+    def get_step(self, ip_address, step_name ):
+        """
+
+        :param ip_address: ip address of the host
+        :param step_name: name of the step
+        :return: :class:`awsext.ec2.remotedag.RemoteDagStep`, None if not found
+
+        """
+        for remote_dag_step in self.remote_dag_steps:
+            if remote_dag_step.ip_address == ip_address and remote_dag_step.step_name == step_name: return remote_dag_step
+        return None
+
+
+    def get_steps(self, status ):
+        """
+
+        :param status: STEP_STATUS_*
+        :return: list of :class:`awsext.ec2.remotedag.RemoteDagStep` with the status
+
+        """
+        return [ remote_dag_step for remote_dag_step in self.remote_dag_steps if remote_dag_step.status == status ]
+
+
+    def get_failed(self):
+        """ """
+        return self.get_steps( STEP_STATUS_FAILED )
+
+
+    def get_skipped(self):
+        """ """
+        return self.get_steps( STEP_STATUS_SKIPPED )
+
+
+    def is_succeeded(self):
+        """
+
+        :return: True if all steps succeeded
+
+        """
+        return len(self.get_steps( STEP_STATUS_SUCCEEDED )) == len(self.remote_dag_steps)
+
+
+    def __str__(self):
+        """ """
+        lines = [ 'RemoteDagResult: num_steps=' + str(len(self.remote_dag_steps)) + ', num_succeeded=' + str(len(self.get_steps( STEP_STATUS_SUCCEEDED ))) +
+                  ', num_failed=' + str(len(self.get_failed())) + ', num_skipped=' + str(len(self.get_skipped())) ]
+        for remote_dag_step in self.get_failed() + self.get_skipped():
+            lines.append( '   ' + remote_dag_step.status.capitalize() + ': ' + str(remote_dag_step) + ', ' + str(remote_dag_step.error) )
+        return '\n'.join( lines )
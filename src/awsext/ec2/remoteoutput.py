@@ -0,0 +1,206 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Streaming capture of remote command output with bounded memory
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import select
+import collections
+import awsext.exception
+
+import logging
+logger = logging.getLogger(__name__)
+
+RECV_SIZE = 32768
+STREAM_NAME_STD_OUT = 'stdout'
+STREAM_NAME_STD_ERR = 'stderr'
+
+
+def drain_channel( chan, std_out_capture, std_err_capture, poll_secs=0.25, is_expired=None ):
+    """Read STD_OUT and STD_ERR concurrently as data arrives, until the command exits and both streams reach EOF.
+    Reading both streams avoids the remote blocking on a full STD_ERR window while the caller waits on STD_OUT
+
+    :param chan: :class:`paramiko.Channel` the command was exec'ed on
+    :param std_out_capture: :class:`awsext.ec2.remoteoutput.OutputCapture` for STD_OUT
+    :param std_err_capture: :class:`awsext.ec2.remoteoutput.OutputCapture` for STD_ERR
+    :param poll_secs: max seconds to wait for data before checking the exit status (Default value = 0.25)
+    :param is_expired: If not None, callable checked at least every poll_secs, stop waiting when it returns True (Default value = None)
+    :return: return code of the remote command
+    :raise awsext.exception.RemoteCommandTimeoutError: if is_expired returned True before the command exited, 
+            the channel is left open with the command still running
+
+    """
+    while True:
+        if is_expired != None and is_expired():
+            std_out_capture.close()
+            std_err_capture.close()
+            raise awsext.exception.RemoteCommandTimeoutError( 'Remote command expired before exit' )
+        is_data = False
+        if chan.recv_ready():
+            std_out_capture.write( chan.recv( RECV_SIZE ) )
+            is_data = True
+        if chan.recv_stderr_ready():
+            std_err_capture.write( chan.recv_stderr( RECV_SIZE ) )
+            is_data = True
+        if is_data: continue
+        # the exit status can arrive before the last of the output, once it's ready keep reading until EOF
+        if chan.exit_status_ready() and (chan.eof_received or chan.closed): break
+        select.select( [chan], [], [], poll_secs )
+    std_out_capture.close()
+    std_err_capture.close()
+    return chan.recv_exit_status()
+
+
+class ProcessIdFilter():
+    """Wraps the STD_OUT capture of a command prefixed with 'echo $$; ', removing the first line which 
+    contains the process id of the remote shell, the leader of the command's process group """
+
+    def __init__(self, std_out_capture ):
+        """
+
+        :param std_out_capture: :class:`awsext.ec2.remoteoutput.OutputCapture` receiving the rest of STD_OUT
+
+        """
+        self.std_out_capture = std_out_capture
+        self.process_id = None
+        self.first_line = ''
+        self.is_first_line = True
+
+
+    def write(self, data ):
+        """
+
+        :param data: next chunk of the stream
+
+        """
+        if self.is_first_line:
+            self.first_line += data
+            if '\n' not in self.first_line: return
+            self.is_first_line = False
+            first_line, data = self.first_line.split( '\n', 1 )
+            self.first_line = ''
+            if first_line.strip().isdigit(): self.process_id = int( first_line.strip() )
+        self.std_out_capture.write( data )
+
+
+    def close(self):
+        """ """
+        self.std_out_capture.close()
+
+
+class OutputCapture():
+    """Keeps the first max_head_bytes and last max_tail_bytes of a stream in memory, optionally writes the full
+    stream to a spool file and delivers each line to a callback as it arrives """
+
+    def __init__(self, stream_name, max_head_bytes=32768, max_tail_bytes=32768, spool_path=None, line_callback=None, max_line_bytes=65536 ):
+        """
+
+        :param stream_name: STREAM_NAME_STD_OUT or STREAM_NAME_STD_ERR, passed to line_callback
+        :param max_head_bytes: bytes kept from the start of the stream (Default value = 32768)
+        :param max_tail_bytes: bytes kept from the end of the stream (Default value = 32768)
+        :param spool_path: If not None, path/name.ext the full stream is written to (Default value = None)
+        :param line_callback: If not None, called with (stream_name, line) for each line (Default value = None)
+        :param max_line_bytes: longer lines are passed to line_callback in pieces of max_line_bytes, so output without newlines
+                (i.e. progress bars, binary data) isn't held in memory (Default value = 65536)
+
+        """
+        self.stream_name = stream_name
+        self.max_head_bytes = max_head_bytes
+        self.max_tail_bytes = max_tail_bytes
+        self.spool_path = spool_path
+        self.line_callback = line_callback
+        self.max_line_bytes = max_line_bytes
+        self.head_chunks = []
+        self.num_head_bytes = 0
+        self.tail_chunks = collections.deque()
+        self.num_tail_bytes = 0
+        self.num_bytes = 0
+        self.partial_line = ''
+        self.spool_file = None
+        if spool_path != None: self.spool_file = open( spool_path, 'wb' )
+
+
+    def write(self, data ):
+        """
+
+        :param data: next chunk of the stream
+
+        """
+        if len(data) == 0: return
+        self.num_bytes += len(data)
+        if self.spool_file != None: self.spool_file.write( data )
+        if self.line_callback != None: self._callback_lines( data )
+        if self.num_head_bytes < self.max_head_bytes:
+            head_data = data[0:self.max_head_bytes - self.num_head_bytes]
+            self.head_chunks.append( head_data )
+            self.num_head_bytes += len(head_data)
+            data = data[len(head_data):]
+        if len(data) == 0: return
+        self.tail_chunks.append( data )
+        self.num_tail_bytes += len(data)
+        while self.num_tail_bytes > self.max_tail_bytes:
+            excess_bytes = self.num_tail_bytes - self.max_tail_bytes
+            first_chunk = self.tail_chunks.popleft()
+            if len(first_chunk) > excess_bytes:
+                self.tail_chunks.appendleft( first_chunk[excess_bytes:] )
+                self.num_tail_bytes -= excess_bytes
+            else: self.num_tail_bytes -= len(first_chunk)
+
+
+    def close(self):
+        """Deliver the last partial line and close the spool file """
+        if self.line_callback != None and self.partial_line != '':
+            self.line_callback( self.stream_name, self.partial_line )
+            self.partial_line = ''
+        if self.spool_file != None:
+            self.spool_file.close()
+            self.spool_file = None
+
+
+    def is_truncated(self):
+        """
+
+        :return: True if bytes between the head and tail were discarded
+
+        """
+        return self.num_bytes > self.num_head_bytes + self.num_tail_bytes
+
+
+    def get_text(self):
+        """
+
+        :return: head and tail of the stream, with a marker where bytes were discarded
+
+        """
+        text = ''.join( self.head_chunks )
+        if self.is_truncated():
+            text += '\n... [' + str(self.num_bytes - self.num_head_bytes - self.num_tail_bytes) + ' bytes truncated] ...\n'
+        return text + ''.join( self.tail_chunks )
+
+
+    def _callback_lines(self, data ):
+        lines = (self.partial_line + data).split( '\n' )
+        self.partial_line = lines.pop()
+        for line in lines:
+            while len(line) > self.max_line_bytes:
+                self.line_callback( self.stream_name, line[0:self.max_line_bytes] )
+                line = line[self.max_line_bytes:]
+            self.line_callback( self.stream_name, line )
+        while len(self.partial_line) >= self.max_line_bytes:
+            self.line_callback( self.stream_name, self.partial_line[0:self.max_line_bytes] )
+            self.partial_line = self.partial_line[self.max_line_bytes:]
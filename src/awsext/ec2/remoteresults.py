@@ -0,0 +1,287 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Columnar results of large RemoteRunRequest runs
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import math
+import array
+import tempfile
+import threading
+from awsext.ec2.remote import RemoteRunResponse
+
+import logging
+logger = logging.getLogger(__name__)
+
+# returncode column value when there is no return code, i.e. timed out or not connected
+RETURNCODE_NONE = -1
+
+FLAG_TIMED_OUT = 1
+FLAG_EXCEPTION = 2
+# returncode exceeded RemoteRunRequest.max_returncode of the row's request
+FLAG_MAX_RETURNCODE_EXCEEDED = 4
+
+
+class RemoteResultTable():
+    """Results of a run as parallel arrays, one row per processed RemoteRunRequest, instead of one RemoteRunThread and
+    RemoteRunResponse per host/request.  Host, step name and cmd_line strings are interned, STD_OUT/STD_ERR are written 
+    to a spooled temporary file and only read back by get_response.  
+    i.e. for remote_run_thread in remote_fleet_executor.iter_run( host_run_requests ): remote_result_table.add_remote_run_thread( remote_run_thread ) """
+
+    def __init__(self, is_store_output=True, spool_max_bytes=1048576, spool_dir=None ):
+        """
+
+        :param is_store_output: If True, keep STD_OUT/STD_ERR of each row in the spool file, else only the byte counts (Default value = True)
+        :param spool_max_bytes: output kept in memory before the spool file is written to disk (Default value = 1048576)
+        :param spool_dir: directory of the spool file (Default value = None, the system temp directory)
+
+        """
+        self.is_store_output = is_store_output
+        self.lock = threading.Lock()
+        self.spool_file = tempfile.SpooledTemporaryFile( max_size=spool_max_bytes, dir=spool_dir )
+        self.spool_offset = 0
+        self.hosts = []
+        self.map_host_indexes = {}
+        self.strings = [ None ]
+        self.map_string_indexes = { None:0 }
+        # one entry per row
+        self.host_indexes = array.array( 'I' )
+        self.step_nums = array.array( 'I' )
+        self.step_name_indexes = array.array( 'I' )
+        self.cmd_line_indexes = array.array( 'I' )
+        self.returncodes = array.array( 'i' )
+        self.flags = array.array( 'B' )
+        self.durations = array.array( 'd' )
+        self.transfer_secs = array.array( 'd' )
+        self.transfer_bytes = array.array( 'L' )
+        self.std_out_bytes = array.array( 'L' )
+        self.std_err_bytes = array.array( 'L' )
+        # std_out, std_err, std_out_spool_path, std_err_spool_path are stored consecutively at output_offsets
+        self.output_offsets = array.array( 'L' )
+        self.output_lengths = array.array( 'I' )
+
+
+    def add_remote_run_thread(self, remote_run_thread ):
+        """Add a row for each response of a processed host.  If the host stopped on an exception before the response of a request
+        was created (i.e. connect failed or a transfer timed out), a row with returncode RETURNCODE_NONE and FLAG_EXCEPTION is added 
+        for that request.  A command that timed out has its own response, its row is flagged FLAG_EXCEPTION instead, either way 
+        the request that stopped the host is the last row and later requests have none
+
+        :param remote_run_thread: processed :class:`awsext.ec2.remote.RemoteRunThread`
+
+        """
+        remote_run_requests = remote_run_thread.remote_run_requests
+        remote_run_responses = remote_run_thread.remote_run_responses
+        # the response of a timed out command is appended before the timeout is raised
+        is_response_of_exception = remote_run_thread.exception != None and len(remote_run_responses) > 0 and remote_run_responses[-1].is_timed_out
+        for step_num, remote_run_response in enumerate( remote_run_responses ):
+            flags = 0
+            if is_response_of_exception and step_num == len(remote_run_responses) - 1: flags = FLAG_EXCEPTION
+            self.add( remote_run_thread.ip_address, step_num, remote_run_response, step_name=remote_run_requests[step_num].step_name,
+                      flags=flags, max_returncode=remote_run_requests[step_num].max_returncode )
+        step_num = len(remote_run_responses)
+        if remote_run_thread.exception != None and not is_response_of_exception and step_num < len(remote_run_requests):
+            remote_run_request = remote_run_requests[step_num]
+            flags = FLAG_EXCEPTION
+            if remote_run_thread.is_timed_out: flags |= FLAG_TIMED_OUT
+            remote_run_response = RemoteRunResponse( returncode=None, cmd_line=remote_run_request.cmd_line, std_err=str(remote_run_thread.exception),
+                                                     is_timed_out=remote_run_thread.is_timed_out )
+            self.add( remote_run_thread.ip_address, step_num, remote_run_response, step_name=remote_run_request.step_name, flags=flags )
+
+
+    def add(self, ip_address, step_num, remote_run_response, step_name=None, flags=0, max_returncode=0 ):
+        """
+
+        :param ip_address: ip address of the host
+        :param step_num: offset of the request in the host's RemoteRunRequest list
+        :param remote_run_response: :class:`awsext.ec2.remote.RemoteRunResponse`
+        :param step_name: If not None, RemoteRunRequest.step_name (Default value = None)
+        :param flags: FLAG_ values, FLAG_TIMED_OUT is also set from remote_run_response.is_timed_out (Default value = 0)
+        :param max_returncode: RemoteRunRequest.max_returncode, FLAG_MAX_RETURNCODE_EXCEEDED is set if the returncode is higher,
+                None to not check the return code (Default value = 0)
+        :return: row number
+
+        """
+        if remote_run_response.is_timed_out: flags |= FLAG_TIMED_OUT
+        returncode = remote_run_response.returncode
+        if returncode == None: returncode = RETURNCODE_NONE
+        elif max_returncode != None and returncode > max_returncode: flags |= FLAG_MAX_RETURNCODE_EXCEEDED
+        with self.lock:
+            host_index = self.map_host_indexes.get( ip_address )
+            if host_index == None:
+                host_index = len(self.hosts)
+                self.hosts.append( ip_address )
+                self.map_host_indexes[ ip_address ] = host_index
+            self.host_indexes.append( host_index )
+            self.step_nums.append( step_num )
+            self.step_name_indexes.append( self.intern( step_name ) )
+            self.cmd_line_indexes.append( self.intern( remote_run_response.cmd_line ) )
+            self.returncodes.append( returncode )
+            self.flags.append( flags )
+            self.durations.append( remote_run_response.duration_secs )
+            self.transfer_secs.append( remote_run_response.transfer_secs )
+            self.transfer_bytes.append( remote_run_response.transfer_bytes )
+            self.std_out_bytes.append( remote_run_response.std_out_bytes )
+            self.std_err_bytes.append( remote_run_response.std_err_bytes )
+            self.output_offsets.append( self.spool_offset )
+            outputs = [ '', '', remote_run_response.std_out_spool_path or '', remote_run_response.std_err_spool_path or '' ]
+            if self.is_store_output: outputs[0:2] = [ remote_run_response.std_out, remote_run_response.std_err ]
+            for output in outputs:
+                self.output_lengths.append( len(output) )
+                if len(output) == 0: continue
+                self.spool_file.seek( self.spool_offset )
+                self.spool_file.write( output )
+                self.spool_offset += len(output)
+            return len(self.returncodes) - 1
+
+
+    def intern(self, value ):
+        """Call with the lock held
+
+        :param value: string or None
+        :return: index of value in self.strings
+
+        """
+        string_index = self.map_string_indexes.get( value )
+        if string_index == None:
+            string_index = len(self.strings)
+            self.strings.append( value )
+            self.map_string_indexes[ value ] = string_index
+        return string_index
+
+
+    def __len__(self):
+        """ """
+        return len(self.returncodes)
+
+
+    def get_host(self, row ):
+        """
+
+        :param row: row number
+        :return: ip address of the row
+
+        """
+        return self.hosts[ self.host_indexes[row] ]
+
+
+    def get_step_name(self, row ):
+        """
+
+        :param row: row number
+        :return: step name of the row, None if the request had no step_name
+
+        """
+        return self.strings[ self.step_name_indexes[row] ]
+
+
+    def get_response(self, row ):
+        """Rebuild the RemoteRunResponse of a row, reading STD_OUT/STD_ERR back from the spool file
+
+        :param row: row number
+        :return: :class:`awsext.ec2.remote.RemoteRunResponse`
+
+        """
+        with self.lock:
+            self.spool_file.seek( self.output_offsets[row] )
+            outputs = [ self.spool_file.read( length ) for length in self.output_lengths[row * 4:row * 4 + 4] ]
+        returncode = self.returncodes[row]
+        if returncode == RETURNCODE_NONE: returncode = None
+        return RemoteRunResponse( returncode=returncode, std_out=outputs[0], std_err=outputs[1], cmd_line=self.strings[ self.cmd_line_indexes[row] ],
+                                  std_out_bytes=self.std_out_bytes[row], std_err_bytes=self.std_err_bytes[row], 
+                                  std_out_spool_path=outputs[2] or None, std_err_spool_path=outputs[3] or None, 
+                                  transfer_bytes=self.transfer_bytes[row], transfer_secs=self.transfer_secs[row], 
+                                  is_timed_out=(self.flags[row] & FLAG_TIMED_OUT) != 0, duration_secs=self.durations[row] )
+
+
+    def get_rows(self, step=None ):
+        """
+
+        :param step: step number (int), step name (string) or None for all rows (Default value = None)
+        :return: list of row numbers of the step
+
+        """
+        if step == None: return range( len(self.returncodes) )
+        if isinstance( step, basestring ):
+            step_name_index = self.map_string_indexes.get( step )
+            if step_name_index == None: return []
+            return [ row for row, row_step_name_index in enumerate( self.step_name_indexes ) if row_step_name_index == step_name_index ]
+        return [ row for row, step_num in enumerate( self.step_nums ) if step_num == step ]
+
+
+    def is_failed(self, row ):
+        """
+
+        :param row: row number
+        :return: True if the row timed out, had an exception or exceeded the max_returncode of its request
+
+        """
+        return self.flags[row] != 0
+
+
+    def failed_hosts(self, step=None ):
+        """i.e. which hosts failed step 7
+
+        :param step: step number (int), step name (string) or None for any step (Default value = None)
+        :return: list of ip addresses, in row order
+
+        """
+        host_indexes = []
+        found_host_indexes = set()
+        for row in self.get_rows( step ):
+            if self.is_failed( row ) and self.host_indexes[row] not in found_host_indexes:
+                found_host_indexes.add( self.host_indexes[row] )
+                host_indexes.append( self.host_indexes[row] )
+        return [ self.hosts[host_index] for host_index in host_indexes ]
+
+
+    def percentile_duration(self, percentile, step=None ):
+        """Nearest-rank percentile of the command durations, i.e. percentile_duration( 99, step=7 )
+
+        :param percentile: 0-100
+        :param step: step number (int), step name (string) or None for all steps (Default value = None)
+        :return: duration in seconds, None if there are no rows
+
+        """
+        if step == None: durations = sorted( self.durations )
+        else: durations = sorted( [ self.durations[row] for row in self.get_rows( step ) ] )
+        if len(durations) == 0: return None
+        rank = int( math.ceil( percentile / 100.0 * len(durations) ) )
+        return durations[ min( max( rank, 1 ), len(durations) ) - 1 ]
+
+
+    def sum_transfer_bytes(self, step=None ):
+        """
+
+        :param step: step number (int), step name (string) or None for all steps (Default value = None)
+        :return: total bytes transferred
+
+        """
+        if step == None: return sum( self.transfer_bytes )
+        return sum( [ self.transfer_bytes[row] for row in self.get_rows( step ) ] )
+
+
+    def close(self):
+        """Delete the spool file """
+        self.spool_file.close()
+
+
+    def __str__(self):
+        """ """
+        return ('RemoteResultTable: rows=' + str(len(self.returncodes)) + ', hosts=' + str(len(self.hosts)) + ', failed_hosts=' + 
+                str(len(self.failed_hosts())) + ', p50_duration=' + str(self.percentile_duration( 50 )) + ', p99_duration=' + 
+                str(self.percentile_duration( 99 )) + ', spool_bytes=' + str(self.spool_offset))
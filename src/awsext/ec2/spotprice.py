@@ -19,11 +19,19 @@ Spot Instance Pricing classes and methods
 :version: 1.1
 """
 
+import os
+import time
+import json
+import fcntl
 import operator
+import threading
+from array import array
 import boto.ec2
-import boto.vpc
-import awsext.ec2.connection
+import awsext.ec2
+import awsext.vpc
+import awsext.regioncache
 from awsext.vpc.connection import InboundRuleItem
+from awsext.workerpool import WorkerPool
 
 import logging
 logger = logging.getLogger(__name__)
@@ -43,28 +51,225 @@ def find_spot_cheapest_prices( instance_type='m3.large', product_description='Li
     """
     spot_cheapest_items = []
     
-    all_regions = boto.ec2.regions( profile_name=profile_name )
+    all_regions = awsext.regioncache.get_regions( 'ec2' )
     for region in all_regions:
         if region_filter != None and not region.name in region_filter: continue
         try:
             ec2_conn_region = boto.ec2.connect_to_region( region.name, profile_name=profile_name )
-            zones = ec2_conn_region.get_all_zones()
+            # AZ's are cached, so an unauthorized region may not fail until the first spot price history call
+            zones = awsext.regioncache.get_zones( region.name, profile_name=profile_name, ec2_conn=ec2_conn_region )
+            for zone in zones:
+                if verbose: logger.info( 'Checking Zone: ' + zone.name )
+                spot_price_histories = ec2_conn_region.get_spot_price_history( instance_type=instance_type, product_description=product_description, max_results=1, availability_zone=zone.name )
+                if len(spot_price_histories) > 0:
+                    if max_bid == None or spot_price_histories[0].price <= max_bid:
+                        spot_cheapest_items.append( SpotCheapestItem( instance_type, product_description, region, zone, spot_price_histories[0].price ) )
         except boto.exception.EC2ResponseError as e:
             if e.code == 'AuthFailure':
                 if verbose: logger.warn( 'Not authorized for region: ' + region.name )
                 continue
             else: raise e            
-        for zone in zones:
-            if verbose: logger.info( 'Checking Zone: ' + zone.name )
-            spot_price_histories = ec2_conn_region.get_spot_price_history( instance_type=instance_type, product_description=product_description, max_results=1, availability_zone=zone.name )
-            if len(spot_price_histories) > 0:
-                if max_bid == None or spot_price_histories[0].price <= max_bid:
-                    spot_cheapest_items.append( SpotCheapestItem( instance_type, product_description, region, zone, spot_price_histories[0].price ) )
 
     spot_cheapest_items.sort( key=operator.attrgetter('price'))
     return spot_cheapest_items
 
 
+def find_spot_cheapest_capacity( instance_type_weights, product_description='Linux/UNIX', profile_name=None, region_filter=None,
+                                 rank_by='vcpu', max_bid=None, max_workers=16, verbose=False):
+    """Find the cheapest spot capacity across a list of acceptable instance types, all regions and all AZ's.
+    Each Region/InstanceType combination is queried concurrently, a single spot price history call per
+    combination returns the current price in every AZ.
+
+    :param instance_type_weights: list of :class:awsext.ec2.spotprice.InstanceTypeWeight
+    :param product_description: Linux/UNIX or Windows (Default value = 'Linux/UNIX')
+    :param profile_name: profile name from credentials file (Default value = None)
+    :param region_filter: list of regions to be checked (Default value = None)
+    :param rank_by: SpotCapacityTable.RANK_BY_VCPU, RANK_BY_MEMORY or RANK_BY_PRICE (Default value = 'vcpu')
+    :param max_bid: only include Region/AZ/InstanceType if spot price is <= max_bid (Default value = None)
+    :param max_workers: max concurrent spot price history requests (Default value = 16)
+    :param verbose: If True, log detailed status messages. (Default value = False)
+    :return: :class:awsext.ec2.spotprice.SpotCapacityTable, ranked by normalized cost
+
+    """
+    region_names = []
+    for region in awsext.regioncache.get_regions( 'ec2' ):
+        if region_filter != None and not region.name in region_filter: continue
+        region_names.append( region.name )
+    region_type_pairs = []
+    for region_name in region_names:
+        for instance_type_weight in instance_type_weights: region_type_pairs.append( (region_name, instance_type_weight) )
+
+    start_time = time.strftime( '%Y-%m-%dT%H:%M:%S.000Z', time.gmtime() )
+    def find_region_type_prices( region_type_pair ):
+        return find_spot_current_prices( region_type_pair[0], region_type_pair[1].instance_type, product_description, 
+                                         start_time, profile_name=profile_name, verbose=verbose )
+
+    spot_capacity_table = SpotCapacityTable( product_description, rank_by=rank_by )
+    worker_pool = WorkerPool( max_workers=max_workers )
+    try:
+        for work_item in worker_pool.imap_unordered( find_region_type_prices, region_type_pairs ):
+            if work_item.exception != None: raise work_item.exception
+            region_name, instance_type_weight = work_item.args[0]
+            for zone_name, price in work_item.result:
+                if max_bid == None or price <= max_bid:
+                    spot_capacity_table.append( region_name, zone_name, instance_type_weight, price )
+    finally:
+        worker_pool.shutdown()
+
+    spot_capacity_table.rank()
+    return spot_capacity_table
+
+
+def find_spot_current_prices( region_name, instance_type, product_description, start_time, profile_name=None, verbose=False ):
+    """Find the current spot price in each AZ of a region for a single instance type
+
+    :param region_name: Region name
+    :param instance_type: EC2 instance type
+    :param product_description: Linux/UNIX or Windows
+    :param start_time: ISO 8601 time, the price in effect at start_time is returned for each AZ
+    :param profile_name: profile name from credentials file (Default value = None)
+    :param verbose: If True, log detailed status messages. (Default value = False)
+    :return: list of (zone_name, price) tuples, empty if not authorized for the region
+
+    """
+    if verbose: logger.info( 'Checking Region: ' + region_name + ', instance_type=' + instance_type )
+    ec2_conn_region = boto.ec2.connect_to_region( region_name, profile_name=profile_name )
+    map_zone_history = {}
+    next_token = None
+    while True:
+        try:
+            spot_price_histories = ec2_conn_region.get_spot_price_history( start_time=start_time, instance_type=instance_type, 
+                                                                           product_description=product_description, next_token=next_token )
+        except boto.exception.EC2ResponseError as e:
+            if e.code == 'AuthFailure':
+                if verbose: logger.warn( 'Not authorized for region: ' + region_name )
+                return []
+            else: raise e
+        for spot_price_history in spot_price_histories:
+            prev_history = map_zone_history.get( spot_price_history.availability_zone )
+            if prev_history == None or spot_price_history.timestamp > prev_history.timestamp:
+                map_zone_history[ spot_price_history.availability_zone ] = spot_price_history
+        next_token = getattr( spot_price_histories, 'next_token', None )
+        if next_token == None or next_token == '': break
+    return [ (zone_name, spot_price_history.price) for zone_name, spot_price_history in map_zone_history.items() ]
+
+
+class InstanceTypeWeight():
+    """Instance type and the capacity used to normalize its spot price """
+
+    def __init__(self, instance_type, vcpu, memory_gib ):
+        """
+
+        :param instance_type: EC2 instance type
+        :param vcpu: number of vCPU's
+        :param memory_gib: memory in GiB
+
+        """
+        if vcpu <= 0 or memory_gib <= 0: raise ValueError( 'vcpu and memory_gib must be > 0' )
+        self.instance_type = instance_type
+        self.vcpu = vcpu
+        self.memory_gib = memory_gib
+
+
+class SpotCapacityTable():
+    """Compact table of spot capacity candidates. Each column is an array, region/zone/instance type
+    names are stored once and referenced by index, so thousands of candidates don't create thousands of objects """
+    RANK_BY_VCPU = 'vcpu'
+    RANK_BY_MEMORY = 'memory'
+    RANK_BY_PRICE = 'price'
+
+    def __init__(self, product_description, rank_by='vcpu' ):
+        """
+
+        :param product_description: Linux/UNIX or Windows
+        :param rank_by: RANK_BY_VCPU ($/vCPU-hour), RANK_BY_MEMORY ($/GiB-hour) or RANK_BY_PRICE ($/hour) (Default value = 'vcpu')
+
+        """
+        if rank_by not in (self.RANK_BY_VCPU, self.RANK_BY_MEMORY, self.RANK_BY_PRICE): raise ValueError( 'Invalid rank_by: ' + str(rank_by) )
+        self.product_description = product_description
+        self.rank_by = rank_by
+        self.region_names = []
+        self.zone_names = []
+        self.instance_type_weights = []
+        self.map_region_idxs = {}
+        self.map_zone_idxs = {}
+        self.map_instance_type_idxs = {}
+        self.region_idxs = array('H')
+        self.zone_idxs = array('H')
+        self.instance_type_idxs = array('H')
+        self.prices = array('d')
+        self.costs = array('d')
+
+
+    def append(self, region_name, zone_name, instance_type_weight, price ):
+        """Add a candidate, normalized cost is calculated based on rank_by
+
+        :param region_name: Region name
+        :param zone_name: Availability Zone name
+        :param instance_type_weight: :class:awsext.ec2.spotprice.InstanceTypeWeight
+        :param price: Spot Price ($/hour)
+
+        """
+        price = float(price)
+        self.region_idxs.append( self._intern( region_name, self.region_names, self.map_region_idxs ) )
+        self.zone_idxs.append( self._intern( zone_name, self.zone_names, self.map_zone_idxs ) )
+        instance_type_idx = self.map_instance_type_idxs.get( instance_type_weight.instance_type )
+        if instance_type_idx == None:
+            instance_type_idx = len(self.instance_type_weights)
+            self.instance_type_weights.append( instance_type_weight )
+            self.map_instance_type_idxs[ instance_type_weight.instance_type ] = instance_type_idx
+        self.instance_type_idxs.append( instance_type_idx )
+        self.prices.append( price )
+        if self.rank_by == self.RANK_BY_VCPU: self.costs.append( price / instance_type_weight.vcpu )
+        elif self.rank_by == self.RANK_BY_MEMORY: self.costs.append( price / instance_type_weight.memory_gib )
+        else: self.costs.append( price )
+
+
+    def rank(self):
+        """Sort all columns by ascending normalized cost """
+        sorted_idxs = sorted( range(len(self.costs)), key=self.costs.__getitem__ )
+        for column_name in ('region_idxs', 'zone_idxs', 'instance_type_idxs', 'prices', 'costs'):
+            column = getattr( self, column_name )
+            setattr( self, column_name, array( column.typecode, [ column[i] for i in sorted_idxs ] ) )
+
+
+    def get_row(self, i ):
+        """
+
+        :param i: row number
+        :return: tuple of (region_name, zone_name, instance_type, price, cost)
+
+        """
+        return ( self.region_names[ self.region_idxs[i] ], self.zone_names[ self.zone_idxs[i] ], 
+                 self.instance_type_weights[ self.instance_type_idxs[i] ].instance_type, self.prices[i], self.costs[i] )
+
+
+    def __len__(self):
+        return len(self.costs)
+
+
+    def __iter__(self):
+        for i in range(len(self.costs)): yield self.get_row(i)
+
+
+    def __str__(self):
+        """ """
+        lines = [ 'SpotCapacityTable: product_description=' + self.product_description + ', rank_by=' + self.rank_by + ', rows=' + str(len(self)) ]
+        for region_name, zone_name, instance_type, price, cost in self:
+            lines.append( '   region.name=' + region_name + ', zone.name=' + zone_name + ', instance_type=' + instance_type + 
+                          ', price=' + str(price) + ', cost=' + str(cost) )
+        return '\n'.join( lines )
+
+
+    def _intern(self, name, names, map_name_idxs ):
+        idx = map_name_idxs.get( name )
+        if idx == None:
+            idx = len(names)
+            names.append( name )
+            map_name_idxs[ name ] = idx
+        return idx
+
+
 class SpotCheapestItem():
     """Contains all attributes to describe a cheapest spot price """
 
@@ -103,31 +308,164 @@ class SpotCheapestItem():
         return 'SpotCheapestItem: instance_type=' + self.instance_type + ', product_description=' + self.product_description + ', region.name=' + region_name + ', zone.name=' + zone_name + ', price=' + price
 
 
+def create_spot_region_items( region_names, profile_name=None, kp_name_prefix='kp_spot_', key_path=None, map_region_vpc_ids=None, 
+                              sg_name_prefix='sg_spot_', state_path=None, max_workers=8 ):
+    """Create a SpotRegionItem for each region concurrently
+
+    :param region_names: list of region names
+    :param profile_name: Profile name from credentials file (Default value = None)
+    :param kp_name_prefix: KeyPair prefix, followed by the region name, used to create unique KeyPair (Default value = 'kp_spot_')
+    :param key_path: path to store KeyPair .pem files, shared by all regions (Default value = None)
+    :param map_region_vpc_ids: dict of region name to VPC id to create spot instances in (Default value = None)
+    :param sg_name_prefix: SecurityGroup prefix, used to create unique SecurityGroup (Default value = 'sg_spot_')
+    :param state_path: path/name.ext of state file used to reuse KeyPairs/SecurityGroups across runs (Default value = None)
+    :param max_workers: max number of regions provisioned concurrently (Default value = 8)
+    :return: dict of region name to :class:awsext.ec2.spotprice.SpotRegionItem
+
+    """
+    if map_region_vpc_ids == None: raise ValueError('map_region_vpc_ids is required')
+    def create_spot_region_item( region_name ):
+        return SpotRegionItem( region_name, profile_name=profile_name, kp_name_prefix=kp_name_prefix, key_path=key_path, 
+                               vpc_id=map_region_vpc_ids.get( region_name ), sg_name_prefix=sg_name_prefix, state_path=state_path )
+
+    map_spot_region_items = {}
+    worker_pool = WorkerPool( max_workers=max(1, min(max_workers, len(region_names))) )
+    try:
+        for work_item in worker_pool.imap_unordered( create_spot_region_item, region_names ):
+            if work_item.exception != None: raise work_item.exception
+            map_spot_region_items[ work_item.args[0] ] = work_item.result
+    finally:
+        worker_pool.shutdown()
+    return map_spot_region_items
+
+
 class SpotRegionItem():
     """Contains/creates attributes necessary to request Spot EC2 instances in a given region """
     
-    def __init__(self, region_name, profile_name=None, kp_name_prefix='kp_spot_', key_path=None, vpc_id=None, sg_name_prefix='sg_spot_' ): 
+    def __init__(self, region_name, profile_name=None, kp_name_prefix='kp_spot_', key_path=None, vpc_id=None, sg_name_prefix='sg_spot_',
+                 state_path=None ): 
         """
 
         :param region_name: Region name
         :param profile_name: Profile name from credentials file (Default value = None)
-        :param kp_name_prefix: KeyPair prefix, used to create unique KeyPair   (Default value = 'kp_spot_')
+        :param kp_name_prefix: KeyPair prefix, followed by the region name, used to create unique KeyPair   (Default value = 'kp_spot_')
         :param key_path: path/name.ext to store KeyPair .pem file (Default value = None)
         :param vpc_id: VPC to create spot instances in (Default value = None)
         :param sg_name_prefix: SecurityGroup prefix, used to create unique SecurityGroup (Default value = 'sg_spot_')
+        :param state_path: path/name.ext of state file, if the KeyPair and SecurityGroup recorded for this region/VPC
+                still exist they are reused, else they are created and recorded (Default value = None)
 
         """
         if key_path == None: raise ValueError('key_path is required')
         if vpc_id == None: raise ValueError('vpc_id is required')
+        self.region_name = region_name
+        self.vpc_id = vpc_id
+        self.is_from_state = False
         
-        self.vpc_conn = boto.vpc.connect_to_region( region_name, profile_name=profile_name )
-        self.ec2_conn = boto.ec2.connect_to_region( region_name, profile_name=profile_name )
-    
-        key_pair = awsext.ec2.connection.AwsExtEC2Connection.create_unique_key_pair_sync( kp_name_prefix, key_path )
-        self.key_name = key_pair.name
-    
-        self.security_group = self.vpc_conn.create_unique_security_group( vpc_id, sg_name_prefix, 
-                                                            inbound_rule_items= [ InboundRuleItem( from_port=22 )]
-                                                            )
+        self.vpc_conn = awsext.vpc.connect_to_region( region_name, profile_name=profile_name )
+        self.ec2_conn = awsext.ec2.connect_to_region( region_name, profile_name=profile_name )
+
+        spot_region_state = None
+        if state_path != None: 
+            spot_region_state = SpotRegionStateFile( state_path )
+            self.is_from_state = self.load_state( spot_region_state, key_path )
+        if self.is_from_state: return
+
+        # KeyPair and SecurityGroup are independent, create them concurrently, each waits for its own existence poll
+        worker_pool = WorkerPool( max_workers=2 )
+        try:
+            # the suffix is a timestamp, the region keeps names and .pem files of regions provisioned concurrently apart
+            key_pair_work_item = worker_pool.submit( self.ec2_conn.create_unique_key_pair_sync, kp_name_prefix + region_name + '_', key_path=key_path )
+            security_group_work_item = worker_pool.submit( self.vpc_conn.create_unique_security_group_sync, vpc_id, sg_name_prefix, 
+                                                           inbound_rule_items=[ InboundRuleItem( from_port=22 ) ] )
+            self.key_name = key_pair_work_item.get().name
+            self.security_group = security_group_work_item.get()
+        finally:
+            worker_pool.shutdown()
         self.security_group_ids = [ self.security_group.id ]
+        if spot_region_state != None: spot_region_state.put( region_name, vpc_id, self.key_name, self.security_group.id )
+
+
+    def load_state(self, spot_region_state, key_path ):
+        """Reuse the KeyPair and SecurityGroup recorded in the state file if the .pem file, KeyPair and SecurityGroup still exist
+
+        :param spot_region_state: :class:awsext.ec2.spotprice.SpotRegionStateFile
+        :param key_path: path where KeyPair .pem files are stored
+        :return: True if the recorded KeyPair and SecurityGroup are valid
 
+        """
+        key_name, security_group_id = spot_region_state.get( self.region_name, self.vpc_id )
+        if key_name == None or security_group_id == None: return False
+        if not os.path.exists( os.path.join( key_path, key_name + '.pem' ) ): return False
+        worker_pool = WorkerPool( max_workers=2 )
+        try:
+            key_pair_work_item = worker_pool.submit( self.ec2_conn.find_key_pair, key_name )
+            security_group_work_item = worker_pool.submit( self.vpc_conn.get_security_group, self.vpc_id, security_group_id )
+            key_pair = key_pair_work_item.get()
+            security_group = security_group_work_item.get()
+        finally:
+            worker_pool.shutdown()
+        if key_pair == None or security_group == None:
+            logger.info( 'Stale spot region state, recreating: region=' + self.region_name + ', vpc_id=' + self.vpc_id )
+            return False
+        self.key_name = key_name
+        self.security_group = security_group
+        self.security_group_ids = [ security_group.id ]
+        return True
+
+
+class SpotRegionStateFile():
+    """JSON file of KeyPair name and SecurityGroup id by region and VPC, shared by all SpotRegionItems in a process and by
+    processes using the same state_path.  Updates are serialized with a flock on <state_path>.lock """
+    lock = threading.Lock()
+
+    def __init__(self, state_path ):
+        """
+
+        :param state_path: path/name.ext of state file
+
+        """
+        self.state_path = state_path
+
+
+    def get(self, region_name, vpc_id ):
+        """
+
+        :param region_name: Region name
+        :param vpc_id: VPC id
+        :return: tuple of (key_name, security_group_id), (None, None) if not recorded
+
+        """
+        with SpotRegionStateFile.lock:
+            state = self._read()
+        region_state = state.get( region_name + '|' + vpc_id, {} )
+        return region_state.get('key_name'), region_state.get('security_group_id')
+
+
+    def put(self, region_name, vpc_id, key_name, security_group_id ):
+        """Record the KeyPair and SecurityGroup, the file is re-read under the lock and replaced atomically, so the
+        entries put by other processes are kept
+
+        :param region_name: Region name
+        :param vpc_id: VPC id
+        :param key_name: KeyPair name
+        :param security_group_id: SecurityGroup id
+
+        """
+        tmp_state_path = self.state_path + '.' + str(os.getpid()) + '.tmp'
+        with SpotRegionStateFile.lock:
+            with open( self.state_path + '.lock', 'a' ) as lock_file:
+                fcntl.flock( lock_file.fileno(), fcntl.LOCK_EX )
+                state = self._read()
+                state[ region_name + '|' + vpc_id ] = { 'key_name':key_name, 'security_group_id':security_group_id }
+                with open( tmp_state_path, 'w' ) as state_file: json.dump( state, state_file, indent=2, sort_keys=True )
+                os.rename( tmp_state_path, self.state_path )
+
+
+    def _read(self):
+        if not os.path.exists( self.state_path ): return {}
+        try:
+            with open( self.state_path, 'r' ) as state_file: return json.load( state_file )
+        except ValueError as e:
+            logger.warn( 'Ignoring invalid spot region state file: ' + self.state_path + ', ' + str(e) )
+            return {}
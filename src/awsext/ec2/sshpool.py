@@ -0,0 +1,296 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Persistent SSH connections, reused across RemoteRunThreads and batches of RemoteRunRequests
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import time
+import threading
+import paramiko
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SshConnectionPool():
+    """SSH connections keyed by (ip_address, port, username, key_filename), shared by all threads.  Each connection
+    is kept alive and health checked before reuse, sessions are multiplexed on the connection's transport so several
+    commands can run on a host concurrently """
+
+    def __init__(self, timeout=60, keepalive_secs=30, max_idle_secs=600, max_sessions_per_host=8, rate_limiter=None ):
+        """
+
+        :param timeout: max time to wait for SSH connection (Default value = 60)
+        :param keepalive_secs: interval of transport keepalive packets, 0 to disable (Default value = 30)
+        :param max_idle_secs: connections unused this long are closed by close_idle (Default value = 600)
+        :param max_sessions_per_host: max concurrently open sessions on one connection (Default value = 8)
+        :param rate_limiter: :class:`awsext.workerpool.RateLimiter` acquired before each SSH handshake (Default value = None)
+
+        """
+        self.timeout = timeout
+        self.keepalive_secs = keepalive_secs
+        self.max_idle_secs = max_idle_secs
+        self.max_sessions_per_host = max_sessions_per_host
+        self.rate_limiter = rate_limiter
+        self.lock = threading.Lock()
+        self.map_connections = {}
+
+
+    def get_connection(self, ip_address, username='ec2-user', key_filename=None, timeout=None, rate_limiter=None, port=22 ):
+        """Check out the pooled connection for the host, connecting or reconnecting if necessary.  Several threads can
+        check out the same connection, close_idle skips it until each of them called release_connection
+
+        :param ip_address: ip address to SSH into
+        :param username: user name for SSH (Default value = 'ec2-user')
+        :param key_filename: path/name.ext of key file used to connect to remote (Default value = None)
+        :param timeout: max time to wait for SSH connection (Default value = None, pool timeout)
+        :param rate_limiter: overrides the pool rate_limiter (Default value = None)
+        :param port: SSH port (Default value = 22)
+        :return: :class:`awsext.ec2.sshpool.SshPooledConnection`
+
+        """
+        connection_key = ( ip_address, port, username, key_filename )
+        with self.lock:
+            ssh_pooled_connection = self.map_connections.get( connection_key )
+            if ssh_pooled_connection == None:
+                ssh_pooled_connection = SshPooledConnection( ip_address, username=username, key_filename=key_filename,
+                                                             keepalive_secs=self.keepalive_secs, max_sessions=self.max_sessions_per_host, port=port )
+                self.map_connections[ connection_key ] = ssh_pooled_connection
+            ssh_pooled_connection.num_checkouts += 1
+        # connect outside of the pool lock, so different hosts handshake concurrently
+        if timeout == None: timeout = self.timeout
+        if rate_limiter == None: rate_limiter = self.rate_limiter
+        try:
+            ssh_pooled_connection.connect( timeout=timeout, rate_limiter=rate_limiter )
+        except:
+            self.release_connection( ssh_pooled_connection )
+            raise
+        return ssh_pooled_connection
+
+
+    def release_connection(self, ssh_pooled_connection ):
+        """Check in a connection from get_connection, it stays open for reuse until close_idle or close_all
+
+        :param ssh_pooled_connection: :class:`awsext.ec2.sshpool.SshPooledConnection`
+
+        """
+        with self.lock:
+            ssh_pooled_connection.num_checkouts -= 1
+            ssh_pooled_connection.last_used_at = time.time()
+
+
+    def close_idle(self):
+        """Close connections that aren't checked out and haven't been used within max_idle_secs or are no longer healthy """
+        expired_at = time.time() - self.max_idle_secs
+        with self.lock:
+            for connection_key, ssh_pooled_connection in self.map_connections.items():
+                if ssh_pooled_connection.num_checkouts == 0 and ssh_pooled_connection.num_open_sessions == 0 and \
+                    (ssh_pooled_connection.last_used_at < expired_at or not ssh_pooled_connection.is_healthy()):
+                    ssh_pooled_connection.close()
+                    del self.map_connections[ connection_key ]
+
+
+    def close_all(self):
+        """Close all connections """
+        with self.lock:
+            for ssh_pooled_connection in self.map_connections.values(): ssh_pooled_connection.close()
+            self.map_connections = {}
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close_all()
+        return False
+
+
+class SshPooledConnection():
+    """Single SSH connection to a host, sessions are opened on the shared transport """
+
+    def __init__(self, ip_address, username='ec2-user', key_filename=None, keepalive_secs=30, max_sessions=8, port=22 ):
+        """
+
+        :param ip_address: ip address to SSH into
+        :param username: user name for SSH (Default value = 'ec2-user')
+        :param key_filename: path/name.ext of key file used to connect to remote (Default value = None)
+        :param keepalive_secs: interval of transport keepalive packets, 0 to disable (Default value = 30)
+        :param max_sessions: max concurrently open sessions (Default value = 8)
+        :param port: SSH port (Default value = 22)
+
+        """
+        self.ip_address = ip_address
+        self.username = username
+        self.key_filename = key_filename
+        self.keepalive_secs = keepalive_secs
+        self.port = port
+        self.ssh_client = None
+        self.sftp_client = None
+        self.lock = threading.Lock()
+        self.session_semaphore = threading.BoundedSemaphore( max_sessions )
+        self.num_open_sessions = 0
+        # callers of SshConnectionPool.get_connection that haven't released it, guarded by the pool lock
+        self.num_checkouts = 0
+        self.num_connects = 0
+        self.last_used_at = time.time()
+
+
+    def connect(self, timeout=60, rate_limiter=None ):
+        """Connect if not connected, or reconnect if the transport is no longer active
+
+        :param timeout: max time to wait for SSH connection (Default value = 60)
+        :param rate_limiter: :class:`awsext.workerpool.RateLimiter` acquired before the SSH handshake (Default value = None)
+
+        """
+        with self.lock:
+            self.last_used_at = time.time()
+            if self.is_healthy(): return
+            if self.ssh_client != None:
+                logger.info( 'Reconnecting unhealthy SSH connection: ' + self.ip_address )
+                self._close()
+            if rate_limiter != None: rate_limiter.acquire()
+            ssh_client = paramiko.SSHClient()
+            ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            ssh_client.connect( self.ip_address, port=self.port, timeout=timeout, username=self.username, key_filename=self.key_filename )
+            if self.keepalive_secs > 0: ssh_client.get_transport().set_keepalive( self.keepalive_secs )
+            self.ssh_client = ssh_client
+            self.num_connects += 1
+
+
+    def is_healthy(self):
+        """
+
+        :return: True if connected and the transport is active and authenticated
+
+        """
+        if self.ssh_client == None: return False
+        transport = self.ssh_client.get_transport()
+        return transport != None and transport.is_active() and transport.is_authenticated()
+
+
+    def open_session(self):
+        """Open a session on the shared transport, blocks while max_sessions are open.
+        Must be followed by close_session
+
+        :return: :class:`paramiko.Channel`
+
+        """
+        self.session_semaphore.acquire()
+        try:
+            chan = self.ssh_client.get_transport().open_session()
+        except:
+            self.session_semaphore.release()
+            raise
+        with self.lock:
+            self.num_open_sessions += 1
+            self.last_used_at = time.time()
+        return chan
+
+
+    def close_session(self, chan ):
+        """Close a session opened by open_session or open_sftp
+
+        :param chan: :class:`paramiko.Channel` or :class:`paramiko.SFTPClient`
+
+        """
+        try:
+            chan.close()
+        finally:
+            with self.lock:
+                self.num_open_sessions -= 1
+                self.last_used_at = time.time()
+            self.session_semaphore.release()
+
+
+    def acquire_sftp(self):
+        """SFTP session for exclusive use by the calling thread: the idle session released by the previous caller is reused,
+        else a new one is opened.  Blocks while max_sessions are open.  Must be followed by release_sftp
+
+        :return: :class:`paramiko.SFTPClient`
+
+        """
+        self.session_semaphore.acquire()
+        try:
+            with self.lock:
+                sftp_client = self.sftp_client
+                self.sftp_client = None
+            if sftp_client == None or sftp_client.sock.closed: sftp_client = self.ssh_client.open_sftp()
+        except:
+            self.session_semaphore.release()
+            raise
+        with self.lock:
+            self.num_open_sessions += 1
+            self.last_used_at = time.time()
+        return sftp_client
+
+
+    def release_sftp(self, sftp_client, is_reusable=True ):
+        """Release a session from acquire_sftp, one idle session is kept open for the next caller
+
+        :param sftp_client: :class:`paramiko.SFTPClient`
+        :param is_reusable: False if the session may be unusable, i.e. after a failed transfer (Default value = True)
+
+        """
+        try:
+            with self.lock:
+                if is_reusable and self.sftp_client == None and self.ssh_client != None and not sftp_client.sock.closed:
+                    self.sftp_client = sftp_client
+                    sftp_client = None
+            if sftp_client != None: sftp_client.close()
+        finally:
+            with self.lock:
+                self.num_open_sessions -= 1
+                self.last_used_at = time.time()
+            self.session_semaphore.release()
+
+
+    def open_sftp(self, is_blocking=True ):
+        """Open an additional SFTP session on the shared transport, i.e. one per thread.
+        Must be followed by close_session
+
+        :param is_blocking: If True, block while max_sessions are open, else return None (Default value = True)
+        :return: :class:`paramiko.SFTPClient`, None if not is_blocking and max_sessions are open
+
+        """
+        if not self.session_semaphore.acquire( is_blocking ): return None
+        try:
+            sftp_client = self.ssh_client.open_sftp()
+        except:
+            self.session_semaphore.release()
+            raise
+        with self.lock:
+            self.num_open_sessions += 1
+            self.last_used_at = time.time()
+        return sftp_client
+
+
+    def close(self):
+        """Close the idle SFTP session and SSH connection """
+        with self.lock:
+            self._close()
+
+
+    def _close(self):
+        if self.sftp_client != None:
+            try:
+                self.sftp_client.close()
+            except Exception as e:
+                logger.warn( 'Failure closing SFTP session: ' + self.ip_address + ', ' + str(e) )
+            self.sftp_client = None
+        if self.ssh_client != None: self.ssh_client.close()
+        self.ssh_client = None
@@ -0,0 +1,653 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+File transfer to remote hosts over an SSH connection
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import re
+import sys
+import stat
+import json
+import gzip
+import errno
+import Queue
+import socket
+import tarfile
+import pipes
+import hashlib
+import posixpath
+import threading
+import awsext.exception
+from awsext.workerpool import WorkerPool
+from awsext.ec2.remoteoutput import OutputCapture, drain_channel, RECV_SIZE, STREAM_NAME_STD_OUT, STREAM_NAME_STD_ERR
+
+import logging
+logger = logging.getLogger(__name__)
+
+SFTP_CHUNK_SIZE = 32768
+HASH_BLOCK_SIZE = 1048576
+DELTA_BLOCK_SIZE = 4194304
+
+# writes "<path>\0<sha256 of each block, comma separated>\0" for each NUL separated path read from STD_IN, run with the
+# remote python (2 or 3).  Any file name is valid and the command line stays short however many files are hashed
+REMOTE_BLOCK_HASH_SCRIPT = '''
+import sys, hashlib
+block_size = int(sys.argv[1])
+std_in = getattr(sys.stdin, 'buffer', sys.stdin)
+std_out = getattr(sys.stdout, 'buffer', sys.stdout)
+for path in std_in.read().split(b'\\0'):
+    if not path: continue
+    hashes = []
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if not data: break
+            hashes.append(hashlib.sha256(data).hexdigest())
+    std_out.write(path + b'\\0' + ','.join(hashes).encode('ascii') + b'\\0')
+'''
+# sets $remote_python to python3 if installed, else python, i.e. images such as Amazon Linux 2023 only have python3
+REMOTE_PYTHON_SELECT = 'remote_python=$(command -v python3 || command -v python) || { echo "python3 or python not found" >&2; exit 127; }'
+# escape sequences of sha256sum names, other than a backslash itself
+SHA256SUM_ESCAPES = { 'n':'\n', 'r':'\r' }
+
+
+def check_expired( is_expired, description ):
+    """
+
+    :param is_expired: If not None, callable that returns True once the transfer must stop, i.e. RemoteDeadline.is_expired
+    :param description: what was being transferred, for the exception
+    :raise awsext.exception.RemoteCommandTimeoutError: if is_expired returned True
+
+    """
+    if is_expired != None and is_expired(): raise awsext.exception.RemoteCommandTimeoutError( 'Transfer expired: ' + description )
+
+
+def put_file( sftp_client, from_file, to_file, mode=None, chunk_size=SFTP_CHUNK_SIZE, is_expired=None ):
+    """Upload a file with pipelined writes, i.e. don't wait for each write to be acknowledged
+
+    :param sftp_client: :class:`paramiko.SFTPClient`
+    :param from_file: local path/name.ext
+    :param to_file: remote path/name.ext
+    :param mode: If not None, set the remote file mode, i.e. 0o755 (Default value = None)
+    :param chunk_size: bytes per write (Default value = 32768)
+    :param is_expired: If not None, callable checked before each write, see check_expired (Default value = None)
+    :return: number of bytes transferred
+    :raise awsext.exception.RemoteCommandTimeoutError: if is_expired returned True, the remote file is left partially written
+
+    """
+    num_bytes = 0
+    with open( from_file, 'rb' ) as local_file:
+        remote_file = sftp_client.open( to_file, 'wb' )
+        try:
+            remote_file.set_pipelined( True )
+            while True:
+                check_expired( is_expired, to_file )
+                data = local_file.read( chunk_size )
+                if not data: break
+                remote_file.write( data )
+                num_bytes += len(data)
+        finally:
+            # close waits for all outstanding write acknowledgements
+            remote_file.close()
+    if mode != None: sftp_client.chmod( to_file, mode )
+    return num_bytes
+
+
+def get_executable_mode( from_file ):
+    """
+
+    :param from_file: local path/name.ext
+    :return: mode of from_file plus execute permission for user, group and other, i.e. chmod +x
+
+    """
+    return stat.S_IMODE( os.stat( from_file ).st_mode ) | 0o111
+
+
+def makedirs_remote( sftp_client, remote_dir, known_remote_dirs=None ):
+    """Create a remote directory and any missing parents, i.e. mkdir -p
+
+    :param sftp_client: :class:`paramiko.SFTPClient`
+    :param remote_dir: remote directory
+    :param known_remote_dirs: If not None, set of directories known to exist, updated with created directories (Default value = None)
+
+    """
+    if known_remote_dirs == None: known_remote_dirs = set()
+    missing_dirs = []
+    check_dir = remote_dir
+    while check_dir not in ('', '/', '.') and check_dir not in known_remote_dirs:
+        try:
+            sftp_client.stat( check_dir )
+            break
+        except IOError as e:
+            if e.errno != errno.ENOENT: raise e
+            missing_dirs.append( check_dir )
+        check_dir = posixpath.dirname( check_dir )
+    for missing_dir in reversed( missing_dirs ):
+        sftp_client.mkdir( missing_dir )
+        known_remote_dirs.add( missing_dir )
+    known_remote_dirs.add( remote_dir )
+
+
+def upload_files( sftp_client, remote_upload_items, max_concurrent=4, ssh_connection=None, is_expired=None ):
+    """Upload files with pipelined writes, concurrently if ssh_connection is passed.  A paramiko.SFTPClient can't
+    be shared by threads (a thread can consume and drop the response another thread is waiting for), so one upload thread
+    uses sftp_client and each other upload thread opens its own SFTP session on the connection's transport.  Only sessions
+    available without waiting are opened: the caller already holds sftp_client, waiting for more while other threads
+    sharing the connection do the same could exhaust max_sessions with no thread able to proceed
+
+    :param sftp_client: :class:`paramiko.SFTPClient` held by the caller
+    :param remote_upload_items: list of :class:`awsext.ec2.transfer.RemoteUploadItem`
+    :param max_concurrent: max files uploaded concurrently (Default value = 4)
+    :param ssh_connection: :class:`awsext.ec2.sshpool.SshPooledConnection`, required to upload concurrently (Default value = None, sequential)
+    :param is_expired: If not None, callable checked before each write, see check_expired (Default value = None)
+    :return: total number of bytes transferred
+
+    """
+    num_bytes = 0
+    if len(remote_upload_items) == 0: return num_bytes
+    max_workers = max(1, min(max_concurrent, len(remote_upload_items)))
+    if ssh_connection == None or max_workers == 1:
+        for remote_upload_item in remote_upload_items:
+            num_bytes += put_file( sftp_client, remote_upload_item.from_file, remote_upload_item.to_file, mode=remote_upload_item.mode, is_expired=is_expired )
+        return num_bytes
+
+    thread_sftp_clients = []
+    sftp_client_queue = Queue.Queue()
+    sftp_client_queue.put( sftp_client )
+    thread_local = threading.local()
+
+    def upload_file( remote_upload_item ):
+        thread_sftp_client = getattr( thread_local, 'sftp_client', None )
+        # one session per worker thread, there are as many sessions as threads
+        if thread_sftp_client == None:
+            thread_sftp_client = sftp_client_queue.get_nowait()
+            thread_local.sftp_client = thread_sftp_client
+        return put_file( thread_sftp_client, remote_upload_item.from_file, remote_upload_item.to_file, mode=remote_upload_item.mode, is_expired=is_expired )
+
+    worker_pool = None
+    try:
+        for i in range(max_workers - 1):
+            thread_sftp_client = ssh_connection.open_sftp( is_blocking=False )
+            if thread_sftp_client == None: break
+            thread_sftp_clients.append( thread_sftp_client )
+            sftp_client_queue.put( thread_sftp_client )
+        worker_pool = WorkerPool( max_workers=len(thread_sftp_clients) + 1, name_prefix='sftp-upload' )
+        for work_item in worker_pool.imap_unordered( upload_file, remote_upload_items ):
+            num_bytes += work_item.get()
+    finally:
+        if worker_pool != None: worker_pool.shutdown()
+        for thread_sftp_client in thread_sftp_clients: ssh_connection.close_session( thread_sftp_client )
+    return num_bytes
+
+
+def upload_manifest( sftp_client, remote_upload_manifest, max_concurrent=4, ssh_connection=None, is_expired=None ):
+    """Create the remote directories of the manifest then upload all of its files
+
+    :param sftp_client: :class:`paramiko.SFTPClient`
+    :param remote_upload_manifest: :class:`awsext.ec2.transfer.RemoteUploadManifest`
+    :param max_concurrent: max files uploaded concurrently (Default value = 4)
+    :param ssh_connection: :class:`awsext.ec2.sshpool.SshPooledConnection`, required to upload concurrently (Default value = None, sequential)
+    :param is_expired: If not None, callable checked before each write, see check_expired (Default value = None)
+    :return: total number of bytes transferred
+
+    """
+    known_remote_dirs = set()
+    for remote_dir in remote_upload_manifest.get_remote_dirs(): makedirs_remote( sftp_client, remote_dir, known_remote_dirs )
+    return upload_files( sftp_client, remote_upload_manifest.remote_upload_items, max_concurrent=max_concurrent, ssh_connection=ssh_connection,
+                         is_expired=is_expired )
+
+
+def run_command( ssh_connection, cmd_line, std_in_data=None, is_expired=None ):
+    """Run a command and wait for it to complete, STD_OUT is returned in full (i.e. for parsing), STD_ERR head and tail only
+
+    :param ssh_connection: :class:`awsext.ec2.sshpool.SshPooledConnection`
+    :param cmd_line: command line/args executed on remote
+    :param std_in_data: If not None, sent to STD_IN followed by EOF (Default value = None)
+    :param is_expired: If not None, callable checked while the command runs, see drain_channel (Default value = None)
+    :return: tuple of (returncode, std_out, std_err)
+    :raise awsext.exception.RemoteCommandTimeoutError: if is_expired returned True
+
+    """
+    std_out_capture = OutputCapture( STREAM_NAME_STD_OUT, max_head_bytes=sys.maxint, max_tail_bytes=0 )
+    std_err_capture = OutputCapture( STREAM_NAME_STD_ERR )
+    chan = ssh_connection.open_session()
+    try:
+        chan.exec_command( cmd_line )
+        if std_in_data != None:
+            ChannelWriter( chan, std_out_capture, std_err_capture, is_expired=is_expired ).write( std_in_data )
+            chan.shutdown_write()
+        returncode = drain_channel( chan, std_out_capture, std_err_capture, is_expired=is_expired )
+    finally:
+        ssh_connection.close_session( chan )
+    return returncode, std_out_capture.get_text(), std_err_capture.get_text()
+
+
+def parse_sha256sum_line( line ):
+    """Parse a line of sha256sum output.  A name containing a backslash or newline is escaped by sha256sum, and the
+    line starts with a backslash
+
+    :param line: line of sha256sum output, without the newline
+    :return: tuple of (hex SHA-256, path/name.ext)
+
+    """
+    is_escaped = line.startswith( '\\' )
+    if is_escaped: line = line[1:]
+    # '<sha256>  <name>' in text mode, '<sha256> *<name>' in binary mode
+    sha256, name = line.split( ' ', 1 )
+    name = name[1:]
+    if is_escaped: name = re.sub( r'\\(.)', lambda match: SHA256SUM_ESCAPES.get( match.group(1), match.group(1) ), name )
+    return sha256, name
+
+
+def sync_dir_to_remote( ssh_connection, local_dir, remote_dir, local_hash_cache=None, is_delete=False, is_preserve_mode=True,
+                        delta_min_bytes=67108864, delta_block_size=DELTA_BLOCK_SIZE, max_concurrent=4, is_expired=None ):
+    """Make remote_dir match local_dir, transferring only new or changed files.  Local hashes are cached by mtime/size,
+    remote hashes are fetched with a single exec.  Changed files of at least delta_min_bytes that exist on the remote 
+    are updated block by block, only blocks whose hash differs are written
+
+    :param ssh_connection: :class:`awsext.ec2.sshpool.SshPooledConnection`
+    :param local_dir: local directory
+    :param remote_dir: remote directory, created if it doesn't exist
+    :param local_hash_cache: :class:`awsext.ec2.transfer.LocalHashCache`, saved after the sync (Default value = None, not cached)
+    :param is_delete: If True, delete remote files that don't exist locally (Default value = False)
+    :param is_preserve_mode: If True, set remote file modes to the local file modes (Default value = True)
+    :param delta_min_bytes: min size of a changed file to be updated by block, None to disable (Default value = 67108864)
+    :param delta_block_size: block size of block updates (Default value = 4194304)
+    :param max_concurrent: max files transferred concurrently (Default value = 4)
+    :param is_expired: If not None, callable checked while hashing and before each write, see check_expired (Default value = None)
+    :return: :class:`awsext.ec2.transfer.RemoteSyncResult`
+    :raise awsext.exception.RemoteCommandTimeoutError: if is_expired returned True
+
+    """
+    if local_hash_cache == None: local_hash_cache = LocalHashCache()
+    remote_sync_result = RemoteSyncResult()
+
+    # 1. local hashes, cached by mtime/size
+    remote_upload_manifest = RemoteUploadManifest()
+    remote_upload_manifest.add_dir( local_dir, remote_dir, is_preserve_mode=is_preserve_mode )
+    map_local_sha256s = {}
+    for remote_upload_item in remote_upload_manifest.remote_upload_items:
+        remote_upload_item.to_file = posixpath.normpath( remote_upload_item.to_file )
+        map_local_sha256s[ remote_upload_item.to_file ] = local_hash_cache.get_sha256( remote_upload_item.from_file )
+    local_hash_cache.save()
+
+    # 2. remote hashes, single exec
+    map_remote_sha256s = get_remote_sha256s( ssh_connection, remote_dir, is_expired=is_expired )
+
+    # 3. new/changed files, full or block updates
+    full_upload_items = []
+    delta_upload_items = []
+    for remote_upload_item in remote_upload_manifest.remote_upload_items:
+        remote_sync_result.num_files += 1
+        remote_sha256 = map_remote_sha256s.get( remote_upload_item.to_file )
+        if remote_sha256 == map_local_sha256s[ remote_upload_item.to_file ]:
+            remote_sync_result.num_unchanged += 1
+        elif remote_sha256 != None and delta_min_bytes != None and os.path.getsize( remote_upload_item.from_file ) >= delta_min_bytes:
+            delta_upload_items.append( remote_upload_item )
+        else: full_upload_items.append( remote_upload_item )
+
+    # 4. remote block hashes of delta candidates, single exec
+    map_remote_block_sha256s = {}
+    if len(delta_upload_items) > 0:
+        map_remote_block_sha256s = get_remote_block_sha256s( ssh_connection, [ item.to_file for item in delta_upload_items ], delta_block_size, 
+                                                             is_expired=is_expired )
+        for remote_upload_item in list(delta_upload_items):
+            if map_remote_block_sha256s.get( remote_upload_item.to_file ) == None: 
+                delta_upload_items.remove( remote_upload_item )
+                full_upload_items.append( remote_upload_item )
+    is_remote_deletes = is_delete and len( set( map_remote_sha256s.keys() ) - set( map_local_sha256s.keys() ) ) > 0
+    if len(delta_upload_items) == 0 and len(full_upload_items) == 0 and not is_remote_deletes: return remote_sync_result
+
+    # 5. writes, on an SFTP session held only after the execs above, so this thread never waits for a session while holding one
+    sftp_client = ssh_connection.acquire_sftp()
+    is_sftp_reusable = False
+    try:
+        for remote_upload_item in delta_upload_items:
+            remote_sync_result.num_bytes += put_file_delta( sftp_client, remote_upload_item.from_file, remote_upload_item.to_file, 
+                                                            map_remote_block_sha256s[ remote_upload_item.to_file ], mode=remote_upload_item.mode, 
+                                                            block_size=delta_block_size, is_expired=is_expired )
+            remote_sync_result.num_delta += 1
+
+        if len(full_upload_items) > 0:
+            known_remote_dirs = set()
+            for remote_dir_path in sorted( set( [ posixpath.dirname( item.to_file ) for item in full_upload_items ] ) ):
+                makedirs_remote( sftp_client, remote_dir_path, known_remote_dirs )
+            remote_sync_result.num_bytes += upload_files( sftp_client, full_upload_items, max_concurrent=max_concurrent, ssh_connection=ssh_connection,
+                                                          is_expired=is_expired )
+            remote_sync_result.num_uploaded += len(full_upload_items)
+
+        if is_delete:
+            for remote_file in sorted( set( map_remote_sha256s.keys() ) - set( map_local_sha256s.keys() ) ):
+                sftp_client.remove( remote_file )
+                remote_sync_result.num_deleted += 1
+        is_sftp_reusable = True
+    finally:
+        ssh_connection.release_sftp( sftp_client, is_reusable=is_sftp_reusable )
+    return remote_sync_result
+
+
+def get_remote_sha256s( ssh_connection, remote_dir, is_expired=None ):
+    """
+
+    :param ssh_connection: :class:`awsext.ec2.sshpool.SshPooledConnection`
+    :param remote_dir: remote directory
+    :param is_expired: If not None, callable checked while the command runs, see drain_channel (Default value = None)
+    :return: dict of remote path/name.ext to hex SHA-256 of all files in remote_dir, empty if remote_dir doesn't exist
+
+    """
+    cmd_line = 'cd ' + pipes.quote(remote_dir) + ' 2>/dev/null || exit 0; find . -type f -print0 | xargs -0 -r sha256sum'
+    returncode, std_out, std_err = run_command( ssh_connection, cmd_line, is_expired=is_expired )
+    if returncode != 0: raise IOError( 'Failure hashing remote files in ' + remote_dir + ': ' + std_err )
+    map_remote_sha256s = {}
+    # escaped names don't contain newlines, other line breaks (i.e. CR) may be part of a name
+    for line in std_out.split( '\n' ):
+        if line == '': continue
+        sha256, rel_path = parse_sha256sum_line( line )
+        map_remote_sha256s[ posixpath.normpath( posixpath.join( remote_dir, rel_path ) ) ] = sha256
+    return map_remote_sha256s
+
+
+def get_remote_block_sha256s( ssh_connection, remote_files, block_size, is_expired=None ):
+    """
+
+    :param ssh_connection: :class:`awsext.ec2.sshpool.SshPooledConnection`
+    :param remote_files: list of remote path/name.ext
+    :param block_size: block size
+    :param is_expired: If not None, callable checked while the command runs, see drain_channel (Default value = None)
+    :return: dict of remote path/name.ext to list of hex SHA-256 of each block, empty if neither python3 nor python is available on the remote
+
+    """
+    cmd_line = REMOTE_PYTHON_SELECT + ' && "$remote_python" -c ' + pipes.quote(REMOTE_BLOCK_HASH_SCRIPT) + ' ' + str(block_size)
+    returncode, std_out, std_err = run_command( ssh_connection, cmd_line, std_in_data=''.join( [ remote_file + '\0' for remote_file in remote_files ] ),
+                                                is_expired=is_expired )
+    if returncode != 0:
+        logger.warn( 'Remote block hashing failed, transferring full files: ' + std_err )
+        return {}
+    map_remote_block_sha256s = {}
+    fields = std_out.split( '\0' )
+    for remote_file, block_sha256s in zip( fields[0:-1:2], fields[1::2] ):
+        map_remote_block_sha256s[ remote_file ] = [ block_sha256 for block_sha256 in block_sha256s.split( ',' ) if block_sha256 != '' ]
+    return map_remote_block_sha256s
+
+
+def put_file_delta( sftp_client, from_file, to_file, remote_block_sha256s, mode=None, block_size=DELTA_BLOCK_SIZE, is_expired=None ):
+    """Update an existing remote file in place, writing only the blocks that differ from the local file
+
+    :param sftp_client: :class:`paramiko.SFTPClient`
+    :param from_file: local path/name.ext
+    :param to_file: remote path/name.ext
+    :param remote_block_sha256s: list of hex SHA-256 of each block of the remote file
+    :param mode: If not None, set the remote file mode (Default value = None)
+    :param block_size: block size used to hash remote_block_sha256s (Default value = 4194304)
+    :param is_expired: If not None, callable checked before each block, see check_expired (Default value = None)
+    :return: number of bytes transferred
+
+    """
+    num_bytes = 0
+    with open( from_file, 'rb' ) as local_file:
+        remote_file = sftp_client.open( to_file, 'r+' )
+        try:
+            remote_file.set_pipelined( True )
+            block_num = 0
+            while True:
+                check_expired( is_expired, to_file )
+                data = local_file.read( block_size )
+                if not data: break
+                if block_num >= len(remote_block_sha256s) or hashlib.sha256( data ).hexdigest() != remote_block_sha256s[block_num]:
+                    remote_file.seek( block_num * block_size )
+                    remote_file.write( data )
+                    num_bytes += len(data)
+                block_num += 1
+        finally:
+            remote_file.close()
+    sftp_client.truncate( to_file, os.path.getsize( from_file ) )
+    if mode != None: sftp_client.chmod( to_file, mode )
+    return num_bytes
+
+
+def put_tar_stream( ssh_connection, local_dir, remote_dir, compress_level=6, is_expired=None ):
+    """Transfer a directory tree as a tar stream over a single exec channel, extracted by tar on the remote.  The archive is
+    created on the fly, nothing is written to disk on either end.  Much faster than per-file SFTP for many small files
+
+    :param ssh_connection: :class:`awsext.ec2.sshpool.SshPooledConnection`
+    :param local_dir: local directory, its contents are extracted into remote_dir
+    :param remote_dir: remote directory, created if it doesn't exist
+    :param compress_level: gzip compression level 1-9, 0 for an uncompressed tar stream (Default value = 6)
+    :param is_expired: If not None, callable checked while sending and while tar runs, see check_expired (Default value = None)
+    :return: number of bytes sent over the channel
+    :raise awsext.exception.RemoteCommandTimeoutError: if is_expired returned True
+
+    """
+    cmd_line = 'mkdir -p ' + pipes.quote(remote_dir) + ' && tar -x' + ('z' if compress_level > 0 else '') + \
+               ' --no-same-owner -f - -C ' + pipes.quote(remote_dir)
+    std_out_capture = OutputCapture( STREAM_NAME_STD_OUT )
+    std_err_capture = OutputCapture( STREAM_NAME_STD_ERR )
+    chan = ssh_connection.open_session()
+    try:
+        chan.exec_command( cmd_line )
+        channel_writer = ChannelWriter( chan, std_out_capture, std_err_capture, is_expired=is_expired )
+        if compress_level > 0: tar_fileobj = gzip.GzipFile( filename='', mode='wb', compresslevel=compress_level, fileobj=channel_writer )
+        else: tar_fileobj = channel_writer
+        tar_file = tarfile.open( fileobj=tar_fileobj, mode='w|' )
+        for entry_name in sorted( os.listdir( local_dir ) ): tar_file.add( os.path.join( local_dir, entry_name ), arcname=entry_name )
+        tar_file.close()
+        if compress_level > 0: tar_fileobj.close()
+        chan.shutdown_write()
+        returncode = drain_channel( chan, std_out_capture, std_err_capture, is_expired=is_expired )
+    finally:
+        ssh_connection.close_session( chan )
+    if returncode != 0: raise IOError( 'Failure extracting tar stream into ' + remote_dir + ', returncode=' + str(returncode) + ': ' + std_err_capture.get_text() )
+    return channel_writer.num_bytes
+
+
+class ChannelWriter():
+    """Minimal file-like object that sends writes over a channel and counts the bytes.  Output of the remote command is
+    read between sends, a command writing more than a window of STD_OUT/STD_ERR before reading all of STD_IN would
+    otherwise block while this side blocks on a full send window """
+
+    def __init__(self, chan, std_out_capture, std_err_capture, poll_secs=0.25, is_expired=None ):
+        """
+
+        :param chan: :class:`paramiko.Channel`
+        :param std_out_capture: :class:`awsext.ec2.remoteoutput.OutputCapture` for STD_OUT
+        :param std_err_capture: :class:`awsext.ec2.remoteoutput.OutputCapture` for STD_ERR
+        :param poll_secs: max seconds to wait for the send window before reading output again (Default value = 0.25)
+        :param is_expired: If not None, callable checked at least every poll_secs, see check_expired (Default value = None)
+
+        """
+        self.chan = chan
+        self.std_out_capture = std_out_capture
+        self.std_err_capture = std_err_capture
+        self.poll_secs = poll_secs
+        self.is_expired = is_expired
+        self.num_bytes = 0
+
+
+    def write(self, data ):
+        """
+
+        :param data: bytes to send
+
+        """
+        offset = 0
+        self.chan.settimeout( self.poll_secs )
+        try:
+            while offset < len(data):
+                check_expired( self.is_expired, 'channel' )
+                while self.chan.recv_ready(): self.std_out_capture.write( self.chan.recv( RECV_SIZE ) )
+                while self.chan.recv_stderr_ready(): self.std_err_capture.write( self.chan.recv_stderr( RECV_SIZE ) )
+                try:
+                    offset += self.chan.send( data[offset:] )
+                except socket.timeout:
+                    pass
+        finally:
+            self.chan.settimeout( None )
+        self.num_bytes += len(data)
+
+
+    def flush(self):
+        """ """
+        pass
+
+
+class LocalHashCache():
+    """SHA-256 of local files, recomputed only if the mtime or size changed, optionally persisted to a JSON file """
+
+    def __init__(self, cache_path=None ):
+        """
+
+        :param cache_path: path/name.ext of the JSON file, None for memory only (Default value = None)
+
+        """
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+        self.map_entries = {}
+        self.is_changed = False
+        if cache_path != None and os.path.exists( cache_path ):
+            try:
+                with open( cache_path, 'r' ) as cache_file: self.map_entries = json.load( cache_file )
+            except ValueError as e:
+                logger.warn( 'Ignoring invalid hash cache file: ' + cache_path + ', ' + str(e) )
+
+
+    def get_sha256(self, path ):
+        """
+
+        :param path: local path/name.ext
+        :return: hex SHA-256 of the file contents
+
+        """
+        abs_path = os.path.abspath( path )
+        file_stat = os.stat( abs_path )
+        with self.lock:
+            entry = self.map_entries.get( abs_path )
+        if entry != None and entry[0] == file_stat.st_mtime and entry[1] == file_stat.st_size: return entry[2]
+        sha256 = hashlib.sha256()
+        with open( abs_path, 'rb' ) as local_file:
+            while True:
+                data = local_file.read( HASH_BLOCK_SIZE )
+                if not data: break
+                sha256.update( data )
+        with self.lock:
+            self.map_entries[ abs_path ] = [ file_stat.st_mtime, file_stat.st_size, sha256.hexdigest() ]
+            self.is_changed = True
+        return sha256.hexdigest()
+
+
+    def save(self):
+        """Write the cache file if any entries changed """
+        if self.cache_path == None: return
+        with self.lock:
+            if not self.is_changed: return
+            tmp_cache_path = self.cache_path + '.tmp'
+            with open( tmp_cache_path, 'w' ) as cache_file: json.dump( self.map_entries, cache_file )
+            os.rename( tmp_cache_path, self.cache_path )
+            self.is_changed = False
+
+
+class RemoteSyncResult():
+    """Counts of a sync_dir_to_remote """
+
+    def __init__(self):
+        """ """
+        self.num_files = 0
+        self.num_unchanged = 0
+        self.num_uploaded = 0
+        self.num_delta = 0
+        self.num_deleted = 0
+        self.num_bytes = 0
+
+
+    def __str__(self):
+        """ """
+        return 'RemoteSyncResult: num_files=' + str(self.num_files) + ', num_unchanged=' + str(self.num_unchanged) + ', num_uploaded=' + \
+                str(self.num_uploaded) + ', num_delta=' + str(self.num_delta) + ', num_deleted=' + str(self.num_deleted) + ', num_bytes=' + str(self.num_bytes)
+
+
+class RemoteUploadItem():
+    """Single local file and its remote target """
+
+    def __init__(self, from_file, to_file, mode=None ):
+        """
+
+        :param from_file: local path/name.ext
+        :param to_file: remote path/name.ext
+        :param mode: If not None, remote file mode (Default value = None)
+
+        """
+        self.from_file = from_file
+        self.to_file = to_file
+        self.mode = mode
+
+
+class RemoteUploadManifest():
+    """Files and directory trees to be uploaded to a remote host in one call """
+
+    def __init__(self):
+        """ """
+        self.remote_upload_items = []
+
+
+    def add_file(self, from_file, to_file, mode=None ):
+        """
+
+        :param from_file: local path/name.ext
+        :param to_file: remote path/name.ext
+        :param mode: If not None, remote file mode (Default value = None)
+
+        """
+        self.remote_upload_items.append( RemoteUploadItem( from_file, to_file, mode=mode ) )
+
+
+    def add_dir(self, local_dir, remote_dir, is_preserve_mode=True ):
+        """Add all files in a local directory tree
+
+        :param local_dir: local directory
+        :param remote_dir: remote directory, created if it doesn't exist
+        :param is_preserve_mode: If True, set remote file modes to the local file modes (Default value = True)
+
+        """
+        for dir_path, dir_names, file_names in os.walk( local_dir ):
+            rel_dir = os.path.relpath( dir_path, local_dir )
+            if rel_dir == '.': target_dir = remote_dir
+            else: target_dir = posixpath.join( remote_dir, *rel_dir.split( os.sep ) )
+            for file_name in sorted( file_names ):
+                from_file = os.path.join( dir_path, file_name )
+                if not os.path.isfile( from_file ): continue
+                mode = None
+                if is_preserve_mode: mode = stat.S_IMODE( os.stat( from_file ).st_mode )
+                self.add_file( from_file, posixpath.join( target_dir, file_name ), mode=mode )
+
+
+    def get_remote_dirs(self):
+        """
+
+        :return: sorted list of remote directories of all files
+
+        """
+        return sorted( set( [ posixpath.dirname( remote_upload_item.to_file ) for remote_upload_item in self.remote_upload_items ] ) )
+
+
+    def get_num_bytes(self):
+        """
+
+        :return: total size of all local files
+
+        """
+        return sum( [ os.path.getsize( remote_upload_item.from_file ) for remote_upload_item in self.remote_upload_items ] )
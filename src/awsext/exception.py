@@ -45,7 +45,7 @@ class InstancePollTerminatedError(Exception):
         :param instance_id: 
 
         """
-        super(InstancePollTimeoutError, self).__init__(message)
+        super(InstancePollTerminatedError, self).__init__(message)
         self.instance_id = instance_id
 
 
@@ -251,3 +251,59 @@ class QueueDoesntExistError(Exception):
         """
         super(QueueDoesntExistError, self).__init__(message)
         self.queue = queue
+
+
+class RemoteCommandTimeoutError(Exception):
+    """ """
+
+    def __init__(self, message, ip_address=None, cmd_line=None, is_cancelled=False ):
+        """
+
+        :param message: 
+        :param ip_address:  (Default value = None)
+        :param cmd_line:  (Default value = None)
+        :param is_cancelled: True if cancelled by the caller, False if the deadline was exceeded (Default value = False)
+
+        """
+        super(RemoteCommandTimeoutError, self).__init__(message)
+        self.ip_address = ip_address
+        self.cmd_line = cmd_line
+        self.is_cancelled = is_cancelled
+
+
+class S3SyncError(Exception):
+    """ """
+
+    def __init__(self, message, errors ):
+        """
+
+        :param message: 
+        :param errors: list of (key name or local path, exception) of every failed transfer
+
+        """
+        super(S3SyncError, self).__init__(message)
+        self.errors = errors
+
+
+class WorkItemCancelledError(Exception):
+    """ """
+
+    def __init__(self, message ):
+        """
+
+        :param message: 
+
+        """
+        super(WorkItemCancelledError, self).__init__(message)
+
+
+class WorkItemTimeoutError(Exception):
+    """ """
+
+    def __init__(self, message ):
+        """
+
+        :param message: 
+
+        """
+        super(WorkItemTimeoutError, self).__init__(message)
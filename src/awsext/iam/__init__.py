@@ -19,14 +19,15 @@ Common methods for awsext.iam
 :version: 1.1
 """
 
-from boto.regioninfo import RegionInfo, get_regions
+from boto.regioninfo import RegionInfo
+import awsext.regioncache
 from boto.iam import IAMRegionInfo
 from awsext.iam.connection import AwsExtIAMConnection
 
 
 def regions():
     """Get all available regions for the IAM service."""
-    regions = get_regions(
+    regions = awsext.regioncache.get_regions(
         'iam',
         region_cls=IAMRegionInfo,
         connection_cls=AwsExtIAMConnection
@@ -0,0 +1,244 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Region and Availability Zone metadata cache, shared by the awsext service packages
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import time
+import json
+import fcntl
+import threading
+import boto.regioninfo
+from boto.regioninfo import RegionInfo
+from boto.ec2.zone import Zone
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECS = 24 * 60 * 60
+ENV_CACHE_PATH = 'AWSEXT_REGION_CACHE_PATH'
+
+
+class RegionCache():
+    """In memory cache of region endpoints and AZ's, with an optional on-disk copy so short lived processes
+    (i.e. CLI invocations, cron jobs) don't rebuild region lists or re-fetch AZ's on every run.  A key missing 
+    (or expired) in memory is looked up in the on-disk copy before it's fetched, i.e. saved by another process """
+
+    def __init__(self, ttl_secs=DEFAULT_TTL_SECS, cache_path=None ):
+        """
+
+        :param ttl_secs: seconds an entry is valid (Default value = 86400)
+        :param cache_path: path/name.ext of the on-disk JSON copy, None for memory only (Default value = None)
+
+        """
+        self.ttl_secs = ttl_secs
+        self.cache_path = cache_path
+        self.lock = threading.RLock()
+        self.map_service_endpoints = {}
+        self.map_region_zones = {}
+
+
+    def get_regions(self, service_name, region_cls=None, connection_cls=None ):
+        """Cached equivalent of boto.regioninfo.get_regions.  New RegionInfo instances are returned
+        on each call, callers are free to modify them (i.e. override the endpoint)
+
+        :param service_name: service name, i.e. 'ec2'
+        :param region_cls: RegionInfo class to create (Default value = None, RegionInfo)
+        :param connection_cls: connection class of each RegionInfo (Default value = None)
+        :return: list of RegionInfo
+
+        """
+        if region_cls == None: region_cls = RegionInfo
+        with self.lock:
+            map_endpoints = self._get_cached( self.map_service_endpoints, service_name )
+            if map_endpoints == None:
+                map_endpoints = {}
+                for region in boto.regioninfo.get_regions( service_name ): map_endpoints[ region.name ] = region.endpoint
+                self.map_service_endpoints[ service_name ] = { 'expires_at':time.time() + self.ttl_secs, 'value':map_endpoints }
+                self._save_disk()
+        return [ region_cls( name=str(region_name), endpoint=str(endpoint), connection_cls=connection_cls )
+                 for region_name, endpoint in sorted( map_endpoints.items() ) ]
+
+
+    def get_zones(self, region_name, profile_name=None, ec2_conn=None ):
+        """Cached equivalent of EC2Connection.get_all_zones, AZ's are fetched once per region/profile
+
+        :param region_name: Region name
+        :param profile_name: profile name from credentials file (Default value = None)
+        :param ec2_conn: EC2Connection in region_name, used to fetch the AZ's on a cache miss and as the connection of the 
+                Zones (Default value = None, connect on demand)
+        :return: list of :class:`awsext.regioncache.CachedZone`
+
+        """
+        import boto.ec2
+        zone_key = str(profile_name) + '|' + region_name
+        with self.lock:
+            zone_name_states = self._get_cached( self.map_region_zones, zone_key )
+        if zone_name_states == None:
+            if ec2_conn == None: ec2_conn = boto.ec2.connect_to_region( region_name, profile_name=profile_name )
+            zone_name_states = [ [zone.name, zone.state] for zone in ec2_conn.get_all_zones() ]
+            with self.lock:
+                self.map_region_zones[ zone_key ] = { 'expires_at':time.time() + self.ttl_secs, 'value':zone_name_states }
+                self._save_disk()
+        zones = []
+        for zone_name, zone_state in zone_name_states:
+            zone = CachedZone( region_name, profile_name=profile_name, connection=ec2_conn )
+            zone.name = str(zone_name)
+            zone.state = str(zone_state)
+            zones.append( zone )
+        return zones
+
+
+    def invalidate(self):
+        """Remove all entries from memory and disk """
+        with self.lock:
+            self.map_service_endpoints = {}
+            self.map_region_zones = {}
+            self._save_disk( is_replace=True )
+
+
+    def _get_cached(self, map_entries, key ):
+        """Call with the lock held """
+        value = self._get_valid( map_entries, key )
+        if value == None and self.cache_path != None:
+            self._load_disk()
+            value = self._get_valid( map_entries, key )
+        return value
+
+
+    def _get_valid(self, map_entries, key ):
+        entry = map_entries.get( key )
+        if entry == None or entry['expires_at'] < time.time(): return None
+        return entry['value']
+
+
+    def _merge(self, map_entries, map_disk_entries ):
+        for key, disk_entry in map_disk_entries.items():
+            entry = map_entries.get( key )
+            if entry == None or entry['expires_at'] < disk_entry['expires_at']: map_entries[ key ] = disk_entry
+
+
+    def _read_disk(self):
+        if not os.path.exists( self.cache_path ): return None
+        try:
+            with open( self.cache_path, 'r' ) as cache_file: return json.load( cache_file )
+        except (IOError, ValueError) as e:
+            logger.warn( 'Ignoring invalid region cache file: ' + self.cache_path + ', ' + str(e) )
+            return None
+
+
+    def _load_disk(self):
+        disk_cache = self._read_disk()
+        if disk_cache == None: return
+        self._merge( self.map_service_endpoints, disk_cache.get( 'service_endpoints', {} ) )
+        self._merge( self.map_region_zones, disk_cache.get( 'region_zones', {} ) )
+
+
+    def _save_disk(self, is_replace=False ):
+        if self.cache_path == None: return
+        # other processes may have saved entries since this one loaded, re-read and merge (newest entry per key wins)
+        # under an exclusive lock, then write to a temp file and rename, concurrent readers always see a complete file
+        tmp_cache_path = self.cache_path + '.' + str(os.getpid()) + '.tmp'
+        try:
+            with open( self.cache_path + '.lock', 'a' ) as lock_file:
+                fcntl.flock( lock_file.fileno(), fcntl.LOCK_EX )
+                if not is_replace:
+                    disk_cache = self._read_disk()
+                    if disk_cache != None:
+                        self._merge( self.map_service_endpoints, disk_cache.get( 'service_endpoints', {} ) )
+                        self._merge( self.map_region_zones, disk_cache.get( 'region_zones', {} ) )
+                with open( tmp_cache_path, 'w' ) as cache_file:
+                    json.dump( { 'service_endpoints':self.map_service_endpoints, 'region_zones':self.map_region_zones }, cache_file )
+                os.rename( tmp_cache_path, self.cache_path )
+        except (IOError, OSError) as e:
+            logger.warn( 'Unable to write region cache file: ' + self.cache_path + ', ' + str(e) )
+
+
+class CachedZone(Zone):
+    """Zone from the region cache, connects to its region on first use of the connection if none was passed """
+
+    def __init__(self, region_name, profile_name=None, connection=None ):
+        """
+
+        :param region_name: Region name
+        :param profile_name: profile name from credentials file (Default value = None)
+        :param connection: If not None, EC2Connection in region_name (Default value = None, connect on demand)
+
+        """
+        # not Zone.__init__, EC2Object.__init__ reads self.connection, which would connect
+        self._connection = connection
+        self.profile_name = profile_name
+        self.region = None
+        if connection != None and hasattr( connection, 'region' ): self.region = connection.region
+        self.name = None
+        self.state = None
+        self.region_name = region_name
+        self.messages = None
+
+
+    def get_connection(self):
+        """ """
+        if self._connection == None: 
+            import boto.ec2
+            self._connection = boto.ec2.connect_to_region( self.region_name, profile_name=self.profile_name )
+        return self._connection
+
+
+    def set_connection(self, connection ):
+        """ """
+        self._connection = connection
+
+
+    connection = property( get_connection, set_connection )
+
+
+default_region_cache = RegionCache( cache_path=os.environ.get( ENV_CACHE_PATH ) )
+
+
+def configure( ttl_secs=DEFAULT_TTL_SECS, cache_path=None ):
+    """Replace the shared region cache, i.e. to enable the on-disk copy
+
+    :param ttl_secs: seconds an entry is valid (Default value = 86400)
+    :param cache_path: path/name.ext of the on-disk JSON copy, None for memory only (Default value = None)
+
+    """
+    global default_region_cache
+    default_region_cache = RegionCache( ttl_secs=ttl_secs, cache_path=cache_path )
+
+
+def get_regions( service_name, region_cls=None, connection_cls=None ):
+    """get_regions via the shared region cache
+
+    :param service_name: service name, i.e. 'ec2'
+    :param region_cls: RegionInfo class to create (Default value = None, RegionInfo)
+    :param connection_cls: connection class of each RegionInfo (Default value = None)
+
+    """
+    return default_region_cache.get_regions( service_name, region_cls=region_cls, connection_cls=connection_cls )
+
+
+def get_zones( region_name, profile_name=None, ec2_conn=None ):
+    """get_zones via the shared region cache
+
+    :param region_name: Region name
+    :param profile_name: profile name from credentials file (Default value = None)
+    :param ec2_conn: EC2Connection in region_name, only used on a cache miss (Default value = None)
+
+    """
+    return default_region_cache.get_zones( region_name, profile_name=profile_name, ec2_conn=ec2_conn )
@@ -19,8 +19,9 @@ Common methods for awsext.s3
 :version: 1.1
 """
 
-from boto.regioninfo import RegionInfo, get_regions
+from boto.regioninfo import RegionInfo
 import boto.s3
+import awsext.regioncache
 
 def regions():
     """Get all available regions for the Amazon S3 service.
@@ -29,7 +30,7 @@ def regions():
     
     """
     from awsext.s3.connection import AwsExtS3Connection
-    return get_regions(
+    return awsext.regioncache.get_regions(
         's3',
         region_cls=boto.s3.S3RegionInfo,
         connection_cls=AwsExtS3Connection
@@ -0,0 +1,215 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Adaptive concurrency and part size of S3 transfers, with live throughput statistics
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import time
+import threading
+from awsext.s3.transfer import DEFAULT_PART_SIZE, MIN_UPLOAD_PART_SIZE
+
+import logging
+logger = logging.getLogger(__name__)
+
+# a change of the interval throughput within this fraction is noise
+RATE_TOLERANCE = 0.05
+
+
+class S3TransferController():
+    """Limits the concurrent requests of S3 transfers and tunes the limit and the part size of large objects to maximize throughput.  
+    Each interval_secs the throughput of the interval is compared to the previous one: the concurrency keeps moving in the same 
+    direction while throughput improves and reverses when it drops (hill climbing), and is halved if S3 responded SlowDown.  
+    The part size doubles while part requests complete faster than min_request_secs (request overhead dominates) and halves 
+    while they take longer than max_request_secs (retries are expensive).  Requests that fail with SlowDown are retried after 
+    an exponential backoff; boto retries 5xx responses itself first, so the controller sees the SlowDowns boto gave up on.  Transfers call acquire/release around each request, 
+    see :func:`awsext.s3.transfer.call_with_retries`; get_stats can be called from any thread while transfers are running """
+
+    def __init__(self, min_concurrency=2, max_concurrency=64, initial_concurrency=8, part_size=DEFAULT_PART_SIZE, min_part_size=MIN_UPLOAD_PART_SIZE, 
+                 max_part_size=67108864, interval_secs=2.0, min_request_secs=0.5, max_request_secs=10.0 ):
+        """
+
+        :param min_concurrency: min concurrent requests (Default value = 2)
+        :param max_concurrency: max concurrent requests, the size of the worker pools of a sync (Default value = 64)
+        :param initial_concurrency: concurrent requests until the first adjustment (Default value = 8)
+        :param part_size: initial bytes per range or part (Default value = DEFAULT_PART_SIZE)
+        :param min_part_size: min bytes per range or part, at least 5 MB for uploads (Default value = MIN_UPLOAD_PART_SIZE)
+        :param max_part_size: max bytes per range or part (Default value = 67108864)
+        :param interval_secs: seconds between adjustments (Default value = 2.0)
+        :param min_request_secs: part requests faster than this on average grow the part size (Default value = 0.5)
+        :param max_request_secs: part requests slower than this on average shrink the part size (Default value = 10.0)
+
+        """
+        if min_concurrency < 1 or min_concurrency > max_concurrency: raise ValueError( 'Require 1 <= min_concurrency <= max_concurrency' )
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = max( min_concurrency, min( initial_concurrency, max_concurrency ) )
+        self.part_size = part_size
+        self.min_part_size = min_part_size
+        self.max_part_size = max_part_size
+        self.interval_secs = interval_secs
+        self.min_request_secs = min_request_secs
+        self.max_request_secs = max_request_secs
+        self.condition = threading.Condition()
+        self.num_active = 0
+        self.direction = 1
+        self.backoff_time = 0.0
+        self.start_time = time.time()
+        self.num_bytes = 0
+        self.num_objects = 0
+        self.num_requests = 0
+        self.num_retries = 0
+        self.num_slowdowns = 0
+        self.sum_request_secs = 0.0
+        self.prev_interval_rate = None
+        self.interval_rate = 0.0
+        self.reset_interval( self.start_time )
+
+
+    def reset_interval(self, now ):
+        """
+
+        :param now: start time of the next interval
+
+        """
+        self.interval_start_time = now
+        self.interval_bytes = 0
+        self.interval_num_slowdowns = 0
+        self.interval_part_requests = 0
+        self.interval_part_secs = 0.0
+
+
+    def acquire(self):
+        """Block until fewer than concurrency requests are active """
+        with self.condition:
+            while self.num_active >= self.concurrency: self.condition.wait()
+            self.num_active += 1
+
+
+    def release(self):
+        """ """
+        with self.condition:
+            self.num_active -= 1
+            self.condition.notify_all()
+
+
+    def get_part_size(self):
+        """
+
+        :return: current bytes per range or part, for the next large object
+
+        """
+        with self.condition:
+            return self.part_size
+
+
+    def record_request(self, num_bytes, request_secs ):
+        """
+
+        :param num_bytes: bytes transferred by a completed request
+        :param request_secs: latency of the request
+
+        """
+        with self.condition:
+            self.num_requests += 1
+            self.num_bytes += num_bytes
+            self.sum_request_secs += request_secs
+            self.interval_bytes += num_bytes
+            # small objects don't tell whether the part size is right
+            if num_bytes >= self.min_part_size:
+                self.interval_part_requests += 1
+                self.interval_part_secs += request_secs
+            self.adjust()
+
+
+    def record_error(self, e, is_slowdown=False, is_retry=True ):
+        """
+
+        :param e: exception of a failed request
+        :param is_slowdown: If True, S3 is throttling (Default value = False)
+        :param is_retry: If True, the request is retried (Default value = True)
+
+        """
+        with self.condition:
+            if is_retry: self.num_retries += 1
+            if is_slowdown:
+                self.num_slowdowns += 1
+                self.interval_num_slowdowns += 1
+            self.adjust()
+
+
+    def record_object(self):
+        """Count a completed object """
+        with self.condition:
+            self.num_objects += 1
+
+
+    def adjust(self):
+        """Adjust concurrency and part size if the interval elapsed, the caller holds self.condition """
+        now = time.time()
+        if self.interval_num_slowdowns > 0:
+            # back off immediately, but once per interval: the requests in flight get their SlowDowns too
+            if now - self.backoff_time >= self.interval_secs:
+                self.concurrency = max( self.min_concurrency, self.concurrency // 2 )
+                self.backoff_time = now
+                logger.info( 'SlowDown, reduced: ' + str(self) )
+            self.direction = 1
+            self.prev_interval_rate = None
+            self.reset_interval( now )
+            return
+        if now - self.interval_start_time < self.interval_secs: return
+        self.interval_rate = self.interval_bytes / (now - self.interval_start_time)
+        if self.interval_bytes > 0:
+            if self.prev_interval_rate != None and self.interval_rate < self.prev_interval_rate * (1 - RATE_TOLERANCE): self.direction = -self.direction
+            step = max( 1, self.concurrency // 4 )
+            self.concurrency = max( self.min_concurrency, min( self.max_concurrency, self.concurrency + self.direction * step ) )
+            # at a bound, the only way left is back
+            if self.concurrency == self.max_concurrency: self.direction = -1
+            elif self.concurrency == self.min_concurrency: self.direction = 1
+            self.prev_interval_rate = self.interval_rate
+        if self.interval_part_requests > 0:
+            mean_part_secs = self.interval_part_secs / self.interval_part_requests
+            if mean_part_secs < self.min_request_secs: self.part_size = min( self.max_part_size, self.part_size * 2 )
+            elif mean_part_secs > self.max_request_secs: self.part_size = max( self.min_part_size, self.part_size // 2 )
+        logger.info( str(self) )
+        self.condition.notify_all()
+        self.reset_interval( now )
+
+
+    def get_stats(self):
+        """
+
+        :return: dict of the statistics since the controller was created and the current settings
+
+        """
+        with self.condition:
+            elapsed_secs = time.time() - self.start_time
+            return { 'num_bytes':self.num_bytes, 'num_objects':self.num_objects, 'num_requests':self.num_requests, 
+                     'num_retries':self.num_retries, 'num_slowdowns':self.num_slowdowns, 
+                     'bytes_per_sec':self.num_bytes / elapsed_secs if elapsed_secs > 0 else 0.0,
+                     'interval_bytes_per_sec':self.interval_rate, 
+                     'mean_request_secs':self.sum_request_secs / self.num_requests if self.num_requests > 0 else 0.0,
+                     'concurrency':self.concurrency, 'num_active':self.num_active, 'part_size':self.part_size, 'elapsed_secs':elapsed_secs }
+
+
+    def __str__(self):
+        """ """
+        stats = self.get_stats()
+        return ('S3TransferController: bytes=' + str(stats['num_bytes']) + ', objects=' + str(stats['num_objects']) + 
+                ', bytes_per_sec=' + str(int(stats['bytes_per_sec'])) + ', interval_bytes_per_sec=' + str(int(stats['interval_bytes_per_sec'])) + 
+                ', requests=' + str(stats['num_requests']) + ', retries=' + str(stats['num_retries']) + ', slowdowns=' + str(stats['num_slowdowns']) + 
+                ', mean_request_secs=' + str(round(stats['mean_request_secs'], 3)) + ', concurrency=' + str(stats['concurrency']) + 
+                ', part_size=' + str(stats['part_size']))
@@ -0,0 +1,279 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Local content-addressable cache of S3 objects, shared by processes on the same host
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import time
+import stat
+import errno
+import fcntl
+import shutil
+import hashlib
+import threading
+import subprocess
+
+import logging
+logger = logging.getLogger(__name__)
+
+MATERIALIZE_HARDLINK = 'hardlink'
+MATERIALIZE_REFLINK = 'reflink'
+MATERIALIZE_COPY = 'copy'
+# temporary files of downloads that died are removed by evict after this many seconds
+STALE_TMP_SECS = 3600
+
+
+class S3ObjectCache():
+    """Objects keyed by (bucket, key, ETag) under cache_path/objects, materialized into sync targets as hardlinks (or reflinks/copies). 
+    Processes and threads coordinate with flock on a lock file per entry, so an object is downloaded once per host.  The last use 
+    of an entry is its atime, set explicitly, entries are read-only and their mtime is whole seconds, so the mtime of a hardlinked 
+    file (see :class:`awsext.s3.manifest.S3SyncManifest`) never changes.  Hardlinked files share the entry's inode and mode: use 
+    MATERIALIZE_REFLINK or MATERIALIZE_COPY if the synced files are written to """
+
+    def __init__(self, cache_path, max_bytes=None, materialize=MATERIALIZE_HARDLINK ):
+        """
+
+        :param cache_path: directory of the cache, created if it doesn't exist
+        :param max_bytes: If not None, evict reduces the cache to this size, least recently used first (Default value = None)
+        :param materialize: MATERIALIZE_HARDLINK, falls back to MATERIALIZE_REFLINK across file systems, MATERIALIZE_REFLINK 
+                (cp --reflink=auto, a copy-on-write clone on btrfs/xfs, else a copy) or MATERIALIZE_COPY (Default value = MATERIALIZE_HARDLINK)
+
+        """
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.materialize = materialize
+        self.lock = threading.Lock()
+        self.num_hits = 0
+        self.num_misses = 0
+        make_dirs( os.path.join( cache_path, 'objects' ) )
+
+
+    def get_entry_path(self, bucket_name, key_name, etag ):
+        """
+
+        :param bucket_name: S3 bucket
+        :param key_name: key
+        :param etag: ETag of the object, with or without quotes
+        :return: path/name of the cache entry
+
+        """
+        if isinstance( key_name, unicode ): key_name = key_name.encode( 'utf-8' )
+        entry_hash = hashlib.sha1( bucket_name + '\n' + key_name + '\n' + etag.strip('"') ).hexdigest()
+        return os.path.join( self.cache_path, 'objects', entry_hash[:2], entry_hash )
+
+
+    def get(self, key, local_file, download_func=None ):
+        """Materialize a key into a local file, downloading it into the cache if it isn't cached
+
+        :param key: :class:`boto.s3.key.Key` from a listing, i.e. with its ETag
+        :param local_file: target path/name.ext, the directory must exist, replaced if it exists
+        :param download_func: download_func( key, local_file ) downloads a key to a file (Default value = None, key.get_contents_to_filename)
+        :return: bytes downloaded, None if the key was cached
+
+        """
+        entry_path = self.get_entry_path( key.bucket.name, key.name, key.etag )
+        # hits don't lock: an entry that is evicted meanwhile fails to materialize and is downloaded again below
+        if self.materialize_entry( entry_path, local_file ):
+            with self.lock: self.num_hits += 1
+            return None
+        num_bytes = None
+        lock_file = self.lock_entry( entry_path )
+        try:
+            # another process or thread may have downloaded it while this one waited for the lock
+            if not os.path.exists( entry_path ): num_bytes = self.download_entry( key, entry_path, download_func )
+            if not self.materialize_entry( entry_path, local_file ): raise IOError( 'Cache entry not found: ' + entry_path )
+        finally:
+            unlock_entry( lock_file )
+        with self.lock:
+            if num_bytes == None: self.num_hits += 1
+            else: self.num_misses += 1
+        return num_bytes
+
+
+    def download_entry(self, key, entry_path, download_func=None ):
+        """Download a key to a temporary file renamed to the entry, the caller holds the entry lock
+
+        :param key: :class:`boto.s3.key.Key`
+        :param entry_path: path/name of the cache entry
+        :param download_func: download_func( key, local_file ) downloads a key to a file (Default value = None, key.get_contents_to_filename)
+        :return: bytes downloaded
+
+        """
+        make_dirs( os.path.dirname( entry_path ) )
+        tmp_entry_path = entry_path + '.' + str(os.getpid()) + '.' + str(threading.current_thread().ident) + '.tmp'
+        try:
+            if download_func != None: download_func( key, tmp_entry_path )
+            else: key.get_contents_to_filename( tmp_entry_path )
+            num_bytes = os.path.getsize( tmp_entry_path )
+            now = int( time.time() )
+            os.utime( tmp_entry_path, (now, now) )
+            os.chmod( tmp_entry_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH )
+            os.rename( tmp_entry_path, entry_path )
+        except:
+            if os.path.exists( tmp_entry_path ): os.remove( tmp_entry_path )
+            raise
+        return num_bytes
+
+
+    def materialize_entry(self, entry_path, local_file ):
+        """
+
+        :param entry_path: path/name of the cache entry
+        :param local_file: target path/name.ext, replaced atomically if it exists
+        :return: True if materialized, False if the entry doesn't exist
+
+        """
+        try:
+            entry_stat = os.stat( entry_path )
+        except OSError as e:
+            if e.errno == errno.ENOENT: return False
+            raise
+        # already materialized by a previous sync
+        if self.materialize == MATERIALIZE_HARDLINK and os.path.exists( local_file ) and os.path.samefile( entry_path, local_file ):
+            os.utime( entry_path, (time.time(), entry_stat.st_mtime) )
+            return True
+        tmp_local_file = local_file + '.tmp'
+        if os.path.lexists( tmp_local_file ): os.remove( tmp_local_file )
+        try:
+            materialize = self.materialize
+            if materialize == MATERIALIZE_HARDLINK:
+                try:
+                    os.link( entry_path, tmp_local_file )
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK): raise
+                    materialize = MATERIALIZE_REFLINK
+            if materialize == MATERIALIZE_REFLINK: 
+                subprocess.check_call( ['cp', '--reflink=auto', entry_path, tmp_local_file] )
+            elif materialize == MATERIALIZE_COPY: 
+                shutil.copyfile( entry_path, tmp_local_file )
+            if materialize != MATERIALIZE_HARDLINK: 
+                os.chmod( tmp_local_file, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH )
+        except (OSError, IOError, subprocess.CalledProcessError):
+            if os.path.lexists( tmp_local_file ): os.remove( tmp_local_file )
+            if not os.path.exists( entry_path ): return False
+            raise
+        os.rename( tmp_local_file, local_file )
+        try:
+            os.utime( entry_path, (time.time(), entry_stat.st_mtime) )
+        except OSError:
+            pass
+        return True
+
+
+    def lock_entry(self, entry_path, is_blocking=True ):
+        """Exclusive flock of the entry's lock file, which evict removes while holding it
+
+        :param entry_path: path/name of the cache entry
+        :param is_blocking: If False, don't wait for the lock (Default value = True)
+        :return: locked lock file, None if not is_blocking and the entry is locked
+
+        """
+        make_dirs( os.path.dirname( entry_path ) )
+        lock_path = entry_path + '.lock'
+        while True:
+            lock_file = open( lock_path, 'a' )
+            try:
+                if is_blocking: fcntl.flock( lock_file.fileno(), fcntl.LOCK_EX )
+                else: fcntl.flock( lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB )
+            except IOError as e:
+                lock_file.close()
+                if e.errno in (errno.EAGAIN, errno.EACCES): return None
+                raise
+            # the lock file is still the one at lock_path, unless it was evicted while this one waited
+            try:
+                if os.fstat( lock_file.fileno() ).st_ino == os.stat( lock_path ).st_ino: return lock_file
+            except OSError:
+                pass
+            lock_file.close()
+
+
+    def evict(self, max_bytes=None ):
+        """Remove least recently used entries until the cache is at most max_bytes, skipping entries in use.  Sizes are file sizes,
+        the space of an entry that is hardlinked into a sync target is only freed when the target is removed.  Only one process 
+        evicts at a time, the others return immediately
+
+        :param max_bytes: target size of the cache (Default value = None, self.max_bytes)
+        :return: number of entries removed
+
+        """
+        if max_bytes == None: max_bytes = self.max_bytes
+        if max_bytes == None: return 0
+        with open( os.path.join( self.cache_path, 'evict.lock' ), 'a' ) as evict_lock_file:
+            try:
+                fcntl.flock( evict_lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB )
+            except IOError as e:
+                if e.errno in (errno.EAGAIN, errno.EACCES): return 0
+                raise
+            now = time.time()
+            entries = []
+            total_bytes = 0
+            for dir_path, dir_names, file_names in os.walk( os.path.join( self.cache_path, 'objects' ) ):
+                for file_name in file_names:
+                    file_path = os.path.join( dir_path, file_name )
+                    try:
+                        file_stat = os.stat( file_path )
+                        if file_name.endswith('.tmp'):
+                            if now - file_stat.st_mtime > STALE_TMP_SECS: os.remove( file_path )
+                            continue
+                    except OSError:
+                        continue
+                    if file_name.endswith('.lock'): continue
+                    entries.append( (file_stat.st_atime, file_stat.st_size, file_path) )
+                    total_bytes += file_stat.st_size
+            entries.sort()
+            num_evicted = 0
+            for atime, size, entry_path in entries:
+                if total_bytes <= max_bytes: break
+                lock_file = self.lock_entry( entry_path, is_blocking=False )
+                if lock_file == None: continue
+                try:
+                    os.remove( entry_path )
+                    os.remove( entry_path + '.lock' )
+                finally:
+                    unlock_entry( lock_file )
+                total_bytes -= size
+                num_evicted += 1
+            logger.info( 'Evicted ' + str(num_evicted) + ' entries, cache bytes=' + str(total_bytes) )
+            return num_evicted
+
+
+    def __str__(self):
+        """ """
+        return 'S3ObjectCache: cache_path=' + self.cache_path + ', hits=' + str(self.num_hits) + ', misses=' + str(self.num_misses)
+
+
+def unlock_entry( lock_file ):
+    """
+
+    :param lock_file: lock file returned by :func:`awsext.s3.cache.S3ObjectCache.lock_entry`
+
+    """
+    fcntl.flock( lock_file.fileno(), fcntl.LOCK_UN )
+    lock_file.close()
+
+
+def make_dirs( dir_path ):
+    """os.makedirs that tolerates other processes creating the directory concurrently
+
+    :param dir_path: directory
+
+    """
+    try:
+        os.makedirs( dir_path )
+    except OSError as e:
+        if e.errno != errno.EEXIST: raise
@@ -0,0 +1,215 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Checkpoint journal of a sync from S3, so an interrupted sync resumes instead of starting over
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import time
+import json
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+# the journal is flushed on every record, so it survives the process being killed, and fsynced at most this often
+FSYNC_INTERVAL_SECS = 1.0
+
+
+class S3SyncCheckpoint():
+    """Append-only journal of the completed objects and the completed byte ranges of partially downloaded objects, one JSON 
+    record per line: {"k": key name, "e": ETag, "s": size} for an object, plus "r": [first byte, last byte] for a range.  It is 
+    replayed and compacted when opened; a torn last line (the process died while writing it) is ignored """
+
+    def __init__(self, checkpoint_path ):
+        """
+
+        :param checkpoint_path: path/name.ext of the journal, replayed if it exists
+
+        """
+        self.checkpoint_path = checkpoint_path
+        self.lock = threading.Lock()
+        self.map_completed = {}
+        self.map_partial = {}
+        self.is_resumed = os.path.exists( checkpoint_path )
+        if self.is_resumed: self.load()
+        self.compact()
+        self.journal_file = open( checkpoint_path, 'a' )
+        self.fsync_time = time.time()
+
+
+    def load(self):
+        """Replay the journal """
+        with open( self.checkpoint_path, 'r' ) as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads( line )
+                except ValueError:
+                    logger.warn( 'Ignoring invalid checkpoint record: ' + self.checkpoint_path + ', ' + line.strip() )
+                    continue
+                self.apply( record )
+
+
+    def apply(self, record ):
+        """
+
+        :param record: journal record
+
+        """
+        key_name = record['k']
+        if 'r' not in record:
+            self.map_completed[ key_name ] = (record['e'], record['s'])
+            self.map_partial.pop( key_name, None )
+            return
+        partial = self.map_partial.get( key_name )
+        # ranges of a previous version of the object are worthless
+        if partial == None or partial[0] != record['e'] or partial[1] != record['s']:
+            partial = (record['e'], record['s'], [])
+            self.map_partial[ key_name ] = partial
+        partial[2].append( tuple(record['r']) )
+
+
+    def compact(self):
+        """Rewrite the journal atomically with one record per completed object and merged ranges per partial object """
+        tmp_checkpoint_path = self.checkpoint_path + '.tmp'
+        with open( tmp_checkpoint_path, 'w' ) as journal_file:
+            for key_name, (etag, size) in self.map_completed.iteritems():
+                journal_file.write( json.dumps( { 'k':key_name, 'e':etag, 's':size } ) + '\n' )
+            for key_name, (etag, size, ranges) in self.map_partial.iteritems():
+                ranges[:] = merge_ranges( ranges )
+                for byte_range in ranges: journal_file.write( json.dumps( { 'k':key_name, 'e':etag, 's':size, 'r':list(byte_range) } ) + '\n' )
+            journal_file.flush()
+            os.fsync( journal_file.fileno() )
+        os.rename( tmp_checkpoint_path, self.checkpoint_path )
+
+
+    def is_completed(self, key, local_file ):
+        """
+
+        :param key: :class:`boto.s3.key.Key` from a listing
+        :param local_file: local path/name.ext of the key
+        :return: True if the key was completed by a previous run, its ETag is unchanged and the local file has its size
+
+        """
+        with self.lock:
+            completed = self.map_completed.get( key.name )
+        if completed == None or completed != (key.etag.strip('"'), key.size): return False
+        try:
+            return os.path.getsize( local_file ) == key.size
+        except OSError:
+            return False
+
+
+    def get_completed_ranges(self, key, local_file ):
+        """
+
+        :param key: :class:`boto.s3.key.Key` from a listing
+        :param local_file: local path/name.ext of the key
+        :return: list of (first byte, last byte) downloaded by a previous run, empty if the ETag changed or the 
+                preallocated local file doesn't have the size of the key
+
+        """
+        with self.lock:
+            partial = self.map_partial.get( key.name )
+        if partial == None or partial[0] != key.etag.strip('"') or partial[1] != key.size: return []
+        try:
+            if os.path.getsize( local_file ) != key.size: return []
+        except OSError:
+            return []
+        return list( partial[2] )
+
+
+    def put_completed(self, key ):
+        """
+
+        :param key: :class:`boto.s3.key.Key` that was downloaded
+
+        """
+        record = { 'k':key.name, 'e':key.etag.strip('"'), 's':key.size }
+        with self.lock:
+            self.apply( record )
+            self.write( record )
+
+
+    def put_range(self, key, start, end ):
+        """
+
+        :param key: :class:`boto.s3.key.Key` being downloaded
+        :param start: first byte of a range written to the local file
+        :param end: last byte of the range
+
+        """
+        record = { 'k':key.name, 'e':key.etag.strip('"'), 's':key.size, 'r':[start, end] }
+        with self.lock:
+            self.apply( record )
+            self.write( record )
+
+
+    def write(self, record ):
+        """Append a record, the caller holds self.lock
+
+        :param record: journal record
+
+        """
+        self.journal_file.write( json.dumps( record ) + '\n' )
+        self.journal_file.flush()
+        now = time.time()
+        if now - self.fsync_time >= FSYNC_INTERVAL_SECS:
+            os.fsync( self.journal_file.fileno() )
+            self.fsync_time = now
+
+
+    def close(self, is_completed=False ):
+        """
+
+        :param is_completed: If True, the sync completed and the journal is removed (Default value = False)
+
+        """
+        with self.lock:
+            if self.journal_file.closed: return
+            self.journal_file.flush()
+            os.fsync( self.journal_file.fileno() )
+            self.journal_file.close()
+            if is_completed: os.remove( self.checkpoint_path )
+
+
+def merge_ranges( ranges ):
+    """
+
+    :param ranges: list of (first byte, last byte)
+    :return: sorted list of non-overlapping (first byte, last byte), adjacent ranges merged
+
+    """
+    merged = []
+    for start, end in sorted( ranges ):
+        if len(merged) > 0 and start <= merged[-1][1] + 1: merged[-1] = (merged[-1][0], max( merged[-1][1], end ))
+        else: merged.append( (start, end) )
+    return merged
+
+
+def is_range_covered( start, end, merged_ranges ):
+    """
+
+    :param start: first byte
+    :param end: last byte
+    :param merged_ranges: result of merge_ranges
+    :return: True if start-end is within one of the ranges
+
+    """
+    for merged_start, merged_end in merged_ranges:
+        if merged_start <= start and end <= merged_end: return True
+    return False
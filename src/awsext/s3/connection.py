@@ -20,9 +20,25 @@ Extensions to boto S3Connection
 """
 
 import os
+import io
+import time
 import shutil
+import warnings
 import threading
+import boto.exception
 import boto.s3.connection
+import boto.s3.key
+import awsext.exception
+from awsext.workerpool import WorkerPool
+from awsext.s3.manifest import S3SyncManifest
+from awsext.s3.checkpoint import S3SyncCheckpoint
+from awsext.s3.listing import iter_keys_parallel
+from awsext.s3.reader import S3SeekableReader, DEFAULT_BLOCK_SIZE
+from awsext.s3.transfer import download_key_ranged, upload_file_multipart, iter_local_files, get_etag_num_parts, get_local_etag, \
+    get_file_md5, get_upload_part_size, get_upload_part_size_for, call_with_retries, S3ThreadConnections, DEFAULT_PART_SIZE, RANGED_MIN_BYTES
+
+import logging
+logger = logging.getLogger(__name__)
 
 
 class AwsExtS3Connection(boto.s3.connection.S3Connection):
@@ -35,34 +51,424 @@ class AwsExtS3Connection(boto.s3.connection.S3Connection):
 
         """
         super(AwsExtS3Connection, self).__init__(**kw_params)
+        self.kw_params = kw_params
+
+
+    def clone(self):
+        """
+
+        :return: new connection to the same endpoint, sharing this connection's provider (credentials)
+
+        """
+        kw_params = dict( self.kw_params )
+        kw_params['provider'] = self.provider
+        return self.__class__( **kw_params )
+
+
+    def download_file(self, bucket_name, key_name, local_file, part_size=DEFAULT_PART_SIZE, max_concurrent=8, ranged_min_bytes=RANGED_MIN_BYTES,
+                      is_verify=True ):
+        """Download one object, as concurrent byte ranges if it's large, see :func:`awsext.s3.transfer.download_key_ranged`
+
+        :param bucket_name: source S3 bucket
+        :param key_name: source key
+        :param local_file: target path/name.ext, the directory must exist
+        :param part_size: bytes per range (Default value = DEFAULT_PART_SIZE)
+        :param max_concurrent: max concurrent ranges (Default value = 8)
+        :param ranged_min_bytes: objects of at least this size are downloaded as ranges (Default value = RANGED_MIN_BYTES)
+        :param is_verify: If True, check the ETag of a ranged download, set to False for ETags that aren't MD5 based, i.e. SSE-KMS (Default value = True)
+        :return: bytes downloaded
+
+        """
+        # no HEAD: a GET of the first ranged_min_bytes returns a small object whole, and the size and ETag of a large one
+        key = boto.s3.key.Key( self.get_bucket( bucket_name, validate=False ), key_name )
+        try:
+            key.open_read( headers={ 'Range':'bytes=0-' + str(ranged_min_bytes - 1) } )
+        except boto.exception.S3ResponseError as e:
+            if e.status == 404: raise IOError( 'Key not found: ' + bucket_name + '/' + key_name )
+            # a range of an empty object isn't satisfiable
+            if e.status != 416: raise
+            key.get_contents_to_filename( local_file )
+            return os.path.getsize( local_file )
+        if key.size >= ranged_min_bytes:
+            # drop the response instead of reading ranged_min_bytes that the ranges will download again
+            key.close( fast=True )
+            return download_key_ranged( key, local_file, part_size=part_size, max_concurrent=max_concurrent, is_verify=is_verify )
+        with open( local_file, 'wb' ) as fp:
+            for data in key: fp.write( data )
+        return os.path.getsize( local_file )
+
+
+    def open_key_reader(self, bucket_name, key_name, block_size=DEFAULT_BLOCK_SIZE, max_cached_blocks=16, read_ahead_blocks=2, 
+                        buffer_size=io.DEFAULT_BUFFER_SIZE ):
+        """Open an object for streaming reads without downloading it first, i.e. 
+        for line in gzip.GzipFile( fileobj=s3_connection.open_key_reader( 'bucket', 'path/file.csv.gz' ) ): ...
+
+        :param bucket_name: S3 bucket
+        :param key_name: key
+        :param block_size: bytes per ranged GET (Default value = DEFAULT_BLOCK_SIZE)
+        :param max_cached_blocks: max blocks kept in memory (Default value = 16)
+        :param read_ahead_blocks: blocks prefetched on background threads, 0 to disable (Default value = 2)
+        :param buffer_size: buffer size of the io.BufferedReader, None for the unbuffered :class:`awsext.s3.reader.S3SeekableReader` (Default value = io.DEFAULT_BUFFER_SIZE)
+        :return: seekable io.BufferedReader, close it to stop the read-ahead threads
+
+        """
+        key = self.get_bucket( bucket_name, validate=False ).get_key( key_name )
+        if key == None: raise IOError( 'Key not found: ' + bucket_name + '/' + key_name )
+        s3_seekable_reader = S3SeekableReader( key, block_size=block_size, max_cached_blocks=max_cached_blocks, read_ahead_blocks=read_ahead_blocks )
+        if buffer_size == None: return s3_seekable_reader
+        return io.BufferedReader( s3_seekable_reader, buffer_size=buffer_size )
 
-    def sync_from_s3(self, bucket_name=None, prefix=None, local_path=None, clean_first=True ):
-        """Transfer all files from and s3 bucket and prefix to a local path
+
+    def list_keys(self, bucket_name, prefix=None, max_workers=8, is_ordered=False, delimiter='/', split_markers=None ):
+        """List the keys of a bucket and prefix, on concurrent connections if max_workers > 1, see :func:`awsext.s3.listing.iter_keys_parallel`
+
+        :param bucket_name: S3 bucket
+        :param prefix: path in S3 bucket to filter objects (Default value = None)
+        :param max_workers: max concurrent listings, 1 for a single sequential bucket.list (Default value = 8)
+        :param is_ordered: If True, keys are yielded in key order, else as they are listed (Default value = False)
+        :param delimiter: delimiter of the sub-prefixes the listing is partitioned by (Default value = '/')
+        :param split_markers: If not None, sorted list of boundary keys the listing is partitioned by, instead of sub-prefixes (Default value = None)
+        :return: generator of :class:`boto.s3.key.Key`
+
+        """
+        bucket = self.get_bucket( bucket_name, validate=False )
+        if prefix == None: prefix = ''
+        if max_workers <= 1 and split_markers == None: return iter( bucket.list( prefix=prefix ) )
+        return iter_keys_parallel( bucket, prefix=prefix, delimiter=delimiter, max_workers=max_workers, split_markers=split_markers, is_ordered=is_ordered )
+
+
+    def sync_from_s3(self, bucket_name=None, prefix=None, local_path=None, clean_first=True, max_workers=16, manifest_path=None, 
+                     is_delete_orphans=False, ranged_min_bytes=RANGED_MIN_BYTES, part_size=DEFAULT_PART_SIZE, max_part_workers=8, 
+                     max_list_workers=1, s3_object_cache=None, s3_transfer_controller=None, checkpoint_path=None, is_verify=True ):
+        """Transfer all files from and s3 bucket and prefix to a local path.  Keys are downloaded on a bounded pool of 
+        worker threads, each on its own keep-alive connection, while the listing is still being paged in
 
         :param bucket_name: source S3 bucket (Default value = None)
         :param prefix: path in S3 bucket to filter objects (Default value = None)
         :param local_path: target local path where S3 bucket/prefix files will be transferre (Default value = None)
-        :param clean_first: delete all files in target local path (Default value = True)
+        :param clean_first: delete all files in target local path, ignored if manifest_path is passed or a sync is resumed (Default value = True)
+        :param max_workers: max concurrent downloads (Default value = 16)
+        :param manifest_path: If not None, incremental sync: path/name.ext of the :class:`awsext.s3.manifest.S3SyncManifest` of the previous sync, 
+                only new or changed keys are downloaded and the manifest is rewritten atomically (Default value = None)
+        :param is_delete_orphans: If True and the listing completed, delete local files that aren't keys under the prefix (Default value = False)
+        :param ranged_min_bytes: keys of at least this size are downloaded as concurrent byte ranges (Default value = RANGED_MIN_BYTES)
+        :param part_size: bytes per range (Default value = DEFAULT_PART_SIZE)
+        :param max_part_workers: max concurrent ranges, shared by all large keys (Default value = 8)
+        :param max_list_workers: If > 1, the prefix is listed as partitions on this many concurrent connections (Default value = 1)
+        :param s3_object_cache: If not None, :class:`awsext.s3.cache.S3ObjectCache` shared with other syncs on the host, keys are 
+                downloaded into the cache and materialized from it, evicted to its max_bytes after the sync (Default value = None)
+        :param s3_transfer_controller: If not None, :class:`awsext.s3.adaptive.S3TransferController` that tunes the concurrent requests 
+                and the part size, replaces max_workers, part_size and max_part_workers (Default value = None)
+        :param checkpoint_path: If not None, path/name.ext (outside local_path) of the :class:`awsext.s3.checkpoint.S3SyncCheckpoint` 
+                journal of completed keys and ranges.  If it exists, an interrupted sync is resumed: keys completed with the same 
+                ETag and size are skipped and large keys continue from their completed ranges.  Removed when a sync completes 
+                without errors (Default value = None)
+        :param is_verify: If True, check the ETags of keys downloaded as ranges, set to False for ETags that aren't MD5 based, 
+                i.e. SSE-KMS (Default value = True)
+        :return: :class:`awsext.s3.connection.S3SyncResult`
+        :raise awsext.exception.S3SyncError: after all keys are processed, if any download or the listing failed, containing every 
+                error, a listing error is (prefix, exception).  Keys listed before a listing failure are still downloaded
 
         """
-        # Clean up and create staging directory
-        if clean_first and os.path.exists(local_path): shutil.rmtree(local_path)
-        os.makedirs(local_path)
-        # Get list of all keys in the bucket
+        s3_sync_manifest = None
+        is_resume = checkpoint_path != None and os.path.exists( checkpoint_path )
+        if manifest_path != None: s3_sync_manifest = S3SyncManifest( manifest_path )
+        # Clean up and create staging directory, unless resuming the work of an interrupted sync
+        elif clean_first and not is_resume and os.path.exists(local_path): shutil.rmtree(local_path)
+        if not os.path.exists(local_path): os.makedirs(local_path)
+        s3_sync_checkpoint = None
+        if checkpoint_path != None: s3_sync_checkpoint = S3SyncCheckpoint( checkpoint_path )
         bucket = self.get_bucket( bucket_name )
-        keys = bucket.list( prefix=prefix+'/')
-        download_from_s3_threads = []
-        for key in keys: download_from_s3_threads.append( DownloadFromS3Thread( key, local_path))
-        # TODO: thread pool instead of one thread per transfer
-        for download_from_s3_thread in download_from_s3_threads: download_from_s3_thread.start()
-        for download_from_s3_thread in download_from_s3_threads: download_from_s3_thread.join()
-        for download_from_s3_thread in download_from_s3_threads: 
-            if download_from_s3_thread.error != None: raise download_from_s3_thread.error
+        if prefix == None: prefix = ''
+        elif not prefix.endswith('/'): prefix += '/'
+        s3_sync_result = S3SyncResult()
+        key_names = set()
+
+        def iter_changed_keys( keys ):
+            for key in keys:
+                key_names.add( key.name )
+                if s3_sync_manifest != None and s3_sync_manifest.is_unchanged( key, local_path + '/' + key.name ): 
+                    s3_sync_result.num_unchanged += 1
+                elif s3_sync_checkpoint != None and s3_sync_checkpoint.is_completed( key, local_path + '/' + key.name ):
+                    s3_sync_result.num_resumed += 1
+                    if s3_sync_manifest != None: s3_sync_manifest.put( key, local_path + '/' + key.name )
+                else: yield key
+
+        listing_errors = []
+
+        def iter_listed_keys( keys ):
+            try:
+                for key in keys: yield key
+            except Exception as e:
+                logger.warn( 'Listing failed: ' + prefix + ', ' + str(e) )
+                listing_errors.append( (prefix, e) )
+
+        # bucket.list pages through the keys lazily, 1000 per request
+        if max_list_workers > 1: listed_keys = iter_keys_parallel( bucket, prefix=prefix, max_workers=max_list_workers )
+        else: listed_keys = bucket.list( prefix=prefix )
+        keys = iter_keys_make_dirs( iter_changed_keys( iter_listed_keys( listed_keys ) ), local_path )
+        is_listed = False
+        # the controller limits the active requests, the pools only have to be large enough for its max
+        if s3_transfer_controller != None: max_workers = max_part_workers = s3_transfer_controller.max_concurrency
+        part_worker_pool = WorkerPool( max_workers=max_part_workers, name_prefix='s3-range' )
+        s3_thread_connections = S3ThreadConnections( self )
+
+        def download_to( key, local_file, is_checkpointed=False ):
+            if key.size < ranged_min_bytes: 
+                return call_with_retries( lambda: download_key( key, local_file ), key.name, s3_transfer_controller=s3_transfer_controller )
+            if s3_transfer_controller != None: key_part_size = s3_transfer_controller.get_part_size()
+            else: key_part_size = part_size
+            completed_ranges = None
+            range_callback = None
+            if is_checkpointed:
+                completed_ranges = s3_sync_checkpoint.get_completed_ranges( key, local_file )
+                range_callback = lambda start, end: s3_sync_checkpoint.put_range( key, start, end )
+            return download_key_ranged( key, local_file, part_size=key_part_size, worker_pool=part_worker_pool, is_verify=is_verify,
+                                        s3_transfer_controller=s3_transfer_controller, completed_ranges=completed_ranges, 
+                                        range_callback=range_callback, s3_thread_connections=s3_thread_connections )
+
+        def download( key ):
+            key = s3_thread_connections.get_key( key )
+            # the ranges of a key downloaded into the cache aren't in local_path, only completed keys are checkpointed
+            if s3_object_cache != None: return s3_object_cache.get( key, local_path + '/' + key.name, download_func=download_to )
+            return download_to( key, local_path + '/' + key.name, is_checkpointed=s3_sync_checkpoint != None )
+
+        worker_pool = WorkerPool( max_workers=max_workers, name_prefix='s3-download' )
+        try:
+            for work_item in worker_pool.imap_unordered( download, keys ):
+                key = work_item.args[0]
+                if work_item.exception != None:
+                    logger.warn( 'Download failed: ' + key.name + ', ' + str(work_item.exception) )
+                    s3_sync_result.errors.append( (key.name, work_item.exception) )
+                    if s3_sync_manifest != None: s3_sync_manifest.remove( key.name )
+                else: 
+                    # None: materialized from the cache
+                    if work_item.result == None: s3_sync_result.num_cached += 1
+                    else: s3_sync_result.add_file( work_item.result )
+                    if s3_transfer_controller != None: s3_transfer_controller.record_object()
+                    if s3_sync_manifest != None: s3_sync_manifest.put( key, local_path + '/' + key.name )
+                    if s3_sync_checkpoint != None: s3_sync_checkpoint.put_completed( key )
+            s3_sync_result.errors.extend( listing_errors )
+            is_listed = len(listing_errors) == 0
+            if is_listed and is_delete_orphans: 
+                s3_sync_result.num_deleted = delete_orphans( local_path, key_names, s3_sync_manifest=s3_sync_manifest )
+            if s3_object_cache != None: s3_object_cache.evict()
+        finally:
+            worker_pool.shutdown()
+            part_worker_pool.shutdown()
+            s3_thread_connections.close()
+            if s3_sync_checkpoint != None: s3_sync_checkpoint.close( is_completed=is_listed and len(s3_sync_result.errors) == 0 )
+            # downloads that completed are kept even if the listing failed
+            if s3_sync_manifest != None:
+                if is_listed:
+                    for key_name in s3_sync_manifest.get_key_names():
+                        if key_name not in key_names: s3_sync_manifest.remove( key_name )
+                s3_sync_manifest.save()
+        s3_sync_result.end_time = time.time()
+        if len(listing_errors) > 0:
+            raise awsext.exception.S3SyncError( 'Listing failed: ' + prefix + ', ' + str(listing_errors[0][1]) + ', downloads failed: ' + 
+                                                str(len(s3_sync_result.errors) - len(listing_errors)), s3_sync_result.errors )
+        if len(s3_sync_result.errors) > 0:
+            raise awsext.exception.S3SyncError( str(len(s3_sync_result.errors)) + ' downloads failed, first: ' + s3_sync_result.errors[0][0] + 
+                                                ', ' + str(s3_sync_result.errors[0][1]), s3_sync_result.errors )
+        return s3_sync_result
+
+
+    def sync_to_s3(self, local_path, bucket_name, prefix=None, max_workers=16, multipart_min_bytes=RANGED_MIN_BYTES, part_size=DEFAULT_PART_SIZE, 
+                   max_part_workers=8, max_list_workers=1, s3_transfer_controller=None ):
+        """Transfer all files of a local path to an S3 bucket and prefix.  The prefix is listed once, files with the same size
+        and MD5/ETag are skipped, the others are uploaded on a bounded pool of worker threads, each on its own keep-alive connection, 
+        as the local tree is walked
+
+        :param local_path: source local path
+        :param bucket_name: target S3 bucket
+        :param prefix: path in S3 bucket the files are written under (Default value = None)
+        :param max_workers: max concurrent uploads (Default value = 16)
+        :param multipart_min_bytes: files of at least this size are uploaded as multipart uploads with concurrent parts (Default value = RANGED_MIN_BYTES)
+        :param part_size: bytes per part (Default value = DEFAULT_PART_SIZE)
+        :param max_part_workers: max concurrent parts, shared by all large files (Default value = 8)
+        :param max_list_workers: If > 1, the prefix is listed as partitions on this many concurrent connections (Default value = 1)
+        :param s3_transfer_controller: If not None, :class:`awsext.s3.adaptive.S3TransferController` that tunes the concurrent requests 
+                and the part size, replaces max_workers, part_size and max_part_workers (Default value = None)
+        :return: :class:`awsext.s3.connection.S3SyncResult`
+        :raise awsext.exception.S3SyncError: after all files are processed, if any upload failed, containing every error
+
+        """
+        bucket = self.get_bucket( bucket_name, validate=False )
+        if prefix == None: prefix = ''
+        elif not prefix.endswith('/'): prefix += '/'
+        map_remote_keys = {}
+        if max_list_workers > 1: listed_keys = iter_keys_parallel( bucket, prefix=prefix, max_workers=max_list_workers )
+        else: listed_keys = bucket.list( prefix=prefix )
+        for key in listed_keys: map_remote_keys[ key.name ] = (key.size, key.etag.strip('"'))
+        s3_sync_result = S3SyncResult()
+        if s3_transfer_controller != None: max_workers = max_part_workers = s3_transfer_controller.max_concurrency
+        part_worker_pool = WorkerPool( max_workers=max_part_workers, name_prefix='s3-part' )
+        s3_thread_connections = S3ThreadConnections( self )
+
+        def upload( local_file_item ):
+            local_file, relative_path = local_file_item
+            key_name = prefix + relative_path
+            size = os.path.getsize( local_file )
+            thread_bucket = s3_thread_connections.get_bucket( bucket_name )
+            remote_key = map_remote_keys.get( key_name )
+            if remote_key != None and remote_key[0] == size and is_etag_match( thread_bucket, key_name, local_file, size, remote_key[1], part_size ): return None
+            if size >= multipart_min_bytes: 
+                if s3_transfer_controller != None: file_part_size = s3_transfer_controller.get_part_size()
+                else: file_part_size = part_size
+                return upload_file_multipart( thread_bucket, key_name, local_file, part_size=file_part_size, worker_pool=part_worker_pool, 
+                                              s3_transfer_controller=s3_transfer_controller )
+
+            def upload_small():
+                thread_bucket.new_key( key_name ).set_contents_from_filename( local_file )
+                return size
+
+            return call_with_retries( upload_small, key_name, s3_transfer_controller=s3_transfer_controller )
+
+        worker_pool = WorkerPool( max_workers=max_workers, name_prefix='s3-upload' )
+        try:
+            for work_item in worker_pool.imap_unordered( upload, iter_local_files( local_path ) ):
+                local_file = work_item.args[0][0]
+                if work_item.exception != None:
+                    logger.warn( 'Upload failed: ' + local_file + ', ' + str(work_item.exception) )
+                    s3_sync_result.errors.append( (local_file, work_item.exception) )
+                elif work_item.result == None: s3_sync_result.num_unchanged += 1
+                else: 
+                    s3_sync_result.add_file( work_item.result )
+                    if s3_transfer_controller != None: s3_transfer_controller.record_object()
+        finally:
+            worker_pool.shutdown()
+            part_worker_pool.shutdown()
+            s3_thread_connections.close()
+        s3_sync_result.end_time = time.time()
+        if len(s3_sync_result.errors) > 0:
+            raise awsext.exception.S3SyncError( str(len(s3_sync_result.errors)) + ' uploads failed, first: ' + s3_sync_result.errors[0][0] + 
+                                                ', ' + str(s3_sync_result.errors[0][1]), s3_sync_result.errors )
+        return s3_sync_result
+
+
+def is_etag_match( bucket, key_name, local_file, size, etag, part_size=DEFAULT_PART_SIZE ):
+    """
+
+    :param bucket: :class:`boto.s3.bucket.Bucket` of the key
+    :param key_name: key of the file in S3
+    :param local_file: local path/name.ext
+    :param size: size of the local file
+    :param etag: ETag of the key, without quotes
+    :param part_size: part size the file would be uploaded with, the key's upload part size is looked up if the number of parts differs (Default value = DEFAULT_PART_SIZE)
+    :return: True if the local file has the contents of the key
+
+    """
+    num_etag_parts = get_etag_num_parts( etag )
+    if num_etag_parts == None: return get_file_md5( local_file ) == etag
+    local_etag = get_local_etag( local_file, part_size=get_upload_part_size_for( size, part_size ), num_parts=num_etag_parts )
+    if local_etag == None:
+        # uploaded by another tool with a different part size
+        upload_part_size = get_upload_part_size( boto.s3.key.Key( bucket, key_name ) )
+        if upload_part_size == None: return False
+        local_etag = get_local_etag( local_file, part_size=upload_part_size, num_parts=num_etag_parts )
+    return local_etag == etag
+
+
+def iter_keys_make_dirs( keys, local_path ):
+    """Create the local directory of each key once, as the listing is consumed, so the download threads don't race on os.makedirs
+
+    :param keys: iterable of :class:`boto.s3.key.Key`
+    :param local_path: target local path
+    :return: generator of the keys, excluding directory placeholders (names ending with /)
+
+    """
+    made_dirs = set()
+    for key in keys:
+        if key.name.endswith('/'): continue
+        last_slash_pos = key.name.rfind('/')
+        if last_slash_pos != -1:
+            key_path = key.name[0:last_slash_pos]
+            if key_path not in made_dirs:
+                local_full_path = local_path + '/' + key_path
+                if not os.path.isdir( local_full_path ): os.makedirs( local_full_path )
+                made_dirs.add( key_path )
+        yield key
+
+
+def delete_orphans( local_path, key_names, s3_sync_manifest=None ):
+    """Delete the local files that don't correspond to a key, and then empty directories
+
+    :param local_path: local path of a sync
+    :param key_names: set of all key names under the prefix
+    :param s3_sync_manifest: If not None, :class:`awsext.s3.manifest.S3SyncManifest`, its file (if under local_path) is kept (Default value = None)
+    :return: number of files deleted
+
+    """
+    keep_paths = set()
+    if s3_sync_manifest != None: keep_paths.update( [ os.path.abspath( s3_sync_manifest.manifest_path ), os.path.abspath( s3_sync_manifest.manifest_path + '.tmp' ) ] )
+    num_deleted = 0
+    for dir_path, dir_names, file_names in os.walk( local_path, topdown=False ):
+        for file_name in file_names:
+            file_path = os.path.join( dir_path, file_name )
+            key_name = os.path.relpath( file_path, local_path ).replace( os.sep, '/' )
+            if key_name in key_names or os.path.abspath( file_path ) in keep_paths: continue
+            os.remove( file_path )
+            num_deleted += 1
+        if dir_path != local_path and len(os.listdir( dir_path )) == 0: os.rmdir( dir_path )
+    return num_deleted
+
+
+def download_key( key, local_file ):
+    """
+
+    :param key: source :class:`boto.s3.key.Key`
+    :param local_file: target path/name.ext, the directory must exist
+    :return: bytes downloaded
+
+    """
+    try:
+        key.get_contents_to_filename( local_file )
+    except Exception:
+        # boto keeps a failed response on the key, a retry would read it instead of sending a new GET
+        key.close()
+        raise
+    return os.path.getsize( local_file )
+
+
+class S3SyncResult():
+    """Counts of a sync between S3 and a local path """
+
+    def __init__(self):
+        """ """
+        self.start_time = time.time()
+        self.end_time = None
+        self.num_files = 0
+        self.num_bytes = 0
+        self.num_unchanged = 0
+        self.num_cached = 0
+        self.num_resumed = 0
+        self.num_deleted = 0
+        self.errors = []
+
+
+    def add_file(self, num_bytes ):
+        """
+
+        :param num_bytes: size of the transferred file
+
+        """
+        self.num_files += 1
+        self.num_bytes += num_bytes
+
+
+    def __str__(self):
+        """ """
+        end_time = self.end_time
+        if end_time == None: end_time = time.time()
+        return ('S3SyncResult: files=' + str(self.num_files) + ', bytes=' + str(self.num_bytes) + ', unchanged=' + str(self.num_unchanged) + 
+                ', cached=' + str(self.num_cached) + ', resumed=' + str(self.num_resumed) + ', deleted=' + str(self.num_deleted) + ', errors=' + str(len(self.errors)) + 
+                ', elapsed_secs=' + str(round(end_time - self.start_time, 3)))
 
 
 
 class DownloadFromS3Thread(threading.Thread):
-    """Support concurrent downloads from S3, each on it's own thread """
+    """Deprecated, unused since sync_from_s3 downloads on a bounded WorkerPool.  Support concurrent downloads from S3, each on it's own thread """
                                 
     def __init__( self, key, local_path ):
         """
@@ -71,6 +477,7 @@ class DownloadFromS3Thread(threading.Thread):
         :param local_path: target local path
 
         """
+        warnings.warn( 'DownloadFromS3Thread is deprecated, use AwsExtS3Connection.sync_from_s3 or download_file', DeprecationWarning, stacklevel=2 )
         threading.Thread.__init__(self)
         self.key = key
         self.local_path = local_path
@@ -0,0 +1,224 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Parallel listing of S3 prefixes, partitioned by sub-prefix or key range
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import Queue
+import threading
+import boto.s3.prefix
+from awsext.workerpool import WorkerPool
+
+import logging
+logger = logging.getLogger(__name__)
+
+# a prefix with more direct keys than this is split by key range instead of by sub-prefix
+MAX_DISCOVERY_KEYS = 1000
+# partition boundaries of a key range split, keys are assumed to start with these characters
+DEFAULT_SPLIT_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+KEYS_PER_CHUNK = 1000
+
+
+class S3ListPartition():
+    """Keys of a prefix after start_after (exclusive) up to end_at (inclusive) """
+
+    def __init__(self, prefix, start_after=None, end_at=None ):
+        """
+
+        :param prefix: key prefix
+        :param start_after: If not None, list keys after this key (Default value = None, from the start of the prefix)
+        :param end_at: If not None, list keys up to and including this key (Default value = None, to the end of the prefix)
+
+        """
+        self.prefix = prefix
+        self.start_after = start_after
+        self.end_at = end_at
+
+
+    def is_whole_prefix(self):
+        """ """
+        return self.start_after == None and self.end_at == None
+
+
+    def iter_keys(self, bucket ):
+        """
+
+        :param bucket: :class:`boto.s3.bucket.Bucket`
+        :return: generator of :class:`boto.s3.key.Key` of the partition, in key order
+
+        """
+        for key in bucket.list( prefix=self.prefix, marker=self.start_after or '' ):
+            if self.end_at != None and key.name > self.end_at: break
+            yield key
+
+
+    def __str__(self):
+        """ """
+        return 'S3ListPartition: prefix=' + self.prefix + ', start_after=' + str(self.start_after) + ', end_at=' + str(self.end_at)
+
+
+def split_by_key_range( prefix, split_chars=DEFAULT_SPLIT_CHARS, split_markers=None ):
+    """Partitions of a prefix by key range: (None, m0], (m0, m1], ... (mN, None)
+
+    :param prefix: key prefix
+    :param split_chars: boundaries are prefix + each character (Default value = DEFAULT_SPLIT_CHARS)
+    :param split_markers: If not None, sorted list of boundary keys, overrides split_chars (Default value = None)
+    :return: list of :class:`awsext.s3.listing.S3ListPartition`, in key order
+
+    """
+    if split_markers == None: split_markers = [ prefix + split_char for split_char in sorted( split_chars ) ]
+    boundaries = [ None ] + list( split_markers ) + [ None ]
+    return [ S3ListPartition( prefix, start_after=boundaries[i], end_at=boundaries[i + 1] ) for i in range( len(boundaries) - 1 ) ]
+
+
+def get_item_name( item ):
+    """
+
+    :param item: :class:`boto.s3.key.Key` or :class:`awsext.s3.listing.S3ListPartition`
+    :return: key name or partition prefix, i.e. the sort order of the items of a delimiter listing
+
+    """
+    if isinstance( item, S3ListPartition ): return item.prefix
+    return item.name
+
+
+def discover_partitions( bucket, prefix='', delimiter='/', max_workers=8, min_partitions=None, max_depth=3, split_chars=DEFAULT_SPLIT_CHARS ):
+    """Split a prefix into partitions that can be listed concurrently.  Whole-prefix partitions are expanded with delimiter 
+    listings into their direct keys and sub-prefixes, level by level, until there are min_partitions or max_depth levels.  
+    A prefix with more than MAX_DISCOVERY_KEYS direct keys (i.e. a flat namespace) is split by key range instead
+
+    :param bucket: :class:`boto.s3.bucket.Bucket`
+    :param prefix: key prefix (Default value = '')
+    :param delimiter: delimiter of the sub-prefixes (Default value = '/')
+    :param max_workers: max concurrent delimiter listings (Default value = 8)
+    :param min_partitions: stop expanding at this many partitions (Default value = None, 4 * max_workers)
+    :param max_depth: max levels of sub-prefixes expanded (Default value = 3)
+    :param split_chars: boundary characters of a key range split (Default value = DEFAULT_SPLIT_CHARS)
+    :return: list of :class:`boto.s3.key.Key` (direct keys found while expanding) and :class:`awsext.s3.listing.S3ListPartition`, in key order
+
+    """
+    if min_partitions == None: min_partitions = 4 * max_workers
+
+    def expand( s3_list_partition ):
+        items = []
+        for item in bucket.list( prefix=s3_list_partition.prefix, delimiter=delimiter ):
+            if len(items) == MAX_DISCOVERY_KEYS: return split_by_key_range( s3_list_partition.prefix, split_chars=split_chars )
+            if isinstance( item, boto.s3.prefix.Prefix ): items.append( S3ListPartition( item.name ) )
+            else: items.append( item )
+        # a page lists its keys before its sub-prefixes
+        items.sort( key=get_item_name )
+        return items
+
+    items = [ S3ListPartition( prefix ) ]
+    worker_pool = WorkerPool( max_workers=max_workers, name_prefix='s3-discover' )
+    try:
+        for depth in range( max_depth ):
+            expand_offsets = [ offset for offset, item in enumerate( items ) if isinstance( item, S3ListPartition ) and item.is_whole_prefix() ]
+            num_partitions = len([ item for item in items if isinstance( item, S3ListPartition ) ])
+            if len(expand_offsets) == 0 or num_partitions >= min_partitions: break
+            work_items = [ worker_pool.submit( expand, items[offset] ) for offset in expand_offsets ]
+            map_expanded = dict( zip( expand_offsets, [ work_item.get() for work_item in work_items ] ) )
+            expanded_items = []
+            for offset, item in enumerate( items ):
+                if offset in map_expanded: expanded_items.extend( map_expanded[offset] )
+                else: expanded_items.append( item )
+            items = expanded_items
+    finally:
+        worker_pool.shutdown()
+    return items
+
+
+def iter_keys_parallel( bucket, prefix='', delimiter='/', max_workers=8, min_partitions=None, max_depth=3, split_chars=DEFAULT_SPLIT_CHARS, 
+                        split_markers=None, is_ordered=False, max_queued_chunks=4 ):
+    """List a prefix as partitions on concurrent connections, see discover_partitions.  Memory is bounded by max_queued_chunks
+    chunks of KEYS_PER_CHUNK keys per partition
+
+    :param bucket: :class:`boto.s3.bucket.Bucket`
+    :param prefix: key prefix (Default value = '')
+    :param delimiter: delimiter of the sub-prefixes (Default value = '/')
+    :param max_workers: max concurrent listings (Default value = 8)
+    :param min_partitions: partitions discovered before listing (Default value = None, 4 * max_workers)
+    :param max_depth: max levels of sub-prefixes expanded (Default value = 3)
+    :param split_chars: boundary characters of a key range split (Default value = DEFAULT_SPLIT_CHARS)
+    :param split_markers: If not None, sorted list of boundary keys, the prefix is split by these key ranges without discovery (Default value = None)
+    :param is_ordered: If True, keys are yielded in key order (as bucket.list), else as they are listed (Default value = False)
+    :param max_queued_chunks: max chunks of keys listed ahead of the consumer, per partition (Default value = 4)
+    :return: generator of :class:`boto.s3.key.Key`
+
+    """
+    if split_markers != None: items = split_by_key_range( prefix, split_markers=split_markers )
+    else: items = discover_partitions( bucket, prefix=prefix, delimiter=delimiter, max_workers=max_workers, min_partitions=min_partitions, 
+                                       max_depth=max_depth, split_chars=split_chars )
+    s3_list_partitions = [ item for item in items if isinstance( item, S3ListPartition ) ]
+    stop_event = threading.Event()
+    # ordered: a queue per partition, consumed in key order.  Unordered: one shared queue
+    if is_ordered: partition_queues = [ Queue.Queue( max_queued_chunks ) for s3_list_partition in s3_list_partitions ]
+    else: partition_queues = [ Queue.Queue( max_queued_chunks * len(s3_list_partitions) + 1 ) ] * len(s3_list_partitions)
+
+    def put( partition_queue, chunk ):
+        while not stop_event.is_set():
+            try:
+                partition_queue.put( chunk, timeout=1 )
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def list_partition( partition_num ):
+        partition_queue = partition_queues[partition_num]
+        try:
+            chunk = []
+            for key in s3_list_partitions[partition_num].iter_keys( bucket ):
+                chunk.append( key )
+                if len(chunk) == KEYS_PER_CHUNK:
+                    if not put( partition_queue, chunk ): return
+                    chunk = []
+            if len(chunk) > 0 and not put( partition_queue, chunk ): return
+            put( partition_queue, None )
+        except Exception as e:
+            put( partition_queue, e )
+
+    def get_chunks( partition_queue, num_partitions ):
+        num_done = 0
+        while num_done < num_partitions:
+            chunk = partition_queue.get()
+            if chunk == None: num_done += 1
+            elif isinstance( chunk, Exception ): raise chunk
+            else: yield chunk
+
+    # partitions are started in key order, so in ordered mode the partition being consumed is always running or done
+    worker_pool = WorkerPool( max_workers=max(1, min(max_workers, len(s3_list_partitions))), max_queued=len(s3_list_partitions) + 1, name_prefix='s3-list' )
+    try:
+        for partition_num in range( len(s3_list_partitions) ): worker_pool.submit( list_partition, partition_num )
+        if not is_ordered:
+            for item in items:
+                if not isinstance( item, S3ListPartition ): yield item
+            if len(s3_list_partitions) > 0:
+                for chunk in get_chunks( partition_queues[0], len(s3_list_partitions) ):
+                    for key in chunk: yield key
+        else:
+            partition_num = 0
+            for item in items:
+                if not isinstance( item, S3ListPartition ): 
+                    yield item
+                    continue
+                for chunk in get_chunks( partition_queues[partition_num], 1 ):
+                    for key in chunk: yield key
+                partition_num += 1
+    finally:
+        stop_event.set()
+        worker_pool.shutdown()
@@ -0,0 +1,111 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Local manifest index of S3 keys, for incremental syncs
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import json
+import threading
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class S3SyncManifest():
+    """Key name -> [ETag, size, last-modified, local mtime] of the files of a previous sync, persisted to a JSON file.
+    A key is unchanged if its ETag and size match and the local file still has the size and mtime written after its download """
+
+    def __init__(self, manifest_path ):
+        """
+
+        :param manifest_path: path/name.ext of the JSON file, loaded if it exists
+
+        """
+        self.manifest_path = manifest_path
+        self.lock = threading.Lock()
+        self.map_entries = {}
+        self.is_changed = False
+        if os.path.exists( manifest_path ):
+            try:
+                with open( manifest_path, 'r' ) as manifest_file: self.map_entries = json.load( manifest_file )
+            except ValueError as e:
+                logger.warn( 'Ignoring invalid manifest file: ' + manifest_path + ', ' + str(e) )
+
+
+    def is_unchanged(self, key, local_file ):
+        """
+
+        :param key: :class:`boto.s3.key.Key` from a listing
+        :param local_file: local path/name.ext of the key
+        :return: True if the local file is the current version of the key
+
+        """
+        with self.lock:
+            entry = self.map_entries.get( key.name )
+        if entry == None or entry[0] != key.etag or entry[1] != key.size: return False
+        try:
+            file_stat = os.stat( local_file )
+        except OSError:
+            return False
+        return file_stat.st_size == key.size and file_stat.st_mtime == entry[3]
+
+
+    def put(self, key, local_file ):
+        """Record a downloaded key
+
+        :param key: :class:`boto.s3.key.Key` from a listing
+        :param local_file: local path/name.ext the key was downloaded to
+
+        """
+        local_mtime = os.stat( local_file ).st_mtime
+        with self.lock:
+            self.map_entries[ key.name ] = [ key.etag, key.size, key.last_modified, local_mtime ]
+            self.is_changed = True
+
+
+    def remove(self, key_name ):
+        """
+
+        :param key_name: key name
+
+        """
+        with self.lock:
+            if self.map_entries.pop( key_name, None ) != None: self.is_changed = True
+
+
+    def get_key_names(self):
+        """
+
+        :return: list of all key names
+
+        """
+        with self.lock:
+            return self.map_entries.keys()
+
+
+    def save(self):
+        """Write the manifest file atomically (rename of a temporary file) if any entries changed """
+        with self.lock:
+            if not self.is_changed: return
+            tmp_manifest_path = self.manifest_path + '.tmp'
+            with open( tmp_manifest_path, 'w' ) as manifest_file: 
+                json.dump( self.map_entries, manifest_file )
+                manifest_file.flush()
+                os.fsync( manifest_file.fileno() )
+            os.rename( tmp_manifest_path, self.manifest_path )
+            self.is_changed = False
@@ -0,0 +1,193 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Seekable file-like reader of S3 objects, ranged GETs with read-ahead
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import io
+import threading
+import collections
+import boto.s3.key
+from awsext.workerpool import WorkerPool
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = 8388608
+
+
+class S3SeekableReader(io.RawIOBase):
+    """Raw, seekable reader of an S3 object.  Blocks of block_size are fetched with ranged GETs, kept in an LRU of 
+    max_cached_blocks and the next read_ahead_blocks are prefetched on background threads.  The ranged GETs require 
+    the ETag seen when opened (If-Match), so a reader never mixes two versions of an object.
+    Wrap in io.BufferedReader for line iteration, gzip.GzipFile( fileobj=... ) or csv.reader, 
+    see :meth:`awsext.s3.connection.AwsExtS3Connection.open_key_reader` """
+
+    def __init__(self, key, block_size=DEFAULT_BLOCK_SIZE, max_cached_blocks=16, read_ahead_blocks=2, max_attempts=3 ):
+        """
+
+        :param key: :class:`boto.s3.key.Key` from get_key or a listing (size and etag are required)
+        :param block_size: bytes per ranged GET (Default value = DEFAULT_BLOCK_SIZE)
+        :param max_cached_blocks: max blocks kept in memory, including prefetched blocks (Default value = 16)
+        :param read_ahead_blocks: blocks prefetched after the block being read, 0 to disable (Default value = 2)
+        :param max_attempts: attempts per ranged GET (Default value = 3)
+
+        """
+        super(S3SeekableReader, self).__init__()
+        # close() is also called on garbage collection
+        self.worker_pool = None
+        self.lock = threading.Lock()
+        self.map_blocks = collections.OrderedDict()
+        if max_cached_blocks <= read_ahead_blocks: raise ValueError( 'max_cached_blocks must be > read_ahead_blocks' )
+        self.key = key
+        self.size = key.size
+        self.etag = key.etag
+        self.block_size = block_size
+        self.max_cached_blocks = max_cached_blocks
+        self.read_ahead_blocks = read_ahead_blocks
+        self.max_attempts = max_attempts
+        self.position = 0
+        self.map_pending = {}
+        self.num_fetches = 0
+        self.num_hits = 0
+        if read_ahead_blocks > 0: 
+            self.worker_pool = WorkerPool( max_workers=read_ahead_blocks, max_queued=read_ahead_blocks + 1, name_prefix='s3-read-ahead' )
+
+
+    def readable(self):
+        """ """
+        return True
+
+
+    def seekable(self):
+        """ """
+        return True
+
+
+    def tell(self):
+        """ """
+        return self.position
+
+
+    def seek(self, offset, whence=os.SEEK_SET ):
+        """
+
+        :param offset: offset relative to whence
+        :param whence: os.SEEK_SET, os.SEEK_CUR or os.SEEK_END (Default value = os.SEEK_SET)
+        :return: new position
+
+        """
+        if whence == os.SEEK_CUR: offset += self.position
+        elif whence == os.SEEK_END: offset += self.size
+        if offset < 0: raise IOError( 'Negative seek position: ' + str(offset) )
+        self.position = offset
+        return self.position
+
+
+    def readinto(self, buffer ):
+        """
+
+        :param buffer: bytearray/memoryview to fill
+        :return: bytes read, 0 at the end of the object
+
+        """
+        if self.closed: raise ValueError( 'I/O operation on closed file' )
+        if self.position >= self.size or len(buffer) == 0: return 0
+        block_num = self.position // self.block_size
+        block = self.get_block( block_num )
+        block_offset = self.position - block_num * self.block_size
+        num_bytes = min( len(buffer), len(block) - block_offset )
+        buffer[0:num_bytes] = block[block_offset:block_offset + num_bytes]
+        self.position += num_bytes
+        self.read_ahead( block_num )
+        return num_bytes
+
+
+    def get_block(self, block_num ):
+        """
+
+        :param block_num: block number
+        :return: contents of the block, from the cache, a pending prefetch or a ranged GET
+
+        """
+        with self.lock:
+            block = self.map_blocks.pop( block_num, None )
+            if block != None:
+                self.map_blocks[ block_num ] = block
+                self.num_hits += 1
+                return block
+            work_item = self.map_pending.get( block_num )
+        if work_item != None: return work_item.get()
+        return self.fetch_block( block_num )
+
+
+    def read_ahead(self, block_num ):
+        """Prefetch the blocks after block_num that aren't cached or pending
+
+        :param block_num: block being read
+
+        """
+        if self.worker_pool == None: return
+        last_block_num = (self.size - 1) // self.block_size
+        for read_ahead_block_num in range( block_num + 1, min( block_num + self.read_ahead_blocks, last_block_num ) + 1 ):
+            with self.lock:
+                if read_ahead_block_num in self.map_blocks or read_ahead_block_num in self.map_pending: continue
+                # bounded so submit never blocks, i.e. after random seeks
+                if len(self.map_pending) >= self.read_ahead_blocks: return
+                self.map_pending[ read_ahead_block_num ] = self.worker_pool.submit( self.fetch_block, read_ahead_block_num )
+
+
+    def fetch_block(self, block_num ):
+        """Ranged GET of a block, added to the LRU
+
+        :param block_num: block number
+        :return: contents of the block
+
+        """
+        start = block_num * self.block_size
+        end = min( start + self.block_size, self.size ) - 1
+        try:
+            for attempt in range( 1, self.max_attempts + 1 ):
+                try:
+                    # a Key holds the state of one response, each GET needs its own
+                    block = boto.s3.key.Key( self.key.bucket, self.key.name ).get_contents_as_string( 
+                                    headers={ 'Range':'bytes=' + str(start) + '-' + str(end), 'If-Match':self.etag } )
+                    if len(block) != end - start + 1: raise IOError( 'Short range: ' + self.key.name + ', expected ' + str(end - start + 1) + ', received ' + str(len(block)) )
+                    break
+                except StandardError as e:
+                    # 412: the object was replaced since it was opened
+                    if attempt == self.max_attempts or getattr( e, 'status', None ) == 412: raise
+                    logger.warn( 'Range failed, retrying: ' + self.key.name + ' bytes=' + str(start) + '-' + str(end) + ', ' + str(e) )
+            with self.lock:
+                self.num_fetches += 1
+                self.map_blocks[ block_num ] = block
+                while len(self.map_blocks) > self.max_cached_blocks: self.map_blocks.popitem( last=False )
+            return block
+        finally:
+            with self.lock:
+                self.map_pending.pop( block_num, None )
+
+
+    def close(self):
+        """Stop the read-ahead threads and release the cached blocks """
+        if self.worker_pool != None:
+            self.worker_pool.shutdown()
+            self.worker_pool = None
+        with self.lock:
+            self.map_blocks.clear()
+        super(S3SeekableReader, self).close()
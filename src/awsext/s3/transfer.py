@@ -0,0 +1,464 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Parallel ranged downloads and multipart uploads of large S3 objects
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import time
+import mmap
+import math
+import random
+import hashlib
+import threading
+import boto.exception
+import boto.s3.key
+from awsext.workerpool import WorkerPool
+from awsext.s3.checkpoint import merge_ranges, is_range_covered
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_PART_SIZE = 8388608
+RANGED_MIN_BYTES = 67108864
+HASH_BLOCK_SIZE = 1048576
+MAX_UPLOAD_PARTS = 10000
+MIN_UPLOAD_PART_SIZE = 5242880
+MAX_BACKOFF_SECS = 20.0
+
+
+def get_part_ranges( size, part_size ):
+    """
+
+    :param size: object size
+    :param part_size: bytes per part
+    :return: list of (first byte, last byte) of each part
+
+    """
+    return [ (start, min(start + part_size, size) - 1) for start in range( 0, size, part_size ) ]
+
+
+def get_etag_num_parts( etag ):
+    """
+
+    :param etag: ETag of an object, with or without quotes
+    :return: number of parts if the ETag is of a multipart upload (md5 of the part md5s + '-' + number of parts), else None
+
+    """
+    etag = etag.strip('"')
+    if '-' not in etag: return None
+    return int( etag.rsplit('-', 1)[1] )
+
+
+def get_upload_part_size( key ):
+    """Size of part 1 of a multipart upload (HEAD with partNumber=1), all parts but the last are usually this size
+
+    :param key: :class:`boto.s3.key.Key`
+    :return: part size, None if it couldn't be determined
+
+    """
+    try:
+        response = key.bucket.connection.make_request( 'HEAD', key.bucket.name, key.name, query_args='partNumber=1' )
+        response.read()
+        if response.status != 200: return None
+        return int( response.getheader( 'content-length' ) )
+    except StandardError as e:
+        logger.warn( 'Unable to determine the upload part size: ' + key.name + ', ' + str(e) )
+        return None
+
+
+def is_slowdown_error( e ):
+    """
+
+    :param e: exception of an S3 request
+    :return: True if S3 is throttling requests (503 SlowDown)
+
+    """
+    return isinstance( e, boto.exception.BotoServerError ) and (e.status == 503 or e.error_code == 'SlowDown')
+
+
+def get_backoff_secs( attempt ):
+    """
+
+    :param attempt: number of the failed attempt, starting at 1
+    :return: random seconds up to an exponentially growing limit, capped at MAX_BACKOFF_SECS
+
+    """
+    return random.uniform( 0, min( MAX_BACKOFF_SECS, 0.5 * 2 ** attempt ) )
+
+
+def call_with_retries( func, description, max_attempts=3, s3_transfer_controller=None ):
+    """Call a single S3 request, retrying failures, after an exponential backoff if S3 responded SlowDown
+
+    :param func: func() performs the request and returns the bytes transferred
+    :param description: request description for logging, i.e. key name and range
+    :param max_attempts: attempts (Default value = 3)
+    :param s3_transfer_controller: If not None, :class:`awsext.s3.adaptive.S3TransferController` that limits the concurrent 
+            requests and records their bytes, latency and errors (Default value = None)
+    :return: func's result
+
+    """
+    for attempt in range( 1, max_attempts + 1 ):
+        if s3_transfer_controller != None: s3_transfer_controller.acquire()
+        start_time = time.time()
+        is_slowdown = False
+        try:
+            num_bytes = func()
+            if s3_transfer_controller != None: s3_transfer_controller.record_request( num_bytes, time.time() - start_time )
+            return num_bytes
+        except StandardError as e:
+            is_slowdown = is_slowdown_error( e )
+            if s3_transfer_controller != None: s3_transfer_controller.record_error( e, is_slowdown=is_slowdown, is_retry=attempt < max_attempts )
+            if attempt == max_attempts: raise
+            logger.warn( 'Request failed, retrying: ' + description + ', ' + str(e) )
+        finally:
+            if s3_transfer_controller != None: s3_transfer_controller.release()
+        if is_slowdown: time.sleep( get_backoff_secs( attempt ) )
+
+
+def download_key_ranged( key, local_file, part_size=DEFAULT_PART_SIZE, max_concurrent=8, worker_pool=None, max_attempts=3, is_verify=True, 
+                         s3_transfer_controller=None, completed_ranges=None, range_callback=None, s3_thread_connections=None ):
+    """Download an object as byte ranges on concurrent connections, each written at its offset of the preallocated local file.
+    If the ETag is of a multipart upload, the ranges are aligned to the upload's parts (part_size is ignored) and the MD5s of 
+    the downloaded parts are checked against the ETag, else the MD5 of the file is checked against the ETag
+
+    :param key: source :class:`boto.s3.key.Key`, from a listing or get_key (size and etag are required)
+    :param local_file: target path/name.ext, the directory must exist
+    :param part_size: bytes per range if the ETag isn't of a multipart upload (Default value = DEFAULT_PART_SIZE)
+    :param max_concurrent: max concurrent ranges if worker_pool is None (Default value = 8)
+    :param worker_pool: If not None, :class:`awsext.workerpool.WorkerPool` the ranges are downloaded on, i.e. shared by all 
+            large objects of a sync, must not be the pool calling this function (Default value = None)
+    :param max_attempts: attempts per range (Default value = 3)
+    :param is_verify: If True, check the ETag, set to False for ETags that aren't MD5 based, i.e. SSE-KMS (Default value = True)
+    :param s3_transfer_controller: If not None, :class:`awsext.s3.adaptive.S3TransferController` of the ranges (Default value = None)
+    :param completed_ranges: If not empty, resume: list of (first byte, last byte) already in the local file, which must have 
+            the size of the key, i.e. from :class:`awsext.s3.checkpoint.S3SyncCheckpoint`.  Ranges within them are not downloaded 
+            (but are verified) (Default value = None)
+    :param range_callback: If not None, range_callback( start, end ) is called after each range is written (Default value = None)
+    :param s3_thread_connections: If not None, :class:`awsext.s3.transfer.S3ThreadConnections`, each range is requested on the 
+            connection of the worker thread instead of the key's connection (Default value = None)
+    :return: bytes downloaded
+    :raise IOError: if a range failed after max_attempts or the ETag doesn't match, the local file is deleted (unless a range 
+            failed and range_callback was passed)
+
+    """
+    etag = key.etag.strip('"')
+    num_etag_parts = get_etag_num_parts( etag )
+    part_ranges = None
+    if is_verify and num_etag_parts != None:
+        # all parts but the last are assumed to be the size of part 1, as uploaded by boto, the AWS CLI and awsext
+        upload_part_size = get_upload_part_size( key )
+        if upload_part_size != None and upload_part_size > 0 and (num_etag_parts - 1) * upload_part_size < key.size: 
+            part_ranges = get_part_ranges( (num_etag_parts - 1) * upload_part_size, upload_part_size ) + [ ((num_etag_parts - 1) * upload_part_size, key.size - 1) ]
+        else:
+            logger.warn( 'Upload part size unknown, ETag not verified: ' + key.name )
+            is_verify = False
+    if part_ranges == None: part_ranges = get_part_ranges( key.size, part_size )
+    part_md5s = [ None ] * len(part_ranges)
+    merged_completed_ranges = merge_ranges( completed_ranges or [] )
+    if len(merged_completed_ranges) == 0:
+        with open( local_file, 'wb' ) as preallocate_file: preallocate_file.truncate( key.size )
+
+    def download_part( part_num ):
+        start, end = part_ranges[part_num]
+        if is_range_covered( start, end, merged_completed_ranges ):
+            if is_verify and num_etag_parts != None: part_md5s[part_num] = get_file_md5( local_file, start, end, is_digest=True )
+            return 0
+
+        def download_range():
+            # a Key holds the state of one response, each part needs its own
+            if s3_thread_connections != None: part_key = boto.s3.key.Key( s3_thread_connections.get_bucket( key.bucket.name ), key.name )
+            else: part_key = boto.s3.key.Key( key.bucket, key.name )
+            with open( local_file, 'r+b' ) as part_file:
+                part_file.seek( start )
+                part_key.get_file( part_file, headers={ 'Range':'bytes=' + str(start) + '-' + str(end) } )
+                num_bytes = part_file.tell() - start
+            if num_bytes != end - start + 1: raise IOError( 'Short range: ' + key.name + ', expected ' + str(end - start + 1) + ', received ' + str(num_bytes) )
+            part_md5s[part_num] = part_key.local_hashes['md5']
+            if range_callback != None: range_callback( start, end )
+            return num_bytes
+
+        return call_with_retries( download_range, key.name + ' bytes=' + str(start) + '-' + str(end), max_attempts=max_attempts, 
+                                  s3_transfer_controller=s3_transfer_controller )
+
+    is_own_pool = worker_pool == None
+    if is_own_pool: worker_pool = WorkerPool( max_workers=max(1, min(max_concurrent, len(part_ranges))), name_prefix='s3-range' )
+    try:
+        work_items = [ worker_pool.submit( download_part, part_num ) for part_num in range( len(part_ranges) ) ]
+        # wait for every range before deleting the file
+        for work_item in work_items: work_item.done_event.wait()
+    finally:
+        if is_own_pool: worker_pool.shutdown()
+    failed_work_items = [ work_item for work_item in work_items if work_item.exception != None ]
+    if len(failed_work_items) > 0:
+        # the completed ranges were reported, keep them for a resume
+        if range_callback == None: os.remove( local_file )
+        raise failed_work_items[0].exception
+
+    if is_verify:
+        if num_etag_parts != None: local_etag = hashlib.md5( ''.join( part_md5s ) ).hexdigest() + '-' + str(len(part_md5s))
+        else: local_etag = get_file_md5( local_file )
+        if local_etag != etag:
+            os.remove( local_file )
+            raise IOError( 'ETag mismatch: ' + key.name + ', expected ' + etag + ', downloaded ' + local_etag )
+    return sum( [ work_item.result for work_item in work_items ] )
+
+
+def get_file_md5( local_file, start=0, end=None, is_digest=False ):
+    """
+
+    :param local_file: path/name.ext
+    :param start: first byte (Default value = 0)
+    :param end: last byte (Default value = None, end of file)
+    :param is_digest: If True, return the binary digest (Default value = False)
+    :return: hex MD5 of the bytes start-end of the file
+
+    """
+    md5 = hashlib.md5()
+    with open( local_file, 'rb' ) as hash_file:
+        hash_file.seek( start )
+        position = start
+        while end == None or position <= end:
+            if end == None: data = hash_file.read( HASH_BLOCK_SIZE )
+            else: data = hash_file.read( min( HASH_BLOCK_SIZE, end + 1 - position ) )
+            if not data: break
+            md5.update( data )
+            position += len(data)
+    if is_digest: return md5.digest()
+    return md5.hexdigest()
+
+
+def get_local_etag( local_file, part_size=None, num_parts=None ):
+    """ETag S3 would assign to the file: the MD5, or for a multipart upload the MD5 of the part MD5s + '-' + number of parts
+
+    :param local_file: path/name.ext
+    :param part_size: If not None, bytes per part of a multipart upload (Default value = None)
+    :param num_parts: If not None, number of parts, the ETag is always multipart, i.e. even if one part (Default value = None)
+    :return: ETag without quotes
+
+    """
+    if part_size == None: return get_file_md5( local_file )
+    part_md5s = []
+    with open( local_file, 'rb' ) as hash_file:
+        while True:
+            md5 = hashlib.md5()
+            num_bytes = 0
+            while num_bytes < part_size:
+                data = hash_file.read( min( HASH_BLOCK_SIZE, part_size - num_bytes ) )
+                if not data: break
+                md5.update( data )
+                num_bytes += len(data)
+            if num_bytes == 0 and len(part_md5s) > 0: break
+            part_md5s.append( md5.digest() )
+            if num_bytes < part_size: break
+    if num_parts != None and num_parts != len(part_md5s): return None
+    return hashlib.md5( ''.join( part_md5s ) ).hexdigest() + '-' + str(len(part_md5s))
+
+
+def get_upload_part_size_for( size, part_size=DEFAULT_PART_SIZE ):
+    """
+
+    :param size: file size
+    :param part_size: requested bytes per part (Default value = DEFAULT_PART_SIZE)
+    :return: part_size, increased if needed to stay within MAX_UPLOAD_PARTS
+
+    """
+    min_part_size = int( math.ceil( float(size) / MAX_UPLOAD_PARTS ) )
+    return max( part_size, min_part_size )
+
+
+def upload_file_multipart( bucket, key_name, local_file, part_size=DEFAULT_PART_SIZE, max_concurrent=8, worker_pool=None, max_attempts=3, 
+                           s3_transfer_controller=None ):
+    """Upload a file as a multipart upload with concurrent parts.  Each part is read from a memory-mapped slice of the file,
+    so parts aren't copied into memory.  The upload is aborted if any part fails
+
+    :param bucket: target :class:`boto.s3.bucket.Bucket`
+    :param key_name: target key
+    :param local_file: source path/name.ext
+    :param part_size: bytes per part, at least 5 MB, increased for files over MAX_UPLOAD_PARTS parts (Default value = DEFAULT_PART_SIZE)
+    :param max_concurrent: max concurrent parts if worker_pool is None (Default value = 8)
+    :param worker_pool: If not None, :class:`awsext.workerpool.WorkerPool` the parts are uploaded on, i.e. shared by all 
+            large files of a sync, must not be the pool calling this function (Default value = None)
+    :param max_attempts: attempts per part (Default value = 3)
+    :param s3_transfer_controller: If not None, :class:`awsext.s3.adaptive.S3TransferController` of the parts (Default value = None)
+    :return: bytes uploaded
+
+    """
+    size = os.path.getsize( local_file )
+    part_size = get_upload_part_size_for( size, part_size )
+    part_ranges = get_part_ranges( size, part_size )
+    multipart_upload = bucket.initiate_multipart_upload( key_name )
+    try:
+        with open( local_file, 'rb' ) as mmap_file:
+            file_mmap = mmap.mmap( mmap_file.fileno(), 0, access=mmap.ACCESS_READ )
+            try:
+
+                def upload_part( part_num ):
+                    start, end = part_ranges[part_num]
+
+                    def upload_slice():
+                        multipart_upload.upload_part_from_file( MmapSliceFile( file_mmap, start, end - start + 1, name=local_file ), 
+                                                                part_num + 1, size=end - start + 1 )
+                        return end - start + 1
+
+                    return call_with_retries( upload_slice, key_name + ' part ' + str(part_num + 1), max_attempts=max_attempts, 
+                                              s3_transfer_controller=s3_transfer_controller )
+
+                is_own_pool = worker_pool == None
+                if is_own_pool: worker_pool = WorkerPool( max_workers=max(1, min(max_concurrent, len(part_ranges))), name_prefix='s3-part' )
+                try:
+                    work_items = [ worker_pool.submit( upload_part, part_num ) for part_num in range( len(part_ranges) ) ]
+                    # the mmap must stay open until every part is done
+                    for work_item in work_items: work_item.done_event.wait()
+                finally:
+                    if is_own_pool: worker_pool.shutdown()
+            finally:
+                file_mmap.close()
+        for work_item in work_items:
+            if work_item.exception != None: raise work_item.exception
+        multipart_upload.complete_upload()
+    except:
+        logger.warn( 'Aborting multipart upload: ' + key_name )
+        multipart_upload.cancel_upload()
+        raise
+    return size
+
+
+def iter_local_files( local_path ):
+    """
+
+    :param local_path: local directory
+    :return: generator of (path/name.ext, path relative to local_path with / separators) of every file, as the tree is walked
+
+    """
+    for dir_path, dir_names, file_names in os.walk( local_path ):
+        dir_names.sort()
+        for file_name in sorted( file_names ):
+            file_path = os.path.join( dir_path, file_name )
+            yield file_path, os.path.relpath( file_path, local_path ).replace( os.sep, '/' )
+
+
+class S3ThreadConnections():
+    """A connection per worker thread, cloned from an :class:`awsext.s3.connection.AwsExtS3Connection` on the thread's first request.  
+    Each worker keeps its HTTP connection alive between its requests instead of contending for the connection pool the listing's 
+    keys share, and the clones share the provider, so credentials (i.e. of an instance profile) aren't fetched per thread """
+
+    def __init__(self, s3_connection ):
+        """
+
+        :param s3_connection: :class:`awsext.s3.connection.AwsExtS3Connection` to clone
+
+        """
+        self.s3_connection = s3_connection
+        self.thread_local = threading.local()
+        self.lock = threading.Lock()
+        self.thread_s3_connections = []
+
+
+    def get_bucket(self, bucket_name ):
+        """
+
+        :param bucket_name: S3 bucket
+        :return: :class:`boto.s3.bucket.Bucket` on the calling thread's connection, not validated
+
+        """
+        map_buckets = getattr( self.thread_local, 'map_buckets', None )
+        if map_buckets == None:
+            thread_s3_connection = self.s3_connection.clone()
+            with self.lock: self.thread_s3_connections.append( thread_s3_connection )
+            self.thread_local.s3_connection = thread_s3_connection
+            map_buckets = {}
+            self.thread_local.map_buckets = map_buckets
+        bucket = map_buckets.get( bucket_name )
+        if bucket == None:
+            bucket = self.thread_local.s3_connection.get_bucket( bucket_name, validate=False )
+            map_buckets[ bucket_name ] = bucket
+        return bucket
+
+
+    def get_key(self, key ):
+        """
+
+        :param key: :class:`boto.s3.key.Key` from a listing
+        :return: :class:`boto.s3.key.Key` on the calling thread's connection, with the listing's size, ETag and last-modified (no HEAD)
+
+        """
+        thread_key = boto.s3.key.Key( self.get_bucket( key.bucket.name ), key.name )
+        thread_key.size = key.size
+        thread_key.etag = key.etag
+        thread_key.last_modified = key.last_modified
+        return thread_key
+
+
+    def close(self):
+        """Close the connections of all threads """
+        with self.lock:
+            for thread_s3_connection in self.thread_s3_connections: thread_s3_connection.close()
+            self.thread_s3_connections = []
+
+
+class MmapSliceFile():
+    """Read-only file-like view of a slice of an mmap, i.e. one part of a multipart upload """
+
+    def __init__(self, file_mmap, offset, size, name=None ):
+        """
+
+        :param file_mmap: mmap of the file
+        :param offset: offset of the slice in the mmap
+        :param size: bytes in the slice
+        :param name: If not None, file name reported to boto (Default value = None)
+
+        """
+        self.file_mmap = file_mmap
+        self.offset = offset
+        self.size = size
+        self.position = 0
+        if name != None: self.name = name
+
+
+    def read(self, size=-1 ):
+        """
+
+        :param size: max bytes, -1 for the rest of the slice (Default value = -1)
+
+        """
+        if size < 0 or size > self.size - self.position: size = self.size - self.position
+        start = self.offset + self.position
+        self.position += size
+        return self.file_mmap[ start:start + size ]
+
+
+    def seek(self, offset, whence=os.SEEK_SET ):
+        """
+
+        :param offset: offset relative to whence
+        :param whence: os.SEEK_SET, os.SEEK_CUR or os.SEEK_END (Default value = os.SEEK_SET)
+
+        """
+        if whence == os.SEEK_CUR: offset += self.position
+        elif whence == os.SEEK_END: offset += self.size
+        self.position = max( 0, min( offset, self.size ) )
+
+
+    def tell(self):
+        """ """
+        return self.position
+
+
+    def close(self):
+        """The mmap is closed by its owner """
+        pass
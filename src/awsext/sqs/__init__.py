@@ -20,7 +20,7 @@ Common methods for awsext.sqs
 """
 
 import boto.sqs
-from boto.regioninfo import get_regions
+import awsext.regioncache
 from boto.sqs.regioninfo import SQSRegionInfo
 
 
@@ -30,7 +30,7 @@ def regions():
     :return: A list of configured ``RegionInfo`` objects
     
     """
-    return get_regions(
+    return awsext.regioncache.get_regions(
         'sqs',
         region_cls=IpcSQSRegionInfo
     )
@@ -19,8 +19,9 @@ Common methods for awsext.vpc
 :version: 1.1
 """
 
+import awsext.regioncache
 import awsext.vpc.connection
-from boto.regioninfo import RegionInfo, get_regions
+from boto.regioninfo import RegionInfo
 
 
 def regions(**kw_params):
@@ -32,7 +33,7 @@ def regions(**kw_params):
     :param **kw_params: 
 
     """
-    return get_regions('ec2', connection_cls=awsext.vpc.connection.AwsExtVPCConnection)
+    return awsext.regioncache.get_regions('ec2', connection_cls=awsext.vpc.connection.AwsExtVPCConnection)
 
 
 def connect_to_region(region_name, **kw_params):
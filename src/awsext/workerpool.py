@@ -0,0 +1,308 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Bounded pool of worker threads, shared by the awsext packages
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import time
+import threading
+import traceback
+import Queue
+from awsext.exception import WorkItemCancelledError, WorkItemTimeoutError
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool():
+    """Fixed number of worker threads processing WorkItems from a bounded queue """
+
+    def __init__(self, max_workers=8, max_queued=None, name_prefix='awsext-worker' ):
+        """
+
+        :param max_workers: number of worker threads (Default value = 8)
+        :param max_queued: max number of WorkItems waiting for a worker, submit blocks when full (Default value = None, 2 * max_workers)
+        :param name_prefix: prefix of worker thread names, used for logging (Default value = 'awsext-worker')
+
+        """
+        if max_workers < 1: raise ValueError( 'max_workers must be >= 1' )
+        if max_queued == None: max_queued = max_workers * 2
+        self.max_workers = max_workers
+        self.name_prefix = name_prefix
+        self.work_queue = Queue.Queue( max_queued )
+        self.shutdown_event = threading.Event()
+        self.worker_threads = []
+        for i in range(0, max_workers):
+            worker_thread = WorkerThread( self.work_queue, name=name_prefix + '-' + str(i), shutdown_event=self.shutdown_event )
+            worker_thread.start()
+            self.worker_threads.append( worker_thread )
+
+
+    def submit(self, func, *args, **kwargs ):
+        """Queue func(*args, **kwargs) for execution on a worker thread, blocks while the queue is full
+
+        :param func: callable to execute
+        :return: :class:`awsext.workerpool.WorkItem`
+
+        """
+        work_item = WorkItem( func, args, kwargs )
+        self.work_queue.put( work_item )
+        return work_item
+
+
+    def submit_work_item(self, work_item ):
+        """Queue a WorkItem, i.e. one created with a done_queue, blocks while the queue is full
+
+        :param work_item: :class:`awsext.workerpool.WorkItem`
+        :return: work_item
+
+        """
+        self.work_queue.put( work_item )
+        return work_item
+
+
+    def imap_unordered(self, func, items ):
+        """Execute func(item) for each item, yielding each WorkItem as it completes.
+        Items are pulled lazily from the iterable, so a generator (i.e. an S3 listing) is consumed
+        while earlier items are still being processed.  If the caller stops early (break or an exception), feeding stops
+        once this generator is closed or the pool is shut down, and the iterable is closed.
+
+        :param func: callable taking a single item
+        :param items: iterable of items
+        :return: generator of :class:`awsext.workerpool.WorkItem`, in completion order
+
+        """
+        done_queue = Queue.Queue()
+        stop_event = threading.Event()
+        feeder_thread = FeederThread( self, func, items, done_queue, stop_event )
+        feeder_thread.start()
+        num_expected = None
+        num_yielded = 0
+        try:
+            while num_expected == None or num_yielded < num_expected:
+                work_item = done_queue.get()
+                if isinstance( work_item, FeederThread ):
+                    num_expected = work_item.num_fed
+                    continue
+                num_yielded += 1
+                yield work_item
+        finally:
+            # runs on completion and when the caller closes or abandons the generator, so a feeder blocked on a full queue exits
+            stop_event.set()
+        if feeder_thread.exception != None: raise feeder_thread.exception
+
+
+    def shutdown(self, wait=True ):
+        """Stop all worker threads after the running WorkItems complete.  WorkItems still queued are cancelled instead of
+        run, their get() raises WorkItemCancelledError, and imap_unordered stops feeding
+
+        :param wait: If True, join the worker threads (Default value = True)
+
+        """
+        self.shutdown_event.set()
+        for worker_thread in self.worker_threads: self.work_queue.put( None )
+        if wait:
+            for worker_thread in self.worker_threads: worker_thread.join()
+            # anything queued behind the stop markers, i.e. by a feeder racing the shutdown
+            while True:
+                try: work_item = self.work_queue.get_nowait()
+                except Queue.Empty: break
+                if work_item != None: work_item.cancel()
+        self.worker_threads = []
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.shutdown()
+        return False
+
+
+class WorkItem():
+    """Single unit of work processed by a WorkerPool, holds the result or exception """
+
+    def __init__(self, func, args, kwargs, done_queue=None ):
+        """
+
+        :param func: callable to execute
+        :param args: positional args to func
+        :param kwargs: keyword args to func
+        :param done_queue: If not None, self is put on this Queue after execution (Default value = None)
+
+        """
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.done_queue = done_queue
+        self.result = None
+        self.exception = None
+        self.traceback = None
+        self.done_event = threading.Event()
+
+
+    def run(self):
+        """Execute func, capturing the result or exception """
+        try:
+            self.result = self.func( *self.args, **self.kwargs )
+        except Exception as e:
+            self.exception = e
+            self.traceback = traceback.format_exc()
+        finally:
+            self.done_event.set()
+            if self.done_queue != None: self.done_queue.put( self )
+
+
+    def get(self, timeout=None ):
+        """Wait for completion, return the result or raise the exception
+
+        :param timeout: max seconds to wait (Default value = None, wait forever)
+        :return: result of func
+        :raise awsext.exception.WorkItemTimeoutError: if func didn't complete within timeout, the WorkItem keeps running
+
+        """
+        # Event.wait returns None before python 2.7
+        if not self.done_event.wait( timeout ) and not self.done_event.is_set():
+            raise WorkItemTimeoutError( 'WorkItem not completed within ' + str(timeout) + ' secs' )
+        if self.exception != None: raise self.exception
+        return self.result
+
+
+    def cancel(self):
+        """Complete without running func, get() raises WorkItemCancelledError """
+        self.exception = WorkItemCancelledError( 'WorkItem cancelled by WorkerPool shutdown' )
+        self.done_event.set()
+        if self.done_queue != None: self.done_queue.put( self )
+
+
+class WorkerThread(threading.Thread):
+    """Worker that processes WorkItems until it receives None, WorkItems received after shutdown are cancelled """
+
+    def __init__(self, work_queue, name=None, shutdown_event=None ):
+        """
+
+        :param work_queue: Queue of WorkItems
+        :param name: thread name (Default value = None)
+        :param shutdown_event: If not None, threading.Event set when the pool is shut down (Default value = None)
+
+        """
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.work_queue = work_queue
+        self.shutdown_event = shutdown_event
+        if self.shutdown_event == None: self.shutdown_event = threading.Event()
+
+
+    def run(self):
+        """ """
+        while True:
+            work_item = self.work_queue.get()
+            if work_item == None: break
+            if self.shutdown_event.is_set(): work_item.cancel()
+            else: work_item.run()
+
+
+class FeederThread(threading.Thread):
+    """Submits items to a WorkerPool so the caller can consume results while items are still being produced """
+
+    def __init__(self, worker_pool, func, items, done_queue, stop_event=None ):
+        """
+
+        :param worker_pool: target WorkerPool
+        :param func: callable taking a single item
+        :param items: iterable of items
+        :param done_queue: Queue receiving completed WorkItems, and finally self
+        :param stop_event: If not None, threading.Event set when the consumer stops (Default value = None)
+
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.worker_pool = worker_pool
+        self.func = func
+        self.items = items
+        self.done_queue = done_queue
+        self.stop_event = stop_event
+        if self.stop_event == None: self.stop_event = threading.Event()
+        self.num_fed = 0
+        self.exception = None
+
+
+    def is_stopped(self):
+        """
+
+        :return: True if the consumer stopped or the pool was shut down
+
+        """
+        return self.stop_event.is_set() or self.worker_pool.shutdown_event.is_set()
+
+
+    def put(self, work_item ):
+        """Queue the WorkItem, waiting in short intervals so a stop isn't missed while the queue is full
+
+        :param work_item: :class:`awsext.workerpool.WorkItem`
+        :return: True if queued, False if stopped
+
+        """
+        while not self.is_stopped():
+            try:
+                self.worker_pool.work_queue.put( work_item, timeout=1 )
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+
+    def run(self):
+        """ """
+        try:
+            for item in self.items:
+                if not self.put( WorkItem( self.func, (item,), {}, done_queue=self.done_queue ) ): break
+                self.num_fed += 1
+            if self.is_stopped() and hasattr( self.items, 'close' ): self.items.close()
+        except Exception as e:
+            logger.error( 'Failure producing work items: ' + str(e) )
+            self.exception = e
+        finally:
+            # release the source iterable, i.e. a listing generator holding a connection
+            self.items = None
+            self.done_queue.put( self )
+
+
+class RateLimiter():
+    """Spaces out an operation (i.e. SSH handshakes) across threads to at most rate_per_sec """
+
+    def __init__(self, rate_per_sec ):
+        """
+
+        :param rate_per_sec: max operations per second
+
+        """
+        if rate_per_sec <= 0: raise ValueError( 'rate_per_sec must be > 0' )
+        self.interval_secs = 1.0 / rate_per_sec
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+
+    def acquire(self):
+        """Block until the next operation is allowed """
+        with self.lock:
+            now = time.time()
+            wait_secs = self.next_at - now
+            self.next_at = max( now, self.next_at ) + self.interval_secs
+        if wait_secs > 0: time.sleep( wait_secs )
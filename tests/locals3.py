@@ -0,0 +1,464 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-process S3 server over objects in memory, standing in for S3 in the tests of awsext.s3.
+Test support only, not part of the installed package.  Not secure - requests aren't authenticated, only bind to loopback addresses
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import re
+import sys
+import time
+import socket
+import shutil
+import urllib
+import tempfile
+import unittest
+import hashlib
+import urlparse
+import threading
+import itertools
+import collections
+import SocketServer
+import BaseHTTPServer
+from xml.sax.saxutils import escape
+import boto.s3.connection
+from awsext.s3.connection import AwsExtS3Connection
+
+import logging
+logger = logging.getLogger(__name__)
+
+LAST_MODIFIED_HEADER = 'Thu, 01 Jan 2015 00:00:00 GMT'
+
+
+class LocalS3Object():
+    """Contents and ETag of an object, part sizes if it was a multipart upload """
+
+    def __init__(self, data, part_sizes=None ):
+        """
+
+        :param data: contents
+        :param part_sizes: If not None, list of the sizes of the uploaded parts, the ETag is multipart (Default value = None)
+
+        """
+        self.data = data
+        self.part_sizes = part_sizes
+        if part_sizes == None: self.etag = hashlib.md5( data ).hexdigest()
+        else:
+            part_md5s = []
+            offset = 0
+            for part_size in part_sizes:
+                part_md5s.append( hashlib.md5( data[offset:offset + part_size] ).digest() )
+                offset += part_size
+            self.etag = hashlib.md5( ''.join( part_md5s ) ).hexdigest() + '-' + str(len(part_sizes))
+        self.last_modified = time.strftime( '%Y-%m-%dT%H:%M:%S.000Z', time.gmtime() )
+
+
+class LocalS3Server():
+    """Subset of the S3 REST API (path style): buckets, GET with Range and If-Match, HEAD with partNumber, listings with prefix,
+    marker, delimiter and max-keys, PUT, multipart uploads and DELETE.  Request counts are kept per method, and GETs of the keys
+    in fail_key_names are refused (403), so failures can be injected """
+
+    def __init__(self, bind_address='127.0.0.1', port=0, latency_secs=0.0 ):
+        """
+
+        :param bind_address: listen address (Default value = '127.0.0.1')
+        :param port: listen port, 0 to pick a free port (Default value = 0)
+        :param latency_secs: delay before each GET or HEAD (Default value = 0.0)
+
+        """
+        self.bind_address = bind_address
+        self.port = port
+        self.latency_secs = latency_secs
+        self.lock = threading.Lock()
+        self.map_buckets = {}
+        self.map_uploads = {}
+        self.upload_ids = itertools.count( 1 )
+        self.counts = collections.defaultdict( int )
+        self.fail_key_names = set()
+        self.open_sockets = set()
+        self.http_server = None
+        self.serve_thread = None
+
+
+    def start(self):
+        """Start serving on a background thread
+
+        :return: port
+
+        """
+        self.http_server = LocalS3HttpServer( (self.bind_address, self.port), LocalS3RequestHandler )
+        self.http_server.local_s3_server = self
+        self.port = self.http_server.server_address[1]
+        self.serve_thread = threading.Thread( target=self.http_server.serve_forever, name='locals3-' + self.bind_address + ':' + str(self.port) )
+        self.serve_thread.daemon = True
+        self.serve_thread.start()
+        return self.port
+
+
+    def stop(self):
+        """ """
+        if self.http_server == None: return
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        self.http_server.close_connections()
+        self.serve_thread.join()
+        self.http_server = None
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.stop()
+        return False
+
+
+    def connect(self, connection_cls=AwsExtS3Connection ):
+        """
+
+        :param connection_cls: class of the connection (Default value = AwsExtS3Connection)
+        :return: connection to this server
+
+        """
+        return connection_cls( aws_access_key_id='local', aws_secret_access_key='local', host=self.bind_address, port=self.port,
+                               is_secure=False, calling_format=boto.s3.connection.OrdinaryCallingFormat() )
+
+
+    def create_bucket(self, bucket_name ):
+        """
+
+        :param bucket_name: bucket name
+
+        """
+        with self.lock:
+            self.map_buckets.setdefault( bucket_name, {} )
+
+
+    def put_object(self, bucket_name, key_name, data, part_sizes=None ):
+        """
+
+        :param bucket_name: bucket name, created if it doesn't exist
+        :param key_name: key
+        :param data: contents
+        :param part_sizes: If not None, list of part sizes, stored as a multipart upload (Default value = None)
+        :return: :class:`tests.locals3.LocalS3Object`
+
+        """
+        local_s3_object = LocalS3Object( data, part_sizes=part_sizes )
+        with self.lock:
+            self.map_buckets.setdefault( bucket_name, {} )[ key_name ] = local_s3_object
+        return local_s3_object
+
+
+    def get_object(self, bucket_name, key_name ):
+        """
+
+        :return: :class:`tests.locals3.LocalS3Object`, None if it doesn't exist
+
+        """
+        with self.lock:
+            return self.map_buckets.get( bucket_name, {} ).get( key_name )
+
+
+    def count(self, request_type ):
+        """
+
+        :param request_type: i.e. 'GET', 'RANGE', 'LIST', 'PUT', 'PART'
+
+        """
+        with self.lock:
+            self.counts[ request_type ] += 1
+
+
+class LocalS3HttpServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """A thread per connection, connections are kept alive until the client or close_connections closes them """
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def process_request(self, request, client_address ):
+        with self.local_s3_server.lock: self.local_s3_server.open_sockets.add( request )
+        SocketServer.ThreadingMixIn.process_request( self, request, client_address )
+
+    def shutdown_request(self, request ):
+        with self.local_s3_server.lock: self.local_s3_server.open_sockets.discard( request )
+        BaseHTTPServer.HTTPServer.shutdown_request( self, request )
+
+    def handle_error(self, request, client_address ):
+        # the client or close_connections closed the connection
+        logger.debug( 'Request failed: ' + str(client_address) + ', ' + str(sys.exc_info()[1]) )
+
+    def close_connections(self):
+        """Close the kept alive connections, their threads exit """
+        with self.local_s3_server.lock: open_sockets = list( self.local_s3_server.open_sockets )
+        for open_socket in open_sockets:
+            try:
+                open_socket.shutdown( socket.SHUT_RDWR )
+            except socket.error:
+                pass
+
+
+class LocalS3RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Requests of a connection to a :class:`tests.locals3.LocalS3Server` """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args ):
+        """ """
+        logger.debug( format % args )
+
+
+    def parse_request_path(self):
+        """
+
+        :return: (bucket name, key name or None, dict of the query args)
+
+        """
+        url = urlparse.urlparse( self.path )
+        query_args = dict( urlparse.parse_qsl( url.query, keep_blank_values=True ) )
+        names = url.path.lstrip('/').split( '/', 1 )
+        key_name = None
+        if len(names) > 1 and names[1] != '': key_name = urllib.unquote( names[1] )
+        return urllib.unquote( names[0] ), key_name, query_args
+
+
+    def send(self, status, body='', headers=None, is_send_body=True ):
+        """
+
+        :param status: HTTP status
+        :param body: response body (Default value = '')
+        :param headers: dict of headers, Content-Length is set from body if missing (Default value = None)
+        :param is_send_body: If False, i.e. HEAD, the body isn't sent (Default value = True)
+
+        """
+        if headers == None: headers = {}
+        self.send_response( status )
+        for name, value in headers.items(): self.send_header( name, value )
+        if 'Content-Length' not in headers: self.send_header( 'Content-Length', str(len(body)) )
+        self.end_headers()
+        if is_send_body and body: self.wfile.write( body )
+
+
+    def send_error_code(self, status, error_code, is_send_body=True ):
+        """ """
+        self.send( status, '<?xml version="1.0" encoding="UTF-8"?><Error><Code>' + error_code + '</Code><Message>' + error_code + '</Message></Error>',
+                   { 'Content-Type':'application/xml' }, is_send_body=is_send_body )
+
+
+    def read_body(self):
+        """ """
+        content_length = int( self.headers.get( 'Content-Length' ) or 0 )
+        if content_length == 0: return ''
+        return self.rfile.read( content_length )
+
+
+    def get_object_headers(self, local_s3_object ):
+        """ """
+        return { 'ETag':'"' + local_s3_object.etag + '"', 'Last-Modified':LAST_MODIFIED_HEADER, 'Content-Type':'application/octet-stream' }
+
+
+    def do_HEAD(self):
+        """ """
+        local_s3_server = self.server.local_s3_server
+        if local_s3_server.latency_secs > 0: time.sleep( local_s3_server.latency_secs )
+        bucket_name, key_name, query_args = self.parse_request_path()
+        local_s3_server.count( 'HEAD' )
+        with local_s3_server.lock:
+            map_objects = local_s3_server.map_buckets.get( bucket_name )
+            local_s3_object = None
+            if map_objects != None and key_name != None: local_s3_object = map_objects.get( key_name )
+        if key_name == None:
+            if map_objects == None: return self.send_error_code( 404, 'NoSuchBucket', is_send_body=False )
+            return self.send( 200, is_send_body=False )
+        if local_s3_object == None: return self.send_error_code( 404, 'NoSuchKey', is_send_body=False )
+        headers = self.get_object_headers( local_s3_object )
+        if 'partNumber' in query_args and local_s3_object.part_sizes != None:
+            headers['Content-Length'] = str(local_s3_object.part_sizes[ int(query_args['partNumber']) - 1 ])
+            headers['x-amz-mp-parts-count'] = str(len(local_s3_object.part_sizes))
+        else: headers['Content-Length'] = str(len(local_s3_object.data))
+        self.send( 200, headers=headers, is_send_body=False )
+
+
+    def do_GET(self):
+        """ """
+        local_s3_server = self.server.local_s3_server
+        if local_s3_server.latency_secs > 0: time.sleep( local_s3_server.latency_secs )
+        bucket_name, key_name, query_args = self.parse_request_path()
+        with local_s3_server.lock:
+            map_objects = local_s3_server.map_buckets.get( bucket_name )
+            local_s3_object = None
+            if map_objects != None and key_name != None: local_s3_object = map_objects.get( key_name )
+        if map_objects == None: return self.send_error_code( 404, 'NoSuchBucket' )
+        if key_name == None: return self.send_listing( bucket_name, query_args )
+        if 'uploadId' in query_args: return self.send_parts( bucket_name, key_name, query_args['uploadId'] )
+        local_s3_server.count( 'GET' )
+        if key_name in local_s3_server.fail_key_names: return self.send_error_code( 403, 'AccessDenied' )
+        if local_s3_object == None: return self.send_error_code( 404, 'NoSuchKey' )
+        if_match = self.headers.get( 'If-Match' )
+        if if_match != None and if_match.strip('"') != local_s3_object.etag: return self.send_error_code( 412, 'PreconditionFailed' )
+        headers = self.get_object_headers( local_s3_object )
+        range_header = self.headers.get( 'Range' )
+        if range_header == None: return self.send( 200, local_s3_object.data, headers )
+        local_s3_server.count( 'RANGE' )
+        match = re.match( r'bytes=(\d+)-(\d*)', range_header )
+        start = int( match.group(1) )
+        end = len(local_s3_object.data) - 1
+        if match.group(2) != '': end = min( end, int( match.group(2) ) )
+        if start >= len(local_s3_object.data): return self.send_error_code( 416, 'InvalidRange' )
+        headers['Content-Range'] = 'bytes ' + str(start) + '-' + str(end) + '/' + str(len(local_s3_object.data))
+        self.send( 206, local_s3_object.data[start:end + 1], headers )
+
+
+    def send_listing(self, bucket_name, query_args ):
+        """ListBucketResult (version 1) of the bucket's keys after the marker """
+        local_s3_server = self.server.local_s3_server
+        local_s3_server.count( 'LIST' )
+        prefix = query_args.get( 'prefix', '' )
+        marker = query_args.get( 'marker', '' )
+        delimiter = query_args.get( 'delimiter', '' )
+        max_keys = int( query_args.get( 'max-keys', 1000 ) )
+        with local_s3_server.lock:
+            map_objects = dict( local_s3_server.map_buckets[bucket_name] )
+        key_names = []
+        common_prefixes = []
+        last_name = None
+        is_truncated = False
+        for key_name in sorted( [ key_name for key_name in map_objects.keys() if key_name.startswith( prefix ) and key_name > marker ] ):
+            if delimiter != '':
+                delimiter_pos = key_name.find( delimiter, len(prefix) )
+                if delimiter_pos != -1:
+                    common_prefix = key_name[0:delimiter_pos + len(delimiter)]
+                    if common_prefix in common_prefixes or common_prefix <= marker: continue
+                    if len(key_names) + len(common_prefixes) == max_keys:
+                        is_truncated = True
+                        break
+                    common_prefixes.append( common_prefix )
+                    last_name = common_prefix
+                    continue
+            if len(key_names) + len(common_prefixes) == max_keys:
+                is_truncated = True
+                break
+            key_names.append( key_name )
+            last_name = key_name
+        xml = [ '<?xml version="1.0" encoding="UTF-8"?><ListBucketResult><Name>' + escape(bucket_name) + '</Name><Prefix>' + escape(prefix) +
+                '</Prefix><Marker>' + escape(marker) + '</Marker><MaxKeys>' + str(max_keys) + '</MaxKeys><IsTruncated>' +
+                str(is_truncated).lower() + '</IsTruncated>' ]
+        if is_truncated and last_name != None: xml.append( '<NextMarker>' + escape(last_name) + '</NextMarker>' )
+        for key_name in key_names:
+            local_s3_object = map_objects[key_name]
+            xml.append( '<Contents><Key>' + escape(key_name) + '</Key><LastModified>' + local_s3_object.last_modified + '</LastModified><ETag>&quot;' +
+                        local_s3_object.etag + '&quot;</ETag><Size>' + str(len(local_s3_object.data)) + '</Size><StorageClass>STANDARD</StorageClass></Contents>' )
+        for common_prefix in common_prefixes: xml.append( '<CommonPrefixes><Prefix>' + escape(common_prefix) + '</Prefix></CommonPrefixes>' )
+        xml.append( '</ListBucketResult>' )
+        self.send( 200, ''.join( xml ), { 'Content-Type':'application/xml' } )
+
+
+    def send_parts(self, bucket_name, key_name, upload_id ):
+        """ListPartsResult of a multipart upload, boto lists the parts to complete an upload """
+        local_s3_server = self.server.local_s3_server
+        with local_s3_server.lock:
+            map_parts = dict( local_s3_server.map_uploads[upload_id] )
+        xml = [ '<?xml version="1.0" encoding="UTF-8"?><ListPartsResult><Bucket>' + escape(bucket_name) + '</Bucket><Key>' + escape(key_name) +
+                '</Key><UploadId>' + upload_id + '</UploadId><IsTruncated>false</IsTruncated>' ]
+        for part_num in sorted( map_parts.keys() ):
+            xml.append( '<Part><PartNumber>' + str(part_num) + '</PartNumber><LastModified>2015-01-01T00:00:00.000Z</LastModified><ETag>&quot;' +
+                        hashlib.md5( map_parts[part_num] ).hexdigest() + '&quot;</ETag><Size>' + str(len(map_parts[part_num])) + '</Size></Part>' )
+        xml.append( '</ListPartsResult>' )
+        self.send( 200, ''.join( xml ), { 'Content-Type':'application/xml' } )
+
+
+    def do_PUT(self):
+        """ """
+        local_s3_server = self.server.local_s3_server
+        bucket_name, key_name, query_args = self.parse_request_path()
+        data = self.read_body()
+        if key_name == None:
+            local_s3_server.create_bucket( bucket_name )
+            return self.send( 200 )
+        if 'uploadId' in query_args:
+            local_s3_server.count( 'PART' )
+            with local_s3_server.lock:
+                local_s3_server.map_uploads[ query_args['uploadId'] ][ int(query_args['partNumber']) ] = data
+            return self.send( 200, headers={ 'ETag':'"' + hashlib.md5( data ).hexdigest() + '"' } )
+        local_s3_server.count( 'PUT' )
+        local_s3_object = local_s3_server.put_object( bucket_name, key_name, data )
+        self.send( 200, headers={ 'ETag':'"' + local_s3_object.etag + '"' } )
+
+
+    def do_POST(self):
+        """ """
+        local_s3_server = self.server.local_s3_server
+        bucket_name, key_name, query_args = self.parse_request_path()
+        self.read_body()
+        if 'uploads' in query_args:
+            with local_s3_server.lock:
+                upload_id = 'upload' + str(local_s3_server.upload_ids.next())
+                local_s3_server.map_uploads[ upload_id ] = {}
+            return self.send( 200, '<?xml version="1.0" encoding="UTF-8"?><InitiateMultipartUploadResult><Bucket>' + escape(bucket_name) + '</Bucket><Key>' +
+                              escape(key_name) + '</Key><UploadId>' + upload_id + '</UploadId></InitiateMultipartUploadResult>', { 'Content-Type':'application/xml' } )
+        if 'uploadId' in query_args:
+            with local_s3_server.lock:
+                map_parts = local_s3_server.map_uploads.pop( query_args['uploadId'] )
+            parts = [ map_parts[part_num] for part_num in sorted( map_parts.keys() ) ]
+            local_s3_object = local_s3_server.put_object( bucket_name, key_name, ''.join( parts ), part_sizes=[ len(part) for part in parts ] )
+            return self.send( 200, '<?xml version="1.0" encoding="UTF-8"?><CompleteMultipartUploadResult><Location>' + escape(self.path) + '</Location><Bucket>' +
+                              escape(bucket_name) + '</Bucket><Key>' + escape(key_name) + '</Key><ETag>&quot;' + local_s3_object.etag +
+                              '&quot;</ETag></CompleteMultipartUploadResult>', { 'Content-Type':'application/xml' } )
+        self.send_error_code( 400, 'InvalidRequest' )
+
+
+    def do_DELETE(self):
+        """ """
+        local_s3_server = self.server.local_s3_server
+        bucket_name, key_name, query_args = self.parse_request_path()
+        with local_s3_server.lock:
+            if 'uploadId' in query_args:
+                local_s3_server.map_uploads.pop( query_args['uploadId'], None )
+                local_s3_server.counts[ 'ABORT' ] += 1
+            else: local_s3_server.map_buckets.get( bucket_name, {} ).pop( key_name, None )
+        self.send( 204 )
+
+
+class LocalS3TestCase(unittest.TestCase):
+    """Starts a LocalS3Server with an empty bucket_name and creates a temp directory for each test """
+
+    bucket_name = 'bucket'
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.local_s3_server = LocalS3Server()
+        self.local_s3_server.start()
+        self.local_s3_server.create_bucket( self.bucket_name )
+        self.s3_connection = self.local_s3_server.connect()
+
+    def tearDown(self):
+        self.s3_connection.close()
+        self.local_s3_server.stop()
+        shutil.rmtree( self.temp_dir )
+
+    def put_objects(self, map_objects ):
+        """
+
+        :param map_objects: dict of key name to contents
+
+        """
+        for key_name, data in map_objects.items(): self.local_s3_server.put_object( self.bucket_name, key_name, data )
+
+    def read_local_file(self, path ):
+        with open( path, 'rb' ) as fp: return fp.read()
@@ -0,0 +1,498 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-process SSH/SFTP servers standing in for EC2 instances, for benchmarking and failure testing of awsext.ec2.remote.
+Test support only, not part of the installed package.  Not secure - any key or password is accepted, only bind to loopback addresses
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import time
+import errno
+import random
+import socket
+import threading
+import subprocess
+import paramiko
+
+import logging
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 32768
+
+
+def generate_key_file( key_filename, bits=2048 ):
+    """Generate an RSA private key file, i.e. the client key_filename passed to RemoteRunThread
+
+    :param key_filename: path/name.ext of the key file
+    :param bits: key size (Default value = 2048)
+    :return: :class:`paramiko.RSAKey`
+
+    """
+    rsa_key = paramiko.RSAKey.generate( bits )
+    rsa_key.write_private_key_file( key_filename )
+    return rsa_key
+
+
+def set_file_attr( local_path, attr ):
+    """Same as paramiko.SFTPServer.set_file_attr, except a size change keeps the file contents (paramiko opens with 'w+',
+    which empties the file first)
+
+    :param local_path: local path/name.ext
+    :param attr: :class:`paramiko.SFTPAttributes`
+
+    """
+    if attr._flags & attr.FLAG_PERMISSIONS: os.chmod( local_path, attr.st_mode )
+    if attr._flags & attr.FLAG_UIDGID: os.chown( local_path, attr.st_uid, attr.st_gid )
+    if attr._flags & attr.FLAG_AMTIME: os.utime( local_path, (attr.st_atime, attr.st_mtime) )
+    if attr._flags & attr.FLAG_SIZE:
+        with open( local_path, 'r+b' ) as local_file: local_file.truncate( attr.st_size )
+
+
+class LocalSshFarm():
+    """Many LocalSshServers, either on one address with a port each, or on loopback addresses 127.0.0.2, 127.0.0.3, ...
+    sharing one port so they can be used as separate hosts by RemoteFleetExecutor (loopback addresses other than 127.0.0.1
+    are only routed by default on Linux) """
+
+    def __init__(self, num_servers, root_dir, is_loopback_ips=False, bind_address='127.0.0.1', port=0, handshake_latency_secs=0.0,
+                 exec_latency_secs=0.0, drop_rate=0.0, random_seed=None ):
+        """
+
+        :param num_servers: number of servers
+        :param root_dir: parent directory, each server gets its own subdirectory as its root
+        :param is_loopback_ips: If True, bind each server to its own 127.0.0.x address (Default value = False)
+        :param bind_address: address of all servers when not is_loopback_ips (Default value = '127.0.0.1')
+        :param port: port of all servers when is_loopback_ips, 0 to pick a free port (Default value = 0)
+        :param handshake_latency_secs: delay before each SSH handshake (Default value = 0.0)
+        :param exec_latency_secs: delay before each command or SFTP session starts (Default value = 0.0)
+        :param drop_rate: fraction 0.0-1.0 of connections dropped before the handshake (Default value = 0.0)
+        :param random_seed: If not None, seed of the drop decisions, for repeatable runs (Default value = None)
+
+        """
+        self.num_servers = num_servers
+        self.root_dir = root_dir
+        self.is_loopback_ips = is_loopback_ips
+        self.bind_address = bind_address
+        self.port = port
+        self.handshake_latency_secs = handshake_latency_secs
+        self.exec_latency_secs = exec_latency_secs
+        self.drop_rate = drop_rate
+        self.random_seed = random_seed
+        self.host_key = paramiko.RSAKey.generate( 2048 )
+        self.local_ssh_servers = []
+
+
+    def start(self):
+        """Start all servers
+
+        :return: list of (ip_address, port) of the servers
+
+        """
+        port = self.port
+        for server_num in range(self.num_servers):
+            if self.is_loopback_ips: bind_address = '127.0.0.' + str(server_num + 2)
+            else:
+                bind_address = self.bind_address
+                port = 0
+            server_root_dir = os.path.join( self.root_dir, bind_address + '_' + str(server_num) )
+            if not os.path.isdir( server_root_dir ): os.makedirs( server_root_dir )
+            random_seed = None
+            if self.random_seed != None: random_seed = self.random_seed + server_num
+            local_ssh_server = LocalSshServer( server_root_dir, bind_address=bind_address, port=port, host_key=self.host_key,
+                                               handshake_latency_secs=self.handshake_latency_secs, exec_latency_secs=self.exec_latency_secs,
+                                               drop_rate=self.drop_rate, random_seed=random_seed )
+            local_ssh_server.start()
+            # the first loopback server picks the port shared by the others
+            port = local_ssh_server.port
+            self.local_ssh_servers.append( local_ssh_server )
+        return self.get_addresses()
+
+
+    def get_addresses(self):
+        """
+
+        :return: list of (ip_address, port) of the servers
+
+        """
+        return [ (local_ssh_server.bind_address, local_ssh_server.port) for local_ssh_server in self.local_ssh_servers ]
+
+
+    def stop(self):
+        """Stop all servers """
+        for local_ssh_server in self.local_ssh_servers: local_ssh_server.stop()
+        self.local_ssh_servers = []
+
+
+    def __enter__(self):
+        self.start()
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.stop()
+        return False
+
+
+class LocalSshServer():
+    """SSH server on a local port, commands are run with /bin/sh in root_dir and SFTP paths are relative to root_dir.
+    Only SFTP paths are remapped: a command sees the real filesystem, so relative paths in commands and over SFTP name the
+    same file, absolute paths don't """
+
+    def __init__(self, root_dir, bind_address='127.0.0.1', port=0, host_key=None, handshake_latency_secs=0.0, exec_latency_secs=0.0,
+                 drop_rate=0.0, random_seed=None ):
+        """
+
+        :param root_dir: working directory of commands and root of SFTP paths
+        :param bind_address: listen address (Default value = '127.0.0.1')
+        :param port: listen port, 0 to pick a free port (Default value = 0)
+        :param host_key: :class:`paramiko.PKey` host key (Default value = None, generated)
+        :param handshake_latency_secs: delay before each SSH handshake (Default value = 0.0)
+        :param exec_latency_secs: delay before each command or SFTP session starts (Default value = 0.0)
+        :param drop_rate: fraction 0.0-1.0 of connections dropped before the handshake (Default value = 0.0)
+        :param random_seed: If not None, seed of the drop decisions, for repeatable runs (Default value = None)
+
+        """
+        if host_key == None: host_key = paramiko.RSAKey.generate( 2048 )
+        self.root_dir = os.path.abspath( root_dir )
+        self.bind_address = bind_address
+        self.port = port
+        self.host_key = host_key
+        self.handshake_latency_secs = handshake_latency_secs
+        self.exec_latency_secs = exec_latency_secs
+        self.drop_rate = drop_rate
+        self.random = random.Random( random_seed )
+        self.lock = threading.Lock()
+        self.listen_socket = None
+        self.accept_thread = None
+        self.transports = []
+        self.is_stopped = False
+        self.num_connections = 0
+        self.num_dropped = 0
+        self.num_execs = 0
+
+
+    def start(self):
+        """Listen and start accepting connections on a daemon thread """
+        self.listen_socket = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+        self.listen_socket.setsockopt( socket.SOL_SOCKET, socket.SO_REUSEADDR, 1 )
+        self.listen_socket.bind( (self.bind_address, self.port) )
+        self.listen_socket.listen( 128 )
+        self.port = self.listen_socket.getsockname()[1]
+        self.accept_thread = threading.Thread( target=self.accept_connections, name='localssh-' + self.bind_address + ':' + str(self.port) )
+        self.accept_thread.daemon = True
+        self.accept_thread.start()
+
+
+    def stop(self):
+        """Stop listening and close all connections """
+        self.is_stopped = True
+        try:
+            self.listen_socket.close()
+        except socket.error:
+            pass
+        with self.lock:
+            for transport in self.transports: transport.close()
+            self.transports = []
+
+
+    def accept_connections(self):
+        """Accept loop, each connection is handshaked on its own thread """
+        while not self.is_stopped:
+            try:
+                client_socket, client_address = self.listen_socket.accept()
+            except socket.error as e:
+                if self.is_stopped: break
+                if e.errno in ( errno.EINTR, errno.ECONNABORTED ): continue
+                raise
+            with self.lock:
+                self.num_connections += 1
+                is_drop = self.drop_rate > 0 and self.random.random() < self.drop_rate
+                if is_drop: self.num_dropped += 1
+            if is_drop:
+                client_socket.close()
+                continue
+            handshake_thread = threading.Thread( target=self.start_transport, args=(client_socket,) )
+            handshake_thread.daemon = True
+            handshake_thread.start()
+
+
+    def start_transport(self, client_socket ):
+        """
+
+        :param client_socket: accepted socket
+
+        """
+        if self.handshake_latency_secs > 0: time.sleep( self.handshake_latency_secs )
+        transport = paramiko.Transport( client_socket )
+        transport.add_server_key( self.host_key )
+        transport.set_subsystem_handler( 'sftp', paramiko.SFTPServer, LocalSftpServerInterface, self )
+        with self.lock:
+            if self.is_stopped:
+                transport.close()
+                return
+            self.transports.append( transport )
+        try:
+            transport.start_server( server=LocalServerInterface( self ) )
+        except (paramiko.SSHException, EOFError, socket.error) as e:
+            logger.warn( 'Handshake failed: ' + str(e) )
+            return
+        # all work is done by the exec/subsystem handlers, accepted channels are only referenced until closed,
+        # a dropped paramiko.Channel closes itself when garbage collected
+        open_channels = []
+        while transport.is_active():
+            channel = transport.accept( 1 )
+            open_channels = [ open_channel for open_channel in open_channels if not open_channel.closed ]
+            if channel != None: open_channels.append( channel )
+        with self.lock:
+            if transport in self.transports: self.transports.remove( transport )
+
+
+    def exec_command(self, channel, command ):
+        """Run the command with /bin/sh in root_dir, relaying STD_IN/STD_OUT/STD_ERR and the exit status over the channel.
+        The command isn't confined to root_dir, absolute paths are used as is
+
+        :param channel: :class:`paramiko.Channel`
+        :param command: command line
+
+        """
+        with self.lock: self.num_execs += 1
+        try:
+            if self.exec_latency_secs > 0: time.sleep( self.exec_latency_secs )
+            # like sshd, the shell leads a new session/process group
+            process = subprocess.Popen( [ '/bin/sh', '-c', command ], cwd=self.root_dir, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=os.setsid )
+            relay_threads = [ threading.Thread( target=self.relay_stdin, args=(channel, process.stdin) ),
+                              threading.Thread( target=self.relay_output, args=(process.stderr, channel.sendall_stderr) ) ]
+            for relay_thread in relay_threads:
+                relay_thread.daemon = True
+                relay_thread.start()
+            self.relay_output( process.stdout, channel.sendall )
+            relay_threads[1].join()
+            returncode = process.wait()
+            channel.send_exit_status( returncode )
+        except Exception as e:
+            logger.warn( 'Exec failed: ' + command + ', ' + str(e) )
+            try:
+                channel.send_exit_status( 255 )
+            # the client is gone, i.e. a transfer stopped at its deadline
+            except (EOFError, socket.error):
+                pass
+        finally:
+            # EOF only, the client closes the channel.  Closing here can reach the client before the exec request
+            # is acknowledged by the transport thread, failing exec_command with 'Channel closed'
+            channel.shutdown_write()
+
+
+    def relay_stdin(self, channel, process_stdin ):
+        """
+
+        :param channel: :class:`paramiko.Channel`
+        :param process_stdin: STD_IN of the process, closed when the channel reaches EOF
+
+        """
+        try:
+            while True:
+                data = channel.recv( READ_SIZE )
+                if not data: break
+                process_stdin.write( data )
+        except (IOError, socket.error):
+            pass
+        finally:
+            try:
+                process_stdin.close()
+            except IOError:
+                pass
+
+
+    def relay_output(self, process_output, send ):
+        """
+
+        :param process_output: STD_OUT or STD_ERR of the process
+        :param send: channel.sendall or channel.sendall_stderr
+
+        """
+        while True:
+            data = os.read( process_output.fileno(), READ_SIZE )
+            if not data: break
+            try:
+                send( data )
+            # the client closed the channel, i.e. a timed out command, keep reading so the process isn't blocked on output
+            except socket.error:
+                pass
+
+
+    def to_local_path(self, path ):
+        """
+
+        :param path: SFTP path, absolute paths are relative to root_dir as well, unlike in commands
+        :return: local path under root_dir
+
+        """
+        return os.path.join( self.root_dir, os.path.normpath( '/' + path ).lstrip( '/' ) )
+
+
+class LocalServerInterface(paramiko.ServerInterface):
+    """Accepts any user/key/password, allows sessions, exec and the SFTP subsystem """
+
+    def __init__(self, local_ssh_server ):
+        """
+
+        :param local_ssh_server: :class:`tests.localssh.LocalSshServer`
+
+        """
+        self.local_ssh_server = local_ssh_server
+
+
+    def get_allowed_auths(self, username ):
+        return 'publickey,password'
+
+
+    def check_auth_publickey(self, username, key ):
+        return paramiko.AUTH_SUCCESSFUL
+
+
+    def check_auth_password(self, username, password ):
+        return paramiko.AUTH_SUCCESSFUL
+
+
+    def check_channel_request(self, kind, chanid ):
+        if kind == 'session': return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+    def check_channel_exec_request(self, channel, command ):
+        exec_thread = threading.Thread( target=self.local_ssh_server.exec_command, args=(channel, command) )
+        exec_thread.daemon = True
+        exec_thread.start()
+        return True
+
+
+class LocalSftpHandle(paramiko.SFTPHandle):
+    """Open local file of a LocalSftpServerInterface """
+
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat( os.fstat( self.readfile.fileno() ) )
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno( e.errno )
+
+
+    def chattr(self, attr ):
+        try:
+            set_file_attr( self.filename, attr )
+            return paramiko.SFTP_OK
+        except (OSError, IOError) as e:
+            return paramiko.SFTPServer.convert_errno( e.errno )
+
+
+class LocalSftpServerInterface(paramiko.SFTPServerInterface):
+    """SFTP over the local filesystem, rooted at the LocalSshServer root_dir """
+
+    def __init__(self, server, local_ssh_server, *args, **kwargs ):
+        """
+
+        :param server: :class:`tests.localssh.LocalServerInterface`
+        :param local_ssh_server: :class:`tests.localssh.LocalSshServer`
+
+        """
+        paramiko.SFTPServerInterface.__init__( self, server, *args, **kwargs )
+        self.local_ssh_server = local_ssh_server
+
+
+    def session_started(self):
+        if self.local_ssh_server.exec_latency_secs > 0: time.sleep( self.local_ssh_server.exec_latency_secs )
+
+
+    def canonicalize(self, path ):
+        return os.path.normpath( '/' + path )
+
+
+    def list_folder(self, path ):
+        local_path = self.local_ssh_server.to_local_path( path )
+        try:
+            sftp_attributes_list = []
+            for file_name in os.listdir( local_path ):
+                sftp_attributes = paramiko.SFTPAttributes.from_stat( os.stat( os.path.join( local_path, file_name ) ) )
+                sftp_attributes.filename = file_name
+                sftp_attributes_list.append( sftp_attributes )
+            return sftp_attributes_list
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno( e.errno )
+
+
+    def stat(self, path ):
+        try:
+            return paramiko.SFTPAttributes.from_stat( os.stat( self.local_ssh_server.to_local_path( path ) ) )
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno( e.errno )
+
+
+    def lstat(self, path ):
+        try:
+            return paramiko.SFTPAttributes.from_stat( os.lstat( self.local_ssh_server.to_local_path( path ) ) )
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno( e.errno )
+
+
+    def open(self, path, flags, attr ):
+        local_path = self.local_ssh_server.to_local_path( path )
+        try:
+            mode = getattr( attr, 'st_mode', None )
+            if mode == None: mode = 0o666
+            fd = os.open( local_path, flags | getattr( os, 'O_BINARY', 0 ), mode )
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno( e.errno )
+        if flags & os.O_WRONLY: fopen_mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR: fopen_mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else: fopen_mode = 'rb'
+        local_file = os.fdopen( fd, fopen_mode )
+        local_sftp_handle = LocalSftpHandle( flags )
+        local_sftp_handle.filename = local_path
+        local_sftp_handle.readfile = local_file
+        local_sftp_handle.writefile = local_file
+        return local_sftp_handle
+
+
+    def remove(self, path ):
+        return self._call_os( os.remove, self.local_ssh_server.to_local_path( path ) )
+
+
+    def rename(self, oldpath, newpath ):
+        return self._call_os( os.rename, self.local_ssh_server.to_local_path( oldpath ), self.local_ssh_server.to_local_path( newpath ) )
+
+
+    def mkdir(self, path, attr ):
+        local_path = self.local_ssh_server.to_local_path( path )
+        result = self._call_os( os.mkdir, local_path )
+        if result == paramiko.SFTP_OK and attr != None: set_file_attr( local_path, attr )
+        return result
+
+
+    def rmdir(self, path ):
+        return self._call_os( os.rmdir, self.local_ssh_server.to_local_path( path ) )
+
+
+    def chattr(self, path, attr ):
+        return self._call_os( set_file_attr, self.local_ssh_server.to_local_path( path ), attr )
+
+
+    def _call_os(self, func, *args ):
+        try:
+            func( *args )
+            return paramiko.SFTP_OK
+        except (OSError, IOError) as e:
+            return paramiko.SFTPServer.convert_errno( e.errno )
@@ -0,0 +1,347 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of the awsext.ec2.remote execution and transfer paths against a LocalSshFarm, run from the repository root,
+i.e. PYTHONPATH=src python -c 'from tests.remotebench import RemoteBenchmark; print RemoteBenchmark().run()'
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import time
+import json
+import random
+import shutil
+import resource
+import tempfile
+from tests.localssh import LocalSshFarm, generate_key_file
+from awsext.ec2.sshpool import SshConnectionPool, SshPooledConnection
+from awsext.ec2.remote import RemoteFleetExecutor, RemoteRunRequest
+import awsext.ec2.transfer
+
+import logging
+logger = logging.getLogger(__name__)
+
+BYTES_PER_MB = 1048576
+MAX_CONNECT_ATTEMPTS = 10
+
+
+def get_rss_bytes():
+    """
+
+    :return: current resident set size of this process, the peak RSS where /proc isn't available
+
+    """
+    try:
+        with open( '/proc/self/statm', 'r' ) as statm_file: return int( statm_file.read().split()[1] ) * resource.getpagesize()
+    except IOError:
+        # ru_maxrss is KB on Linux, bytes on OS X
+        return resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss * 1024
+
+
+def median( values ):
+    """
+
+    :param values: list of numbers
+    :return: median of values, None if empty
+
+    """
+    if len(values) == 0: return None
+    sorted_values = sorted( values )
+    mid = len(sorted_values) // 2
+    if len(sorted_values) % 2 == 1: return sorted_values[mid]
+    return (sorted_values[mid - 1] + sorted_values[mid]) / 2.0
+
+
+class RemoteBenchmark():
+    """Measures hosts/sec, handshake cost, transfer MB/s and memory per host.  Each measurement is repeated num_repeats times
+    and the median is reported, the transferred data is generated from a fixed seed, so runs with the same parameters on
+    the same machine are comparable.  The farm runs in this process, so the numbers include the server side cost; use them
+    to compare changes, not as absolute EC2 numbers """
+
+    def __init__(self, num_hosts=32, max_workers=16, num_commands_per_host=4, num_handshakes=10, transfer_mb=16, num_small_files=500,
+                 num_repeats=3, handshake_latency_secs=0.0, exec_latency_secs=0.0, drop_rate=0.0, work_dir=None, random_seed=1 ):
+        """
+
+        :param num_hosts: number of local servers, each on its own 127.0.0.x address (Default value = 32)
+        :param max_workers: max hosts processed concurrently (Default value = 16)
+        :param num_commands_per_host: commands run on each host per hosts/sec run (Default value = 4)
+        :param num_handshakes: sequential handshakes per handshake run (Default value = 10)
+        :param transfer_mb: size of the file transferred per transfer run (Default value = 16)
+        :param num_small_files: number of 4KB files in the directory transferred per directory run (Default value = 500)
+        :param num_repeats: repeats of each measurement, the median is reported (Default value = 3)
+        :param handshake_latency_secs: injected delay before each SSH handshake (Default value = 0.0)
+        :param exec_latency_secs: injected delay before each command or SFTP session (Default value = 0.0)
+        :param drop_rate: injected fraction of connections dropped before the handshake (Default value = 0.0)
+        :param work_dir: directory for server roots, keys and test data, removed after the run (Default value = None, temp dir)
+        :param random_seed: seed of the test data and drop decisions (Default value = 1)
+
+        """
+        self.num_hosts = num_hosts
+        self.max_workers = max_workers
+        self.num_commands_per_host = num_commands_per_host
+        self.num_handshakes = num_handshakes
+        self.transfer_mb = transfer_mb
+        self.num_small_files = num_small_files
+        self.num_repeats = num_repeats
+        self.handshake_latency_secs = handshake_latency_secs
+        self.exec_latency_secs = exec_latency_secs
+        self.drop_rate = drop_rate
+        self.work_dir = work_dir
+        self.random_seed = random_seed
+
+
+    def run(self):
+        """Start the farm, run all measurements and stop the farm
+
+        :return: :class:`tests.remotebench.RemoteBenchmarkResult`
+
+        """
+        is_own_work_dir = self.work_dir == None
+        work_dir = self.work_dir
+        if is_own_work_dir: work_dir = tempfile.mkdtemp( prefix='awsext_remotebench_' )
+        remote_benchmark_result = RemoteBenchmarkResult( self.get_params() )
+        try:
+            key_filename = os.path.join( work_dir, 'client.pem' )
+            generate_key_file( key_filename )
+            from_file = self.create_transfer_file( os.path.join( work_dir, 'transfer.dat' ) )
+            from_dir = self.create_small_files( os.path.join( work_dir, 'small_files' ) )
+            with LocalSshFarm( self.num_hosts, os.path.join( work_dir, 'servers' ), is_loopback_ips=True,
+                               handshake_latency_secs=self.handshake_latency_secs, exec_latency_secs=self.exec_latency_secs,
+                               drop_rate=self.drop_rate, random_seed=self.random_seed ) as local_ssh_farm:
+                addresses = local_ssh_farm.get_addresses()
+                port = addresses[0][1]
+                ip_addresses = [ ip_address for ip_address, port in addresses ]
+                remote_benchmark_result.add( 'handshake_secs', self.repeat( self.bench_handshake, ip_addresses[0], port, key_filename ) )
+                remote_benchmark_result.add( 'hosts_per_sec', self.repeat( self.bench_hosts_per_sec, ip_addresses, port, key_filename ) )
+                remote_benchmark_result.add( 'sftp_mb_per_sec', self.repeat( self.bench_sftp, ip_addresses[0], port, key_filename, from_file ) )
+                remote_benchmark_result.add( 'sftp_dir_mb_per_sec', self.repeat( self.bench_sftp_dir, ip_addresses[0], port, key_filename, from_dir ) )
+                remote_benchmark_result.add( 'tar_dir_mb_per_sec', self.repeat( self.bench_tar_dir, ip_addresses[0], port, key_filename, from_dir ) )
+                remote_benchmark_result.add( 'memory_bytes_per_host', self.bench_memory_per_host( ip_addresses, port, key_filename ) )
+        finally:
+            if is_own_work_dir: shutil.rmtree( work_dir, ignore_errors=True )
+        remote_benchmark_result.end_time = time.time()
+        return remote_benchmark_result
+
+
+    def repeat(self, func, *args ):
+        """
+
+        :param func: measurement, returns a number
+        :param args: args to func
+        :return: median of num_repeats calls
+
+        """
+        return median( [ func( *args ) for i in range(self.num_repeats) ] )
+
+
+    def bench_handshake(self, ip_address, port, key_filename ):
+        """
+
+        :return: seconds per connect (TCP, SSH handshake and authentication) and close
+
+        """
+        start = time.time()
+        for i in range(self.num_handshakes): self.connect( ip_address, port, key_filename ).close()
+        return (time.time() - start) / self.num_handshakes
+
+
+    def bench_hosts_per_sec(self, ip_addresses, port, key_filename ):
+        """
+
+        :return: hosts per second successfully processed by RemoteFleetExecutor, connecting and running num_commands_per_host on 
+                each host, failed hosts (i.e. dropped connections) aren't counted
+
+        """
+        host_run_requests = [ (ip_address, [ RemoteRunRequest( cmd_line='echo ' + str(i) ) for i in range(self.num_commands_per_host) ])
+                              for ip_address in ip_addresses ]
+        with SshConnectionPool() as ssh_pool:
+            remote_fleet_executor = RemoteFleetExecutor( max_workers=self.max_workers, handshakes_per_sec=None, key_filename=key_filename,
+                                                         ssh_pool=ssh_pool, port=port )
+            start = time.time()
+            remote_fleet_summary = remote_fleet_executor.run( host_run_requests )
+            elapsed_secs = time.time() - start
+        if remote_fleet_summary.num_failed > 0: logger.warn( str(remote_fleet_summary) )
+        return remote_fleet_summary.num_succeeded / elapsed_secs
+
+
+    def bench_sftp(self, ip_address, port, key_filename, from_file ):
+        """
+
+        :return: MB/s of one file uploaded over SFTP
+
+        """
+        ssh_pooled_connection = self.connect( ip_address, port, key_filename )
+        try:
+            start = time.time()
+            sftp_client = ssh_pooled_connection.acquire_sftp()
+            try: num_bytes = awsext.ec2.transfer.put_file( sftp_client, from_file, 'transfer.dat' )
+            finally: ssh_pooled_connection.release_sftp( sftp_client )
+            return num_bytes / float(BYTES_PER_MB) / (time.time() - start)
+        finally:
+            ssh_pooled_connection.close()
+
+
+    def bench_sftp_dir(self, ip_address, port, key_filename, from_dir ):
+        """
+
+        :return: MB/s of a directory of small files uploaded as an SFTP manifest
+
+        """
+        ssh_pooled_connection = self.connect( ip_address, port, key_filename )
+        try:
+            remote_upload_manifest = awsext.ec2.transfer.RemoteUploadManifest()
+            remote_upload_manifest.add_dir( from_dir, 'sftp_dir' )
+            start = time.time()
+            sftp_client = ssh_pooled_connection.acquire_sftp()
+            try: num_bytes = awsext.ec2.transfer.upload_manifest( sftp_client, remote_upload_manifest, ssh_connection=ssh_pooled_connection )
+            finally: ssh_pooled_connection.release_sftp( sftp_client )
+            return num_bytes / float(BYTES_PER_MB) / (time.time() - start)
+        finally:
+            ssh_pooled_connection.close()
+
+
+    def bench_tar_dir(self, ip_address, port, key_filename, from_dir ):
+        """
+
+        :return: MB/s (uncompressed bytes) of a directory of small files transferred as a tar stream
+
+        """
+        num_bytes = sum( [ os.path.getsize( os.path.join( from_dir, file_name ) ) for file_name in os.listdir( from_dir ) ] )
+        ssh_pooled_connection = self.connect( ip_address, port, key_filename )
+        try:
+            start = time.time()
+            awsext.ec2.transfer.put_tar_stream( ssh_pooled_connection, from_dir, 'tar_dir', compress_level=1 )
+            return num_bytes / float(BYTES_PER_MB) / (time.time() - start)
+        finally:
+            ssh_pooled_connection.close()
+
+
+    def bench_memory_per_host(self, ip_addresses, port, key_filename ):
+        """
+
+        :return: RSS growth in bytes per pooled connection with an open SFTP session
+
+        """
+        rss_bytes_before = get_rss_bytes()
+        with SshConnectionPool() as ssh_pool:
+            for ip_address in ip_addresses:
+                # the released session stays open as the connection's idle session
+                ssh_pooled_connection = self.connect( ip_address, port, key_filename, ssh_pool=ssh_pool )
+                ssh_pooled_connection.release_sftp( ssh_pooled_connection.acquire_sftp() )
+                ssh_pool.release_connection( ssh_pooled_connection )
+            rss_bytes_after = get_rss_bytes()
+        return (rss_bytes_after - rss_bytes_before) // len(ip_addresses)
+
+
+    def connect(self, ip_address, port, key_filename, ssh_pool=None ):
+        """
+
+        :param ssh_pool: If not None, :class:`awsext.ec2.sshpool.SshConnectionPool` the connection is checked out of (Default value = None)
+        :return: connected :class:`awsext.ec2.sshpool.SshPooledConnection`, retried while drop faults are injected
+
+        """
+        if ssh_pool == None: ssh_pooled_connection = SshPooledConnection( ip_address, key_filename=key_filename, keepalive_secs=0, port=port )
+        for attempt in range(MAX_CONNECT_ATTEMPTS):
+            try:
+                if ssh_pool != None: return ssh_pool.get_connection( ip_address, key_filename=key_filename, port=port )
+                ssh_pooled_connection.connect()
+                return ssh_pooled_connection
+            except Exception as e:
+                if self.drop_rate == 0 or attempt == MAX_CONNECT_ATTEMPTS - 1: raise
+                logger.info( 'Retrying dropped connection: ' + str(e) )
+
+
+    def create_transfer_file(self, path ):
+        """
+
+        :param path: path/name.ext of the file
+        :return: path of a transfer_mb file of repeatable pseudo random bytes
+
+        """
+        seeded_random = random.Random( self.random_seed )
+        block = bytearray( seeded_random.getrandbits(8) for i in range(BYTES_PER_MB) )
+        with open( path, 'wb' ) as transfer_file:
+            for i in range(self.transfer_mb): transfer_file.write( block )
+        return path
+
+
+    def create_small_files(self, dir_path ):
+        """
+
+        :param dir_path: directory of the files
+        :return: dir_path, containing num_small_files 4KB files of repeatable pseudo random bytes
+
+        """
+        os.makedirs( dir_path )
+        seeded_random = random.Random( self.random_seed )
+        for file_num in range(self.num_small_files):
+            with open( os.path.join( dir_path, 'file_' + str(file_num) ), 'wb' ) as small_file:
+                small_file.write( bytearray( seeded_random.getrandbits(8) for i in range(4096) ) )
+        return dir_path
+
+
+    def get_params(self):
+        """
+
+        :return: dict of the parameters that affect the results, stored with the results
+
+        """
+        return { 'num_hosts':self.num_hosts, 'max_workers':self.max_workers, 'num_commands_per_host':self.num_commands_per_host,
+                 'num_handshakes':self.num_handshakes, 'transfer_mb':self.transfer_mb, 'num_small_files':self.num_small_files,
+                 'num_repeats':self.num_repeats, 'handshake_latency_secs':self.handshake_latency_secs,
+                 'exec_latency_secs':self.exec_latency_secs, 'drop_rate':self.drop_rate, 'random_seed':self.random_seed }
+
+
+class RemoteBenchmarkResult():
+    """Metrics of a RemoteBenchmark run """
+
+    def __init__(self, params ):
+        """
+
+        :param params: dict of the benchmark parameters
+
+        """
+        self.params = params
+        self.metrics = {}
+        self.start_time = time.time()
+        self.end_time = None
+
+
+    def add(self, metric_name, value ):
+        """
+
+        :param metric_name: name of the metric
+        :param value: measured value
+
+        """
+        self.metrics[ metric_name ] = value
+
+
+    def to_json(self):
+        """
+
+        :return: JSON of the params and metrics, i.e. to save and compare runs
+
+        """
+        return json.dumps( { 'params':self.params, 'metrics':self.metrics, 'start_time':self.start_time, 'end_time':self.end_time }, sort_keys=True )
+
+
+    def __str__(self):
+        """ """
+        lines = [ 'RemoteBenchmarkResult: ' + ', '.join( [ key + '=' + str(value) for key, value in sorted( self.params.items() ) ] ) ]
+        for metric_name, value in sorted( self.metrics.items() ): lines.append( '   ' + metric_name + '=' + str(value) )
+        return '\n'.join( lines )
@@ -0,0 +1,158 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of the relay key and the distribution tree of :mod:`awsext.ec2.fanout`, transfers are simulated in process
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import unittest
+from awsext.ec2 import fanout
+
+
+def run_locally( remote_run_requests, home_dir ):
+    """Run the requests as the remote host would, with home_dir as the login directory """
+    for remote_run_request in remote_run_requests:
+        if remote_run_request.from_file != None:
+            shutil.copyfile( remote_run_request.from_file, os.path.join( home_dir, remote_run_request.to_file ) )
+        if remote_run_request.cmd_line != None:
+            if subprocess.call( [ '/bin/sh', '-c', remote_run_request.cmd_line ], cwd=home_dir ) != 0:
+                raise IOError( 'Failed: ' + remote_run_request.cmd_line )
+
+
+class TestFanoutRelayKey(unittest.TestCase):
+
+    def setUp(self):
+        self.home_dir = tempfile.mkdtemp()
+        self.fanout_relay_key = fanout.FanoutRelayKey( bits=1024 )
+
+    def tearDown(self):
+        self.fanout_relay_key.close()
+        shutil.rmtree( self.home_dir )
+
+    def read_authorized_keys(self):
+        with open( os.path.join( self.home_dir, fanout.AUTHORIZED_KEYS_FILE ) ) as fp: return fp.read().splitlines()
+
+    def test_install_is_repeatable(self):
+        run_locally( self.fanout_relay_key.get_install_requests(), self.home_dir )
+        run_locally( self.fanout_relay_key.get_install_requests(), self.home_dir )
+        self.assertEqual( [ self.fanout_relay_key.public_key ], self.read_authorized_keys() )
+        private_key_file = os.path.join( self.home_dir, self.fanout_relay_key.to_file )
+        self.assertEqual( 0o600, os.stat( private_key_file ).st_mode & 0o777 )
+
+    def test_remove_keeps_other_keys(self):
+        os.makedirs( os.path.join( self.home_dir, '.ssh' ) )
+        with open( os.path.join( self.home_dir, fanout.AUTHORIZED_KEYS_FILE ), 'w' ) as fp: fp.write( 'ssh-rsa AAAAother keep-me\n' )
+        run_locally( self.fanout_relay_key.get_install_requests(), self.home_dir )
+        self.assertEqual( 2, len( self.read_authorized_keys() ) )
+        run_locally( self.fanout_relay_key.get_remove_requests(), self.home_dir )
+        self.assertEqual( [ 'ssh-rsa AAAAother keep-me' ], self.read_authorized_keys() )
+        self.assertFalse( os.path.exists( os.path.join( self.home_dir, self.fanout_relay_key.to_file ) ) )
+
+    def test_remove_without_install(self):
+        run_locally( self.fanout_relay_key.get_remove_requests(), self.home_dir )
+
+    def test_close_removes_local_private_key(self):
+        local_file = self.fanout_relay_key.local_file
+        self.assertTrue( os.path.exists( local_file ) )
+        self.fanout_relay_key.close()
+        self.assertFalse( os.path.exists( local_file ) )
+
+
+class SimulatedFanout(fanout.RemoteFanout):
+    """Records each transfer instead of connecting, transfers from a parent in failed_parents fail """
+
+    def __init__(self, failed_parents=(), failed_removals=(), **kwargs ):
+        fanout.RemoteFanout.__init__( self, key_filename='unused.pem', **kwargs )
+        self.failed_parents = failed_parents
+        self.failed_removals = failed_removals
+        self.lock = threading.RLock()
+        self.map_parent_num_active = {}
+        self.max_parent_num_active = 0
+        self.transfers = []
+        self.removed_ip_addresses = []
+
+    def transfer(self, ssh_pool, ip_address, parent_ip_address, from_file, to_file, sha256, map_relay_ip_addresses, fanout_relay_key,
+                 remote_fanout_host_status ):
+        remote_fanout_host_status.is_relay_key_sent = True
+        with self.lock:
+            self.transfers.append( (ip_address, parent_ip_address) )
+            num_active = self.map_parent_num_active.get( parent_ip_address, 0 ) + 1
+            self.map_parent_num_active[ parent_ip_address ] = num_active
+            self.max_parent_num_active = max( self.max_parent_num_active, num_active )
+        time.sleep( .02 )
+        with self.lock: self.map_parent_num_active[ parent_ip_address ] -= 1
+        if parent_ip_address in self.failed_parents: raise IOError( 'Relay failed from ' + str(parent_ip_address) )
+
+    def run_requests(self, ssh_pool, ip_address, remote_run_requests ):
+        if ip_address in self.failed_removals: raise IOError( 'Removal failed' )
+        with self.lock: self.removed_ip_addresses.append( ip_address )
+
+
+class TestRemoteFanout(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.from_file = tempfile.mkstemp()
+        os.write( fd, 'artifact' )
+        os.close( fd )
+        self.ip_addresses = [ '10.0.0.' + str(i) for i in range(1, 21) ]
+
+    def tearDown(self):
+        os.remove( self.from_file )
+
+    def test_tree(self):
+        remote_fanout = SimulatedFanout( fanout=2 )
+        remote_fanout_result = remote_fanout.distribute( self.ip_addresses, self.from_file, 'artifact' )
+        self.assertEqual( self.ip_addresses, remote_fanout_result.get_verified() )
+        self.assertTrue( remote_fanout.max_parent_num_active <= 2 )
+        # the local host only seeds the tree, hosts relay to each other
+        num_from_local = len( [ parent for ip_address, parent in remote_fanout.transfers if parent == fanout.LOCAL_PARENT ] )
+        self.assertTrue( num_from_local < len(self.ip_addresses) / 2 )
+        for remote_fanout_host_status in remote_fanout_result.map_host_statuses.values():
+            if remote_fanout_host_status.parent_ip_address != fanout.LOCAL_PARENT:
+                self.assertTrue( remote_fanout_result.map_host_statuses[ remote_fanout_host_status.parent_ip_address ].is_verified )
+        self.assertEqual( sorted(self.ip_addresses), sorted(remote_fanout.removed_ip_addresses) )
+
+    def test_failed_relay_retried_from_another_parent(self):
+        remote_fanout = SimulatedFanout( fanout=1, failed_parents=( self.ip_addresses[0], ) )
+        remote_fanout_result = remote_fanout.distribute( self.ip_addresses[0:4], self.from_file, 'artifact' )
+        self.assertEqual( self.ip_addresses[0:4], remote_fanout_result.get_verified() )
+        for remote_fanout_host_status in remote_fanout_result.map_host_statuses.values():
+            self.assertNotEqual( self.ip_addresses[0], remote_fanout_host_status.parent_ip_address )
+
+    def test_max_attempts(self):
+        remote_fanout = SimulatedFanout( fanout=1, failed_parents=( fanout.LOCAL_PARENT, ), max_attempts=2 )
+        remote_fanout_result = remote_fanout.distribute( self.ip_addresses[0:2], self.from_file, 'artifact' )
+        self.assertEqual( self.ip_addresses[0:2], remote_fanout_result.get_failed() )
+        # hosts that received the relay key are cleaned up even though they weren't verified
+        self.assertEqual( sorted(self.ip_addresses[0:2]), sorted(remote_fanout.removed_ip_addresses) )
+
+    def test_cleanup_failed(self):
+        remote_fanout = SimulatedFanout( fanout=2, failed_removals=( self.ip_addresses[1], ) )
+        remote_fanout_result = remote_fanout.distribute( self.ip_addresses[0:3], self.from_file, 'artifact' )
+        self.assertEqual( 3, len( remote_fanout_result.get_verified() ) )
+        self.assertEqual( [ self.ip_addresses[1] ], remote_fanout_result.get_cleanup_failed() )
+        self.assertFalse( remote_fanout_result.map_host_statuses[ self.ip_addresses[1] ].is_relay_key_removed )
+        self.assertTrue( remote_fanout_result.map_host_statuses[ self.ip_addresses[0] ].is_relay_key_removed )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Unit tests of the region cache and its on-disk copy
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from awsext.regioncache import RegionCache
+
+
+class FakeZone():
+
+    def __init__(self, name ):
+        self.name = name
+        self.state = 'available'
+
+
+class FakeEC2Connection():
+
+    def __init__(self, region_name ):
+        self.region_name = region_name
+        self.num_calls = 0
+
+    def get_all_zones(self):
+        self.num_calls += 1
+        return [ FakeZone( self.region_name + 'a' ), FakeZone( self.region_name + 'b' ) ]
+
+
+def get_zones_process( cache_path, process_num, num_regions ):
+    region_cache = RegionCache( cache_path=cache_path )
+    for i in range(num_regions):
+        region_name = 'r' + str(process_num) + '-' + str(i)
+        region_cache.get_zones( region_name, ec2_conn=FakeEC2Connection( region_name ) )
+
+
+class TestRegionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join( self.temp_dir, 'region_cache.json' )
+
+    def tearDown(self):
+        shutil.rmtree( self.temp_dir )
+
+    def test_zones_cached(self):
+        region_cache = RegionCache()
+        ec2_conn = FakeEC2Connection( 'us-east-1' )
+        zones = region_cache.get_zones( 'us-east-1', ec2_conn=ec2_conn )
+        self.assertEqual( [ 'us-east-1a', 'us-east-1b' ], [ zone.name for zone in zones ] )
+        zones = region_cache.get_zones( 'us-east-1', ec2_conn=ec2_conn )
+        self.assertEqual( 1, ec2_conn.num_calls )
+        self.assertTrue( zones[0].connection is ec2_conn )
+        self.assertEqual( 'us-east-1', zones[0].region_name )
+
+    def test_hit_without_connection_connects_lazily(self):
+        region_cache = RegionCache()
+        region_cache.get_zones( 'us-east-1', ec2_conn=FakeEC2Connection( 'us-east-1' ) )
+        zones = region_cache.get_zones( 'us-east-1' )
+        self.assertEqual( None, zones[0]._connection )
+        ec2_conn = FakeEC2Connection( 'us-east-1' )
+        zones[0].connection = ec2_conn
+        self.assertTrue( zones[0].connection is ec2_conn )
+
+    def test_expired(self):
+        region_cache = RegionCache( ttl_secs=0.1 )
+        ec2_conn = FakeEC2Connection( 'us-east-1' )
+        region_cache.get_zones( 'us-east-1', ec2_conn=ec2_conn )
+        time.sleep( 0.2 )
+        region_cache.get_zones( 'us-east-1', ec2_conn=ec2_conn )
+        self.assertEqual( 2, ec2_conn.num_calls )
+
+    def test_miss_reads_entries_saved_by_other_instances(self):
+        region_cache = RegionCache( cache_path=self.cache_path )
+        region_cache.get_zones( 'us-east-1', ec2_conn=FakeEC2Connection( 'us-east-1' ) )
+        # another process saves a region after this one loaded the file
+        RegionCache( cache_path=self.cache_path ).get_zones( 'us-west-2', ec2_conn=FakeEC2Connection( 'us-west-2' ) )
+        ec2_conn = FakeEC2Connection( 'us-west-2' )
+        self.assertEqual( [ 'us-west-2a', 'us-west-2b' ], [ zone.name for zone in region_cache.get_zones( 'us-west-2', ec2_conn=ec2_conn ) ] )
+        self.assertEqual( 0, ec2_conn.num_calls )
+
+    def test_concurrent_processes_merge(self):
+        processes = [ multiprocessing.Process( target=get_zones_process, args=(self.cache_path, process_num, 10) ) for process_num in range(6) ]
+        for process in processes: process.start()
+        for process in processes: process.join()
+        with open( self.cache_path ) as cache_file: self.assertEqual( 60, len(json.load( cache_file )['region_zones']) )
+
+    def test_invalidate(self):
+        region_cache = RegionCache( cache_path=self.cache_path )
+        region_cache.get_zones( 'us-east-1', ec2_conn=FakeEC2Connection( 'us-east-1' ) )
+        region_cache.invalidate()
+        with open( self.cache_path ) as cache_file: self.assertEqual( {}, json.load( cache_file )['region_zones'] )
+        ec2_conn = FakeEC2Connection( 'us-east-1' )
+        RegionCache( cache_path=self.cache_path ).get_zones( 'us-east-1', ec2_conn=ec2_conn )
+        self.assertEqual( 1, ec2_conn.num_calls )
+
+    def test_regions(self):
+        region_cache = RegionCache( cache_path=self.cache_path )
+        region_names = [ region.name for region in region_cache.get_regions( 'ec2' ) ]
+        self.assertTrue( 'us-east-1' in region_names )
+        self.assertEqual( region_names, [ region.name for region in RegionCache( cache_path=self.cache_path ).get_regions( 'ec2' ) ] )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,275 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of remote execution and transfers against the local SSH/SFTP servers of :mod:`tests.localssh`
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+import threading
+import unittest
+import awsext.exception
+from tests import localssh
+from awsext.ec2 import transfer
+from tests.localssh import LocalSshFarm, generate_key_file
+from awsext.ec2.sshpool import SshPooledConnection
+from awsext.ec2.remote import RemoteFleetExecutor, RemoteRunRequest, RemoteRunThread, RemoteDeadline
+from awsext.ec2.remoteresults import FLAG_TIMED_OUT, FLAG_EXCEPTION
+from awsext.ec2.remoteoutput import OutputCapture, drain_channel, STREAM_NAME_STD_OUT, STREAM_NAME_STD_ERR
+
+
+class LocalSshTestCase(unittest.TestCase):
+    """Starts two local SSH servers, each with its own root_dir, for each test """
+
+    num_servers = 2
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.key_filename = os.path.join( self.temp_dir, 'key.pem' )
+        generate_key_file( self.key_filename )
+        self.local_ssh_farm = LocalSshFarm( self.num_servers, os.path.join( self.temp_dir, 'farm' ), is_loopback_ips=True )
+        self.local_ssh_farm.start()
+        self.addresses = self.local_ssh_farm.get_addresses()
+        self.port = self.addresses[0][1]
+
+    def tearDown(self):
+        self.local_ssh_farm.stop()
+        shutil.rmtree( self.temp_dir )
+
+    def get_root_dir(self, server_num=0 ):
+        return self.local_ssh_farm.local_ssh_servers[server_num].root_dir
+
+    def connect(self, server_num=0 ):
+        ssh_connection = SshPooledConnection( self.addresses[server_num][0], key_filename=self.key_filename, port=self.port )
+        ssh_connection.connect()
+        return ssh_connection
+
+    def create_executor(self):
+        return RemoteFleetExecutor( key_filename=self.key_filename, port=self.port, handshakes_per_sec=None )
+
+    def write_local_file(self, name, num_bytes ):
+        local_file = os.path.join( self.temp_dir, name )
+        if not os.path.exists( os.path.dirname( local_file ) ): os.makedirs( os.path.dirname( local_file ) )
+        with open( local_file, 'wb' ) as fp: fp.write( os.urandom( num_bytes ) )
+        return local_file
+
+
+class TestRemoteTimeouts(LocalSshTestCase):
+
+    def test_request_timeout(self):
+        start = time.time()
+        remote_fleet_summary = self.create_executor().run( { self.addresses[0][0]:[ RemoteRunRequest( cmd_line='echo started; sleep 60', timeout_secs=1 ) ],
+                                                             self.addresses[1][0]:[ RemoteRunRequest( cmd_line='echo fast' ) ] } )
+        self.assertTrue( time.time() - start < 30 )
+        self.assertEqual( 1, remote_fleet_summary.num_succeeded )
+        self.assertEqual( 1, remote_fleet_summary.num_timed_out )
+        remote_run_thread = remote_fleet_summary.get_timed_out()[0]
+        self.assertEqual( self.addresses[0][0], remote_run_thread.ip_address )
+        self.assertTrue( remote_run_thread.remote_run_responses[0].is_timed_out )
+        self.assertEqual( None, remote_run_thread.remote_run_responses[0].returncode )
+
+    def test_timeouts_in_result_table(self):
+        from_file = self.write_local_file( 'big', 64 * 1048576 )
+        remote_result_table = self.create_executor().run_table( { 
+                    self.addresses[0][0]:[ RemoteRunRequest( cmd_line='echo first' ), RemoteRunRequest( cmd_line='sleep 60', timeout_secs=1 ), 
+                                           RemoteRunRequest( cmd_line='echo never' ) ],
+                    self.addresses[1][0]:[ RemoteRunRequest( cmd_line='sleep 2' ), RemoteRunRequest( from_file=from_file, to_file='big' ), 
+                                           RemoteRunRequest( cmd_line='echo never' ) ] }, timeout_secs=2.5 )
+        # one row for the request that timed out, none for the request after it, whether a command or a transfer timed out
+        for ip_address, port in self.addresses:
+            rows = [ row for row in range(len(remote_result_table)) if remote_result_table.get_host( row ) == ip_address ]
+            self.assertEqual( [ 0, 1 ], [ remote_result_table.step_nums[row] for row in rows ] )
+            self.assertFalse( remote_result_table.is_failed( rows[0] ) )
+            self.assertEqual( FLAG_TIMED_OUT | FLAG_EXCEPTION, remote_result_table.flags[ rows[1] ] )
+        remote_result_table.close()
+
+    def test_cancel_only_affects_the_running_batch(self):
+        remote_fleet_executor = self.create_executor()
+        host_run_requests = dict( [ (ip_address, [ RemoteRunRequest( cmd_line='sleep 60' ) ]) for ip_address, port in self.addresses ] )
+        threading.Timer( 1, remote_fleet_executor.cancel ).start()
+        remote_fleet_summary = remote_fleet_executor.run( host_run_requests )
+        self.assertEqual( len(self.addresses), remote_fleet_summary.num_timed_out )
+        self.assertTrue( all( [ remote_run_thread.exception.is_cancelled for remote_run_thread in remote_fleet_summary.remote_run_threads ] ) )
+        remote_fleet_summary = remote_fleet_executor.run( dict( [ (ip_address, [ RemoteRunRequest( cmd_line='echo again' ) ]) for ip_address, port in self.addresses ] ) )
+        self.assertEqual( len(self.addresses), remote_fleet_summary.num_succeeded )
+
+    def test_transfer_stopped_at_deadline(self):
+        from_file = self.write_local_file( 'big', 64 * 1048576 )
+        remote_fleet_summary = self.create_executor().run( { self.addresses[0][0]:[ RemoteRunRequest( from_file=from_file, to_file='big', cmd_line='echo done' ) ] },
+                                                           timeout_secs=0.5 )
+        self.assertEqual( 1, remote_fleet_summary.num_timed_out )
+        self.assertTrue( isinstance( remote_fleet_summary.remote_run_threads[0].exception, awsext.exception.RemoteCommandTimeoutError ) )
+
+    def test_dag_timeout_skips_pending_steps(self):
+        remote_dag_result = self.create_executor().run_dag( { self.addresses[0][0]:[ RemoteRunRequest( cmd_line='sleep 60', step_name='slow' ),
+                                                                                     RemoteRunRequest( cmd_line='echo next', step_name='next' ) ] },
+                                                            timeout_secs=1 )
+        self.assertEqual( 'failed', remote_dag_result.get_step( self.addresses[0][0], 'slow' ).status )
+        self.assertEqual( 'skipped', remote_dag_result.get_step( self.addresses[0][0], 'next' ).status )
+
+    def run_recording_commands(self, remote_run_request, deadline=None ):
+        commands = []
+        original_exec_command = localssh.LocalSshServer.exec_command
+        def exec_command( local_ssh_server, channel, command ):
+            commands.append( command )
+            original_exec_command( local_ssh_server, channel, command )
+        localssh.LocalSshServer.exec_command = exec_command
+        try:
+            remote_run_thread = RemoteRunThread( 0, self.addresses[0][0], key_filename=self.key_filename, port=self.port,
+                                                 remote_run_requests=[ remote_run_request ], deadline=deadline )
+            remote_run_thread.run()
+        finally:
+            localssh.LocalSshServer.exec_command = original_exec_command
+        self.assertEqual( 'first\nsecond\n', remote_run_thread.remote_run_responses[0].std_out )
+        return commands[0]
+
+    def test_process_id_only_requested_if_stoppable(self):
+        cmd_line = 'echo first; echo second'
+        self.assertEqual( cmd_line, self.run_recording_commands( RemoteRunRequest( cmd_line=cmd_line ) ) )
+        self.assertEqual( 'echo $$; ' + cmd_line, self.run_recording_commands( RemoteRunRequest( cmd_line=cmd_line, timeout_secs=30 ) ) )
+        self.assertEqual( 'echo $$; ' + cmd_line, self.run_recording_commands( RemoteRunRequest( cmd_line=cmd_line ), RemoteDeadline( timeout_secs=30 ) ) )
+        self.assertEqual( 'echo $$; ' + cmd_line, self.run_recording_commands( RemoteRunRequest( cmd_line=cmd_line ), 
+                                                                               self.create_executor().start_deadline( None ) ) )
+
+
+class TestDrainChannel(LocalSshTestCase):
+
+    num_servers = 1
+
+    def test_output_after_exit_status(self):
+        def exec_command( local_ssh_server, channel, command ):
+            # exit status first, output after it, then EOF
+            channel.send_exit_status( 7 )
+            time.sleep( 0.3 )
+            channel.sendall( 'late stdout\n' )
+            channel.sendall_stderr( 'late stderr\n' * 5000 )
+            time.sleep( 0.3 )
+            channel.sendall( 'last\n' )
+            channel.shutdown_write()
+        original_exec_command = localssh.LocalSshServer.exec_command
+        localssh.LocalSshServer.exec_command = exec_command
+        try:
+            ssh_connection = self.connect()
+            chan = ssh_connection.open_session()
+            chan.exec_command( 'ignored' )
+            std_out_capture = OutputCapture( STREAM_NAME_STD_OUT )
+            std_err_capture = OutputCapture( STREAM_NAME_STD_ERR, max_head_bytes=1048576 )
+            returncode = drain_channel( chan, std_out_capture, std_err_capture )
+            ssh_connection.close_session( chan )
+            ssh_connection.close()
+        finally:
+            localssh.LocalSshServer.exec_command = original_exec_command
+        self.assertEqual( 7, returncode )
+        self.assertEqual( 'late stdout\nlast\n', std_out_capture.get_text() )
+        self.assertEqual( 5000 * len('late stderr\n'), std_err_capture.num_bytes )
+
+    def test_std_in_while_output_fills_the_window(self):
+        ssh_connection = self.connect()
+        try:
+            returncode, std_out, std_err = transfer.run_command( ssh_connection, 'head -c 3000000 /dev/zero | tr "\\0" x >&2; wc -c', 
+                                                                 std_in_data='y' * 5000000 )
+        finally:
+            ssh_connection.close()
+        self.assertEqual( 0, returncode )
+        self.assertEqual( '5000000', std_out.strip() )
+        # STD_ERR is kept as head and tail
+        self.assertEqual( 'x' * 100, std_err[0:100] )
+
+    def test_expired(self):
+        ssh_connection = self.connect()
+        try:
+            expires_at = time.time() + 0.5
+            self.assertRaises( awsext.exception.RemoteCommandTimeoutError, transfer.run_command, ssh_connection, 'sleep 30', 
+                               is_expired=lambda: time.time() >= expires_at )
+        finally:
+            ssh_connection.close()
+
+
+class TestUploads(LocalSshTestCase):
+
+    num_servers = 1
+
+    def test_put_file(self):
+        from_file = self.write_local_file( 'one', 100000 )
+        ssh_connection = self.connect()
+        sftp_client = ssh_connection.acquire_sftp()
+        try:
+            self.assertEqual( 100000, transfer.put_file( sftp_client, from_file, 'one', mode=0o750 ) )
+        finally:
+            ssh_connection.release_sftp( sftp_client )
+            ssh_connection.close()
+        to_file = os.path.join( self.get_root_dir(), 'one' )
+        self.assertEqual( open( from_file, 'rb' ).read(), open( to_file, 'rb' ).read() )
+        self.assertEqual( 0o750, os.stat( to_file ).st_mode & 0o777 )
+
+    def test_run_request_uploads(self):
+        from_file = self.write_local_file( 'script_data', 5000 )
+        self.write_local_file( 'tree/a/1', 1000 )
+        self.write_local_file( 'tree/b/2', 2000 )
+        remote_fleet_summary = self.create_executor().run( { self.addresses[0][0]:[ 
+                    RemoteRunRequest( from_file=from_file, to_file='copy', cmd_line='wc -c < copy' ),
+                    RemoteRunRequest( tar_from_dir=os.path.join( self.temp_dir, 'tree' ), tar_to_dir='tar_tree', cmd_line='ls tar_tree' ) ] } )
+        self.assertEqual( 1, remote_fleet_summary.num_succeeded )
+        remote_run_responses = remote_fleet_summary.remote_run_threads[0].remote_run_responses
+        self.assertEqual( '5000', remote_run_responses[0].std_out.strip() )
+        self.assertEqual( 'a\nb\n', remote_run_responses[1].std_out )
+        self.assertEqual( open( os.path.join( self.temp_dir, 'tree/b/2' ), 'rb' ).read(), 
+                          open( os.path.join( self.get_root_dir(), 'tar_tree/b/2' ), 'rb' ).read() )
+
+    def test_sync_dir_to_remote(self):
+        local_dir = os.path.join( self.temp_dir, 'sync' )
+        for i in range(20): self.write_local_file( 'sync/d' + str(i % 3) + '/f' + str(i), 1000 + i )
+        ssh_connection = self.connect()
+        try:
+            remote_sync_result = transfer.sync_dir_to_remote( ssh_connection, local_dir, 'synced' )
+            self.assertEqual( 20, remote_sync_result.num_uploaded )
+            remote_sync_result = transfer.sync_dir_to_remote( ssh_connection, local_dir, 'synced' )
+            self.assertEqual( 20, remote_sync_result.num_unchanged )
+            with open( os.path.join( local_dir, 'd1/f1' ), 'ab' ) as fp: fp.write( 'changed' )
+            remote_sync_result = transfer.sync_dir_to_remote( ssh_connection, local_dir, 'synced', delta_min_bytes=1, delta_block_size=512 )
+            self.assertEqual( 1, remote_sync_result.num_delta )
+        finally:
+            ssh_connection.close()
+        self.assertEqual( open( os.path.join( local_dir, 'd1/f1' ), 'rb' ).read(), open( os.path.join( self.get_root_dir(), 'synced/d1/f1' ), 'rb' ).read() )
+
+    def test_block_sha256s_with_python3_only(self):
+        try:
+            python3_path = subprocess.check_output( [ 'python3', '-c', 'import sys; print(sys.executable)' ] ).strip()
+        except OSError:
+            self.skipTest( 'python3 not installed' )
+        bin_dir = os.path.join( self.temp_dir, 'bin' )
+        os.makedirs( bin_dir )
+        os.symlink( python3_path, os.path.join( bin_dir, 'python3' ) )
+        local_file = self.write_local_file( 'blocks', 1500 )
+        save_path = os.environ['PATH']
+        # the local SSH server runs commands with this process' environment, so python isn't on the remote PATH
+        os.environ['PATH'] = bin_dir
+        ssh_connection = self.connect()
+        try:
+            map_remote_block_sha256s = transfer.get_remote_block_sha256s( ssh_connection, [ local_file ], 512 )
+        finally:
+            os.environ['PATH'] = save_path
+            ssh_connection.close()
+        self.assertEqual( [ local_file ], list( map_remote_block_sha256s.keys() ) )
+        self.assertEqual( 3, len( map_remote_block_sha256s[local_file] ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of :mod:`tests.remotebench` with a small farm
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import unittest
+from tests.remotebench import RemoteBenchmark
+
+METRIC_NAMES = [ 'handshake_secs', 'hosts_per_sec', 'sftp_mb_per_sec', 'sftp_dir_mb_per_sec', 'tar_dir_mb_per_sec', 'memory_bytes_per_host' ]
+
+
+class TestRemoteBenchmark(unittest.TestCase):
+
+    def run_benchmark(self, drop_rate ):
+        return RemoteBenchmark( num_hosts=4, max_workers=4, num_commands_per_host=1, num_handshakes=2, transfer_mb=1, num_small_files=10,
+                                num_repeats=1, drop_rate=drop_rate ).run()
+
+    def test_run(self):
+        remote_benchmark_result = self.run_benchmark( 0.0 )
+        self.assertEqual( sorted(METRIC_NAMES), sorted(remote_benchmark_result.metrics.keys()) )
+        for metric_name in METRIC_NAMES: self.assertTrue( remote_benchmark_result.metrics[metric_name] != None, metric_name )
+
+    def test_run_with_dropped_connections(self):
+        # every measurement, including memory per host, retries dropped connections
+        remote_benchmark_result = self.run_benchmark( 0.3 )
+        self.assertEqual( sorted(METRIC_NAMES), sorted(remote_benchmark_result.metrics.keys()) )
+
+
+if __name__ == '__main__':
+    unittest.main()
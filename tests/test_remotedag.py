@@ -0,0 +1,71 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Unit tests of RemoteDagScheduler dependency resolution, no hosts are contacted
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import unittest
+from awsext.ec2.remote import RemoteRunRequest
+from awsext.ec2.remotedag import RemoteDagScheduler
+
+
+class TestRemoteDagResolve(unittest.TestCase):
+
+    def test_cycle_across_hosts(self):
+        remote_dag_scheduler = RemoteDagScheduler()
+        remote_dag_scheduler.add_host( '10.0.0.1', [ RemoteRunRequest( cmd_line='a', step_name='a', depends_on=[ '10.0.0.2:b' ] ) ] )
+        remote_dag_scheduler.add_host( '10.0.0.2', [ RemoteRunRequest( cmd_line='b', step_name='b', depends_on=[ '10.0.0.1:a' ] ) ] )
+        self.assertRaisesRegexp( ValueError, 'Dependency cycle', remote_dag_scheduler.resolve )
+
+    def test_cycle_with_implicit_host_order(self):
+        remote_dag_scheduler = RemoteDagScheduler()
+        remote_dag_scheduler.add_host( '10.0.0.1', [ RemoteRunRequest( cmd_line='a', step_name='a', depends_on=[ 'c' ] ),
+                                                     RemoteRunRequest( cmd_line='b', step_name='b' ),
+                                                     RemoteRunRequest( cmd_line='c', step_name='c' ) ] )
+        self.assertRaisesRegexp( ValueError, 'Dependency cycle', remote_dag_scheduler.resolve )
+
+    def test_no_cycle_without_implicit_host_order(self):
+        remote_dag_scheduler = RemoteDagScheduler( is_implicit_host_order=False )
+        remote_dag_scheduler.add_host( '10.0.0.1', [ RemoteRunRequest( cmd_line='a', step_name='a', depends_on=[ 'c' ] ),
+                                                     RemoteRunRequest( cmd_line='b', step_name='b' ),
+                                                     RemoteRunRequest( cmd_line='c', step_name='c' ) ] )
+        self.assertEqual( 3, len(remote_dag_scheduler.resolve()) )
+
+    def test_self_dependency(self):
+        remote_dag_scheduler = RemoteDagScheduler()
+        remote_dag_scheduler.add_host( '10.0.0.1', [ RemoteRunRequest( cmd_line='a', step_name='a', depends_on=[ 'a' ] ) ] )
+        self.assertRaisesRegexp( ValueError, 'depends on itself', remote_dag_scheduler.resolve )
+
+    def test_unknown_reference(self):
+        remote_dag_scheduler = RemoteDagScheduler()
+        remote_dag_scheduler.add_host( '10.0.0.1', [ RemoteRunRequest( cmd_line='a', step_name='a', depends_on=[ 'missing' ] ) ] )
+        self.assertRaisesRegexp( ValueError, 'Unknown step reference', remote_dag_scheduler.resolve )
+
+    def test_group_and_all_hosts_references(self):
+        remote_dag_scheduler = RemoteDagScheduler()
+        for ip_address in [ '10.0.0.1', '10.0.0.2' ]:
+            remote_dag_scheduler.add_host( ip_address, [ RemoteRunRequest( cmd_line='install', step_name='install' ) ], group_names=[ 'db' ] )
+        remote_dag_scheduler.add_host( '10.0.0.3', [ RemoteRunRequest( cmd_line='start', step_name='start', depends_on=[ 'db:install' ] ),
+                                                     RemoteRunRequest( cmd_line='check', step_name='check', depends_on=[ '*:install' ] ) ] )
+        map_steps = dict( [ ((remote_dag_step.ip_address, remote_dag_step.step_name), remote_dag_step) for remote_dag_step in remote_dag_scheduler.resolve() ] )
+        self.assertEqual( set( [ ('10.0.0.1', 'install'), ('10.0.0.2', 'install') ] ),
+                          set( [ (step.ip_address, step.step_name) for step in map_steps[ ('10.0.0.3', 'start') ].dependencies ] ) )
+        self.assertEqual( 3, len(map_steps[ ('10.0.0.3', 'check') ].dependencies) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Unit tests of the remote output capture helpers
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import unittest
+from awsext.ec2.remoteoutput import OutputCapture, ProcessIdFilter, STREAM_NAME_STD_OUT
+
+
+class TestProcessIdFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.std_out_capture = OutputCapture( STREAM_NAME_STD_OUT )
+        self.process_id_filter = ProcessIdFilter( self.std_out_capture )
+
+    def test_first_line_split_across_writes(self):
+        for data in [ '12', '34', '\nhello', ' world\n' ]: self.process_id_filter.write( data )
+        self.process_id_filter.close()
+        self.assertEqual( 1234, self.process_id_filter.process_id )
+        self.assertEqual( 'hello world\n', self.std_out_capture.get_text() )
+
+    def test_first_line_only(self):
+        self.process_id_filter.write( '42\n' )
+        self.process_id_filter.close()
+        self.assertEqual( 42, self.process_id_filter.process_id )
+        self.assertEqual( '', self.std_out_capture.get_text() )
+
+    def test_not_a_process_id(self):
+        self.process_id_filter.write( 'not a pid\nrest\n' )
+        self.assertEqual( None, self.process_id_filter.process_id )
+        self.assertEqual( 'rest\n', self.std_out_capture.get_text() )
+
+
+class TestOutputCapture(unittest.TestCase):
+
+    def test_head_and_tail(self):
+        lines = []
+        output_capture = OutputCapture( STREAM_NAME_STD_OUT, max_head_bytes=4, max_tail_bytes=4, line_callback=lambda stream_name, line: lines.append( line ) )
+        for data in [ 'abc', 'def\ngh', 'ijkl\n' ]: output_capture.write( data )
+        output_capture.close()
+        self.assertTrue( output_capture.is_truncated() )
+        text = output_capture.get_text()
+        self.assertTrue( text.startswith( 'abcd' ) )
+        self.assertTrue( text.endswith( 'jkl\n' ) )
+        self.assertEqual( 2, len(lines) )
+
+    def test_long_line_passed_in_pieces(self):
+        lines = []
+        output_capture = OutputCapture( STREAM_NAME_STD_OUT, line_callback=lambda stream_name, line: lines.append( line ), max_line_bytes=10 )
+        for i in range(5): output_capture.write( 'x' * 7 )
+        self.assertEqual( [ 'x' * 10 ] * 3, lines )
+        self.assertEqual( 5, len(output_capture.partial_line) )
+        output_capture.write( 'y' * 23 + '\nshort\nz' )
+        output_capture.close()
+        self.assertEqual( [ 'x' * 10 ] * 3 + [ 'xxxxxyyyyy', 'y' * 10, 'yyyyyyyy', 'short', 'z' ], lines )
+
+
+if __name__ == '__main__':
+    unittest.main()
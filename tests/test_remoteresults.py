@@ -0,0 +1,105 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of :mod:`awsext.ec2.remoteresults`, rows are added from RemoteRunThreads built as the executor leaves them
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import unittest
+import awsext.exception
+from awsext.ec2.remote import RemoteRunThread, RemoteRunRequest, RemoteRunResponse
+from awsext.ec2.remoteresults import RemoteResultTable, RETURNCODE_NONE, FLAG_TIMED_OUT, FLAG_EXCEPTION, FLAG_MAX_RETURNCODE_EXCEEDED
+
+
+def create_processed_thread( ip_address, remote_run_responses, exception=None, is_timed_out=False ):
+    remote_run_requests = [ RemoteRunRequest( cmd_line='step ' + str(i), step_name='step_' + str(i) ) for i in range(3) ]
+    remote_run_thread = RemoteRunThread( 0, ip_address, remote_run_requests=remote_run_requests )
+    remote_run_thread.remote_run_responses = remote_run_responses
+    remote_run_thread.exception = exception
+    remote_run_thread.is_timed_out = is_timed_out
+    return remote_run_thread
+
+
+def create_timeout_error( ip_address, cmd_line ):
+    return awsext.exception.RemoteCommandTimeoutError( 'Timed out: ' + ip_address, ip_address=ip_address, cmd_line=cmd_line )
+
+
+class TestRemoteResultTable(unittest.TestCase):
+
+    def setUp(self):
+        self.remote_result_table = RemoteResultTable()
+
+    def tearDown(self):
+        self.remote_result_table.close()
+
+    def test_responses(self):
+        self.remote_result_table.add_remote_run_thread( create_processed_thread( 'h1', [ RemoteRunResponse( returncode=0, cmd_line='step 0', std_out='out' ),
+                                                                                         RemoteRunResponse( returncode=3, cmd_line='step 1', std_err='err' ) ] ) )
+        self.assertEqual( 2, len(self.remote_result_table) )
+        self.assertFalse( self.remote_result_table.is_failed( 0 ) )
+        self.assertEqual( FLAG_MAX_RETURNCODE_EXCEEDED, self.remote_result_table.flags[1] )
+        self.assertEqual( 'step_1', self.remote_result_table.get_step_name( 1 ) )
+        remote_run_response = self.remote_result_table.get_response( 1 )
+        self.assertEqual( 3, remote_run_response.returncode )
+        self.assertEqual( 'err', remote_run_response.std_err )
+        self.assertEqual( 'out', self.remote_result_table.get_response( 0 ).std_out )
+
+    def test_command_timeout(self):
+        # the timed out command's response is appended before the timeout is raised
+        remote_run_responses = [ RemoteRunResponse( returncode=0, cmd_line='step 0' ),
+                                 RemoteRunResponse( returncode=None, cmd_line='step 1', is_timed_out=True ) ]
+        self.remote_result_table.add_remote_run_thread( create_processed_thread( 'h1', remote_run_responses, exception=create_timeout_error( 'h1', 'step 1' ),
+                                                                                 is_timed_out=True ) )
+        self.assertEqual( 2, len(self.remote_result_table) )
+        self.assertEqual( FLAG_TIMED_OUT | FLAG_EXCEPTION, self.remote_result_table.flags[1] )
+        self.assertEqual( RETURNCODE_NONE, self.remote_result_table.returncodes[1] )
+        self.assertEqual( [], self.remote_result_table.get_rows( 2 ) )
+
+    def test_transfer_timeout(self):
+        # a transfer timeout is raised before the request's response is created
+        self.remote_result_table.add_remote_run_thread( create_processed_thread( 'h1', [ RemoteRunResponse( returncode=0, cmd_line='step 0' ) ], 
+                                                                                 exception=create_timeout_error( 'h1', 'step 1' ), is_timed_out=True ) )
+        self.assertEqual( 2, len(self.remote_result_table) )
+        self.assertEqual( FLAG_TIMED_OUT | FLAG_EXCEPTION, self.remote_result_table.flags[1] )
+        self.assertEqual( 'step_1', self.remote_result_table.get_step_name( 1 ) )
+        self.assertEqual( [], self.remote_result_table.get_rows( 2 ) )
+
+    def test_connect_failed(self):
+        self.remote_result_table.add_remote_run_thread( create_processed_thread( 'h1', [], exception=IOError( 'refused' ) ) )
+        self.assertEqual( 1, len(self.remote_result_table) )
+        self.assertEqual( FLAG_EXCEPTION, self.remote_result_table.flags[0] )
+        self.assertEqual( 'refused', self.remote_result_table.get_response( 0 ).std_err )
+
+    def test_failed_hosts(self):
+        for i in range(5):
+            returncode = 0
+            if i % 2 == 1: returncode = 1
+            self.remote_result_table.add_remote_run_thread( create_processed_thread( 'h' + str(i), [ RemoteRunResponse( returncode=returncode, cmd_line='step 0' ),
+                                                                                                     RemoteRunResponse( returncode=returncode, cmd_line='step 1' ) ] ) )
+        self.assertEqual( [ 'h1', 'h3' ], self.remote_result_table.failed_hosts() )
+        self.assertEqual( [ 'h1', 'h3' ], self.remote_result_table.failed_hosts( 'step_1' ) )
+        self.assertEqual( [], self.remote_result_table.failed_hosts( 2 ) )
+
+    def test_percentile_duration(self):
+        self.remote_result_table.add_remote_run_thread( create_processed_thread( 'h1', [ RemoteRunResponse( cmd_line='step 0', duration_secs=float(i) ) 
+                                                                                         for i in range(1, 3) ] ) )
+        self.assertEqual( None, self.remote_result_table.percentile_duration( 50, step=2 ) )
+        self.assertEqual( 1.0, self.remote_result_table.percentile_duration( 50 ) )
+        self.assertEqual( 2.0, self.remote_result_table.percentile_duration( 99 ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
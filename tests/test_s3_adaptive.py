@@ -0,0 +1,159 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of :class:`awsext.s3.adaptive.S3TransferController` and of the retries of :func:`awsext.s3.transfer.call_with_retries`
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import time
+import threading
+import unittest
+import boto.exception
+from awsext.s3.adaptive import S3TransferController
+from awsext.s3.transfer import call_with_retries
+from awsext.s3.connection import download_key
+from tests.locals3 import LocalS3TestCase
+
+
+class TestS3TransferController(unittest.TestCase):
+
+    def test_bounds(self):
+        self.assertRaises( ValueError, S3TransferController, min_concurrency=0 )
+        self.assertRaises( ValueError, S3TransferController, min_concurrency=8, max_concurrency=4 )
+        self.assertEqual( 4, S3TransferController( min_concurrency=2, max_concurrency=4, initial_concurrency=16 ).concurrency )
+
+    def test_slowdown_halves_once_per_interval(self):
+        s3_transfer_controller = S3TransferController( initial_concurrency=16, interval_secs=60.0 )
+        s3_transfer_controller.record_error( IOError('SlowDown'), is_slowdown=True )
+        self.assertEqual( 8, s3_transfer_controller.concurrency )
+        # the other requests in flight get their SlowDowns too
+        s3_transfer_controller.record_error( IOError('SlowDown'), is_slowdown=True )
+        self.assertEqual( 8, s3_transfer_controller.concurrency )
+        self.assertEqual( 2, s3_transfer_controller.get_stats()['num_slowdowns'] )
+
+    def test_hill_climbing(self):
+        s3_transfer_controller = S3TransferController( initial_concurrency=8, interval_secs=0.01, min_part_size=1000000 )
+        time.sleep( 0.02 )
+        s3_transfer_controller.record_request( 100000, 0.01 )
+        self.assertEqual( 10, s3_transfer_controller.concurrency )
+        # throughput dropped, reverse
+        time.sleep( 0.02 )
+        s3_transfer_controller.record_request( 1000, 0.01 )
+        self.assertEqual( 8, s3_transfer_controller.concurrency )
+
+    def test_part_size(self):
+        s3_transfer_controller = S3TransferController( part_size=1000, min_part_size=1000, max_part_size=4000, interval_secs=0.01 )
+        for expected_part_size in [ 2000, 4000, 4000 ]:
+            time.sleep( 0.02 )
+            s3_transfer_controller.record_request( s3_transfer_controller.get_part_size(), 0.01 )
+            self.assertEqual( expected_part_size, s3_transfer_controller.get_part_size() )
+        time.sleep( 0.02 )
+        s3_transfer_controller.record_request( 4000, 20.0 )
+        self.assertEqual( 2000, s3_transfer_controller.get_part_size() )
+        # small objects don't change the part size
+        time.sleep( 0.02 )
+        s3_transfer_controller.record_request( 10, 0.01 )
+        self.assertEqual( 2000, s3_transfer_controller.get_part_size() )
+
+    def test_acquire_limits_concurrency(self):
+        s3_transfer_controller = S3TransferController( min_concurrency=1, initial_concurrency=2 )
+        lock = threading.Lock()
+        num_active = [ 0, 0 ]
+
+        def request():
+            s3_transfer_controller.acquire()
+            try:
+                with lock:
+                    num_active[0] += 1
+                    num_active[1] = max( num_active[0], num_active[1] )
+                time.sleep( 0.02 )
+                with lock: num_active[0] -= 1
+            finally:
+                s3_transfer_controller.release()
+
+        threads = [ threading.Thread( target=request ) for i in range(8) ]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual( 2, num_active[1] )
+        self.assertEqual( 0, s3_transfer_controller.get_stats()['num_active'] )
+
+
+class TestCallWithRetries(unittest.TestCase):
+
+    def test_slowdown_retried(self):
+        s3_transfer_controller = S3TransferController( interval_secs=60.0 )
+        results = [ boto.exception.BotoServerError( 503, 'Slow Down' ), 10 ]
+
+        def func():
+            result = results.pop( 0 )
+            if isinstance( result, Exception ): raise result
+            return result
+
+        self.assertEqual( 10, call_with_retries( func, 'key', s3_transfer_controller=s3_transfer_controller ) )
+        stats = s3_transfer_controller.get_stats()
+        self.assertEqual( (1, 1, 1, 10, 0), (stats['num_requests'], stats['num_retries'], stats['num_slowdowns'], stats['num_bytes'], stats['num_active']) )
+
+    def test_max_attempts(self):
+        s3_transfer_controller = S3TransferController()
+        num_calls = [ 0 ]
+
+        def func():
+            num_calls[0] += 1
+            raise IOError( 'failed' )
+
+        self.assertRaises( IOError, call_with_retries, func, 'key', max_attempts=3, s3_transfer_controller=s3_transfer_controller )
+        self.assertEqual( 3, num_calls[0] )
+        stats = s3_transfer_controller.get_stats()
+        self.assertEqual( (2, 0, 0), (stats['num_retries'], stats['num_slowdowns'], stats['num_active']) )
+
+
+class TestLocalS3Transfers(LocalS3TestCase):
+
+    def test_download_retried(self):
+        self.put_objects( { 'a':'a' * 100 } )
+        key = self.s3_connection.get_bucket( self.bucket_name, validate=False ).get_key( 'a' )
+        local_file = os.path.join( self.temp_dir, 'a' )
+        self.local_s3_server.fail_key_names.add( 'a' )
+
+        def func():
+            try:
+                return download_key( key, local_file )
+            finally:
+                self.local_s3_server.fail_key_names.discard( 'a' )
+
+        self.assertEqual( 100, call_with_retries( func, 'a' ) )
+        self.assertEqual( 'a' * 100, self.read_local_file( local_file ) )
+        self.assertEqual( 2, self.local_s3_server.counts['GET'] )
+
+    def test_sync(self):
+        map_objects = { 'small' + str(i):str(i) * 100 for i in range(10) }
+        map_objects['large'] = os.urandom( 50000 )
+        self.put_objects( map_objects )
+        s3_transfer_controller = S3TransferController( min_concurrency=1, max_concurrency=4, initial_concurrency=2, part_size=5000, 
+                                                       min_part_size=5000, interval_secs=0.01 )
+        local_path = os.path.join( self.temp_dir, 'local' )
+        s3_sync_result = self.s3_connection.sync_from_s3( bucket_name=self.bucket_name, local_path=local_path, ranged_min_bytes=20000, 
+                                                          s3_transfer_controller=s3_transfer_controller )
+        self.assertEqual( 11, s3_sync_result.num_files )
+        for key_name, data in map_objects.items(): self.assertEqual( data, self.read_local_file( os.path.join( local_path, key_name ) ) )
+        stats = s3_transfer_controller.get_stats()
+        self.assertEqual( (11, sum( len(data) for data in map_objects.values() ), 0), (stats['num_objects'], stats['num_bytes'], stats['num_active']) )
+        self.assertTrue( 1 <= stats['concurrency'] <= 4 )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of the shared local object cache against the local S3 server of :mod:`tests.locals3`
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import threading
+import unittest
+from awsext.s3.cache import S3ObjectCache, MATERIALIZE_COPY
+from tests.locals3 import LocalS3TestCase
+
+
+class TestS3ObjectCache(LocalS3TestCase):
+
+    def setUp(self):
+        LocalS3TestCase.setUp( self )
+        self.cache_path = os.path.join( self.temp_dir, 'cache' )
+        self.put_objects( { 'a':'a' * 1000, 'b':'b' * 2000, 'c':'c' * 3000 } )
+
+    def get_listed_key(self, key_name ):
+        return [ key for key in self.s3_connection.get_bucket( self.bucket_name, validate=False ).list( prefix=key_name ) if key.name == key_name ][0]
+
+    def test_miss_then_hit(self):
+        s3_object_cache = S3ObjectCache( self.cache_path )
+        key = self.get_listed_key( 'a' )
+        first_file = os.path.join( self.temp_dir, 'first' )
+        second_file = os.path.join( self.temp_dir, 'second' )
+        self.assertEqual( 1000, s3_object_cache.get( key, first_file ) )
+        self.assertEqual( None, s3_object_cache.get( key, second_file ) )
+        self.assertEqual( (1, 1), (s3_object_cache.num_misses, s3_object_cache.num_hits) )
+        self.assertEqual( 1, self.local_s3_server.counts['GET'] )
+        self.assertTrue( os.path.samefile( first_file, second_file ) )
+        # a new version is a new entry
+        self.put_objects( { 'a':'A' * 1000 } )
+        self.assertEqual( 1000, s3_object_cache.get( self.get_listed_key( 'a' ), second_file ) )
+        self.assertEqual( 'A' * 1000, self.read_local_file( second_file ) )
+        self.assertEqual( 'a' * 1000, self.read_local_file( first_file ) )
+
+    def test_copy(self):
+        s3_object_cache = S3ObjectCache( self.cache_path, materialize=MATERIALIZE_COPY )
+        local_file = os.path.join( self.temp_dir, 'copy' )
+        s3_object_cache.get( self.get_listed_key( 'a' ), local_file )
+        with open( local_file, 'ab' ) as fp: fp.write( 'changed' )
+        other_file = os.path.join( self.temp_dir, 'other' )
+        self.assertEqual( None, s3_object_cache.get( self.get_listed_key( 'a' ), other_file ) )
+        self.assertEqual( 'a' * 1000, self.read_local_file( other_file ) )
+
+    def test_concurrent_gets_download_once(self):
+        s3_object_cache = S3ObjectCache( self.cache_path )
+        key = self.get_listed_key( 'c' )
+        threads = [ threading.Thread( target=s3_object_cache.get, args=(key, os.path.join( self.temp_dir, 'c' + str(i) )) ) for i in range(8) ]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual( 1, self.local_s3_server.counts['GET'] )
+        self.assertEqual( (1, 7), (s3_object_cache.num_misses, s3_object_cache.num_hits) )
+        self.assertEqual( 'c' * 3000, self.read_local_file( os.path.join( self.temp_dir, 'c7' ) ) )
+
+    def test_evict_least_recently_used(self):
+        s3_object_cache = S3ObjectCache( self.cache_path )
+        entry_paths = []
+        for atime, key_name in enumerate( [ 'b', 'a', 'c' ] ):
+            key = self.get_listed_key( key_name )
+            s3_object_cache.get( key, os.path.join( self.temp_dir, key_name ) )
+            entry_path = s3_object_cache.get_entry_path( self.bucket_name, key_name, key.etag )
+            os.utime( entry_path, (1000 + atime, os.stat( entry_path ).st_mtime) )
+            entry_paths.append( entry_path )
+        self.assertEqual( 0, s3_object_cache.evict() )
+        self.assertEqual( 2, s3_object_cache.evict( max_bytes=3500 ) )
+        self.assertEqual( [ False, False, True ], [ os.path.exists( entry_path ) for entry_path in entry_paths ] )
+        # the materialized files are kept
+        self.assertEqual( 'b' * 2000, self.read_local_file( os.path.join( self.temp_dir, 'b' ) ) )
+
+    def test_shared_by_syncs(self):
+        s3_object_cache = S3ObjectCache( self.cache_path, max_bytes=1000000 )
+        for sync_name in [ 'first', 'second' ]:
+            local_path = os.path.join( self.temp_dir, sync_name )
+            s3_sync_result = self.s3_connection.sync_from_s3( bucket_name=self.bucket_name, local_path=local_path, s3_object_cache=s3_object_cache )
+            self.assertEqual( 'b' * 2000, self.read_local_file( os.path.join( local_path, 'b' ) ) )
+        self.assertEqual( (0, 3), (s3_sync_result.num_files, s3_sync_result.num_cached) )
+        self.assertEqual( 3, self.local_s3_server.counts['GET'] )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of the journal of :class:`awsext.s3.checkpoint.S3SyncCheckpoint` and of resuming syncs against the local S3 server of :mod:`tests.locals3`
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import json
+import unittest
+import awsext.exception
+from boto.s3.key import Key
+from awsext.s3.checkpoint import S3SyncCheckpoint
+from tests.locals3 import LocalS3TestCase
+
+
+def make_key( key_name, etag, size ):
+    """Key as a listing returns it """
+    key = Key( name=key_name )
+    key.etag = '"' + etag + '"'
+    key.size = size
+    return key
+
+
+class TestS3SyncCheckpoint(LocalS3TestCase):
+
+    def setUp(self):
+        LocalS3TestCase.setUp( self )
+        self.checkpoint_path = os.path.join( self.temp_dir, 'checkpoint.json' )
+        self.local_file = os.path.join( self.temp_dir, 'large' )
+        with open( self.local_file, 'wb' ) as fp: fp.truncate( 300 )
+
+    def read_records(self):
+        with open( self.checkpoint_path ) as fp: return [ json.loads( line ) for line in fp ]
+
+    def test_replay_and_compact(self):
+        s3_sync_checkpoint = S3SyncCheckpoint( self.checkpoint_path )
+        self.assertFalse( s3_sync_checkpoint.is_resumed )
+        key = make_key( 'large', 'etag1', 300 )
+        for start in [ 100, 0, 200 ]: s3_sync_checkpoint.put_range( key, start, start + 99 )
+        s3_sync_checkpoint.put_completed( make_key( 'small', 'etag2', 0 ) )
+        s3_sync_checkpoint.close()
+        with open( self.checkpoint_path, 'a' ) as fp: fp.write( '{"k": "torn' )
+        s3_sync_checkpoint = S3SyncCheckpoint( self.checkpoint_path )
+        self.assertTrue( s3_sync_checkpoint.is_resumed )
+        self.assertEqual( [ (0, 299) ], s3_sync_checkpoint.get_completed_ranges( key, self.local_file ) )
+        open( os.path.join( self.temp_dir, 'small' ), 'w' ).close()
+        self.assertTrue( s3_sync_checkpoint.is_completed( make_key( 'small', 'etag2', 0 ), os.path.join( self.temp_dir, 'small' ) ) )
+        self.assertFalse( s3_sync_checkpoint.is_completed( make_key( 'small', 'etag3', 0 ), os.path.join( self.temp_dir, 'small' ) ) )
+        # compacted: one record per completed object, merged ranges, the torn line dropped
+        self.assertEqual( 2, len( self.read_records() ) )
+        s3_sync_checkpoint.close( is_completed=True )
+        self.assertFalse( os.path.exists( self.checkpoint_path ) )
+
+    def test_changed_object(self):
+        s3_sync_checkpoint = S3SyncCheckpoint( self.checkpoint_path )
+        s3_sync_checkpoint.put_range( make_key( 'large', 'etag1', 300 ), 0, 99 )
+        s3_sync_checkpoint.put_range( make_key( 'large', 'etag2', 300 ), 100, 199 )
+        s3_sync_checkpoint.close()
+        s3_sync_checkpoint = S3SyncCheckpoint( self.checkpoint_path )
+        self.assertEqual( [], s3_sync_checkpoint.get_completed_ranges( make_key( 'large', 'etag1', 300 ), self.local_file ) )
+        self.assertEqual( [ (100, 199) ], s3_sync_checkpoint.get_completed_ranges( make_key( 'large', 'etag2', 300 ), self.local_file ) )
+        # the preallocated file must have the size of the key
+        self.assertEqual( [], s3_sync_checkpoint.get_completed_ranges( make_key( 'large', 'etag2', 300 ), self.local_file + '.missing' ) )
+        s3_sync_checkpoint.close()
+
+
+class TestResumeSync(LocalS3TestCase):
+
+    def setUp(self):
+        LocalS3TestCase.setUp( self )
+        self.checkpoint_path = os.path.join( self.temp_dir, 'checkpoint.json' )
+        self.local_path = os.path.join( self.temp_dir, 'local' )
+
+    def sync_from_s3(self, **kwargs ):
+        return self.s3_connection.sync_from_s3( bucket_name=self.bucket_name, local_path=self.local_path, checkpoint_path=self.checkpoint_path, **kwargs )
+
+    def test_resume_after_failure(self):
+        self.put_objects( { 'a':'a' * 100, 'b':'b' * 100, 'c':'c' * 100 } )
+        self.local_s3_server.fail_key_names.add( 'b' )
+        try:
+            self.sync_from_s3()
+            self.fail( 'S3SyncError expected' )
+        except awsext.exception.S3SyncError as e:
+            self.assertEqual( [ 'b' ], [ key_name for key_name, exception in e.errors ] )
+        self.assertTrue( os.path.exists( self.checkpoint_path ) )
+        self.local_s3_server.fail_key_names.clear()
+        num_gets = self.local_s3_server.counts['GET']
+        s3_sync_result = self.sync_from_s3()
+        self.assertEqual( (2, 1), (s3_sync_result.num_resumed, s3_sync_result.num_files) )
+        self.assertEqual( num_gets + 1, self.local_s3_server.counts['GET'] )
+        for key_name in [ 'a', 'b', 'c' ]: self.assertEqual( key_name * 100, self.read_local_file( os.path.join( self.local_path, key_name ) ) )
+        self.assertFalse( os.path.exists( self.checkpoint_path ) )
+
+    def test_resume_ranges(self):
+        data = os.urandom( 40000 )
+        self.put_objects( { 'large':data } )
+        etag = self.local_s3_server.get_object( self.bucket_name, 'large' ).etag
+        # an interrupted sync wrote the first two ranges into the preallocated file
+        os.makedirs( self.local_path )
+        with open( os.path.join( self.local_path, 'large' ), 'wb' ) as fp:
+            fp.write( data[0:20000] )
+            fp.truncate( 40000 )
+        s3_sync_checkpoint = S3SyncCheckpoint( self.checkpoint_path )
+        s3_sync_checkpoint.put_range( make_key( 'large', etag, 40000 ), 0, 9999 )
+        s3_sync_checkpoint.put_range( make_key( 'large', etag, 40000 ), 10000, 19999 )
+        s3_sync_checkpoint.close()
+        self.sync_from_s3( ranged_min_bytes=20000, part_size=10000 )
+        self.assertEqual( 2, self.local_s3_server.counts['RANGE'] )
+        self.assertEqual( data, self.read_local_file( os.path.join( self.local_path, 'large' ) ) )
+        self.assertFalse( os.path.exists( self.checkpoint_path ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of the per thread connections of :class:`awsext.s3.transfer.S3ThreadConnections` against the local S3 server of :mod:`tests.locals3`
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import threading
+import unittest
+from awsext.s3.transfer import S3ThreadConnections
+from tests.locals3 import LocalS3TestCase
+
+
+class TestS3ThreadConnections(LocalS3TestCase):
+
+    def setUp(self):
+        LocalS3TestCase.setUp( self )
+        self.put_objects( { 'a':'a' * 100 } )
+        self.s3_thread_connections = S3ThreadConnections( self.s3_connection )
+
+    def tearDown(self):
+        self.s3_thread_connections.close()
+        LocalS3TestCase.tearDown( self )
+
+    def test_clone(self):
+        s3_connection = self.s3_connection.clone()
+        self.assertFalse( s3_connection is self.s3_connection )
+        self.assertTrue( s3_connection.provider is self.s3_connection.provider )
+        self.assertEqual( (self.s3_connection.host, self.s3_connection.port), (s3_connection.host, s3_connection.port) )
+        s3_connection.close()
+
+    def test_cached_per_thread(self):
+        bucket = self.s3_thread_connections.get_bucket( self.bucket_name )
+        self.assertTrue( bucket is self.s3_thread_connections.get_bucket( self.bucket_name ) )
+        self.assertEqual( [ bucket.connection ], self.s3_thread_connections.thread_s3_connections )
+        self.assertFalse( bucket.connection is self.s3_connection )
+        self.assertTrue( bucket.connection.provider is self.s3_connection.provider )
+
+    def test_connection_per_thread(self):
+        thread_buckets = []
+
+        def get_bucket():
+            bucket = self.s3_thread_connections.get_bucket( self.bucket_name )
+            self.assertEqual( 'a' * 100, bucket.get_key( 'a' ).get_contents_as_string() )
+            thread_buckets.append( bucket )
+
+        threads = [ threading.Thread( target=get_bucket ) for i in range(4) ]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        s3_connection_ids = set( [ id(bucket.connection) for bucket in thread_buckets ] )
+        self.assertEqual( 4, len(s3_connection_ids) )
+        self.assertEqual( s3_connection_ids, set( [ id(s3_connection) for s3_connection in self.s3_thread_connections.thread_s3_connections ] ) )
+        self.s3_thread_connections.close()
+        self.assertEqual( [], self.s3_thread_connections.thread_s3_connections )
+
+    def test_get_key(self):
+        key = [ key for key in self.s3_connection.get_bucket( self.bucket_name, validate=False ).list() ][0]
+        num_heads = self.local_s3_server.counts['HEAD']
+        thread_key = self.s3_thread_connections.get_key( key )
+        self.assertEqual( (key.name, key.size, key.etag, key.last_modified), (thread_key.name, thread_key.size, thread_key.etag, thread_key.last_modified) )
+        self.assertTrue( thread_key.bucket.connection is self.s3_thread_connections.thread_s3_connections[0] )
+        self.assertEqual( num_heads, self.local_s3_server.counts['HEAD'] )
+        self.assertEqual( 'a' * 100, thread_key.get_contents_as_string() )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of downloads as parallel byte ranges against the local S3 server of :mod:`tests.locals3`
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import unittest
+from tests.locals3 import LocalS3TestCase
+
+
+class TestDownloadFile(LocalS3TestCase):
+
+    def setUp(self):
+        LocalS3TestCase.setUp( self )
+        self.data = os.urandom( 10000 )
+        self.local_file = os.path.join( self.temp_dir, 'data' )
+
+    def download(self, key_name, **kwargs ):
+        return self.s3_connection.download_file( self.bucket_name, key_name, self.local_file, part_size=1000, ranged_min_bytes=4000, **kwargs )
+
+    def test_small(self):
+        self.put_objects( { 'small':self.data[0:3000] } )
+        self.assertEqual( 3000, self.download( 'small' ) )
+        self.assertEqual( self.data[0:3000], self.read_local_file( self.local_file ) )
+        self.assertEqual( 1, self.local_s3_server.counts['GET'] )
+
+    def test_ranged(self):
+        self.put_objects( { 'large':self.data } )
+        self.assertEqual( 10000, self.download( 'large' ) )
+        self.assertEqual( self.data, self.read_local_file( self.local_file ) )
+        # the first GET only finds the size, then a range per part
+        self.assertEqual( 11, self.local_s3_server.counts['RANGE'] )
+
+    def test_ranged_multipart_etag(self):
+        # ranges follow the upload's parts, not part_size
+        self.local_s3_server.put_object( self.bucket_name, 'large', self.data, part_sizes=[ 3000, 3000, 3000, 1000 ] )
+        self.assertEqual( 10000, self.download( 'large' ) )
+        self.assertEqual( self.data, self.read_local_file( self.local_file ) )
+        self.assertEqual( 5, self.local_s3_server.counts['RANGE'] )
+
+    def test_etag_mismatch(self):
+        self.put_objects( { 'large':self.data } )
+        self.local_s3_server.get_object( self.bucket_name, 'large' ).etag = '0' * 32
+        self.assertRaises( IOError, self.download, 'large' )
+        self.assertFalse( os.path.exists( self.local_file ) )
+        # i.e. SSE-KMS, the ETag isn't the MD5
+        self.assertEqual( 10000, self.download( 'large', is_verify=False ) )
+        self.assertEqual( self.data, self.read_local_file( self.local_file ) )
+
+    def test_empty(self):
+        self.put_objects( { 'empty':'' } )
+        self.assertEqual( 0, self.download( 'empty' ) )
+        self.assertEqual( '', self.read_local_file( self.local_file ) )
+
+    def test_not_found(self):
+        self.assertRaises( IOError, self.download, 'missing' )
+
+
+class TestSyncRanged(LocalS3TestCase):
+
+    def test_sync_from_s3(self):
+        map_objects = dict( [ ('p/' + str(i), os.urandom( 1000 * i )) for i in range(1, 8) ] )
+        self.put_objects( map_objects )
+        local_path = os.path.join( self.temp_dir, 'sync' )
+        s3_sync_result = self.s3_connection.sync_from_s3( bucket_name=self.bucket_name, prefix='p', local_path=local_path, max_workers=3,
+                                                          ranged_min_bytes=4000, part_size=1024, max_part_workers=2 )
+        self.assertEqual( 7, s3_sync_result.num_files )
+        self.assertEqual( sum( [ len(data) for data in map_objects.values() ] ), s3_sync_result.num_bytes )
+        for key_name, data in map_objects.items(): self.assertEqual( data, self.read_local_file( os.path.join( local_path, key_name ) ) )
+        self.assertTrue( self.local_s3_server.counts['RANGE'] > 0 )
+
+
+if __name__ == '__main__':
+    unittest.main()
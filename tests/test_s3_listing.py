@@ -0,0 +1,93 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of the parallel prefix-partitioned listing against the local S3 server of :mod:`tests.locals3`
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import unittest
+from awsext.s3 import listing
+from awsext.s3.listing import S3ListPartition, discover_partitions, iter_keys_parallel
+from tests.locals3 import LocalS3TestCase
+
+
+class TestParallelListing(LocalS3TestCase):
+
+    def setUp(self):
+        LocalS3TestCase.setUp( self )
+        self.key_names = []
+        for i in range(4):
+            for j in range(5):
+                for k in range(3): self.key_names.append( 'p/d' + str(i) + '/e' + str(j) + '/f' + str(k) )
+            self.key_names.append( 'p/d' + str(i) + '/top' )
+        self.key_names.extend( [ 'p/root', 'other/x' ] )
+        self.put_objects( dict( [ (key_name, key_name) for key_name in self.key_names ] ) )
+        self.bucket = self.s3_connection.get_bucket( self.bucket_name, validate=False )
+        self.prefix_key_names = sorted( [ key_name for key_name in self.key_names if key_name.startswith( 'p/' ) ] )
+        self.save_keys_per_chunk = listing.KEYS_PER_CHUNK
+        self.save_max_discovery_keys = listing.MAX_DISCOVERY_KEYS
+        listing.KEYS_PER_CHUNK = 2
+
+    def tearDown(self):
+        listing.KEYS_PER_CHUNK = self.save_keys_per_chunk
+        listing.MAX_DISCOVERY_KEYS = self.save_max_discovery_keys
+        LocalS3TestCase.tearDown( self )
+
+    def test_discover_partitions(self):
+        items = discover_partitions( self.bucket, prefix='p/', max_workers=2, min_partitions=6 )
+        # p/ is expanded into its key and 4 sub-prefixes, each expanded into its key and 5 sub-prefix partitions
+        self.assertEqual( 'p/root', items[-1].name )
+        s3_list_partitions = [ item for item in items if isinstance( item, S3ListPartition ) ]
+        self.assertEqual( 20, len(s3_list_partitions) )
+        self.assertEqual( 'p/d0/e0/', s3_list_partitions[0].prefix )
+
+    def test_unordered(self):
+        key_names = [ key.name for key in iter_keys_parallel( self.bucket, prefix='p/', max_workers=3 ) ]
+        self.assertEqual( self.prefix_key_names, sorted( key_names ) )
+
+    def test_ordered(self):
+        self.assertEqual( self.prefix_key_names, [ key.name for key in iter_keys_parallel( self.bucket, prefix='p/', max_workers=3, is_ordered=True ) ] )
+        self.assertEqual( self.prefix_key_names, [ key.name for key in self.s3_connection.list_keys( self.bucket_name, prefix='p/', max_workers=3, is_ordered=True ) ] )
+
+    def test_split_markers(self):
+        key_names = [ key.name for key in iter_keys_parallel( self.bucket, prefix='p/', split_markers=[ 'p/d1/top', 'p/d3' ], is_ordered=True ) ]
+        self.assertEqual( self.prefix_key_names, key_names )
+
+    def test_flat_prefix_split_by_key_range(self):
+        listing.MAX_DISCOVERY_KEYS = 3
+        self.put_objects( dict( [ ('flat/' + chr(ord('a') + i) + str(i), 'x') for i in range(20) ] ) )
+        items = discover_partitions( self.bucket, prefix='flat/', max_workers=2, split_chars='aeiou' )
+        self.assertEqual( [ (None, 'flat/a'), ('flat/a', 'flat/e'), ('flat/e', 'flat/i'), ('flat/i', 'flat/o'), ('flat/o', 'flat/u'), ('flat/u', None) ],
+                          [ (item.start_after, item.end_at) for item in items ] )
+        key_names = [ key.name for key in iter_keys_parallel( self.bucket, prefix='flat/', max_workers=2, split_chars='aeiou', is_ordered=True ) ]
+        self.assertEqual( sorted( [ 'flat/' + chr(ord('a') + i) + str(i) for i in range(20) ] ), key_names )
+
+    def test_early_stop(self):
+        keys = iter_keys_parallel( self.bucket, prefix='p/', max_workers=3 )
+        self.assertEqual( 5, len( [ keys.next() for i in range(5) ] ) )
+        # the listing threads are stopped
+        keys.close()
+
+    def test_sync_from_s3(self):
+        local_path = os.path.join( self.temp_dir, 'sync' )
+        s3_sync_result = self.s3_connection.sync_from_s3( bucket_name=self.bucket_name, prefix='p', local_path=local_path, max_list_workers=3 )
+        self.assertEqual( len(self.prefix_key_names), s3_sync_result.num_files )
+        self.assertEqual( 'p/d2/e4/f1', self.read_local_file( os.path.join( local_path, 'p/d2/e4/f1' ) ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
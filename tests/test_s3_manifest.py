@@ -0,0 +1,108 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of the manifest index and incremental sync_from_s3 against the local S3 server of :mod:`tests.locals3`
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import unittest
+from awsext.s3.manifest import S3SyncManifest
+from tests.locals3 import LocalS3TestCase
+
+
+class TestS3SyncManifest(LocalS3TestCase):
+
+    def create_listed_key(self, key_name, data ):
+        self.local_s3_server.put_object( self.bucket_name, key_name, data )
+        return [ key for key in self.s3_connection.get_bucket( self.bucket_name ).list( prefix=key_name ) if key.name == key_name ][0]
+
+    def test_put_and_reload(self):
+        manifest_path = os.path.join( self.temp_dir, 'manifest.json' )
+        local_file = os.path.join( self.temp_dir, 'a' )
+        with open( local_file, 'wb' ) as fp: fp.write( 'aaa' )
+        key = self.create_listed_key( 'a', 'aaa' )
+        s3_sync_manifest = S3SyncManifest( manifest_path )
+        self.assertFalse( s3_sync_manifest.is_unchanged( key, local_file ) )
+        s3_sync_manifest.put( key, local_file )
+        s3_sync_manifest.save()
+        s3_sync_manifest = S3SyncManifest( manifest_path )
+        self.assertTrue( s3_sync_manifest.is_unchanged( key, local_file ) )
+        self.assertEqual( [ 'a' ], s3_sync_manifest.get_key_names() )
+        # the local file was modified after the download
+        with open( local_file, 'wb' ) as fp: fp.write( 'aab' )
+        os.utime( local_file, (0, 1000) )
+        self.assertFalse( s3_sync_manifest.is_unchanged( key, local_file ) )
+        s3_sync_manifest.remove( 'a' )
+        s3_sync_manifest.save()
+        self.assertEqual( [], S3SyncManifest( manifest_path ).get_key_names() )
+
+    def test_key_changed(self):
+        local_file = os.path.join( self.temp_dir, 'a' )
+        with open( local_file, 'wb' ) as fp: fp.write( 'aaa' )
+        s3_sync_manifest = S3SyncManifest( os.path.join( self.temp_dir, 'manifest.json' ) )
+        s3_sync_manifest.put( self.create_listed_key( 'a', 'aaa' ), local_file )
+        self.assertFalse( s3_sync_manifest.is_unchanged( self.create_listed_key( 'a', 'bbb' ), local_file ) )
+
+    def test_invalid_file_ignored(self):
+        manifest_path = os.path.join( self.temp_dir, 'manifest.json' )
+        with open( manifest_path, 'w' ) as fp: fp.write( '{ torn' )
+        self.assertEqual( [], S3SyncManifest( manifest_path ).get_key_names() )
+
+
+class TestIncrementalSync(LocalS3TestCase):
+
+    def setUp(self):
+        LocalS3TestCase.setUp( self )
+        self.local_path = os.path.join( self.temp_dir, 'sync' )
+        self.manifest_path = os.path.join( self.temp_dir, 'manifest.json' )
+        self.put_objects( { 'p/a':'a' * 100, 'p/d/b':'b' * 200, 'p/d/e/c':'c' * 300 } )
+
+    def sync(self):
+        return self.s3_connection.sync_from_s3( bucket_name=self.bucket_name, prefix='p', local_path=self.local_path, max_workers=4,
+                                                manifest_path=self.manifest_path, is_delete_orphans=True )
+
+    def test_only_changed_keys_downloaded(self):
+        s3_sync_result = self.sync()
+        self.assertEqual( 3, s3_sync_result.num_files )
+        self.assertEqual( 'c' * 300, self.read_local_file( os.path.join( self.local_path, 'p/d/e/c' ) ) )
+        num_gets = self.local_s3_server.counts['GET']
+        s3_sync_result = self.sync()
+        self.assertEqual( (0, 3), (s3_sync_result.num_files, s3_sync_result.num_unchanged) )
+        self.assertEqual( num_gets, self.local_s3_server.counts['GET'] )
+        self.put_objects( { 'p/d/b':'B' * 200 } )
+        s3_sync_result = self.sync()
+        self.assertEqual( (1, 2), (s3_sync_result.num_files, s3_sync_result.num_unchanged) )
+        self.assertEqual( 'B' * 200, self.read_local_file( os.path.join( self.local_path, 'p/d/b' ) ) )
+
+    def test_deleted_key(self):
+        self.sync()
+        with self.local_s3_server.lock: del self.local_s3_server.map_buckets[self.bucket_name]['p/d/b']
+        s3_sync_result = self.sync()
+        self.assertEqual( 1, s3_sync_result.num_deleted )
+        self.assertFalse( os.path.exists( os.path.join( self.local_path, 'p/d/b' ) ) )
+        self.assertEqual( [ 'p/a', 'p/d/e/c' ], sorted( S3SyncManifest( self.manifest_path ).get_key_names() ) )
+
+    def test_local_file_removed(self):
+        self.sync()
+        os.remove( os.path.join( self.local_path, 'p/a' ) )
+        s3_sync_result = self.sync()
+        self.assertEqual( (1, 2), (s3_sync_result.num_files, s3_sync_result.num_unchanged) )
+        self.assertTrue( os.path.exists( os.path.join( self.local_path, 'p/a' ) ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
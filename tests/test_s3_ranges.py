@@ -0,0 +1,106 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Unit tests of the S3 range, listing partition and ETag helpers
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+import unittest
+from awsext.s3.checkpoint import merge_ranges, is_range_covered
+from awsext.s3.listing import split_by_key_range
+from awsext.s3.transfer import get_local_etag, get_etag_num_parts
+
+
+class TestMergeRanges(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual( [], merge_ranges( [] ) )
+
+    def test_overlapping_and_adjacent(self):
+        self.assertEqual( [ (0, 199), (300, 399) ], merge_ranges( [ (100, 199), (300, 399), (0, 99), (50, 120) ] ) )
+
+    def test_contained(self):
+        self.assertEqual( [ (0, 999) ], merge_ranges( [ (0, 999), (10, 20), (500, 999) ] ) )
+
+    def test_gap(self):
+        self.assertEqual( [ (0, 9), (11, 20) ], merge_ranges( [ (11, 20), (0, 9) ] ) )
+
+    def test_is_range_covered(self):
+        merged_ranges = merge_ranges( [ (0, 99), (100, 199), (300, 399) ] )
+        self.assertTrue( is_range_covered( 50, 150, merged_ranges ) )
+        self.assertFalse( is_range_covered( 150, 350, merged_ranges ) )
+        self.assertFalse( is_range_covered( 400, 400, merged_ranges ) )
+
+
+class TestSplitByKeyRange(unittest.TestCase):
+
+    def test_split_chars(self):
+        partitions = split_by_key_range( 'logs/', split_chars='ba' )
+        self.assertEqual( [ (None, 'logs/a'), ('logs/a', 'logs/b'), ('logs/b', None) ],
+                          [ (partition.start_after, partition.end_at) for partition in partitions ] )
+        self.assertTrue( all( [ partition.prefix == 'logs/' for partition in partitions ] ) )
+
+    def test_split_markers(self):
+        partitions = split_by_key_range( 'p/', split_markers=[ 'p/k1000', 'p/k2000' ] )
+        self.assertEqual( [ (None, 'p/k1000'), ('p/k1000', 'p/k2000'), ('p/k2000', None) ],
+                          [ (partition.start_after, partition.end_at) for partition in partitions ] )
+
+    def test_no_markers(self):
+        partitions = split_by_key_range( 'p/', split_markers=[] )
+        self.assertEqual( [ (None, None) ], [ (partition.start_after, partition.end_at) for partition in partitions ] )
+
+
+class TestGetLocalEtag(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.data = os.urandom( 2500 )
+        self.local_file = os.path.join( self.temp_dir, 'data' )
+        with open( self.local_file, 'wb' ) as fp: fp.write( self.data )
+
+    def tearDown(self):
+        shutil.rmtree( self.temp_dir )
+
+    def test_single_part(self):
+        self.assertEqual( hashlib.md5( self.data ).hexdigest(), get_local_etag( self.local_file ) )
+
+    def test_multipart(self):
+        part_md5s = [ hashlib.md5( self.data[start:start + 1000] ).digest() for start in range( 0, 2500, 1000 ) ]
+        etag = get_local_etag( self.local_file, part_size=1000 )
+        self.assertEqual( hashlib.md5( ''.join( part_md5s ) ).hexdigest() + '-3', etag )
+        self.assertEqual( 3, get_etag_num_parts( '"' + etag + '"' ) )
+
+    def test_exact_parts(self):
+        etag = get_local_etag( self.local_file, part_size=1250 )
+        self.assertTrue( etag.endswith( '-2' ) )
+
+    def test_num_parts_mismatch(self):
+        self.assertEqual( None, get_local_etag( self.local_file, part_size=1000, num_parts=2 ) )
+        self.assertNotEqual( None, get_local_etag( self.local_file, part_size=1000, num_parts=3 ) )
+
+    def test_empty_file(self):
+        empty_file = os.path.join( self.temp_dir, 'empty' )
+        open( empty_file, 'wb' ).close()
+        self.assertEqual( hashlib.md5( hashlib.md5( '' ).digest() ).hexdigest() + '-1', get_local_etag( empty_file, part_size=1000 ) )
+        self.assertEqual( None, get_etag_num_parts( hashlib.md5( '' ).hexdigest() ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
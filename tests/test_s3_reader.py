@@ -0,0 +1,97 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of the seekable S3 reader against the local S3 server of :mod:`tests.locals3`
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import gzip
+import StringIO
+import unittest
+import boto.exception
+from tests.locals3 import LocalS3TestCase
+
+
+class TestS3SeekableReader(LocalS3TestCase):
+
+    def setUp(self):
+        LocalS3TestCase.setUp( self )
+        self.data = os.urandom( 10000 )
+        self.put_objects( { 'data':self.data } )
+
+    def open_reader(self, **kwargs ):
+        return self.s3_connection.open_key_reader( self.bucket_name, 'data', block_size=1024, max_cached_blocks=4, **kwargs )
+
+    def test_sequential(self):
+        reader = self.open_reader()
+        try:
+            self.assertEqual( self.data, reader.read() )
+        finally:
+            reader.close()
+        self.assertEqual( 10, self.local_s3_server.counts['RANGE'] )
+
+    def test_seek(self):
+        reader = self.open_reader( read_ahead_blocks=0, buffer_size=None )
+        try:
+            reader.seek( 5000 )
+            self.assertEqual( self.data[5000:5100], reader.read( 100 ) )
+            self.assertEqual( 5100, reader.tell() )
+            reader.seek( -100, os.SEEK_END )
+            self.assertEqual( self.data[-100:], reader.read( 1000 ) )
+            self.assertEqual( '', reader.read( 10 ) )
+            reader.seek( -10, os.SEEK_CUR )
+            self.assertEqual( self.data[-10:], reader.read() )
+            # block 4 is still cached, only blocks 4 and 9 were fetched
+            reader.seek( 4100 )
+            self.assertEqual( self.data[4100:4200], reader.read( 100 ) )
+            self.assertEqual( 2, reader.num_fetches )
+            self.assertRaises( IOError, reader.seek, -1 )
+        finally:
+            reader.close()
+
+    def test_lines_of_gzip(self):
+        lines = [ 'line ' + str(i) + '\n' for i in range(2000) ]
+        gzip_data = StringIO.StringIO()
+        with gzip.GzipFile( fileobj=gzip_data, mode='wb' ) as gzip_file: gzip_file.write( ''.join( lines ) )
+        self.put_objects( { 'data':gzip_data.getvalue() } )
+        reader = self.open_reader()
+        try:
+            self.assertEqual( lines, list( gzip.GzipFile( fileobj=reader ) ) )
+        finally:
+            reader.close()
+
+    def test_replaced_object(self):
+        reader = self.open_reader( read_ahead_blocks=0 )
+        try:
+            self.assertEqual( self.data[0:10], reader.read( 10 ) )
+            self.put_objects( { 'data':os.urandom( 10000 ) } )
+            reader.seek( 8000 )
+            self.assertRaises( boto.exception.S3ResponseError, reader.read, 10 )
+        finally:
+            reader.close()
+
+    def test_not_found(self):
+        self.assertRaises( IOError, self.s3_connection.open_key_reader, self.bucket_name, 'missing' )
+
+    def test_closed(self):
+        reader = self.open_reader()
+        reader.close()
+        self.assertRaises( ValueError, reader.read, 10 )
+
+
+if __name__ == '__main__':
+    unittest.main()
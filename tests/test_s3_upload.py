@@ -0,0 +1,101 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of sync_to_s3 and multipart uploads against the local S3 server of :mod:`tests.locals3`
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import unittest
+from awsext.s3.connection import is_etag_match
+from awsext.s3.transfer import upload_file_multipart, iter_local_files
+from tests.locals3 import LocalS3TestCase
+
+
+class TestSyncToS3(LocalS3TestCase):
+
+    def setUp(self):
+        LocalS3TestCase.setUp( self )
+        self.local_path = os.path.join( self.temp_dir, 'tree' )
+        self.map_files = {}
+        for relative_path, num_bytes in [ ('a', 100), ('d/b', 5000), ('d/e/c', 12345), ('d/e/empty', 0) ]:
+            self.write_file( relative_path, os.urandom( num_bytes ) )
+
+    def write_file(self, relative_path, data ):
+        local_file = os.path.join( self.local_path, relative_path )
+        if not os.path.isdir( os.path.dirname( local_file ) ): os.makedirs( os.path.dirname( local_file ) )
+        with open( local_file, 'wb' ) as fp: fp.write( data )
+        self.map_files[ relative_path ] = data
+
+    def sync(self):
+        return self.s3_connection.sync_to_s3( self.local_path, self.bucket_name, prefix='up', max_workers=3, multipart_min_bytes=4000,
+                                              part_size=1000, max_part_workers=2 )
+
+    def test_sync(self):
+        s3_sync_result = self.sync()
+        self.assertEqual( 4, s3_sync_result.num_files )
+        self.assertEqual( sum( [ len(data) for data in self.map_files.values() ] ), s3_sync_result.num_bytes )
+        for relative_path, data in self.map_files.items():
+            self.assertEqual( data, self.local_s3_server.get_object( self.bucket_name, 'up/' + relative_path ).data )
+        local_s3_object = self.local_s3_server.get_object( self.bucket_name, 'up/d/e/c' )
+        self.assertEqual( [ 1000 ] * 12 + [ 345 ], local_s3_object.part_sizes )
+        self.assertEqual( None, self.local_s3_server.get_object( self.bucket_name, 'up/a' ).part_sizes )
+
+    def test_unchanged_skipped(self):
+        self.sync()
+        num_puts = self.local_s3_server.counts['PUT'] + self.local_s3_server.counts['PART']
+        s3_sync_result = self.sync()
+        self.assertEqual( (0, 4), (s3_sync_result.num_files, s3_sync_result.num_unchanged) )
+        self.assertEqual( num_puts, self.local_s3_server.counts['PUT'] + self.local_s3_server.counts['PART'] )
+        # same size, different contents
+        self.write_file( 'd/b', os.urandom( 5000 ) )
+        s3_sync_result = self.sync()
+        self.assertEqual( (1, 3), (s3_sync_result.num_files, s3_sync_result.num_unchanged) )
+        self.assertEqual( self.map_files['d/b'], self.local_s3_server.get_object( self.bucket_name, 'up/d/b' ).data )
+
+    def test_etag_match_other_part_size(self):
+        # uploaded by another tool with 3000 byte parts
+        self.local_s3_server.put_object( self.bucket_name, 'up/d/e/c', self.map_files['d/e/c'], part_sizes=[ 3000, 3000, 3000, 3000, 345 ] )
+        bucket = self.s3_connection.get_bucket( self.bucket_name, validate=False )
+        etag = self.local_s3_server.get_object( self.bucket_name, 'up/d/e/c' ).etag
+        local_file = os.path.join( self.local_path, 'd/e/c' )
+        self.assertTrue( is_etag_match( bucket, 'up/d/e/c', local_file, 12345, etag, part_size=1000 ) )
+        self.write_file( 'd/e/c', os.urandom( 12345 ) )
+        self.assertFalse( is_etag_match( bucket, 'up/d/e/c', local_file, 12345, etag, part_size=1000 ) )
+
+
+class TestUploadFileMultipart(LocalS3TestCase):
+
+    def test_upload(self):
+        data = os.urandom( 2500 )
+        local_file = os.path.join( self.temp_dir, 'data' )
+        with open( local_file, 'wb' ) as fp: fp.write( data )
+        bucket = self.s3_connection.get_bucket( self.bucket_name, validate=False )
+        self.assertEqual( 2500, upload_file_multipart( bucket, 'data', local_file, part_size=1000, max_concurrent=3 ) )
+        local_s3_object = self.local_s3_server.get_object( self.bucket_name, 'data' )
+        self.assertEqual( data, local_s3_object.data )
+        self.assertEqual( [ 1000, 1000, 500 ], local_s3_object.part_sizes )
+
+    def test_iter_local_files(self):
+        for relative_path in [ 'b', 'a/z', 'a/y/x' ]:
+            local_file = os.path.join( self.temp_dir, 'tree', relative_path )
+            if not os.path.isdir( os.path.dirname( local_file ) ): os.makedirs( os.path.dirname( local_file ) )
+            open( local_file, 'wb' ).close()
+        self.assertEqual( [ 'b', 'a/z', 'a/y/x' ], [ relative_path for local_file, relative_path in iter_local_files( os.path.join( self.temp_dir, 'tree' ) ) ] )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Unit tests of the spot region state file
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from awsext.ec2.spotprice import SpotRegionStateFile
+
+
+def put_regions( state_path, process_num, num_puts ):
+    spot_region_state = SpotRegionStateFile( state_path )
+    for i in range(num_puts): 
+        spot_region_state.put( 'region-' + str(process_num), 'vpc-' + str(i), 'kp_' + str(process_num) + '_' + str(i), 'sg-' + str(i) )
+
+
+class TestSpotRegionStateFile(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join( self.temp_dir, 'spot_state.json' )
+
+    def tearDown(self):
+        shutil.rmtree( self.temp_dir )
+
+    def test_put_get(self):
+        spot_region_state = SpotRegionStateFile( self.state_path )
+        self.assertEqual( (None, None), spot_region_state.get( 'us-east-1', 'vpc-1' ) )
+        spot_region_state.put( 'us-east-1', 'vpc-1', 'kp_us-east-1_', 'sg-1' )
+        self.assertEqual( ('kp_us-east-1_', 'sg-1'), SpotRegionStateFile( self.state_path ).get( 'us-east-1', 'vpc-1' ) )
+
+    def test_invalid_file(self):
+        with open( self.state_path, 'w' ) as state_file: state_file.write( '{ not json' )
+        spot_region_state = SpotRegionStateFile( self.state_path )
+        self.assertEqual( (None, None), spot_region_state.get( 'us-east-1', 'vpc-1' ) )
+        spot_region_state.put( 'us-east-1', 'vpc-1', 'kp', 'sg-1' )
+        self.assertEqual( ('kp', 'sg-1'), spot_region_state.get( 'us-east-1', 'vpc-1' ) )
+
+    def test_concurrent_processes(self):
+        processes = [ multiprocessing.Process( target=put_regions, args=(self.state_path, process_num, 10) ) for process_num in range(6) ]
+        for process in processes: process.start()
+        for process in processes: process.join()
+        spot_region_state = SpotRegionStateFile( self.state_path )
+        for process_num in range(6):
+            for i in range(10): 
+                self.assertEqual( ('kp_' + str(process_num) + '_' + str(i), 'sg-' + str(i)), 
+                                  spot_region_state.get( 'region-' + str(process_num), 'vpc-' + str(i) ) )
+        self.assertEqual( [ 'spot_state.json', 'spot_state.json.lock' ], sorted( os.listdir( self.temp_dir ) ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests of SSH connection pooling against the local SSH servers of :mod:`tests.localssh`
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from tests.localssh import LocalSshFarm, generate_key_file
+from awsext.ec2.sshpool import SshConnectionPool
+
+
+class TestSshConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.key_filename = os.path.join( self.temp_dir, 'key.pem' )
+        generate_key_file( self.key_filename )
+        self.local_ssh_farm = LocalSshFarm( 1, os.path.join( self.temp_dir, 'farm' ) )
+        self.local_ssh_farm.start()
+        self.ip_address, self.port = self.local_ssh_farm.get_addresses()[0]
+        self.ssh_pool = SshConnectionPool( max_idle_secs=0, max_sessions_per_host=2 )
+
+    def tearDown(self):
+        self.ssh_pool.close_all()
+        self.local_ssh_farm.stop()
+        shutil.rmtree( self.temp_dir )
+
+    def get_connection(self):
+        return self.ssh_pool.get_connection( self.ip_address, key_filename=self.key_filename, port=self.port )
+
+    def test_connection_reused(self):
+        ssh_connection = self.get_connection()
+        self.ssh_pool.release_connection( ssh_connection )
+        self.assertTrue( ssh_connection is self.get_connection() )
+        self.assertEqual( 1, ssh_connection.num_connects )
+        self.assertEqual( 1, ssh_connection.num_checkouts )
+
+    def test_close_idle_skips_checked_out(self):
+        ssh_connection = self.get_connection()
+        self.ssh_pool.close_idle()
+        self.assertTrue( ssh_connection.is_healthy() )
+        chan = ssh_connection.open_session()
+        ssh_connection.close_session( chan )
+        self.ssh_pool.release_connection( ssh_connection )
+        self.ssh_pool.close_idle()
+        self.assertFalse( ssh_connection.is_healthy() )
+        self.assertFalse( ssh_connection is self.get_connection() )
+
+    def test_reconnect_unhealthy(self):
+        ssh_connection = self.get_connection()
+        ssh_connection.ssh_client.get_transport().close()
+        self.ssh_pool.release_connection( ssh_connection )
+        self.assertTrue( ssh_connection is self.get_connection() )
+        self.assertTrue( ssh_connection.is_healthy() )
+        self.assertEqual( 2, ssh_connection.num_connects )
+
+    def test_max_sessions(self):
+        ssh_connection = self.get_connection()
+        sftp_client = ssh_connection.acquire_sftp()
+        chan = ssh_connection.open_session()
+        self.assertEqual( None, ssh_connection.open_sftp( is_blocking=False ) )
+        ssh_connection.close_session( chan )
+        ssh_connection.release_sftp( sftp_client )
+        # the released session is kept idle and reused
+        self.assertTrue( ssh_connection.acquire_sftp() is sftp_client )
+        self.assertEqual( 1, ssh_connection.num_open_sessions )
+        ssh_connection.release_sftp( sftp_client, is_reusable=False )
+        self.assertEqual( None, ssh_connection.sftp_client )
+        self.assertEqual( 0, ssh_connection.num_open_sessions )
+
+
+if __name__ == '__main__':
+    unittest.main()
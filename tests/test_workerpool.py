@@ -0,0 +1,119 @@
+# Copyright 2015 IPC Global (http://www.ipc-global.com) and others.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Unit tests of WorkerPool, WorkItem and RateLimiter
+:author: Pete Zybrick
+:contact: pete.zybrick@ipc-global.com, pzybrick@gmail.com
+:version: 1.1
+"""
+
+import time
+import threading
+import unittest
+from awsext.exception import WorkItemCancelledError, WorkItemTimeoutError
+from awsext.workerpool import WorkerPool, RateLimiter
+
+
+class TestWorkItem(unittest.TestCase):
+
+    def setUp(self):
+        self.worker_pool = WorkerPool( max_workers=2 )
+
+    def tearDown(self):
+        self.worker_pool.shutdown()
+
+    def test_result(self):
+        self.assertEqual( 5, self.worker_pool.submit( lambda a, b=0: a + b, 2, b=3 ).get() )
+
+    def test_exception(self):
+        def fail(): raise IOError( 'boom' )
+        work_item = self.worker_pool.submit( fail )
+        self.assertRaises( IOError, work_item.get )
+        self.assertTrue( 'boom' in work_item.traceback )
+
+    def test_get_timeout(self):
+        release_event = threading.Event()
+        work_item = self.worker_pool.submit( release_event.wait )
+        self.assertRaises( WorkItemTimeoutError, work_item.get, 0.1 )
+        release_event.set()
+        self.assertTrue( work_item.get( 5 ) )
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def test_imap_unordered(self):
+        with WorkerPool( max_workers=4 ) as worker_pool:
+            results = [ work_item.get() for work_item in worker_pool.imap_unordered( lambda i: i * i, iter( range(100) ) ) ]
+        self.assertEqual( [ i * i for i in range(100) ], sorted( results ) )
+
+    def test_imap_unordered_feeder_exception(self):
+        def iter_items():
+            for i in range(10): yield i
+            raise IOError( 'listing failed' )
+        with WorkerPool( max_workers=2 ) as worker_pool:
+            results = []
+            try:
+                for work_item in worker_pool.imap_unordered( lambda i: i, iter_items() ): results.append( work_item.get() )
+                self.fail( 'Feeder exception not raised' )
+            except IOError:
+                pass
+        # items produced before the failure are processed
+        self.assertEqual( range(10), sorted( results ) )
+
+    def test_imap_unordered_early_stop_closes_items(self):
+        state = { 'closed':False, 'num_produced':0 }
+        def iter_items():
+            try:
+                while True:
+                    state['num_produced'] += 1
+                    yield state['num_produced']
+            finally:
+                state['closed'] = True
+        worker_pool = WorkerPool( max_workers=2, max_queued=2 )
+        try:
+            for work_item in worker_pool.imap_unordered( lambda i: i, iter_items() ): break
+        finally:
+            worker_pool.shutdown()
+        expires_at = time.time() + 5
+        while not state['closed'] and time.time() < expires_at: time.sleep( 0.05 )
+        self.assertTrue( state['closed'] )
+
+    def test_shutdown_cancels_queued(self):
+        release_event = threading.Event()
+        worker_pool = WorkerPool( max_workers=1, max_queued=10 )
+        running = worker_pool.submit( release_event.wait, 5 )
+        queued = [ worker_pool.submit( lambda: 1 ) for i in range(3) ]
+        threading.Timer( 0.2, release_event.set ).start()
+        worker_pool.shutdown()
+        self.assertTrue( running.get() )
+        for work_item in queued: self.assertRaises( WorkItemCancelledError, work_item.get )
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_spacing(self):
+        rate_limiter = RateLimiter( 20 )
+        start = time.time()
+        threads = [ threading.Thread( target=rate_limiter.acquire ) for i in range(6) ]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        # the first acquire is immediate, the other 5 are 0.05 secs apart
+        self.assertTrue( time.time() - start >= 0.24 )
+
+    def test_invalid_rate(self):
+        self.assertRaises( ValueError, RateLimiter, 0 )
+
+
+if __name__ == '__main__':
+    unittest.main()